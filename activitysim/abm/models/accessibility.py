@@ -10,6 +10,283 @@ from activitysim.core.pathbuilder import TransitVirtualPathBuilder
 
 logger = logging.getLogger(__name__)
 
+# default number of od pairs evaluated at a time when streaming origin blocks
+ORIGIN_BLOCK_OD_PAIRS = 1000000
+
+
+class OriginBlockSkims(object):
+    """
+    Skim wrapper returning skim values for an origin block as 2D (origin, destination) arrays
+    """
+
+    def __init__(self, skim_wrapper, shape):
+        self.skim_wrapper = skim_wrapper
+        self.shape = shape
+
+    def _block(self, values):
+        return np.asanyarray(values).reshape(self.shape)
+
+    def __getitem__(self, key):
+        return self._block(self.skim_wrapper[key])
+
+    def lookup(self, key, reverse=False):
+        return self._block(self.skim_wrapper.lookup(key, reverse=reverse))
+
+    def reverse(self, key):
+        return self._block(self.skim_wrapper.reverse(key))
+
+    def max(self, key):
+        return self._block(self.skim_wrapper.max(key))
+
+
+class DestinationAttributes(object):
+    """
+    Stand-in for the od_df in accessibility expressions evaluated for an origin block
+
+    Land use columns are destination attribute vectors, which broadcast against the 2D
+    (origin, destination) skim arrays, and orig and dest are 2D arrays of zone ids.
+    """
+
+    def __init__(self, land_use_df, orig, dest):
+        self.columns = {c: land_use_df[c].values for c in land_use_df.columns}
+        self.columns["orig"] = orig
+        self.columns["dest"] = dest
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__["columns"][name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+
+def eval_origin_block(assignment_spec, locals_d, df, shape, trace_cell=None):
+    """
+    Evaluate accessibility expressions for an origin block and sum them over destinations
+
+    Expressions are evaluated as in assign.assign_variables, but against 2D (origin, destination)
+    numpy arrays rather than columns of an od_df, so (other than singular temps) they should
+    evaluate to numpy arrays or scalars.
+
+    Parameters
+    ----------
+    assignment_spec : pandas.DataFrame
+        target and expression columns as read by assign.read_assignment_spec
+    locals_d : dict
+        locals for eval of expressions, including the skim_od and skim_do OriginBlockSkims
+    df : DestinationAttributes
+    shape : tuple
+        (number of origins in block, number of destinations)
+    trace_cell : tuple, optional
+        (origin, destination) offsets in block of trace od pair
+
+    Returns
+    -------
+    sums : dict
+        {target: 1D array of sum over destinations of target value of each origin in block}
+    trace_results : dict or None
+        {target: value of target for trace od pair} for all targets (including temps)
+    trace_assigned_locals : dict or None
+        {target: value} of singular temps
+    """
+
+    np_logger = assign.NumpyLogger(logger)
+
+    _locals_dict = assign.local_utilities()
+    _locals_dict.update(locals_d)
+    _locals_dict["df"] = df
+
+    trace_results = trace_assigned_locals = None
+    if trace_cell is not None:
+        trace_results = {}
+        trace_assigned_locals = {}
+
+    variables = {}
+    for target, expression in zip(assignment_spec.target, assignment_spec.expression):
+
+        if target == "_" or (target.startswith("_") and target.isupper()):
+            x = eval(expression, globals(), _locals_dict)
+            if target != "_":
+                _locals_dict[target] = x
+                if trace_assigned_locals is not None:
+                    trace_assigned_locals[
+                        assign.uniquify_key(trace_assigned_locals, target)
+                    ] = x
+            continue
+
+        np_logger.target = str(target)
+        np_logger.expression = str(expression)
+        try:
+            with np.errstate(all="log", call=np_logger):
+                values = eval(expression, {}, _locals_dict)
+        except Exception as err:
+            logger.exception(
+                f"eval_origin_block - {type(err).__name__} ({str(err)}) evaluating: {str(expression)}"
+            )
+            raise err
+
+        if not assign.is_temp(target):
+            variables[target] = values
+
+        if trace_results is not None:
+            trace_results[assign.uniquify_key(trace_results, target)] = np.broadcast_to(
+                values, shape
+            )[trace_cell]
+
+        _locals_dict[target] = values
+
+    assert variables, "No non-temp variables were assigned."
+
+    sums = {
+        target: np.sum(np.broadcast_to(values, shape), axis=1)
+        for target, values in variables.items()
+    }
+
+    return sums, trace_results, trace_assigned_locals
+
+
+def compute_accessibilities_for_origin_blocks(
+    accessibility_df,
+    land_use_df,
+    assignment_spec,
+    constants,
+    network_los,
+    trace_od,
+    trace_label,
+    origin_block_size=None,
+):
+    """
+    Compute accessibilities by streaming blocks of origins through eval_origin_block
+
+    Same results as compute_accessibilities_for_zones, without building an od_df with the
+    land_use columns of each destination, and needing only one origin block of od values at a time.
+    """
+
+    orig_zones = accessibility_df.index.values
+    dest_zones = land_use_df.index.values
+
+    dest_zone_count = len(dest_zones)
+
+    if not origin_block_size:
+        origin_block_size = max(1, ORIGIN_BLOCK_OD_PAIRS // max(dest_zone_count, 1))
+
+    logger.info(
+        f"Running {trace_label} with {len(orig_zones)} orig zones {dest_zone_count} dest zones "
+        f"in blocks of {origin_block_size} orig zones"
+    )
+
+    locals_d = {
+        "log": np.log,
+        "exp": np.exp,
+        "network_los": network_los,
+    }
+    locals_d.update(constants)
+
+    skim_dict = network_los.get_default_skim_dict()
+
+    trace_orig = trace_dest_offset = None
+    if trace_od:
+        trace_orig, trace_dest = trace_od
+        if trace_orig in orig_zones and trace_dest in dest_zones:
+            trace_dest_offset = np.flatnonzero(dest_zones == trace_dest)[0]
+
+    block_sums = []
+    for start in range(0, len(orig_zones), origin_block_size):
+
+        block_orig_zones = orig_zones[start : start + origin_block_size]
+        shape = (len(block_orig_zones), dest_zone_count)
+
+        # just the od zone ids, which are all skim wrappers need for their lookups
+        od_df = pd.DataFrame(
+            data={
+                "orig": np.repeat(block_orig_zones, dest_zone_count),
+                "dest": np.tile(dest_zones, len(block_orig_zones)),
+            }
+        )
+        chunk.log_df(trace_label, "od_df", od_df)
+
+        locals_d["skim_od"] = OriginBlockSkims(
+            skim_dict.wrap("orig", "dest").set_df(od_df), shape
+        )
+        locals_d["skim_do"] = OriginBlockSkims(
+            skim_dict.wrap("dest", "orig").set_df(od_df), shape
+        )
+
+        df = DestinationAttributes(
+            land_use_df,
+            od_df.orig.values.reshape(shape),
+            od_df.dest.values.reshape(shape),
+        )
+
+        trace_cell = None
+        if trace_dest_offset is not None and trace_orig in block_orig_zones:
+            trace_cell = (
+                np.flatnonzero(block_orig_zones == trace_orig)[0],
+                trace_dest_offset,
+            )
+
+        sums, trace_results, trace_assigned_locals = eval_origin_block(
+            assignment_spec, locals_d, df, shape, trace_cell
+        )
+        block_sums.append(sums)
+
+        if trace_cell is not None:
+            write_origin_block_trace(
+                start * dest_zone_count,
+                od_df,
+                land_use_df,
+                shape,
+                trace_cell,
+                trace_results,
+                trace_assigned_locals,
+            )
+
+        del od_df
+        chunk.log_df(trace_label, "od_df", None)
+
+    if trace_od and trace_dest_offset is None:
+        logger.warning(f"trace_od not found origin = {trace_orig}, dest = {trace_dest}")
+
+    for column in block_sums[0]:
+        data = np.concatenate([sums[column] for sums in block_sums])
+        accessibility_df[column] = np.log(data + 1)
+
+    return accessibility_df
+
+
+def write_origin_block_trace(
+    block_offset,
+    od_df,
+    land_use_df,
+    shape,
+    trace_cell,
+    trace_results,
+    trace_assigned_locals,
+):
+
+    # od_df row of trace od pair, with the land_use columns of its destination
+    # (indexed by its offset in the od pairs of all the origins, as in compute_accessibilities_for_zones)
+    skim_offset = np.ravel_multi_index(trace_cell, shape)
+    df = od_df.iloc[[skim_offset]].copy()
+    df.index = [block_offset + skim_offset]
+    for c in land_use_df.columns:
+        df[c] = land_use_df[c].values[trace_cell[1]]
+    for target, value in trace_results.items():
+        df[target] = value
+
+    tracing.trace_df(
+        df,
+        label="accessibility",
+        index_label="skim_offset",
+        slicer="NONE",
+        warn_if_empty=True,
+    )
+
+    if trace_assigned_locals:
+        tracing.write_csv(trace_assigned_locals, file_name="accessibility_locals")
+
 
 def compute_accessibilities_for_zones(
     accessibility_df,
@@ -155,21 +432,41 @@ def compute_accessibility(land_use, accessibility, network_los, chunk_size, trac
         f"Running {trace_label} with {len(accessibility_df.index)} orig zones {len(land_use_df)} dest zones"
     )
 
+    stream_origin_blocks = model_settings.get("stream_origin_blocks", False)
+    if stream_origin_blocks and network_los.zone_system == los.THREE_ZONE:
+        # tvpb expressions need a flat od_df
+        logger.warning(
+            f"{trace_label}: stream_origin_blocks not supported for three zone systems"
+        )
+        stream_origin_blocks = False
+
     accessibilities_list = []
 
     for i, chooser_chunk, chunk_trace_label in chunk.adaptive_chunked_choosers(
         accessibility_df, chunk_size, trace_label
     ):
 
-        accessibilities = compute_accessibilities_for_zones(
-            chooser_chunk,
-            land_use_df,
-            assignment_spec,
-            constants,
-            network_los,
-            trace_od,
-            trace_label,
-        )
+        if stream_origin_blocks:
+            accessibilities = compute_accessibilities_for_origin_blocks(
+                chooser_chunk,
+                land_use_df,
+                assignment_spec,
+                constants,
+                network_los,
+                trace_od,
+                trace_label,
+                origin_block_size=model_settings.get("origin_block_size"),
+            )
+        else:
+            accessibilities = compute_accessibilities_for_zones(
+                chooser_chunk,
+                land_use_df,
+                assignment_spec,
+                constants,
+                network_los,
+                trace_od,
+                trace_label,
+            )
         accessibilities_list.append(accessibilities)
 
     accessibility_df = pd.concat(accessibilities_list)
@@ -98,7 +98,8 @@ def initialize_los(network_los):
 
         # if multiprocessing make sure shared cache is filled with np.nan
         # so that initialize_tvpb subprocesses can detect when cache is fully populated
-        if network_los.multiprocess():
+        # (a DYNAMIC cache was filled with np.nan and any saved entries by load_data_to_buffer)
+        if network_los.multiprocess() and not tap_cache.is_dynamic:
             (
                 data,
                 lock,
@@ -199,6 +200,8 @@ def initialize_tvpb(network_los, attribute_combinations, chunk_size):
     """
     Initialize STATIC tap_tap_utility cache and write mmap to disk.
 
+    Not needed (and skipped) if network_los tvpb_cache_type is dynamic.
+
     uses pipeline attribute_combinations table created in initialize_los to determine which attribute tuples
     to compute utilities for.
 
@@ -227,6 +230,12 @@ def initialize_tvpb(network_los, attribute_combinations, chunk_size):
     tap_cache = network_los.tvpb.tap_cache
     assert not tap_cache.is_open
 
+    if tap_cache.is_dynamic:
+        logger.info(
+            f"{trace_label} - skipping step because DYNAMIC tvpb cache is populated on demand"
+        )
+        return
+
     # if cache already exists,
     if os.path.isfile(tap_cache.cache_path):
         # otherwise should have been deleted by TVPBCache.cleanup in initialize_los step
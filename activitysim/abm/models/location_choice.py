@@ -541,6 +541,126 @@ def run_location_logsums(
     return location_sample_df
 
 
+def run_location_sample_incremental(
+    segment_name,
+    persons_merged,
+    network_los,
+    dest_size_terms,
+    segment_cache,
+    estimator,
+    model_settings,
+    utility_tolerance,
+    chunk_size,
+    chunk_tag,
+    trace_label,
+):
+    """
+    incremental alternative to run_location_sample and run_location_logsums for later
+    shadow pricing iterations (shadow_pricing.yaml INCREMENTAL_RESIMULATION)
+
+    Only choosers whose prior sample included a zone whose shadow price changed utility by more
+    than utility_tolerance (or who have no prior sample) are resampled. Other choosers keep their
+    prior sample (pick_count and prob included). Logsums of (chooser, zone) pairs already computed
+    in an earlier iteration are reused, as they don't depend on shadow prices.
+
+    Parameters
+    ----------
+    segment_cache : dict
+        prior iteration 'dest_size_terms' and 'sample', and 'logsums' of all evaluated
+        (chooser, zone) pairs, all of which are updated for this iteration
+
+    Returns
+    -------
+    location_sample_df : pandas.DataFrame
+        location sample with ALT_LOGSUM column for all persons_merged
+    """
+
+    alt_dest_col_name = model_settings["ALT_DEST_COL_NAME"]
+
+    prior_dest_size_terms = segment_cache["dest_size_terms"]
+    prior_sample_df = segment_cache["sample"]
+    cached_logsums = segment_cache["logsums"]
+
+    # shadow prices either scale size terms (which enter utility as logs) or adjust utility
+    with np.errstate(divide="ignore", invalid="ignore"):
+        utility_change = np.abs(
+            np.log(
+                dest_size_terms.shadow_price_size_term_adjustment
+                / prior_dest_size_terms.shadow_price_size_term_adjustment
+            )
+        ) + np.abs(
+            dest_size_terms.shadow_price_utility_adjustment
+            - prior_dest_size_terms.shadow_price_utility_adjustment
+        )
+    # nan (e.g. zero size term adjustment) counts as repriced
+    repriced_zones = dest_size_terms.index[~(utility_change <= utility_tolerance)]
+
+    prior_sample_df = prior_sample_df[prior_sample_df.index.isin(persons_merged.index)]
+    touched = prior_sample_df[alt_dest_col_name].isin(repriced_zones)
+    resample = ~persons_merged.index.isin(
+        prior_sample_df.index[~touched.groupby(level=0).transform("any")]
+    )
+
+    logger.info(
+        "%s resampling %s of %s choosers (%s repriced zones)"
+        % (trace_label, resample.sum(), len(persons_merged), len(repriced_zones))
+    )
+
+    kept_sample_df = prior_sample_df[
+        ~prior_sample_df.index.isin(persons_merged.index[resample])
+    ]
+    if not resample.any():
+        return kept_sample_df
+
+    location_sample_df = run_location_sample(
+        segment_name,
+        persons_merged[resample],
+        network_los,
+        dest_size_terms,
+        estimator,
+        model_settings,
+        chunk_size,
+        chunk_tag,
+        trace_label=tracing.extend_trace_label(trace_label, "sample.%s" % segment_name),
+    )
+
+    # - reuse logsums of previously evaluated (chooser, zone) pairs
+    keys = pd.MultiIndex.from_arrays(
+        [location_sample_df.index, location_sample_df[alt_dest_col_name]]
+    )
+    location_sample_df[ALT_LOGSUM] = cached_logsums.reindex(keys).values
+    missing = location_sample_df[ALT_LOGSUM].isna()
+
+    if missing.any():
+        new_logsums_df = run_location_logsums(
+            segment_name,
+            persons_merged[resample],
+            network_los,
+            location_sample_df[missing].drop(columns=ALT_LOGSUM),
+            model_settings,
+            chunk_size,
+            chunk_tag=f"{chunk_tag}.logsums",
+            trace_label=tracing.extend_trace_label(
+                trace_label, "logsums.%s" % segment_name
+            ),
+        )
+        location_sample_df.loc[missing, ALT_LOGSUM] = new_logsums_df[ALT_LOGSUM].values
+
+        new_logsums = new_logsums_df.set_index(alt_dest_col_name, append=True)[
+            ALT_LOGSUM
+        ]
+        segment_cache["logsums"] = pd.concat(
+            [cached_logsums, new_logsums[~new_logsums.index.duplicated()]]
+        )
+
+    # interaction_sample_simulate expects alternatives grouped by chooser in chooser order
+    location_sample_df = pd.concat([kept_sample_df, location_sample_df]).sort_index(
+        kind="mergesort"
+    )
+
+    return location_sample_df
+
+
 def run_location_simulate(
     segment_name,
     persons_merged,
@@ -656,12 +776,16 @@ def run_location_choice(
     trace_hh_id,
     trace_label,
     skip_choice=False,
+    sample_cache=None,
 ):
     """
     Run the three-part location choice algorithm to generate a location choice for each chooser
 
     Handle the various segments separately and in turn for simplicity of expression files
 
+    If sample_cache is not None, the sample and logsums of each segment are saved in it, and
+    (if already there from a prior shadow pricing iteration) only incrementally updated.
+
     Parameters
     ----------
     persons_merged_df : pandas.DataFrame
@@ -676,6 +800,8 @@ def run_location_choice(
     chunk_size : int
     trace_hh_id : int
     trace_label : str
+    sample_cache : dict or None
+        dict of per segment cache dicts for run_location_sample_incremental
 
     Returns
     -------
@@ -710,34 +836,61 @@ def run_location_choice(
             logger.info(f"{trace_label} skipping segment {segment_name}: no choosers")
             continue
 
-        # - location_sample
-        location_sample_df = run_location_sample(
-            segment_name,
-            choosers,
-            network_los,
-            dest_size_terms,
-            estimator,
-            model_settings,
-            chunk_size,
-            chunk_tag,  # run_location_sample will add appropriate suffix for sample or presample
-            trace_label=tracing.extend_trace_label(
-                trace_label, "sample.%s" % segment_name
-            ),
-        )
+        if sample_cache is not None and segment_name in sample_cache:
+            # - incremental location_sample and location_logsums
+            location_sample_df = run_location_sample_incremental(
+                segment_name,
+                choosers,
+                network_los,
+                dest_size_terms,
+                sample_cache[segment_name],
+                estimator,
+                model_settings,
+                shadow_price_calculator.incremental_utility_tolerance,
+                chunk_size,
+                chunk_tag,
+                trace_label,
+            )
+        else:
+            # - location_sample
+            location_sample_df = run_location_sample(
+                segment_name,
+                choosers,
+                network_los,
+                dest_size_terms,
+                estimator,
+                model_settings,
+                chunk_size,
+                chunk_tag,  # run_location_sample will add appropriate suffix for sample or presample
+                trace_label=tracing.extend_trace_label(
+                    trace_label, "sample.%s" % segment_name
+                ),
+            )
 
-        # - location_logsums
-        location_sample_df = run_location_logsums(
-            segment_name,
-            choosers,
-            network_los,
-            location_sample_df,
-            model_settings,
-            chunk_size,
-            chunk_tag=f"{chunk_tag}.logsums",
-            trace_label=tracing.extend_trace_label(
-                trace_label, "logsums.%s" % segment_name
-            ),
-        )
+            # - location_logsums
+            location_sample_df = run_location_logsums(
+                segment_name,
+                choosers,
+                network_los,
+                location_sample_df,
+                model_settings,
+                chunk_size,
+                chunk_tag=f"{chunk_tag}.logsums",
+                trace_label=tracing.extend_trace_label(
+                    trace_label, "logsums.%s" % segment_name
+                ),
+            )
+
+        if sample_cache is not None:
+            alt_dest_col_name = model_settings["ALT_DEST_COL_NAME"]
+            segment_cache = sample_cache.setdefault(segment_name, {})
+            segment_cache["dest_size_terms"] = dest_size_terms
+            segment_cache["sample"] = location_sample_df
+            if "logsums" not in segment_cache:
+                logsums = location_sample_df.set_index(alt_dest_col_name, append=True)[
+                    ALT_LOGSUM
+                ]
+                segment_cache["logsums"] = logsums[~logsums.index.duplicated()]
 
         # - location_simulate
         choices_df = run_location_simulate(
@@ -810,8 +963,9 @@ def run_location_choice(
 
         if want_sample_table:
             # FIXME - sample_table
-            location_sample_df.set_index(
-                model_settings["ALT_DEST_COL_NAME"], append=True, inplace=True
+            # (not inplace, as location_sample_df may be in sample_cache)
+            location_sample_df = location_sample_df.set_index(
+                model_settings["ALT_DEST_COL_NAME"], append=True
             )
             sample_list.append(location_sample_df)
         else:
@@ -909,6 +1063,9 @@ def iterate_location_choice(
 
     choices_df = None  # initialize to None, will be populated in first iteration
 
+    # samples and logsums carried between iterations for INCREMENTAL_RESIMULATION
+    sample_cache = {} if spc.use_shadow_pricing and spc.incremental else None
+
     for iteration in range(1, max_iterations + 1):
 
         persons_merged_df_ = persons_merged_df.copy()
@@ -935,6 +1092,7 @@ def iterate_location_choice(
             chunk_tag=chunk_tag,
             trace_hh_id=trace_hh_id,
             trace_label=tracing.extend_trace_label(trace_label, "i%s" % iteration),
+            sample_cache=sample_cache,
         )
 
         # choices_df is a pandas DataFrame with columns "choice" and (optionally) "logsum"
@@ -988,6 +1146,7 @@ def iterate_location_choice(
     if locutor:
         if spc.use_shadow_pricing and "SHADOW_PRICE_TABLE" in model_settings:
             inject.add_table(model_settings["SHADOW_PRICE_TABLE"], spc.shadow_prices)
+        spc.write_warm_start_shadow_prices()
         if "MODELED_SIZE_TABLE" in model_settings:
             inject.add_table(model_settings["MODELED_SIZE_TABLE"], spc.modeled_size)
 
@@ -21,6 +21,8 @@ def write_trip_matrices(network_los):
     then aggregates trip counts and writes OD matrices to OMX.  Save annotated
     trips table to pipeline if desired.
 
+    The data_fields of all matrices are aggregated at once by aggregate_od_trips.
+
     Writes taz trip tables for one and two zone system.  Writes taz and tap
     trip tables for three zone system.  Add ``is_tap:True`` to the settings file
     to identify an output matrix as tap level trips as opposed to taz level trips.
@@ -61,63 +63,31 @@ def write_trip_matrices(network_los):
     # write matrices by zone system type
     if network_los.zone_system == los.ONE_ZONE:  # taz trips written to taz matrices
         logger.info("aggregating trips one zone...")
-        aggregate_trips = trips_df.groupby(["origin", "destination"], sort=False).sum(
-            numeric_only=True
-        )
-
-        # use the average household weight for all trips in the origin destination pair
-        hh_weight_col = model_settings.get("HH_EXPANSION_WEIGHT_COL")
-        aggregate_weight = (
-            trips_df[["origin", "destination", hh_weight_col]]
-            .groupby(["origin", "destination"], sort=False)
-            .mean()
-        )
-        aggregate_trips[hh_weight_col] = aggregate_weight[hh_weight_col]
-
-        orig_vals = aggregate_trips.index.get_level_values("origin")
-        dest_vals = aggregate_trips.index.get_level_values("destination")
 
         # use the land use table for the set of possible tazs
         land_use = pipeline.get_table("land_use")
         zone_index = land_use.index
-        assert all(zone in zone_index for zone in orig_vals)
-        assert all(zone in zone_index for zone in dest_vals)
-
-        _, orig_index = zone_index.reindex(orig_vals)
-        _, dest_index = zone_index.reindex(dest_vals)
 
         try:
             zone_labels = land_use[f"_original_{land_use.index.name}"]
         except KeyError:
             zone_labels = land_use.index
 
-        write_matrices(
-            aggregate_trips, zone_labels, orig_index, dest_index, model_settings
-        )
-
-    elif network_los.zone_system == los.TWO_ZONE:  # maz trips written to taz matrices
-        logger.info("aggregating trips two zone...")
-        trips_df["otaz"] = (
-            pipeline.get_table("land_use").reindex(trips_df["origin"]).TAZ.tolist()
-        )
-        trips_df["dtaz"] = (
-            pipeline.get_table("land_use").reindex(trips_df["destination"]).TAZ.tolist()
-        )
-        aggregate_trips = trips_df.groupby(["otaz", "dtaz"], sort=False).sum(
-            numeric_only=True
+        write_zone_matrices(
+            trips_df,
+            trips_df["origin"].values,
+            trips_df["destination"].values,
+            zone_index,
+            model_settings,
+            zone_labels=zone_labels,
         )
 
-        # use the average household weight for all trips in the origin destination pair
-        hh_weight_col = model_settings.get("HH_EXPANSION_WEIGHT_COL")
-        aggregate_weight = (
-            trips_df[["otaz", "dtaz", hh_weight_col]]
-            .groupby(["otaz", "dtaz"], sort=False)
-            .mean()
-        )
-        aggregate_trips[hh_weight_col] = aggregate_weight[hh_weight_col]
+    else:  # maz trips written to taz matrices (and tap matrices for three zone system)
+        logger.info("aggregating trips %s zone taz..." % network_los.zone_system)
 
-        orig_vals = aggregate_trips.index.get_level_values("otaz")
-        dest_vals = aggregate_trips.index.get_level_values("dtaz")
+        maz_taz = pipeline.get_table("land_use")["TAZ"]
+        otaz = map_zones(trips_df["origin"], maz_taz)
+        dtaz = map_zones(trips_df["destination"], maz_taz)
 
         try:
             land_use_taz = pipeline.get_table("land_use_taz")
@@ -125,94 +95,177 @@ def write_trip_matrices(network_los):
             pass  # table missing, ignore
         else:
             if "_original_TAZ" in land_use_taz.columns:
-                orig_vals = orig_vals.map(land_use_taz["_original_TAZ"])
-                dest_vals = dest_vals.map(land_use_taz["_original_TAZ"])
+                otaz = map_zones(otaz, land_use_taz["_original_TAZ"])
+                dtaz = map_zones(dtaz, land_use_taz["_original_TAZ"])
 
         zone_index = pd.Index(network_los.get_tazs(), name="TAZ")
-        assert all(zone in zone_index for zone in orig_vals)
-        assert all(zone in zone_index for zone in dest_vals)
+        write_zone_matrices(trips_df, otaz, dtaz, zone_index, model_settings)
+
+        if network_los.zone_system == los.THREE_ZONE:
+            logger.info("aggregating trips three zone tap...")
+            zone_index = pd.Index(network_los.get_taps(), name="TAP")
+            write_zone_matrices(
+                trips_df,
+                trips_df["btap"].values,
+                trips_df["atap"].values,
+                zone_index,
+                model_settings,
+                is_tap=True,
+            )
 
-        _, orig_index = zone_index.reindex(orig_vals)
-        _, dest_index = zone_index.reindex(dest_vals)
 
-        write_matrices(
-            aggregate_trips, zone_index, orig_index, dest_index, model_settings
-        )
+def map_zones(zone_ids, zone_map):
+    """
+    Return zone_map values (e.g. taz) of zone_ids (e.g. maz) in zone_map index
+    """
+    offsets = zone_map.index.get_indexer(zone_ids)
+    assert (offsets >= 0).all(), f"zones not in {zone_map.index.name} zone map"
+    return zone_map.values[offsets]
 
-    elif (
-        network_los.zone_system == los.THREE_ZONE
-    ):  # maz trips written to taz and tap matrices
 
-        logger.info("aggregating trips three zone taz...")
-        trips_df["otaz"] = (
-            pipeline.get_table("land_use").reindex(trips_df["origin"]).TAZ.tolist()
-        )
-        trips_df["dtaz"] = (
-            pipeline.get_table("land_use").reindex(trips_df["destination"]).TAZ.tolist()
-        )
-        aggregate_trips = trips_df.groupby(["otaz", "dtaz"], sort=False).sum(
-            numeric_only=True
-        )
+def matrix_data_fields(trips_df, model_settings, is_tap=False):
+    """
+    Return the summable trips_df columns that are data_fields of the (tap or taz) MATRICES
 
-        # use the average household weight for all trips in the origin destination pair
-        hh_weight_col = model_settings.get("HH_EXPANSION_WEIGHT_COL")
-        aggregate_weight = (
-            trips_df[["otaz", "dtaz", hh_weight_col]]
-            .groupby(["otaz", "dtaz"], sort=False)
-            .mean()
-        )
-        aggregate_trips[hh_weight_col] = aggregate_weight[hh_weight_col]
+    Non-numeric data_fields are skipped with a warning (as summing trips by od pair always
+    dropped them) so write_matrices reports them as missing.
+    """
 
-        orig_vals = aggregate_trips.index.get_level_values("otaz")
-        dest_vals = aggregate_trips.index.get_level_values("dtaz")
+    columns = []
+    for matrix in model_settings.get("MATRICES") or []:
+        if matrix.get("is_tap", False) == is_tap:
+            for table in matrix.get("tables"):
+                col = table.get("data_field")
+                if col not in trips_df or col in columns:
+                    continue
+                if not pd.api.types.is_numeric_dtype(trips_df[col]):
+                    logger.warning(
+                        f"skipping data_field {col} of matrix table {table.get('name')}: "
+                        f"{trips_df[col].dtype} column is not summable"
+                    )
+                    continue
+                columns.append(col)
 
-        try:
-            land_use_taz = pipeline.get_table("land_use_taz")
-        except (KeyError, RuntimeError):
-            pass  # table missing, ignore
-        else:
-            if "_original_TAZ" in land_use_taz.columns:
-                orig_vals = orig_vals.map(land_use_taz["_original_TAZ"])
-                dest_vals = dest_vals.map(land_use_taz["_original_TAZ"])
+    return columns
 
-        zone_index = pd.Index(network_los.get_tazs(), name="TAZ")
-        assert all(zone in zone_index for zone in orig_vals)
-        assert all(zone in zone_index for zone in dest_vals)
 
-        _, orig_index = zone_index.reindex(orig_vals)
-        _, dest_index = zone_index.reindex(dest_vals)
+def aggregate_od_trips(
+    trips_df, orig_index, dest_index, num_zones, columns, hh_weight_col
+):
+    """
+    Sum columns of trips by od pair
+
+    All columns are summed in one pass of np.bincount over the flat od offsets of the trips,
+    (rather than a pandas groupby of the whole trips table by origin and destination).
+
+    Parameters
+    ----------
+    trips_df : pandas.DataFrame
+    orig_index : numpy.ndarray of int
+        offset of origin zone of each trip in zone index
+    dest_index : numpy.ndarray of int
+        offset of destination zone of each trip in zone index
+    num_zones : int
+    columns : list of str
+        summable (int, float, or bool) trips_df columns to aggregate
+    hh_weight_col : str or None
+        trips_df column with household expansion weight of each trip
+
+    Returns
+    -------
+    aggregate_trips : pandas.DataFrame
+        sum of each of columns for each od pair with trips, and (if hh_weight_col) the average
+        household weight of trips of each od pair, indexed by flat od offset
+    """
 
-        write_matrices(
-            aggregate_trips, zone_index, orig_index, dest_index, model_settings
-        )
+    od = orig_index.astype(np.int64) * num_zones + dest_index
+    od_pairs, pair_index = np.unique(od, return_inverse=True)
 
-        logger.info("aggregating trips three zone tap...")
-        aggregate_trips = trips_df.groupby(["btap", "atap"], sort=False).sum(
-            numeric_only=True
+    aggregate_trips = pd.DataFrame(index=od_pairs)
+    for c in columns:
+        if not pd.api.types.is_numeric_dtype(trips_df[c]):
+            raise RuntimeError(
+                f"aggregate_od_trips: {trips_df[c].dtype} column {c} is not summable"
+            )
+        aggregate_trips[c] = np.bincount(
+            pair_index,
+            weights=trips_df[c].values.astype(np.float64),
+            minlength=len(od_pairs),
         )
 
+    if hh_weight_col:
         # use the average household weight for all trips in the origin destination pair
-        hh_weight_col = model_settings.get("HH_EXPANSION_WEIGHT_COL")
-        aggregate_weight = (
-            trips_df[["btap", "atap", hh_weight_col]]
-            .groupby(["btap", "atap"], sort=False)
-            .mean()
+        weight = np.bincount(
+            pair_index,
+            weights=trips_df[hh_weight_col].values.astype(np.float64),
+            minlength=len(od_pairs),
+        )
+        aggregate_trips[hh_weight_col] = weight / np.bincount(
+            pair_index, minlength=len(od_pairs)
         )
-        aggregate_trips[hh_weight_col] = aggregate_weight[hh_weight_col]
 
-        orig_vals = aggregate_trips.index.get_level_values("btap")
-        dest_vals = aggregate_trips.index.get_level_values("atap")
+    return aggregate_trips
 
-        zone_index = pd.Index(network_los.get_taps(), name="TAP")
-        assert all(zone in zone_index for zone in orig_vals)
-        assert all(zone in zone_index for zone in dest_vals)
 
-        _, orig_index = zone_index.reindex(orig_vals)
-        _, dest_index = zone_index.reindex(dest_vals)
+def write_zone_matrices(
+    trips_df,
+    orig_zones,
+    dest_zones,
+    zone_index,
+    model_settings,
+    is_tap=False,
+    zone_labels=None,
+):
+    """
+    Aggregate trips by od pair and write the aggregate trip matrices for zone_index
+
+    Parameters
+    ----------
+    trips_df : pandas.DataFrame
+    orig_zones : numpy.ndarray
+        origin zone id (in zone_index) of each trip
+    dest_zones : numpy.ndarray
+        destination zone id (in zone_index) of each trip
+    zone_index : pandas.Index
+    model_settings : dict
+    is_tap : bool
+        write tap (rather than taz) matrices
+    zone_labels : pandas.Index or pandas.Series, optional
+        zone ids to write in the zone mapping of matrix files, if not zone_index
+    """
 
-        write_matrices(
-            aggregate_trips, zone_index, orig_index, dest_index, model_settings, True
-        )
+    # trips without an od pair (e.g. the taps of non-transit trips) are not in any matrix
+    has_od = pd.notnull(orig_zones) & pd.notnull(dest_zones)
+    if not has_od.all():
+        trips_df = trips_df[has_od]
+        orig_zones = orig_zones[has_od]
+        dest_zones = dest_zones[has_od]
+
+    orig_index = zone_index.get_indexer(orig_zones)
+    dest_index = zone_index.get_indexer(dest_zones)
+    assert (orig_index >= 0).all(), f"trip origins not in {zone_index.name} zones"
+    assert (dest_index >= 0).all(), f"trip destinations not in {zone_index.name} zones"
+
+    num_zones = len(zone_index)
+    aggregate_trips = aggregate_od_trips(
+        trips_df,
+        orig_index,
+        dest_index,
+        num_zones,
+        matrix_data_fields(trips_df, model_settings, is_tap),
+        model_settings.get("HH_EXPANSION_WEIGHT_COL"),
+    )
+
+    orig_index, dest_index = np.divmod(aggregate_trips.index.values, num_zones)
+
+    write_matrices(
+        aggregate_trips,
+        zone_index if zone_labels is None else zone_labels,
+        orig_index,
+        dest_index,
+        model_settings,
+        is_tap,
+    )
 
 
 def annotate_trips(trips, network_los, model_settings):
@@ -11,8 +11,8 @@ from activitysim.abm.models.util.trip import cleanup_failed_trips, failed_trip_c
 from activitysim.core import chunk, config, inject, logit, pipeline, tracing
 from activitysim.core.util import reindex
 
-from .util.school_escort_tours_trips import split_out_school_escorting_trips
 from .util import probabilistic_scheduling as ps
+from .util.school_escort_tours_trips import split_out_school_escorting_trips
 
 logger = logging.getLogger(__name__)
 
@@ -351,6 +351,74 @@ def run_trip_scheduling(
     return choices
 
 
+def run_trip_scheduling_kernel(
+    trips_chunk,
+    tours,
+    probs_spec,
+    model_settings,
+    trace_hh_id,
+    trace_label,
+):
+    """
+    Schedule all trips in trips_chunk with the compiled leg scheduling kernel
+
+    Each outbound and inbound leg is scheduled in a single pass by
+    probabilistic_scheduling.schedule_legs, which resamples legs with a failed trip in the
+    kernel (up to MAX_ITERATIONS times) rather than by rerunning run_trip_scheduling.
+
+    Traced trips are traced from the kernel results (see schedule_legs), so tracing
+    does not change their choices.
+
+    Returns
+    -------
+    choices: pd.Series
+        depart choice for trips, indexed by trip_id (nan for trips that could not be scheduled)
+    """
+
+    set_tour_hour(trips_chunk, tours)
+    set_stop_num(trips_chunk)
+
+    depart_alt_base = model_settings.get("DEPART_ALT_BASE", 0)
+    probs_join_cols = model_settings.get(
+        "probs_join_cols", PROBS_JOIN_COLUMNS_DEPARTURE_BASED
+    )
+    max_iterations = model_settings.get("MAX_ITERATIONS", 1)
+    choose_most_initial = (
+        model_settings.get(FAILFIX, FAILFIX_DEFAULT) == FAILFIX_CHOOSE_MOST_INITIAL
+    )
+
+    result_list = []
+    for outbound, leg_name in [(True, "outbound"), (False, "inbound")]:
+
+        is_leg = trips_chunk.outbound == outbound
+        if not is_leg.any():
+            continue
+
+        choices, _ = ps.schedule_legs(
+            trips_chunk[is_leg],
+            outbound,
+            probs_spec,
+            probs_join_cols,
+            depart_alt_base,
+            max_iterations,
+            choose_most_initial,
+            trace_hh_id=trace_hh_id,
+            trace_label=tracing.extend_trace_label(trace_label, leg_name),
+        )
+        result_list.append(choices)
+
+        chunk.log_df(trace_label, f"result_list", result_list)
+
+        if outbound:
+            # departure time of last outbound trips must constrain
+            # departure times for initial inbound trips
+            update_tour_earliest(trips_chunk, choices)
+
+    choices = pd.concat(result_list)
+
+    return choices
+
+
 @inject.step()
 def trip_scheduling(trips, tours, chunk_size, trace_hh_id):
 
@@ -398,6 +466,12 @@ def trip_scheduling(trips, tours, chunk_size, trace_hh_id):
 
     Which option is applied is determined by the FAILFIX model setting
 
+    With the vectorized_scheduling model setting, departure based trips are scheduled by a
+    compiled kernel that schedules each leg in a single pass and resamples failed legs itself
+    (see run_trip_scheduling_kernel), rather than trip_num by trip_num and iteration by iteration.
+    Trips are still scheduled trip_num by trip_num in estimation mode, so estimation data is
+    written as before.
+
     """
     trace_label = "trip_scheduling"
     model_settings_file_name = "trip_scheduling.yaml"
@@ -456,6 +530,19 @@ def trip_scheduling(trips, tours, chunk_size, trace_hh_id):
     max_iterations = model_settings.get("MAX_ITERATIONS", 1)
     assert max_iterations > 0
 
+    vectorized_scheduling = model_settings.get("vectorized_scheduling", False)
+    if vectorized_scheduling and (
+        model_settings.get("scheduling_mode", DEPARTURE_MODE) != DEPARTURE_MODE
+    ):
+        logger.warning(
+            f"{trace_label} vectorized_scheduling is only supported for "
+            f"scheduling_mode '{DEPARTURE_MODE}', scheduling trips by trip_num"
+        )
+        vectorized_scheduling = False
+    if vectorized_scheduling and estimator:
+        logger.info(f"{trace_label} scheduling trips by trip_num in estimation mode")
+        vectorized_scheduling = False
+
     choices_list = []
 
     for (
@@ -466,6 +553,26 @@ def trip_scheduling(trips, tours, chunk_size, trace_hh_id):
         trips_df, chunk_size, trace_label, trace_label
     ):
 
+        if vectorized_scheduling:
+            with chunk.chunk_log(trace_label):
+                logger.info(
+                    "%s scheduling %s trips within chunk %s",
+                    trace_label,
+                    trips_chunk.shape[0],
+                    chunk_i,
+                )
+                choices = run_trip_scheduling_kernel(
+                    trips_chunk,
+                    tours,
+                    probs_spec,
+                    model_settings,
+                    trace_hh_id=trace_hh_id,
+                    trace_label=chunk_trace_label,
+                )
+                choices_list.append(choices)
+            i = max_iterations
+            continue
+
         i = 0
         while (i < max_iterations) and not trips_chunk.empty:
 
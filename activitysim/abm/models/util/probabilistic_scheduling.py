@@ -2,6 +2,7 @@
 # See full license in LICENSE.txt.
 import logging
 
+import numba
 import numpy as np
 import pandas as pd
 
@@ -339,3 +340,308 @@ def make_scheduling_choices(
         assert (choices <= choosers_df.latest[~failed]).all()
 
     return choices
+
+
+@numba.njit(nogil=True)
+def _choose_depart(probs, earliest, latest, depart_alt_base, first_trip_in_leg, rand):
+    """
+    Choose a depart period from a row of depart probabilities, as make_scheduling_choices does
+
+    The probabilities are normalized and zeroed outside the earliest-latest window (and, for the
+    first trip in leg, renormalized) by _preprocess_departure_probs, and the residual probability
+    is the probability of failing to schedule the trip.
+
+    Returns
+    -------
+    depart : int
+        chosen depart period, or -1 if the trip failed
+    """
+    num_cols = len(probs)
+
+    total = 0.0
+    for col in range(num_cols):
+        total += probs[col]
+
+    window_total = 0.0
+    for col in range(num_cols):
+        if earliest <= col + depart_alt_base <= latest:
+            window_total += probs[col] / total
+
+    scale = 1.0 / total
+    if first_trip_in_leg:
+        # probs should sum to 1 unless all zero
+        if window_total > 0:
+            scale = scale / window_total
+            window_total = 1.0
+        else:
+            scale = 0.0
+
+    fail_prob = 1.0 - min(max(window_total, 0.0), 1.0)
+
+    # same cumulative subtraction rule as choosing.choice_maker, with fail as the last alternative
+    z = rand
+    choice = -1
+    max_pr = 0.0
+    for col in range(num_cols):
+        pr = 0.0
+        if earliest <= col + depart_alt_base <= latest:
+            pr = probs[col] * scale
+        z = z - pr
+        if z <= 0:
+            return col + depart_alt_base
+        if pr > max_pr:
+            choice = col + depart_alt_base
+            max_pr = pr
+    z = z - fail_prob
+    if z <= 0 or fail_prob > max_pr:
+        return -1
+    return choice
+
+
+@numba.njit(nogil=True)
+def _schedule_legs(
+    leg_offsets,
+    pending,
+    schedule,
+    earliest,
+    latest,
+    prob_rows,
+    probs,
+    rands,
+    rand_rows,
+    depart_alt_base,
+    outbound,
+    final,
+    choose_most_initial,
+    choices,
+    failed,
+):
+    """
+    Schedule the trips of each pending tour leg, resampling legs in which a trip fails
+
+    The trips of leg i are leg_offsets[i] to leg_offsets[i + 1], in scheduling order (ascending
+    trip_num for outbound legs, descending for inbound legs). Each trip's depart constrains the
+    earliest (outbound) or latest (inbound) depart of the next trip in the leg. If a trip fails,
+    the whole leg is rescheduled with the next column of rands. If the leg still fails with the
+    last column of rands of the final batch, failed trips are given their most initial depart if
+    choose_most_initial, or else a depart of -1.
+
+    Parameters
+    ----------
+    leg_offsets : numpy.ndarray of int
+    pending : numpy.ndarray of bool
+        legs to schedule, set False as legs are scheduled
+    schedule : numpy.ndarray of bool
+        False for trips whose depart is already in choices (e.g. to/from tour origin)
+    earliest : numpy.ndarray of int
+    latest : numpy.ndarray of int
+    prob_rows : numpy.ndarray of int
+        row of probs for each trip
+    probs : numpy.ndarray of float
+        depart probabilities, one row per probs_spec row and one column per depart period
+    rands : numpy.ndarray of float
+        one row of random numbers per scheduled trip in a pending leg, one column per attempt
+    rand_rows : numpy.ndarray of int
+        row of rands for each trip
+    depart_alt_base : int
+    outbound : bool
+    final : bool
+        True if these are the last attempts
+    choose_most_initial : bool
+    choices : numpy.ndarray of int
+        depart choices, updated in place for legs that are scheduled
+    failed : numpy.ndarray of bool
+        set for trips that failed in the last attempt
+    """
+    num_attempts = rands.shape[1]
+    for leg in range(len(leg_offsets) - 1):
+        if not pending[leg]:
+            continue
+        for attempt in range(num_attempts):
+            last_attempt = final and attempt == num_attempts - 1
+            leg_failed = False
+            constraint = -1
+            first_trip_in_leg = True
+            for t in range(leg_offsets[leg], leg_offsets[leg + 1]):
+                if not schedule[t]:
+                    continue
+                trip_earliest = earliest[t]
+                trip_latest = latest[t]
+                if constraint >= 0:
+                    if outbound:
+                        trip_earliest = constraint
+                    else:
+                        trip_latest = constraint
+
+                depart = _choose_depart(
+                    probs[prob_rows[t]],
+                    trip_earliest,
+                    trip_latest,
+                    depart_alt_base,
+                    first_trip_in_leg,
+                    rands[rand_rows[t], attempt],
+                )
+                first_trip_in_leg = False
+
+                if depart < 0:
+                    leg_failed = True
+                    if not last_attempt:
+                        break
+                    failed[t] = True
+                    # the next trip gets this trip's constraint
+                    constraint = trip_earliest if outbound else trip_latest
+                    choices[t] = constraint if choose_most_initial else -1
+                else:
+                    choices[t] = depart
+                    constraint = depart
+
+            if not leg_failed or last_attempt:
+                pending[leg] = False
+                break
+
+
+def schedule_legs(
+    trips,
+    outbound,
+    probs_spec,
+    probs_join_cols,
+    depart_alt_base,
+    max_iterations,
+    choose_most_initial,
+    trace_hh_id,
+    trace_label,
+):
+    """
+    Schedule the departure based trips of all tour legs in one direction in a compiled kernel
+
+    This makes the same choices as make_scheduling_choices (called trip_num by trip_num by
+    trip_scheduling.schedule_trips_in_leg) would for each attempt, but each leg is scheduled
+    from start to end in a single pass, and legs with a failed trip are resampled in the kernel
+    up to max_iterations times. Random numbers are drawn for all pending trips in batches of
+    1, 2, 4... attempts.
+
+    The probs_spec rows and depart choices of traced trips are traced, as the kernel makes
+    its choices without building a table of chooser probs.
+
+    Parameters
+    ----------
+    trips : pandas.DataFrame
+        trips of one direction, with tour_hour, earliest and latest columns
+    outbound : bool
+    probs_spec : pandas.DataFrame
+    probs_join_cols : list of str
+    depart_alt_base : int
+    max_iterations : int
+    choose_most_initial : bool
+        give failed trips their most initial depart rather than leaving them unscheduled
+    trace_hh_id : int
+    trace_label : str
+
+    Returns
+    -------
+    choices : pandas.Series
+        depart choice for trips, indexed by trip_id (nan for trips that could not be scheduled)
+    failed : pandas.Series
+        bool, True for trips that could not be scheduled
+    """
+
+    assert (trips.outbound == outbound).all()
+
+    # trips of each leg, in scheduling order
+    trip_num = trips.trip_num.values
+    order = np.lexsort((trip_num if outbound else -trip_num, trips.tour_id.values))
+    trips = trips.iloc[order]
+
+    tour_ids = trips.tour_id.values
+    leg_offsets = np.concatenate(
+        [[0], np.flatnonzero(tour_ids[1:] != tour_ids[:-1]) + 1, [len(trips)]]
+    )
+
+    # trips to/from tour origin or atwork get tour_hour departure times
+    to_from_tour_orig = (
+        (trips.trip_num == 1) if outbound else (trips.trip_num == trips.trip_count)
+    )
+    schedule = ~(to_from_tour_orig | (trips.primary_purpose == "atwork")).values
+    choices = np.where(schedule, -1, trips.tour_hour.values).astype(np.int64)
+    failed = np.zeros(len(trips), dtype=bool)
+
+    # probs_spec row for each trip
+    probs_cols = [c for c in probs_spec.columns if c not in probs_join_cols]
+    probs = probs_spec[probs_cols].values.astype(np.float64)
+    spec_keys = probs_spec[probs_join_cols].assign(_prob_row=np.arange(len(probs_spec)))
+    if spec_keys.duplicated(subset=probs_join_cols).any():
+        raise RuntimeError(f"{trace_label} duplicate {probs_join_cols} in probs_spec")
+    prob_rows = (
+        trips[probs_join_cols]
+        .merge(spec_keys, on=probs_join_cols, how="left")["_prob_row"]
+        .values
+    )
+    missing = schedule & np.isnan(prob_rows)
+    if missing.any():
+        raise RuntimeError(
+            f"{trace_label} no probs_spec row for {missing.sum()} trips "
+            f"(join columns {probs_join_cols})"
+        )
+    prob_rows = np.nan_to_num(prob_rows, nan=-1).astype(np.int64)
+
+    pending = np.ones(len(leg_offsets) - 1, dtype=bool)
+    trip_legs = np.repeat(np.arange(len(pending)), np.diff(leg_offsets))
+    attempts = 0
+    num_attempts = 1
+    rng = pipeline.get_rn_generator()
+    while pending.any() and attempts < max_iterations:
+        num_attempts = min(num_attempts, max_iterations - attempts)
+        attempts += num_attempts
+
+        needs_rands = schedule & pending[trip_legs]
+        rand_rows = np.cumsum(needs_rands) - 1
+        rands = rng.random_for_df(trips[needs_rands], n=num_attempts)
+        rands = np.asanyarray(rands).reshape(-1, num_attempts)
+
+        _schedule_legs(
+            leg_offsets,
+            pending,
+            schedule,
+            trips.earliest.values.astype(np.int64),
+            trips.latest.values.astype(np.int64),
+            prob_rows,
+            probs,
+            rands,
+            rand_rows,
+            depart_alt_base,
+            outbound,
+            attempts == max_iterations,
+            choose_most_initial,
+            choices,
+            failed,
+        )
+
+        logger.debug(
+            f"{trace_label} {pending.sum()} of {len(pending)} legs pending after "
+            f"{attempts} attempts"
+        )
+        num_attempts *= 2
+
+    choices = pd.Series(choices, index=trips.index).where(lambda c: c >= 0)
+    failed = pd.Series(failed, index=trips.index)
+
+    if trace_hh_id and tracing.has_trace_targets(trips):
+        trip_probs = pd.DataFrame(
+            probs[prob_rows[schedule]], index=trips.index[schedule], columns=probs_cols
+        )
+        tracing.trace_df(trip_probs, "%s.probs" % trace_label)
+        tracing.trace_df(choices, "%s.choices" % trace_label, columns=[None, "depart"])
+
+    if failed.any():
+        logger.warning(
+            f"{trace_label} {failed.sum()} trips failed after {max_iterations} attempts"
+        )
+        _report_bad_choices(
+            bad_row_map=failed,
+            df=trips,
+            filename="failed_choosers",
+            trace_label=trace_label,
+            trace_choosers=None,
+        )
+
+    return choices, failed
@@ -0,0 +1,169 @@
+# ActivitySim
+# See full license in LICENSE.txt.
+
+import numpy as np
+import numpy.testing as npt
+import pandas as pd
+import pandas.testing as pdt
+import pytest
+
+from activitysim.core import inject, pipeline
+
+from .. import probabilistic_scheduling as ps
+
+TRACE_HH_ID = 2
+TRACE_TRIP_IDS = [103, 104, 105]
+
+
+def schedule(rands, last_prob_row=1, final=True, choose_most_initial=True):
+
+    # two legs of three trips, the first trip of each leg is not scheduled
+    leg_offsets = np.array([0, 3, 6])
+    schedule = np.array([False, True, True] * 2)
+    earliest = np.array([1, 1, 1, 2, 2, 2])
+    latest = np.array([4, 4, 4, 3, 3, 3])
+
+    # depart periods 1 to 4 (depart_alt_base 1)
+    probs = np.array(
+        [
+            [0.25, 0.25, 0.25, 0.25],
+            [0.0, 0.0, 0.0, 1.0],
+        ]
+    )
+    prob_rows = np.array([0, 0, 0, 0, 0, last_prob_row])
+
+    pending = np.ones(2, dtype=bool)
+    choices = np.where(schedule, -1, earliest)
+    failed = np.zeros(6, dtype=bool)
+    rand_rows = np.cumsum(schedule) - 1
+
+    ps._schedule_legs(
+        leg_offsets,
+        pending,
+        schedule,
+        earliest,
+        latest,
+        prob_rows,
+        probs,
+        rands,
+        rand_rows,
+        1,
+        True,
+        final,
+        choose_most_initial,
+        choices,
+        failed,
+    )
+    return choices, failed, pending
+
+
+def test_schedule_legs():
+
+    # each depart constrains the earliest depart of the next trip in the leg
+    # (the first trip in leg chooses from probs renormalized to its window)
+    rands = np.array([[0.6], [0.1], [0.9], [0.2]])
+    choices, failed, pending = schedule(rands, last_prob_row=0)
+    npt.assert_array_equal(choices, [1, 3, 3, 2, 3, 3])
+    assert not failed.any() and not pending.any()
+
+    # the second leg can only depart in period 4, which is outside its window
+    rands = np.array([[0.6], [0.1], [0.9], [0.5]])
+    choices, failed, pending = schedule(rands, final=False)
+    npt.assert_array_equal(pending, [False, True])
+
+    # failed legs are resampled and, in the final attempt, get their most initial depart
+    rands = np.array([[0.6, 0.6], [0.1, 0.1], [0.9, 0.9], [0.5, 0.5]])
+    choices, failed, pending = schedule(rands)
+    npt.assert_array_equal(choices, [1, 3, 3, 2, 3, 3])
+    npt.assert_array_equal(failed, [False] * 5 + [True])
+
+    choices, failed, pending = schedule(rands, choose_most_initial=False)
+    npt.assert_array_equal(choices, [1, 3, 3, 2, 3, -1])
+
+
+@pytest.fixture
+def trace_setup(tmp_path):
+
+    inject.add_injectable("output_dir", str(tmp_path))
+    inject.add_injectable(
+        "traceable_table_indexes", {"household_id": "households", "trip_id": "trips"}
+    )
+    inject.add_injectable(
+        "traceable_table_ids", {"households": [TRACE_HH_ID], "trips": TRACE_TRIP_IDS}
+    )
+
+    yield tmp_path
+
+    inject.remove_injectable("traceable_table_indexes")
+    inject.remove_injectable("traceable_table_ids")
+    inject.clear_cache()
+    inject.reinject_decorated_tables()
+
+
+def schedule_outbound_legs(trips, probs_spec, trace_hh_id):
+
+    rng = pipeline.get_rn_generator()
+    rng.add_channel("trips", trips)
+    rng.begin_step("trip_scheduling")
+    try:
+        choices, failed = ps.schedule_legs(
+            trips,
+            True,
+            probs_spec,
+            ["primary_purpose"],
+            1,
+            3,
+            True,
+            trace_hh_id=trace_hh_id,
+            trace_label="trip_scheduling",
+        )
+    finally:
+        rng.end_step("trip_scheduling")
+        rng.drop_channel("trips")
+    return choices, failed
+
+
+def test_schedule_legs_tracing(trace_setup):
+
+    # an outbound leg of three trips for each of four households
+    trips = pd.DataFrame(
+        {
+            "household_id": np.repeat([1, 2, 3, 4], 3),
+            "tour_id": np.repeat([10, 20, 30, 40], 3),
+            "trip_num": np.tile([1, 2, 3], 4),
+            "trip_count": 3,
+            "outbound": True,
+            "primary_purpose": "work",
+            "tour_hour": 1,
+            "earliest": 1,
+            "latest": 4,
+        },
+        index=pd.Index(np.arange(100, 112), name="trip_id"),
+    )
+    probs_spec = pd.DataFrame(
+        {"primary_purpose": ["work"], "1": 0.4, "2": 0.3, "3": 0.2, "4": 0.1}
+    )
+
+    choices, failed = schedule_outbound_legs(trips, probs_spec, trace_hh_id=None)
+    assert not list(trace_setup.glob("trace/*"))
+
+    # tracing does not change the choices
+    traced_choices, traced_failed = schedule_outbound_legs(
+        trips, probs_spec, trace_hh_id=TRACE_HH_ID
+    )
+    pdt.assert_series_equal(traced_choices, choices)
+    pdt.assert_series_equal(traced_failed, failed)
+
+    # probs and depart choices of the traced household's trips are traced
+    trace_dir = trace_setup / "trace" / "trip_scheduling"
+    (choices_file,) = trace_dir.glob("choices-*.csv")
+    (probs_file,) = trace_dir.glob("probs-*.csv")
+
+    traced_choices = pd.read_csv(choices_file, index_col="trip_id").depart
+    pdt.assert_series_equal(
+        traced_choices, choices.loc[TRACE_TRIP_IDS], check_names=False
+    )
+
+    # trace files are transposed, one column per scheduled trip
+    traced_probs = pd.read_csv(probs_file, index_col=0)
+    assert traced_probs.loc["trip_id"].astype(int).tolist() == TRACE_TRIP_IDS[1:]
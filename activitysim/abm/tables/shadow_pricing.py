@@ -3,7 +3,7 @@
 import ctypes
 import logging
 import multiprocessing
-import time
+import os
 from collections import OrderedDict
 
 import numpy as np
@@ -50,11 +50,123 @@ we use the first two rows of the final column in numpy-wrapped shared data as 'r
 ShadowPriceCalculator.synchronize_modeled_size coordinates access to the global aggregate zone counts
 (local_modeled_size summed across all sub-processes) using these two semaphores
 (which are really only tuples of indexes of locations in the shared data array.
+
+The lock bundled with the shared data buffer is a multiprocessing.Condition, so processes waiting
+for a tally to reach its target sleep on the condition and are woken (by notify_all) as soon as
+the last process checks in or out, rather than polling the tallys.
 """
 TALLY_CHECKIN = (0, -1)
 TALLY_CHECKOUT = (1, -1)
 TALLY_PENDING_PERSONS = (2, -1)
 
+
+def wait_for_tally(shared_data, condition, tally, target):
+    """
+    Block until shared_data[tally] == target
+
+    Caller must hold condition, which is released while waiting and reacquired before returning.
+    Processes that change a tally call condition.notify_all(), so waiters are woken as soon as
+    the tally changes rather than by polling.
+
+    Parameters
+    ----------
+    shared_data : numpy array wrapping multiprocessing.RawArray
+    condition : multiprocessing.Condition
+        lock bundled with the shared data buffer
+    tally : tuple
+        index of tally in shared_data (e.g. TALLY_CHECKIN)
+    target : int
+    """
+    condition.wait_for(lambda: shared_data[tally] == target)
+
+
+def increment_tally(shared_data, condition, tally):
+    """
+    Increment shared_data[tally] and wake any processes waiting on condition
+
+    Caller must hold condition.
+    """
+    shared_data[tally] += 1
+    condition.notify_all()
+
+
+ACCELERATION_METHODS = ["aitken", "anderson"]
+
+
+def aitken_acceleration(x_history, g_history):
+    """
+    Componentwise Aitken (secant) extrapolation of a fixed point iteration x = G(x)
+
+    Uses the last two iterates x and their (plain) updates g = G(x). Components whose residuals
+    have not changed (or would be extrapolated more than tenfold) keep the plain update.
+
+    Parameters
+    ----------
+    x_history : list of numpy.ndarray
+        iterates x, oldest first
+    g_history : list of numpy.ndarray
+        plain updates G(x) for each iterate in x_history
+
+    Returns
+    -------
+    numpy.ndarray
+        accelerated next iterate
+    """
+    g = g_history[-1]
+    if len(x_history) < 2:
+        return g
+
+    r0 = g_history[-2] - x_history[-2]
+    r1 = g - x_history[-1]
+    dr = r1 - r0
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        theta = r1 / dr
+    # noisy (simulated) residuals can make for wild extrapolations, so don't
+    ok = np.isfinite(theta) & (np.abs(theta) <= 10)
+    x = np.where(ok, g - theta * (g - g_history[-2]), g)
+
+    return x
+
+
+def anderson_acceleration(x_history, g_history):
+    """
+    Anderson (type II) extrapolation of a fixed point iteration x = G(x)
+
+    Mixes the plain updates g = G(x) of the iterates in history, with weights chosen to minimize
+    the (least squares) norm of the mixed residuals G(x) - x. Memory is len(x_history) - 1.
+
+    Parameters
+    ----------
+    x_history : list of numpy.ndarray
+        iterates x, oldest first
+    g_history : list of numpy.ndarray
+        plain updates G(x) for each iterate in x_history
+
+    Returns
+    -------
+    numpy.ndarray
+        accelerated next iterate
+    """
+    g = g_history[-1]
+    if len(x_history) < 2:
+        return g
+
+    residuals = np.column_stack([gi - xi for xi, gi in zip(x_history, g_history)])
+    updates = np.column_stack(g_history)
+
+    delta_residuals = np.diff(residuals, axis=1)
+    delta_updates = np.diff(updates, axis=1)
+
+    gamma, *_ = np.linalg.lstsq(delta_residuals, residuals[:, -1], rcond=None)
+    x = g - delta_updates @ gamma
+
+    if not np.isfinite(x).all():
+        return g
+
+    return x
+
+
 default_segment_to_name_dict = {
     # model_selector : persons_segment_name
     "school": "school_segment",
@@ -93,10 +205,11 @@ class ShadowPriceCalculator(object):
         Presence of shared_data is used as a flag for multiprocessing
         If we are multiprocessing, shared_data should be a multiprocessing.RawArray buffer
         to aggregate modeled_size across all sub-processes, and shared_data_lock should be
-        a multiprocessing.Lock object to coordinate access to that buffer.
+        a multiprocessing.Condition object to coordinate access to that buffer.
 
         Optionally load saved shadow_prices from data_dir if config setting use_shadow_pricing
-        and shadow_setting LOAD_SAVED_SHADOW_PRICES are both True
+        and shadow_setting LOAD_SAVED_SHADOW_PRICES are both True, or else (if shadow_setting
+        WARM_START_KEY is set) the shadow_prices of a prior run with the same key from cache_dir
 
         Parameters
         ----------
@@ -197,12 +310,58 @@ class ShadowPriceCalculator(object):
             # ignore convergence criteria for zones smaller than target_threshold
             self.target_threshold = self.shadow_settings["TARGET_THRESHOLD"]
 
+            # optional acceleration of ctramp and daysim fixed point iterations
+            self.acceleration = self.shadow_settings.get("SHADOW_PRICE_ACCELERATION")
+            self.adaptive_damping = self.shadow_settings.get("ADAPTIVE_DAMPING", False)
+            self.warm_start_key = self.shadow_settings.get("WARM_START_KEY")
+            # only resample choosers whose sample includes a repriced zone in later iterations
+            self.incremental = self.shadow_settings.get(
+                "INCREMENTAL_RESIMULATION", False
+            )
+            self.incremental_utility_tolerance = self.shadow_settings.get(
+                "INCREMENTAL_UTILITY_TOLERANCE", 0.01
+            )
+            if self.shadow_price_method == "simulation" and (
+                self.acceleration
+                or self.adaptive_damping
+                or self.warm_start_key
+                or self.incremental
+            ):
+                # simulation method already only resimulates sampled_persons
+                logger.warning(
+                    "SHADOW_PRICE_ACCELERATION, ADAPTIVE_DAMPING, WARM_START_KEY and "
+                    "INCREMENTAL_RESIMULATION are ignored by the 'simulation' shadow price method"
+                )
+                self.acceleration = None
+                self.adaptive_damping = False
+                self.warm_start_key = None
+                self.incremental = False
+            assert (
+                self.acceleration is None or self.acceleration in ACCELERATION_METHODS
+            ), f"unknown SHADOW_PRICE_ACCELERATION {self.acceleration}"
+
+            if self.shadow_price_method == "ctramp":
+                self.damping_factor = self.shadow_settings["DAMPING_FACTOR"]
+                assert 0 < self.damping_factor <= 1
+            else:
+                self.damping_factor = 1.0
+
+            # fit residuals (set by check_fit) and iterates (set by update_shadow_prices)
+            self.fit_residuals = []
+            self.x_history = []
+            self.g_history = []
+
             if self.shadow_settings["LOAD_SAVED_SHADOW_PRICES"]:
                 # read_saved_shadow_prices logs error and returns None if file not found
                 self.shadow_prices = self.read_saved_shadow_prices(model_settings)
 
             if self.shadow_prices is None:
                 self.max_iterations = self.shadow_settings.get("MAX_ITERATIONS", 5)
+
+                # warm start prices from a prior run may not be converged for this scenario,
+                # so we still allow the cold start MAX_ITERATIONS
+                if self.warm_start_key:
+                    self.shadow_prices = self.read_warm_start_shadow_prices()
             else:
                 self.max_iterations = self.shadow_settings.get(
                     "MAX_ITERATIONS_SAVED", 1
@@ -304,6 +463,60 @@ class ShadowPriceCalculator(object):
 
         return shadow_prices
 
+    def warm_start_file_path(self):
+        """
+        path of cache_dir file with shadow_prices for model_selector saved under WARM_START_KEY
+        """
+        file_name = "shadow_prices_%s_%s.csv" % (
+            self.warm_start_key,
+            self.model_selector,
+        )
+        return os.path.join(config.get_cache_dir(), file_name)
+
+    def read_warm_start_shadow_prices(self):
+        """
+        Read shadow_prices saved in cache_dir by a prior run with the same WARM_START_KEY
+        returns None if there is no such file or its zones and segments don't match desired_size
+
+        Returns
+        -------
+        shadow_prices : pandas.DataFrame or None
+        """
+
+        file_path = self.warm_start_file_path()
+        if not os.path.isfile(file_path):
+            logger.info("no warm start shadow_prices file %s" % file_path)
+            return None
+
+        shadow_prices = pd.read_csv(file_path, index_col=0)
+        if not (
+            shadow_prices.index.equals(self.desired_size.index)
+            and shadow_prices.columns.equals(self.desired_size.columns)
+        ):
+            logger.warning(
+                "ignoring warm start shadow_prices file %s with different zones or segments"
+                % file_path
+            )
+            return None
+
+        self.saved_shadow_price_file_path = file_path  # informational
+        logger.info("loaded warm start shadow_prices from %s" % file_path)
+
+        return shadow_prices
+
+    def write_warm_start_shadow_prices(self):
+        """
+        Save current shadow_prices in cache_dir to warm start the next run with the same
+        WARM_START_KEY (only one sub-process should call this)
+        """
+
+        if not (self.use_shadow_pricing and self.warm_start_key):
+            return
+
+        file_path = self.warm_start_file_path()
+        self.shadow_prices.to_csv(file_path)
+        logger.info("wrote warm start shadow_prices to %s" % file_path)
+
     def synchronize_modeled_size(self, local_modeled_size):
         """
         We have to wait until all processes have computed choices and aggregated them by segment
@@ -311,6 +524,7 @@ class ShadowPriceCalculator(object):
         zone counts are in shared data, we have to coordinate access to the data structure across
         sub-processes.
         Note that all access to self.shared_data has to be protected by acquiring shared_data_lock
+        (a multiprocessing.Condition, so waiting processes are woken as soon as a tally changes)
         ShadowPriceCalculator.synchronize_modeled_size coordinates access to the global aggregate
         zone counts (local_modeled_size summed across all sub-processes).
         * All processes wait (in case we are iterating) until any stragglers from the previous
@@ -334,46 +548,47 @@ class ShadowPriceCalculator(object):
         assert self.shared_data is not None
         assert self.num_processes > 1
 
-        def get_tally(t):
-            with self.shared_data_lock:
-                return self.shared_data[t]
-
-        def wait(tally, target):
-            while get_tally(tally) != target:
-                time.sleep(1)
-
         # - nobody checks in until checkout clears
-        wait(TALLY_CHECKOUT, 0)
-
-        # - add local_modeled_size data, increment TALLY_CHECKIN
         with self.shared_data_lock:
+            wait_for_tally(self.shared_data, self.shared_data_lock, TALLY_CHECKOUT, 0)
+
+            # - add local_modeled_size data, increment TALLY_CHECKIN
             first_in = self.shared_data[TALLY_CHECKIN] == 0
             # add local data from df to shared data buffer
             # final column is used for tallys, hence the negative index
             # Ellipsis expands : to fill available dims so [..., 0:-1] is the whole array except for the tallys
             self.shared_data[..., 0:-1] += local_modeled_size.values
-            self.shared_data[TALLY_CHECKIN] += 1
             if len(self.sampled_persons) > 0:
                 self.shared_data[TALLY_PENDING_PERSONS] += 1
+            increment_tally(self.shared_data, self.shared_data_lock, TALLY_CHECKIN)
+
+            # - wait until everybody else has checked in
+            wait_for_tally(
+                self.shared_data,
+                self.shared_data_lock,
+                TALLY_CHECKIN,
+                self.num_processes,
+            )
 
-        # - wait until everybody else has checked in
-        wait(TALLY_CHECKIN, self.num_processes)
-
-        # - copy shared data, increment TALLY_CHECKOUT
-        with self.shared_data_lock:
+            # - copy shared data, increment TALLY_CHECKOUT
             logger.info("copy shared_data")
             # numpy array with sum of local_modeled_size.values from all processes
             global_modeled_size_array = self.shared_data[..., 0:-1].copy()
             self.global_pending_persons = self.shared_data[TALLY_PENDING_PERSONS]
-            self.shared_data[TALLY_CHECKOUT] += 1
-
-        # - first in waits until all other processes have checked out, and cleans tub
-        if first_in:
-            wait(TALLY_CHECKOUT, self.num_processes)
-            with self.shared_data_lock:
+            increment_tally(self.shared_data, self.shared_data_lock, TALLY_CHECKOUT)
+
+            # - first in waits until all other processes have checked out, and cleans tub
+            if first_in:
+                wait_for_tally(
+                    self.shared_data,
+                    self.shared_data_lock,
+                    TALLY_CHECKOUT,
+                    self.num_processes,
+                )
                 # zero shared_data, clear TALLY_CHECKIN, and TALLY_CHECKOUT semaphores
                 self.shared_data[:] = 0
-            logger.info("first_in clearing shared_data")
+                self.shared_data_lock.notify_all()
+                logger.info("first_in clearing shared_data")
 
         # convert summed numpy array data to conform to original dataframe
         global_modeled_size_df = pd.DataFrame(
@@ -406,45 +621,37 @@ class ShadowPriceCalculator(object):
         assert self.shared_data_choice is not None
         assert self.num_processes > 1
 
-        def get_tally(t):
-            with self.shared_data_choice_lock:
-                return self.shared_data_choice[t]
-
-        def wait(tally, target):
-            while get_tally(tally) != target:
-                time.sleep(1)
+        data = self.shared_data_choice
+        condition = self.shared_data_choice_lock
 
         # - nobody checks in until checkout clears
-        wait(TALLY_CHECKOUT, 0)
+        with condition:
+            wait_for_tally(data, condition, TALLY_CHECKOUT, 0)
 
-        # - add local_modeled_size data, increment TALLY_CHECKIN
-        with self.shared_data_choice_lock:
-            first_in = self.shared_data_choice[TALLY_CHECKIN] == 0
+            # - add local_modeled_size data, increment TALLY_CHECKIN
+            first_in = data[TALLY_CHECKIN] == 0
             # add local data from df to shared data buffer
             # final column is used for tallys, hence the negative index
             # Ellipsis expands : to fill available dims so [..., 0:-1] is the whole array except for the tallys
-            self.shared_data_choice[..., 0:-1] += local_modeled_size.values.astype(
-                np.int64
-            )
-            self.shared_data_choice[TALLY_CHECKIN] += 1
+            data[..., 0:-1] += local_modeled_size.values.astype(np.int64)
+            increment_tally(data, condition, TALLY_CHECKIN)
 
-        # - wait until everybody else has checked in
-        wait(TALLY_CHECKIN, self.num_processes)
+            # - wait until everybody else has checked in
+            wait_for_tally(data, condition, TALLY_CHECKIN, self.num_processes)
 
-        # - copy shared data, increment TALLY_CHECKIN
-        with self.shared_data_choice_lock:
+            # - copy shared data, increment TALLY_CHECKOUT
             logger.info("copy shared_data")
             # numpy array with sum of local_modeled_size.values from all processes
-            global_modeled_size_array = self.shared_data_choice[..., 0:-1].copy()
-            self.shared_data_choice[TALLY_CHECKOUT] += 1
+            global_modeled_size_array = data[..., 0:-1].copy()
+            increment_tally(data, condition, TALLY_CHECKOUT)
 
-        # - first in waits until all other processes have checked out, and cleans tub
-        if first_in:
-            wait(TALLY_CHECKOUT, self.num_processes)
-            with self.shared_data_choice_lock:
+            # - first in waits until all other processes have checked out, and cleans tub
+            if first_in:
+                wait_for_tally(data, condition, TALLY_CHECKOUT, self.num_processes)
                 # zero shared_data, clear TALLY_CHECKIN, and TALLY_CHECKOUT semaphores
-                self.shared_data_choice[:] = 0
-            logger.info("first_in clearing shared_data")
+                data[:] = 0
+                condition.notify_all()
+                logger.info("first_in clearing shared_data")
 
         # convert summed numpy array data to conform to original dataframe
         global_modeled_size_df = pd.DataFrame(
@@ -564,6 +771,9 @@ class ShadowPriceCalculator(object):
             self.max_abs_diff["iter%s" % iteration] = abs_diff.max()
             self.max_rel_diff["iter%s" % iteration] = self.rel_diff.max()
 
+            # total misallocation, used by update_shadow_prices for ADAPTIVE_DAMPING
+            self.fit_residuals.append(abs_diff.values.sum())
+
             total_fails = (self.rel_diff > 0).values.sum()
 
             # FIXME - should not count zones where desired_size < threshold? (could calc in init)
@@ -687,8 +897,7 @@ class ShadowPriceCalculator(object):
             // else
             //    shadowPrice *= scaledSize;
             """
-            damping_factor = self.shadow_settings["DAMPING_FACTOR"]
-            assert 0 < damping_factor <= 1
+            damping_factor = self.update_damping_factor()
 
             new_scale_factor = self.desired_size / self.modeled_size
             damped_scale_factor = 1 + (new_scale_factor - 1) * damping_factor
@@ -699,7 +908,7 @@ class ShadowPriceCalculator(object):
             new_shadow_prices.where(
                 self.modeled_size > 0, self.shadow_prices, inplace=True
             )
-            self.shadow_prices = new_shadow_prices
+            self.shadow_prices = self.accelerate(new_shadow_prices)
 
         elif shadow_price_method == "daysim":
             # - Daysim
@@ -746,8 +955,10 @@ class ShadowPriceCalculator(object):
                 np.maximum(target, 0.01) / np.maximum(self.modeled_size, 1)
             )
 
-            new_shadow_prices = self.shadow_prices + adjustment
-            self.shadow_prices = new_shadow_prices
+            new_shadow_prices = (
+                self.shadow_prices + adjustment * self.update_damping_factor()
+            )
+            self.shadow_prices = self.accelerate(new_shadow_prices)
 
         elif shadow_price_method == "simulation":
             # - NewMethod
@@ -850,6 +1061,84 @@ class ShadowPriceCalculator(object):
         else:
             raise RuntimeError("unknown SHADOW_PRICE_METHOD %s" % shadow_price_method)
 
+    def update_damping_factor(self):
+        """
+        With ADAPTIVE_DAMPING, take bolder steps while the check_fit residual is falling
+        and back off when it rises (e.g. because we overshot). Otherwise damping is fixed
+        (DAMPING_FACTOR for ctramp, and none for daysim).
+
+        Returns
+        -------
+        damping_factor : float
+        """
+
+        if self.adaptive_damping and len(self.fit_residuals) > 1:
+            min_damping_factor = self.shadow_settings.get("MIN_DAMPING_FACTOR", 0.1)
+            if self.fit_residuals[-1] < self.fit_residuals[-2]:
+                self.damping_factor = min(1.0, self.damping_factor * 1.5)
+            else:
+                self.damping_factor = max(min_damping_factor, self.damping_factor * 0.5)
+            logger.info(
+                "%s shadow price damping_factor %s"
+                % (self.model_selector, self.damping_factor)
+            )
+
+        return self.damping_factor
+
+    def accelerate(self, new_shadow_prices):
+        """
+        Apply SHADOW_PRICE_ACCELERATION to the plain (ctramp or daysim) update of shadow_prices
+
+        Shadow pricing is a fixed point iteration, so rather than simply taking new_shadow_prices,
+        we extrapolate from the history of prior iterates and their updates. ctramp shadow prices
+        are multiplicative, so we extrapolate their logs.
+
+        Parameters
+        ----------
+        new_shadow_prices : pandas.DataFrame
+            plain update of self.shadow_prices
+
+        Returns
+        -------
+        shadow_prices : pandas.DataFrame
+        """
+
+        if self.acceleration is None:
+            return new_shadow_prices
+
+        x = self.shadow_prices.values.astype(np.float64).ravel()
+        g = new_shadow_prices.values.astype(np.float64).ravel()
+
+        log_space = self.shadow_price_method == "ctramp"
+        if log_space:
+            # zones with no desired_size have (and keep) zero shadow price
+            x = np.log(np.maximum(x, 1e-10))
+            g = np.log(np.maximum(g, 1e-10))
+
+        memory = (
+            self.shadow_settings.get("ANDERSON_MEMORY", 3)
+            if self.acceleration == "anderson"
+            else 1
+        )
+        self.x_history = (self.x_history + [x])[-(memory + 1) :]
+        self.g_history = (self.g_history + [g])[-(memory + 1) :]
+
+        if self.acceleration == "anderson":
+            x = anderson_acceleration(self.x_history, self.g_history)
+        else:
+            x = aitken_acceleration(self.x_history, self.g_history)
+
+        if log_space:
+            x = np.where(new_shadow_prices.values.ravel() > 0, np.exp(x), 0)
+
+        shadow_prices = pd.DataFrame(
+            data=x.reshape(new_shadow_prices.shape),
+            index=new_shadow_prices.index,
+            columns=new_shadow_prices.columns,
+        )
+
+        return shadow_prices
+
     def dest_size_terms(self, segment):
 
         assert segment in self.segment_ids
@@ -949,11 +1238,11 @@ def buffers_for_shadow_pricing(shadow_pricing_info):
     Allocates one buffer per model_selector.
     Buffer datatype and shape specified by shadow_pricing_info
 
-    buffers are multiprocessing.Array (RawArray protected by a multiprocessing.Lock wrapper)
+    buffers are multiprocessing.Array (RawArray protected by a multiprocessing.Condition wrapper)
     We don't actually use the wrapped version as it slows access down and doesn't provide
     protection for numpy-wrapped arrays, but it does provide a convenient way to bundle
-    RawArray and an associated lock. (ShadowPriceCalculator uses the lock to coordinate access to
-    the numpy-wrapped RawArray.)
+    RawArray and an associated lock. (ShadowPriceCalculator uses the condition to coordinate
+    access to the numpy-wrapped RawArray and to wait for the tallys.)
 
     Parameters
     ----------
@@ -987,7 +1276,11 @@ def buffers_for_shadow_pricing(shadow_pricing_info):
                 "buffer_for_shadow_pricing unrecognized dtype %s" % dtype
             )
 
-        shared_data_buffer = multiprocessing.Array(typecode, buffer_size)
+        # bundle a Condition (rather than the default RLock) so ShadowPriceCalculator
+        # can wait on the tallys without polling
+        shared_data_buffer = multiprocessing.Array(
+            typecode, buffer_size, lock=multiprocessing.Condition()
+        )
 
         logger.info("buffer_for_shadow_pricing added block %s" % block_key)
 
@@ -1037,7 +1330,9 @@ def buffers_for_shadow_pricing_choice(shadow_pricing_choice_info):
                 "buffer_for_shadow_pricing unrecognized dtype %s" % dtype
             )
 
-        shared_data_buffer = multiprocessing.Array(typecode, buffer_size)
+        shared_data_buffer = multiprocessing.Array(
+            typecode, buffer_size, lock=multiprocessing.Condition()
+        )
 
         logger.info("buffer_for_shadow_pricing_choice added block %s" % block_key)
 
@@ -1067,7 +1362,7 @@ def shadow_price_data_from_buffers_choice(
     Parameters
     ----------
     data_buffers : dict of {<model_selector> : <multiprocessing.Array>}
-        multiprocessing.Array is simply a convenient way to bundle Array and Lock
+        multiprocessing.Array is simply a convenient way to bundle Array and Condition
         we extract the lock and wrap the RawArray in a numpy array for convenience in indexing
         The shared data buffer has shape (<num_zones, <num_segments> + 1)
         extra column is for reverse semaphores with TALLY_CHECKIN and TALLY_CHECKOUT
@@ -1084,7 +1379,7 @@ def shadow_price_data_from_buffers_choice(
     -------
     shared_data, shared_data_lock
         shared_data : multiprocessing.Array or None (if single process)
-        shared_data_lock : numpy array wrapping multiprocessing.RawArray or None (if single process)
+        shared_data_lock : multiprocessing.Condition or None (if single process)
     """
 
     assert type(data_buffers) == dict
@@ -1117,7 +1412,7 @@ def shadow_price_data_from_buffers(data_buffers, shadow_pricing_info, model_sele
     Parameters
     ----------
     data_buffers : dict of {<model_selector> : <multiprocessing.Array>}
-        multiprocessing.Array is simply a convenient way to bundle Array and Lock
+        multiprocessing.Array is simply a convenient way to bundle Array and Condition
         we extract the lock and wrap the RawArray in a numpy array for convenience in indexing
         The shared data buffer has shape (<num_zones, <num_segments> + 1)
         extra column is for reverse semaphores with TALLY_CHECKIN and TALLY_CHECKOUT
@@ -1134,7 +1429,7 @@ def shadow_price_data_from_buffers(data_buffers, shadow_pricing_info, model_sele
     -------
     shared_data, shared_data_lock
         shared_data : multiprocessing.Array or None (if single process)
-        shared_data_lock : numpy array wrapping multiprocessing.RawArray or None (if single process)
+        shared_data_lock : multiprocessing.Condition or None (if single process)
     """
 
     assert type(data_buffers) == dict
@@ -1176,9 +1471,18 @@ def load_shadow_price_calculator(model_settings):
 
     model_selector = model_settings["MODEL_SELECTOR"]
 
+    # multiprocess work units don't run in lockstep, so can't synchronize across sub-processes
+    work_unit = inject.get_injectable("work_unit", None)
+    if work_unit is not None:
+        if config.setting("use_shadow_pricing"):
+            raise RuntimeError(
+                f"{model_selector} shadow pricing can't be run in a multiprocess step with work_units"
+            )
+        num_processes = 1
+
     # - get shared_data from data_buffers (if multiprocessing)
     data_buffers = inject.get_injectable("data_buffers", None)
-    if data_buffers is not None:
+    if data_buffers is not None and work_unit is None:
         logger.info("Using existing data_buffers for shadow_price")
 
         # - shadow_pricing_info
@@ -0,0 +1,185 @@
+import numpy as np
+import pandas as pd
+import pandas.testing as pdt
+import pytest
+
+from activitysim.abm.models import location_choice
+
+ZONES = np.arange(1, 9)
+ALT_DEST_COL_NAME = "alt_dest"
+MODEL_SETTINGS = {"ALT_DEST_COL_NAME": ALT_DEST_COL_NAME}
+SAMPLE_SIZE = 3
+
+
+@pytest.fixture
+def choosers():
+    return pd.DataFrame(
+        {"home_zone_id": np.resize(ZONES, 20)},
+        index=pd.Index(np.arange(100, 120), name="person_id"),
+    )
+
+
+@pytest.fixture
+def location_sampler(monkeypatch):
+    """
+    deterministic stand ins for run_location_sample and run_location_logsums,
+    which record the choosers they sample and the (chooser, zone) pairs they compute logsums for
+    """
+
+    weights = np.random.default_rng(0).random((1000, len(ZONES) + 1))
+    calls = {"sampled": [], "logsums": []}
+
+    def run_location_sample(
+        segment_name, persons_merged, network_los, dest_size_terms, *args, **kwargs
+    ):
+        calls["sampled"].append(persons_merged.index.values)
+
+        # sample the zones with the highest shadow priced size of each chooser
+        size = (
+            dest_size_terms.size_term
+            * dest_size_terms.shadow_price_size_term_adjustment
+            * np.exp(dest_size_terms.shadow_price_utility_adjustment)
+        )
+        score = weights[persons_merged.index.values][:, size.index] * size.values
+        order = np.argsort(-score, axis=1)[:, :SAMPLE_SIZE]
+        return pd.DataFrame(
+            {
+                ALT_DEST_COL_NAME: size.index.values[order].ravel(),
+                "prob": np.take_along_axis(score, order, axis=1).ravel(),
+                "pick_count": 1,
+            },
+            index=persons_merged.index.repeat(SAMPLE_SIZE),
+        )
+
+    def run_location_logsums(
+        segment_name,
+        persons_merged_df,
+        network_los,
+        location_sample_df,
+        *args,
+        **kwargs
+    ):
+        calls["logsums"].append(
+            list(zip(location_sample_df.index, location_sample_df[ALT_DEST_COL_NAME]))
+        )
+        location_sample_df = location_sample_df.copy()
+        location_sample_df[location_choice.ALT_LOGSUM] = (
+            location_sample_df.index * 0.01 + location_sample_df[ALT_DEST_COL_NAME]
+        )
+        return location_sample_df
+
+    monkeypatch.setattr(location_choice, "run_location_sample", run_location_sample)
+    monkeypatch.setattr(location_choice, "run_location_logsums", run_location_logsums)
+
+    return calls
+
+
+def dest_size_terms(size_term_adjustment=1.0, utility_adjustment=0.0):
+    return pd.DataFrame(
+        {
+            "size_term": ZONES * 10.0,
+            "shadow_price_size_term_adjustment": size_term_adjustment,
+            "shadow_price_utility_adjustment": utility_adjustment,
+        },
+        index=pd.Index(ZONES, name="zone_id"),
+    )
+
+
+def full_sample(choosers, size_terms):
+    location_sample_df = location_choice.run_location_sample(
+        "work", choosers, None, size_terms, None, MODEL_SETTINGS, 0, "test", "test"
+    )
+    return location_choice.run_location_logsums(
+        "work", choosers, None, location_sample_df, MODEL_SETTINGS, 0, "test", "test"
+    )
+
+
+def segment_cache(choosers, size_terms):
+    location_sample_df = full_sample(choosers, size_terms)
+    logsums = location_sample_df.set_index(ALT_DEST_COL_NAME, append=True)[
+        location_choice.ALT_LOGSUM
+    ]
+    return {
+        "dest_size_terms": size_terms,
+        "sample": location_sample_df,
+        "logsums": logsums,
+    }
+
+
+def incremental_sample(choosers, size_terms, cache, utility_tolerance):
+    return location_choice.run_location_sample_incremental(
+        "work",
+        choosers,
+        None,
+        size_terms,
+        cache,
+        None,
+        MODEL_SETTINGS,
+        utility_tolerance,
+        0,
+        "test",
+        "test",
+    )
+
+
+def test_incremental_sample_zero_tolerance(choosers, location_sampler):
+
+    cache = segment_cache(choosers, dest_size_terms())
+    cached_pairs = set(location_sampler["logsums"][-1])
+
+    # shadow prices change the utility of every zone
+    size_terms = dest_size_terms(
+        size_term_adjustment=np.linspace(2.0, 0.5, len(ZONES)),
+        utility_adjustment=np.linspace(-1.0, 1.0, len(ZONES)),
+    )
+    location_sampler["sampled"].clear()
+    location_sampler["logsums"].clear()
+
+    location_sample_df = incremental_sample(choosers, size_terms, cache, 0)
+
+    # with no tolerance, all choosers are resampled as by a full resample
+    sampled = np.concatenate(location_sampler["sampled"])
+    assert sorted(sampled) == sorted(choosers.index)
+    pdt.assert_frame_equal(location_sample_df, full_sample(choosers, size_terms))
+
+    # but only logsums of pairs not evaluated in a prior iteration are computed
+    computed_pairs = location_sampler["logsums"][0]
+    assert not set(computed_pairs) & cached_pairs
+    assert set(computed_pairs) == set(
+        zip(location_sample_df.index, location_sample_df[ALT_DEST_COL_NAME])
+    ) - set(cached_pairs)
+
+
+def test_incremental_sample_tolerance(choosers, location_sampler):
+
+    prior_size_terms = dest_size_terms()
+    cache = segment_cache(choosers, prior_size_terms)
+    prior_sample_df = cache["sample"]
+
+    # utility of zone 3 moves past tolerance, the rest by less
+    utility_adjustment = np.where(ZONES == 3, -2.0, 0.005)
+    size_terms = dest_size_terms(utility_adjustment=utility_adjustment)
+    location_sampler["sampled"].clear()
+
+    location_sample_df = incremental_sample(choosers, size_terms, cache, 0.01)
+
+    # only choosers with zone 3 in their prior sample are resampled
+    touched = prior_sample_df[prior_sample_df[ALT_DEST_COL_NAME] == 3].index.unique()
+    assert 0 < len(touched) < len(choosers)
+    (resampled,) = location_sampler["sampled"]
+    assert sorted(resampled) == sorted(touched)
+
+    # the others keep their prior sample
+    kept = ~location_sample_df.index.isin(touched)
+    pdt.assert_frame_equal(
+        location_sample_df[kept],
+        prior_sample_df[~prior_sample_df.index.isin(touched)],
+    )
+    pdt.assert_frame_equal(
+        location_sample_df[~kept],
+        full_sample(choosers.loc[touched], size_terms),
+    )
+
+    # alternatives stay grouped by chooser in chooser order
+    assert location_sample_df.index.is_monotonic_increasing
+    assert cache["logsums"].index.is_unique
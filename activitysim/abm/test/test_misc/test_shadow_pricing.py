@@ -0,0 +1,261 @@
+import multiprocessing
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import pandas.testing as pdt
+import pytest
+import yaml
+
+from activitysim.abm.tables import shadow_pricing
+from activitysim.core import inject
+
+NUM_PROCESSES = 3
+
+
+ZONES = [1, 2, 3, 4]
+SEGMENT_IDS = {"university": 3, "highschool": 2, "gradeschool": 1}
+MODEL_SETTINGS = {"MODEL_SELECTOR": "school", "SEGMENT_IDS": SEGMENT_IDS}
+NUM_PERSONS = 3 * NUM_PROCESSES
+
+SHADOW_SETTINGS = {
+    "LOAD_SAVED_SHADOW_PRICES": False,
+    "MAX_ITERATIONS": 10,
+    "SIZE_THRESHOLD": 0,
+    "TARGET_THRESHOLD": 0,
+    "PERCENT_TOLERANCE": 5,
+    "FAIL_THRESHOLD": 0,
+    "SHADOW_PRICE_METHOD": "ctramp",
+    "DAMPING_FACTOR": 0.5,
+}
+
+
+def desired_size(zones=ZONES, segments=SEGMENT_IDS):
+    return pd.DataFrame(
+        {
+            segment: np.arange(len(zones)) * 10.0 + 10 * (i + 1)
+            for i, segment in enumerate(segments)
+        },
+        index=pd.Index(zones, name="zone_id"),
+    )
+
+
+@pytest.fixture
+def shadow_pricing_setup(tmp_path):
+    def setup(use_shadow_pricing=True, size=None, **shadow_settings):
+
+        configs_dir = tmp_path / "configs"
+        configs_dir.mkdir(exist_ok=True)
+        with open(configs_dir / "shadow_pricing.yaml", "w") as f:
+            yaml.dump(dict(SHADOW_SETTINGS, **shadow_settings), f)
+
+        inject.add_injectable("configs_dir", str(configs_dir))
+        inject.add_injectable("output_dir", str(tmp_path))
+        inject.add_injectable(
+            "settings",
+            {
+                "use_shadow_pricing": use_shadow_pricing,
+                "fail_fast": True,
+                "households_sample_size": 0,
+            },
+        )
+        inject.add_table(
+            shadow_pricing.size_table_name("school"),
+            desired_size() if size is None else size,
+            replace=True,
+        )
+        inject.clear_cache()
+
+    yield setup
+
+    inject.clear_cache()
+    inject.reinject_decorated_tables()
+
+
+def synchronize_worker(data_buffers, i, queue):
+
+    data, condition = shadow_pricing.shadow_price_data_from_buffers(
+        data_buffers,
+        {"dtype": np.int64, "block_shapes": {"school": (len(ZONES), 4)}},
+        "school",
+    )
+    (
+        data_choice,
+        choice_condition,
+    ) = shadow_pricing.shadow_price_data_from_buffers_choice(
+        data_buffers,
+        {"dtype": np.int64, "block_shapes": {"school": (NUM_PERSONS, 2)}},
+        "school",
+    )
+    spc = shadow_pricing.ShadowPriceCalculator(
+        MODEL_SETTINGS,
+        NUM_PROCESSES,
+        data,
+        condition,
+        data_choice,
+        choice_condition,
+    )
+
+    # two rounds, so stragglers from the first round have to check out before the second
+    for iteration in range(2):
+        local_modeled_size = pd.DataFrame(
+            i + iteration,
+            index=spc.desired_size.index,
+            columns=spc.desired_size.columns,
+        )
+        modeled_size = spc.synchronize_modeled_size(local_modeled_size)
+
+        # each process has the choices of its own persons
+        person_ids = np.arange(NUM_PERSONS)
+        local_choices = pd.DataFrame(
+            {"choice": np.where(person_ids // 3 == i, person_ids + iteration, 0)},
+            index=person_ids,
+        )
+        choices = spc.synchronize_choices(local_choices)
+
+        queue.put((iteration, modeled_size.values.tolist(), choices.choice.tolist()))
+
+
+def test_shadow_pricing_synchronize(shadow_pricing_setup):
+
+    shadow_pricing_setup(use_shadow_pricing=False)
+
+    data_buffers = shadow_pricing.buffers_for_shadow_pricing(
+        {
+            "dtype": np.int64,
+            "block_shapes": OrderedDict(
+                {"school": (len(ZONES), 4), "school_choice": (NUM_PERSONS, 2)}
+            ),
+        }
+    )
+
+    queue = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(
+            target=synchronize_worker, args=(data_buffers, i, queue)
+        )
+        for i in range(NUM_PROCESSES)
+    ]
+    for p in processes:
+        p.start()
+    results = sorted(queue.get(timeout=60) for _ in range(2 * NUM_PROCESSES))
+    for p in processes:
+        p.join(timeout=60)
+        assert p.exitcode == 0
+
+    # every process sees the complete sums for each round
+    for iteration in range(2):
+        expected_size = [[3 + 3 * iteration] * 3] * len(ZONES)
+        expected_choices = list(range(iteration, NUM_PERSONS + iteration))
+        assert (
+            results[iteration * NUM_PROCESSES : (iteration + 1) * NUM_PROCESSES]
+            == [(iteration, expected_size, expected_choices)] * NUM_PROCESSES
+        )
+
+
+def test_adaptive_damping(shadow_pricing_setup):
+
+    shadow_pricing_setup(ADAPTIVE_DAMPING=True, MIN_DAMPING_FACTOR=0.2)
+    spc = shadow_pricing.ShadowPriceCalculator(MODEL_SETTINGS, 1)
+
+    desired = spc.desired_size
+    persons = pd.DataFrame(
+        {
+            "segment": np.repeat(list(SEGMENT_IDS.values()), len(ZONES)),
+            "zone": np.tile(ZONES, len(SEGMENT_IDS)),
+        }
+    )
+
+    def modeled_size(scale):
+        # persons choose zones in proportion to desired_size times scale
+        counts = (desired.values * scale).round().astype(int).T.ravel()
+        choosers = persons.loc[persons.index.repeat(counts)].reset_index(drop=True)
+        return choosers.zone, choosers.segment
+
+    # residual falls, then rises, then keeps rising
+    expected_damping_factors = [0.5, 0.75, 0.375, 0.2]
+    for iteration, scale in enumerate([0.5, 0.8, 1.5, 2.0]):
+        spc.set_choices(*modeled_size(scale))
+        spc.check_fit(iteration)
+
+        prior_shadow_prices = spc.shadow_prices.copy()
+        spc.update_shadow_prices()
+        damping_factor = expected_damping_factors[iteration]
+        assert spc.damping_factor == damping_factor
+
+        expected = prior_shadow_prices * (
+            1 + (desired / spc.modeled_size - 1) * damping_factor
+        )
+        pdt.assert_frame_equal(spc.shadow_prices, expected)
+
+
+def test_warm_start(shadow_pricing_setup):
+
+    shadow_pricing_setup(WARM_START_KEY="base")
+    spc = shadow_pricing.ShadowPriceCalculator(MODEL_SETTINGS, 1)
+    assert (spc.shadow_prices == 1.0).all(axis=None)
+
+    spc.shadow_prices = spc.shadow_prices * np.arange(1, len(ZONES) + 1)[:, None]
+    spc.write_warm_start_shadow_prices()
+
+    # a new run with the same key starts with the saved shadow prices
+    warm = shadow_pricing.ShadowPriceCalculator(MODEL_SETTINGS, 1)
+    pdt.assert_frame_equal(warm.shadow_prices, spc.shadow_prices)
+    assert warm.max_iterations == SHADOW_SETTINGS["MAX_ITERATIONS"]
+
+    # but not with a different key
+    shadow_pricing_setup(WARM_START_KEY="other")
+    cold = shadow_pricing.ShadowPriceCalculator(MODEL_SETTINGS, 1)
+    assert (cold.shadow_prices == 1.0).all(axis=None)
+
+    # or when the zones or segments differ from those of the saved shadow prices
+    for size in [
+        desired_size(zones=ZONES[:-1]),
+        desired_size(segments=["university", "highschool"]),
+    ]:
+        shadow_pricing_setup(WARM_START_KEY="base", size=size)
+        cold = shadow_pricing.ShadowPriceCalculator(MODEL_SETTINGS, 1)
+        pdt.assert_index_equal(cold.shadow_prices.index, size.index)
+        assert (cold.shadow_prices == 1.0).all(axis=None)
+
+
+def test_shadow_pricing_with_work_unit(shadow_pricing_setup):
+
+    # work units don't run in lockstep, so sub processes can't synchronize shadow prices
+    shadow_pricing_setup()
+    inject.add_injectable("work_unit", "mp_households_unit_0")
+    try:
+        with pytest.raises(RuntimeError, match="can't be run .* with work_units"):
+            shadow_pricing.load_shadow_price_calculator(MODEL_SETTINGS)
+
+        shadow_pricing_setup(use_shadow_pricing=False)
+        spc = shadow_pricing.load_shadow_price_calculator(MODEL_SETTINGS)
+        assert spc.num_processes == 1
+    finally:
+        inject.remove_injectable("work_unit")
+
+
+@pytest.mark.parametrize("acceleration", ["aitken", "anderson"])
+def test_shadow_price_acceleration(acceleration):
+
+    # a slowly converging linear fixed point iteration x = G(x), with fixed point 1
+    a = np.array([0.9, 0.8, -0.5, 0.85])
+
+    def G(x):
+        return a * x + (1 - a)
+
+    accelerate = {
+        "aitken": shadow_pricing.aitken_acceleration,
+        "anderson": shadow_pricing.anderson_acceleration,
+    }[acceleration]
+
+    plain_x = x = np.zeros_like(a)
+    x_history, g_history = [], []
+    for _ in range(8):
+        plain_x = G(plain_x)
+        x_history = (x_history + [x])[-4:]
+        g_history = (g_history + [G(x)])[-4:]
+        x = accelerate(x_history, g_history)
+
+    assert np.abs(x - 1).max() < 1e-5
+    assert np.abs(plain_x - 1).max() > 0.25
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import pandas.testing as pdt
+import pytest
+
+from activitysim.abm.models import trip_matrices
+
+
+def test_aggregate_od_trips():
+
+    rng = np.random.default_rng(0)
+    num_trips = 1000
+    num_zones = 7
+
+    trips = pd.DataFrame(
+        {
+            "origin": rng.integers(0, num_zones, num_trips),
+            "destination": rng.integers(0, num_zones, num_trips),
+            "WALK": rng.random(num_trips) < 0.3,
+            "DRIVE": rng.integers(0, 3, num_trips),
+            "sample_rate": rng.choice([0.01, 0.02], num_trips),
+        }
+    )
+
+    # groupby of the whole trips table, as write_trip_matrices aggregated trips before
+    expected = trips.groupby(["origin", "destination"]).sum()
+    expected["sample_rate"] = (
+        trips.groupby(["origin", "destination"]).sample_rate.mean().values
+    )
+    expected.index = expected.index.get_level_values(
+        "origin"
+    ) * num_zones + expected.index.get_level_values("destination")
+
+    aggregate_trips = trip_matrices.aggregate_od_trips(
+        trips,
+        trips.origin.values,
+        trips.destination.values,
+        num_zones,
+        ["WALK", "DRIVE"],
+        "sample_rate",
+    )
+
+    pdt.assert_frame_equal(
+        aggregate_trips, expected.astype(np.float64), check_index_type=False
+    )
+
+
+def test_matrix_data_fields():
+
+    trips = pd.DataFrame(
+        {
+            "WALK": [True, False],
+            "DRIVE": [1, 2],
+            "mode": ["WALK", "DRIVE"],
+        }
+    )
+    model_settings = {
+        "MATRICES": [
+            {
+                "tables": [
+                    {"name": "WALK", "data_field": "WALK"},
+                    {"name": "MODE", "data_field": "mode"},
+                    {"name": "BIKE", "data_field": "BIKE"},
+                ]
+            },
+            {"is_tap": True, "tables": [{"name": "DRIVE", "data_field": "DRIVE"}]},
+        ]
+    }
+
+    # non-numeric and missing data_fields are not aggregated
+    assert trip_matrices.matrix_data_fields(trips, model_settings) == ["WALK"]
+    assert trip_matrices.matrix_data_fields(trips, model_settings, is_tap=True) == [
+        "DRIVE"
+    ]
+
+    with pytest.raises(RuntimeError, match="column mode is not summable"):
+        trip_matrices.aggregate_od_trips(
+            trips, np.array([0, 1]), np.array([1, 0]), 2, ["WALK", "mode"], None
+        )
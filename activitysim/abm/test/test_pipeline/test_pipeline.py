@@ -12,7 +12,16 @@ import pkg_resources
 import pytest
 import yaml
 
-from activitysim.core import config, inject, pipeline, random, tracing
+from activitysim.abm.models import accessibility
+from activitysim.core import (
+    assign,
+    chunk,
+    config,
+    inject,
+    pipeline,
+    random,
+    tracing,
+)
 
 # set the max households for all tests (this is to limit memory use on travis)
 HOUSEHOLDS_SAMPLE_SIZE = 50
@@ -276,6 +285,44 @@ def test_mini_pipeline_run2():
     close_handlers()
 
 
+def test_accessibility_origin_blocks():
+
+    # streaming origin blocks should give the same accessibilities as the merged od_df
+
+    setup_dirs()
+    inject_settings(households_sample_size=HOUSEHOLDS_SAMPLE_SIZE)
+
+    try:
+        pipeline.run(models=["initialize_landuse", "compute_accessibility"])
+        expected = pipeline.get_table("accessibility")
+
+        model_settings = config.read_model_settings("accessibility.yaml")
+        land_use_df = pipeline.get_table("land_use")[model_settings["land_use_columns"]]
+        assignment_spec = assign.read_assignment_spec(
+            config.config_file_path("accessibility.csv")
+        )
+
+        trace_label = "test_accessibility_origin_blocks"
+        with chunk.chunk_log(trace_label, base=True):
+            accessibility_df = accessibility.compute_accessibilities_for_origin_blocks(
+                pd.DataFrame(index=expected.index),
+                land_use_df,
+                assignment_spec,
+                config.get_model_constants(model_settings),
+                inject.get_injectable("network_los"),
+                trace_od=None,
+                trace_label=trace_label,
+                origin_block_size=7,
+            )
+        pdt.assert_frame_equal(accessibility_df, expected)
+
+    finally:
+        if pipeline.is_open():
+            pipeline.close_pipeline()
+        inject.clear_cache()
+        close_handlers()
+
+
 def test_mini_pipeline_run3():
 
     # test that hh_ids setting overrides household sampling
@@ -9,7 +9,15 @@ import warnings
 
 import numpy as np
 
-from activitysim.core import chunk, config, inject, mem, pipeline, tracing
+from activitysim.core import (
+    chunk,
+    config,
+    inject,
+    mem,
+    pipeline,
+    skim_dict_factory,
+    tracing,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -357,6 +365,9 @@ def run(args):
                 memory_sidecar_process=memory_sidecar_process,
             )
 
+            # save the populated portion of a dynamic tvpb cache
+            inject.get_injectable("network_los_preload").write_tvpb_cache()
+
             if config.setting("cleanup_pipeline_after_run", False):
                 pipeline.cleanup_pipeline()  # has side effect of closing open pipeline
             else:
@@ -371,6 +382,7 @@ def run(args):
 
     chunk.consolidate_logs()
     mem.consolidate_logs()
+    skim_dict_factory.consolidate_skim_usage_logs()
 
     from ..core.flow import TimeLogger
 
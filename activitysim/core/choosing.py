@@ -28,6 +28,270 @@ def choice_maker(pr, rn, out=None):
     return out
 
 
+@njit
+def logit_choice_maker(
+    utils,
+    rn,
+    exp_util_min,
+    exponentiated=False,
+    out_choices=None,
+    out_choice_probs=None,
+    out_status=None,
+):
+    """
+    Make multinomial logit choices directly from a table of utilities.
+
+    This fuses the work of `logit.utils_to_probs` and `choice_maker` into a
+    single pass per row, without materializing the table of probabilities.
+    Utilities are shifted by the row maximum before exponentiation so large
+    utilities cannot overflow.  Alternatives whose exponentiated utility
+    would be at or below `exp_util_min` are treated as unavailable, as in
+    `logit.utils_to_probs`, but nan utilities are not: rows with a nan
+    utility are bad rows, as their probabilities would not add up to 1.
+    The choice itself uses the same cumulative subtraction rule as
+    `choice_maker`.
+
+    Parameters
+    ----------
+    utils : array of float, shape (n_choosers, n_alts)
+    rn : array of float, shape (n_choosers)
+    exp_util_min : float
+    exponentiated : bool
+        True if utilities have already been exponentiated
+    out_choices : array of int, shape (n_choosers), optional
+    out_choice_probs : array of float, shape (n_choosers), optional
+    out_status : array of int8, shape (n_choosers), optional
+
+    Returns
+    -------
+    out_choices, out_choice_probs, out_status
+        out_status is 0 for good rows, 1 for rows in which all probabilities
+        are zero, 2 for rows with infinite utilities and 3 for rows with nan
+        utilities.  Bad rows are given a choice of -1 and a choice probability
+        of zero.
+    """
+    n_choosers = utils.shape[0]
+    n_alts = utils.shape[1]
+    if out_choices is None:
+        out_choices = np.empty(n_choosers, dtype=np.int32)
+    if out_choice_probs is None:
+        out_choice_probs = np.empty(n_choosers, dtype=np.float64)
+    if out_status is None:
+        out_status = np.empty(n_choosers, dtype=np.int8)
+    util_min = np.log(exp_util_min)
+
+    for row in range(n_choosers):
+        out_choices[row] = -1
+        out_choice_probs[row] = 0.0
+        out_status[row] = 0
+
+        # find the largest available utility, used to shift the row
+        shift = -np.inf
+        for col in range(n_alts):
+            u = utils[row, col]
+            if np.isnan(u):
+                out_status[row] = 3
+                break
+            if np.isinf(u) and u > 0:
+                out_status[row] = 2
+                break
+            if exponentiated:
+                if u > exp_util_min and u > shift:
+                    shift = u
+            elif u > util_min and u > shift:
+                shift = u
+        if out_status[row] != 0:
+            continue
+        if shift == -np.inf:
+            out_status[row] = 1
+            continue
+
+        total = 0.0
+        for col in range(n_alts):
+            u = utils[row, col]
+            if exponentiated:
+                if u > exp_util_min:
+                    total += u / shift
+            elif u > util_min:
+                total += np.exp(u - shift)
+
+        z = rn[row]
+        max_pr = 0.0
+        for col in range(n_alts):
+            u = utils[row, col]
+            if exponentiated:
+                pr = u / shift / total if u > exp_util_min else 0.0
+            else:
+                pr = np.exp(u - shift) / total if u > util_min else 0.0
+            z = z - pr
+            if z <= 0:
+                out_choices[row] = col
+                out_choice_probs[row] = pr
+                break
+            # remember the most likely alt, for the rare condition in which
+            # the random point is greater than the sum of the probabilities
+            if pr > max_pr:
+                out_choices[row] = col
+                out_choice_probs[row] = pr
+                max_pr = pr
+
+    return out_choices, out_choice_probs, out_status
+
+
+@njit
+def _ragged_shift_and_total(utils, start, end, util_min):
+    """
+    Return status, shift and total of exp(utils - shift) of the alternatives utils[start:end]
+
+    status is 0 for good segments, 1 if all probabilities are zero, 2 if a utility is infinite
+    and 3 if a utility is nan.  Alternatives with utilities at or below util_min are unavailable,
+    as in `logit_choice_maker`.
+    """
+    shift = -np.inf
+    for i in range(start, end):
+        u = utils[i]
+        if np.isnan(u):
+            return 3, shift, 0.0
+        if np.isinf(u) and u > 0:
+            return 2, shift, 0.0
+        if u > util_min and u > shift:
+            shift = u
+    if shift == -np.inf:
+        return 1, shift, 0.0
+
+    total = 0.0
+    for i in range(start, end):
+        u = utils[i]
+        if u > util_min:
+            total += np.exp(u - shift)
+    return 0, shift, total
+
+
+@njit
+def ragged_logit_choice_maker(
+    utils,
+    offsets,
+    rn,
+    exp_util_min,
+    out_choices=None,
+    out_choice_probs=None,
+    out_logsums=None,
+    out_status=None,
+):
+    """
+    Make multinomial logit choices from ragged (CSR) utilities.
+
+    The alternatives of chooser c are utils[offsets[c]:offsets[c + 1]], so choosers can
+    have different numbers of alternatives without padding.  Otherwise this is the same as
+    `logit_choice_maker`, and also returns the logsum of each chooser.
+
+    Parameters
+    ----------
+    utils : array of float, shape (n_utils)
+    offsets : array of int, shape (n_choosers + 1)
+    rn : array of float, shape (n_choosers)
+    exp_util_min : float
+    out_choices : array of int, shape (n_choosers), optional
+    out_choice_probs : array of float, shape (n_choosers), optional
+    out_logsums : array of float, shape (n_choosers), optional
+    out_status : array of int8, shape (n_choosers), optional
+
+    Returns
+    -------
+    out_choices, out_choice_probs, out_logsums, out_status
+        choices are offsets into the chooser's alternatives.  Bad rows (see `logit_choice_maker`)
+        are given a choice of -1, a choice probability of zero and a logsum of -inf, or of nan
+        for rows with nan utilities, as from `logit.utils_to_logsums`.
+    """
+    n_choosers = len(offsets) - 1
+    if out_choices is None:
+        out_choices = np.empty(n_choosers, dtype=np.int32)
+    if out_choice_probs is None:
+        out_choice_probs = np.empty(n_choosers, dtype=np.float64)
+    if out_logsums is None:
+        out_logsums = np.empty(n_choosers, dtype=np.float64)
+    if out_status is None:
+        out_status = np.empty(n_choosers, dtype=np.int8)
+    util_min = np.log(exp_util_min)
+
+    for row in range(n_choosers):
+        start = offsets[row]
+        end = offsets[row + 1]
+        out_choices[row] = -1
+        out_choice_probs[row] = 0.0
+        out_logsums[row] = -np.inf
+
+        status, shift, total = _ragged_shift_and_total(utils, start, end, util_min)
+        out_status[row] = status
+        if status == 3:
+            out_logsums[row] = np.nan
+        if status != 0:
+            continue
+        out_logsums[row] = shift + np.log(total)
+
+        z = rn[row]
+        max_pr = 0.0
+        for i in range(start, end):
+            u = utils[i]
+            pr = np.exp(u - shift) / total if u > util_min else 0.0
+            z = z - pr
+            if z <= 0:
+                out_choices[row] = i - start
+                out_choice_probs[row] = pr
+                break
+            # remember the most likely alt, for the rare condition in which
+            # the random point is greater than the sum of the probabilities
+            if pr > max_pr:
+                out_choices[row] = i - start
+                out_choice_probs[row] = pr
+                max_pr = pr
+
+    return out_choices, out_choice_probs, out_logsums, out_status
+
+
+@njit
+def ragged_logsum_maker(
+    utils, offsets, exp_util_min, out_logsums=None, out_status=None
+):
+    """
+    Logsums of ragged (CSR) utilities, as computed by `ragged_logit_choice_maker`
+
+    Parameters
+    ----------
+    utils : array of float, shape (n_utils)
+    offsets : array of int, shape (n_choosers + 1)
+    exp_util_min : float
+    out_logsums : array of float, shape (n_choosers), optional
+    out_status : array of int8, shape (n_choosers), optional
+
+    Returns
+    -------
+    out_logsums, out_status
+    """
+    n_choosers = len(offsets) - 1
+    if out_logsums is None:
+        out_logsums = np.empty(n_choosers, dtype=np.float64)
+    if out_status is None:
+        out_status = np.empty(n_choosers, dtype=np.int8)
+    util_min = np.log(exp_util_min)
+
+    for row in range(n_choosers):
+        status, shift, total = _ragged_shift_and_total(
+            utils, offsets[row], offsets[row + 1], util_min
+        )
+        out_status[row] = status
+        if status == 0:
+            out_logsums[row] = shift + np.log(total)
+        elif status == 2:
+            out_logsums[row] = np.inf
+        elif status == 3:
+            out_logsums[row] = np.nan
+        else:
+            out_logsums[row] = -np.inf
+
+    return out_logsums, out_status
+
+
 @njit
 def sample_choices_maker(
     prob_array,
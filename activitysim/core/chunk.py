@@ -72,13 +72,27 @@ MODE_PRODUCTION
 MODE_CHUNKLESS
     Do not do chunking, and also do not check or log memory usage, so ActivitySim can focus on performance
     assuming there is abundant RAM.
+
+MODE_PREDICTIVE
+    Size chunks with a RowSizeModel for each chunk_tag, which predicts the bytes of data logged with log_df
+    (e.g. choosers x alternatives x expressions) from the number of chooser rows. The model is fit online to the
+    observed high water mark of logged bytes of each chunk, and starts from the model persisted in
+    output/cache/chunk_model.csv by previous runs (if any), which it updates at the end of the run. There is no
+    separate training run, and no need to force garbage collection or poll rss/uss while chunking.
 """
 
 MODE_RETRAIN = "training"
 MODE_ADAPTIVE = "adaptive"
 MODE_PRODUCTION = "production"
 MODE_CHUNKLESS = "disabled"
-TRAINING_MODES = [MODE_RETRAIN, MODE_ADAPTIVE, MODE_PRODUCTION, MODE_CHUNKLESS]
+MODE_PREDICTIVE = "predictive"
+TRAINING_MODES = [
+    MODE_RETRAIN,
+    MODE_ADAPTIVE,
+    MODE_PRODUCTION,
+    MODE_CHUNKLESS,
+    MODE_PREDICTIVE,
+]
 
 #
 # low level
@@ -102,6 +116,12 @@ CACHE_FILE_NAME = "chunk_cache.csv"
 LOG_FILE_NAME = "chunk_history.csv"
 OMNIBUS_LOG_FILE_NAME = f"omnibus_{LOG_FILE_NAME}"
 
+MODEL_FILE_NAME = "chunk_model.csv"
+OBSERVATIONS_FILE_NAME = "chunk_observations.csv"
+
+# weight of the persisted chunk_model observations relative to those of the current run
+MODEL_DECAY = 0.5
+
 C_CHUNK_TAG = "tag"
 C_DEPTH = "depth"
 C_NUM_ROWS = "num_rows"
@@ -241,8 +261,50 @@ def overhead_for_chunk_method(overhead, method=None):
     return oh
 
 
+def consolidate_observations():
+    """
+    Update the persisted chunk_model with the row size observations from this run (from all processes)
+
+    The RowSizeModel statistics are additive, so we simply add the (decayed) persisted statistics
+    to those observed in this run.
+    """
+
+    glob_file_name = config.log_file_path(f"*{OBSERVATIONS_FILE_NAME}", prefix=False)
+    glob_files = glob.glob(glob_file_name)
+
+    if not glob_files:
+        return
+
+    logger.debug(f"chunk.consolidate_observations reading glob {glob_file_name}")
+    observations_df = pd.concat((pd.read_csv(f, comment="#") for f in glob_files))
+
+    if not keep_chunk_logs():
+        util.delete_files(glob_files, "chunk.consolidate_observations")
+
+    model_df = observations_df.groupby(C_CHUNK_TAG)[RowSizeModel.STATS].sum()
+
+    model_path = os.path.join(config.get_cache_dir(), MODEL_FILE_NAME)
+    if os.path.exists(model_path):
+        cached_df = pd.read_csv(model_path, comment="#").set_index(C_CHUNK_TAG)
+        model_df = model_df.add(
+            cached_df[RowSizeModel.STATS] * MODEL_DECAY, fill_value=0
+        )
+
+    # informational
+    fits = [RowSizeModel(stats).fit() for stats in model_df.to_dict(orient="records")]
+    model_df["fixed_bytes"] = [int(fixed_bytes) for fixed_bytes, _ in fits]
+    model_df["row_size"] = [math.ceil(row_size) for _, row_size in fits]
+
+    logger.debug(f"chunk.consolidate_observations writing chunk model to {model_path}")
+    model_df.sort_index().reset_index(drop=False).to_csv(
+        model_path, mode="w", index=False
+    )
+
+
 def consolidate_logs():
 
+    consolidate_observations()
+
     glob_file_name = config.log_file_path(f"*{LOG_FILE_NAME}", prefix=False)
     glob_files = glob.glob(glob_file_name)
 
@@ -339,6 +401,80 @@ def consolidate_logs():
             omnibus_df.to_csv(cache_dir_output_path, mode="w", index=False)
 
 
+class RowSizeModel(object):
+    """
+    Least squares model of chunk overhead (high water mark of bytes logged with log_df) by number of rows
+
+    ::
+
+        bytes = fixed_bytes + rows * row_size
+
+    The model is kept as sums of observations so that observations from different chunks,
+    processes, and runs can be combined simply by adding them.
+    """
+
+    STATS = ["n", "sum_rows", "sum_bytes", "sum_rows_sq", "sum_rows_bytes"]
+
+    def __init__(self, stats=None):
+        self.stats = {k: 0.0 for k in self.STATS}
+        if stats:
+            self.add(stats)
+
+    def add(self, stats):
+        for k in self.STATS:
+            self.stats[k] += stats[k]
+
+    def observe(self, rows, bytes):
+        self.add(
+            {
+                "n": 1,
+                "sum_rows": rows,
+                "sum_bytes": bytes,
+                "sum_rows_sq": float(rows) * rows,
+                "sum_rows_bytes": float(rows) * bytes,
+            }
+        )
+
+    @property
+    def trained(self):
+        return self.stats["sum_rows"] > 0 and self.stats["sum_bytes"] > 0
+
+    def fit(self):
+        """
+        Returns
+        -------
+        fixed_bytes, row_size : float
+        """
+        n, sum_rows, sum_bytes, sum_rows_sq, sum_rows_bytes = (
+            self.stats[k] for k in self.STATS
+        )
+
+        if not self.trained:
+            return 0.0, 0.0
+
+        # need observations of different numbers of rows to distinguish fixed_bytes from row_size
+        var_rows = sum_rows_sq - sum_rows * sum_rows / n
+        if n > 1 and var_rows > 1e-9 * sum_rows_sq:
+            row_size = (sum_rows_bytes - sum_rows * sum_bytes / n) / var_rows
+            fixed_bytes = (sum_bytes - row_size * sum_rows) / n
+            if row_size > 0 and fixed_bytes >= 0:
+                return fixed_bytes, row_size
+
+        # otherwise attribute all overhead to rows, which is conservative for larger chunks
+        return 0.0, sum_bytes / sum_rows
+
+    def row_size(self):
+        return self.fit()[1]
+
+    def rows_for_headroom(self, headroom):
+        """
+        predicted number of rows that will fit in headroom bytes (at least 1)
+        """
+        fixed_bytes, row_size = self.fit()
+        assert row_size > 0
+        return max(int((headroom - fixed_bytes) / row_size), 1)
+
+
 class ChunkHistorian(object):
     """
     Utility for estimating row_size
@@ -350,6 +486,9 @@ class ChunkHistorian(object):
         self.have_cached_history = None
         self.cached_history_df = None
 
+        self.observations_path = None
+        self.row_size_models = None
+
     def load_cached_history(self):
 
         if chunk_training_mode() == MODE_RETRAIN:
@@ -442,6 +581,52 @@ class ChunkHistorian(object):
 
         return row_size
 
+    def row_size_model(self, chunk_tag):
+        """
+        RowSizeModel for chunk_tag, initialized from persisted chunk_model (if any)
+
+        The model is shared by all ChunkSizers with the same chunk_tag, so it continues
+        to learn over the course of the run.
+        """
+
+        if self.row_size_models is None:
+            self.row_size_models = {}
+
+            model_path = os.path.join(config.get_cache_dir(), MODEL_FILE_NAME)
+            if os.path.exists(model_path):
+                logger.debug(
+                    f"ChunkHistorian row_size_model reading chunk model from {model_path}"
+                )
+                df = pd.read_csv(model_path, comment="#")
+                for c in [C_CHUNK_TAG] + RowSizeModel.STATS:
+                    assert (
+                        c in df
+                    ), f"Expected column '{c}' not in chunk_model: {model_path}"
+                for stats in df.to_dict(orient="records"):
+                    self.row_size_models[stats[C_CHUNK_TAG]] = RowSizeModel(stats)
+
+        return self.row_size_models.setdefault(chunk_tag, RowSizeModel())
+
+    def write_observations(self, observations, chunk_tag):
+
+        assert chunk_training_mode() == MODE_PREDICTIVE
+
+        observations_df = pd.DataFrame([observations.stats])
+        observations_df[C_CHUNK_TAG] = chunk_tag
+        observations_df = observations_df[[C_CHUNK_TAG] + RowSizeModel.STATS]
+
+        if self.observations_path is None:
+            self.observations_path = config.log_file_path(OBSERVATIONS_FILE_NAME)
+
+        tracing.write_df_csv(
+            observations_df,
+            self.observations_path,
+            index_label=None,
+            columns=None,
+            column_labels=None,
+            transpose=False,
+        )
+
     def write_history(self, history, chunk_tag):
 
         assert chunk_training_mode() not in (MODE_PRODUCTION, MODE_CHUNKLESS)
@@ -659,7 +844,7 @@ def log_rss(trace_label, force=False):
 
     hwm_trace_label = f"{trace_label}.log_rss"
 
-    if chunk_training_mode() == MODE_PRODUCTION:
+    if chunk_training_mode() in (MODE_PRODUCTION, MODE_PREDICTIVE):
         # FIXME - this trace_memory_info call slows things down a lot so it is turned off for now
         # trace_ticks = 0 if force else mem.MEM_TRACE_TICK_LEN
         # mem.trace_memory_info(hwm_trace_label, trace_ticks=trace_ticks)
@@ -683,7 +868,11 @@ def log_df(trace_label, table_name, df):
     op = "del" if df is None else "add"
     hwm_trace_label = f"{trace_label}.{op}.{table_name}"
 
-    rss, uss = mem.trace_memory_info(hwm_trace_label)
+    if chunk_training_mode() == MODE_PREDICTIVE:
+        # predictive chunking only needs the bytes tally, so don't poll rss and uss
+        rss, uss = 0, 0
+    else:
+        rss, uss = mem.trace_memory_info(hwm_trace_label)
 
     cur_chunker = CHUNK_LEDGERS[-1]
 
@@ -718,10 +907,19 @@ class ChunkSizer(object):
         self.depth = len(CHUNK_SIZERS) + 1
 
         if chunk_training_mode() != MODE_CHUNKLESS:
-            if chunk_metric() == USS:
-                self.rss, self.uss = mem.get_rss(force_garbage_collect=True, uss=True)
+            # predictive chunk sizes don't depend on a precise reading, so skip forced garbage collection
+            force_garbage_collect = chunk_training_mode() != MODE_PREDICTIVE
+            if chunk_training_mode() == MODE_PREDICTIVE and chunk_size == 0:
+                # unchunked, so no need for a baseline to compute headroom
+                self.rss, self.uss = 0, 0
+            elif chunk_metric() == USS:
+                self.rss, self.uss = mem.get_rss(
+                    force_garbage_collect=force_garbage_collect, uss=True
+                )
             else:
-                self.rss, _ = mem.get_rss(force_garbage_collect=True, uss=False)
+                self.rss, _ = mem.get_rss(
+                    force_garbage_collect=force_garbage_collect, uss=False
+                )
                 self.uss = 0
 
             if self.depth > 1:
@@ -763,6 +961,11 @@ class ChunkSizer(object):
         self.cum_rows = 0
         self.cum_overhead = {m: 0 for m in METRICS}
 
+        if chunk_training_mode() == MODE_PREDICTIVE:
+            self.row_size_model = _HISTORIAN.row_size_model(self.chunk_tag)
+            # observations made by this chunker, to persist when it is closed
+            self.observations = RowSizeModel()
+
         # if production mode, to reduce volatility, initialize cum_overhead and cum_rows from cache
         if chunk_training_mode() in [MODE_ADAPTIVE, MODE_PRODUCTION]:
             cached_history = _HISTORIAN.cached_history_for_chunk_tag(self.chunk_tag)
@@ -789,10 +992,14 @@ class ChunkSizer(object):
     def close(self):
 
         if ((self.depth == 1) or WRITE_SUBCHUNK_HISTORY) and (
-            chunk_training_mode() not in (MODE_PRODUCTION, MODE_CHUNKLESS)
+            chunk_training_mode()
+            not in (MODE_PRODUCTION, MODE_CHUNKLESS, MODE_PREDICTIVE)
         ):
             _HISTORIAN.write_history(self.history, self.chunk_tag)
 
+        if chunk_training_mode() == MODE_PREDICTIVE and self.observations.trained:
+            _HISTORIAN.write_observations(self.observations, self.chunk_tag)
+
         _chunk_sizer = CHUNK_SIZERS.pop()
         assert _chunk_sizer == self
 
@@ -819,7 +1026,10 @@ class ChunkSizer(object):
 
         # whatever the TRAINING_MODE, use cache to determine initial_row_size
         # (presumably preferable to default_initial_rows_per_chunk)
-        self.initial_row_size = _HISTORIAN.cached_row_size(self.chunk_tag)
+        if chunk_training_mode() == MODE_PREDICTIVE:
+            self.initial_row_size = self.row_size_model.row_size()
+        else:
+            self.initial_row_size = _HISTORIAN.cached_row_size(self.chunk_tag)
 
         if self.chunk_size == 0:
             rows_per_chunk = self.num_choosers
@@ -831,9 +1041,14 @@ class ChunkSizer(object):
             assert len(CHUNK_LEDGERS) == 0, f"len(CHUNK_LEDGERS): {len(CHUNK_LEDGERS)}"
 
             if self.initial_row_size > 0:
-                max_rows_per_chunk = np.maximum(
-                    int(self.headroom / self.initial_row_size), 1
-                )
+                if chunk_training_mode() == MODE_PREDICTIVE:
+                    max_rows_per_chunk = self.row_size_model.rows_for_headroom(
+                        self.headroom
+                    )
+                else:
+                    max_rows_per_chunk = np.maximum(
+                        int(self.headroom / self.initial_row_size), 1
+                    )
                 rows_per_chunk = np.clip(max_rows_per_chunk, 1, self.num_choosers)
                 estimated_number_of_chunks = math.ceil(
                     self.num_choosers / rows_per_chunk
@@ -883,7 +1098,7 @@ class ChunkSizer(object):
         prev_rss = self.rss
         prev_uss = self.uss
 
-        if chunk_training_mode() != MODE_PRODUCTION:
+        if chunk_training_mode() not in (MODE_PRODUCTION, MODE_PREDICTIVE):
 
             if chunk_metric() == USS:
                 self.rss, self.uss = mem.get_rss(force_garbage_collect=True, uss=True)
@@ -903,6 +1118,18 @@ class ChunkSizer(object):
             # which is stored in self.initial_row_size because initial_rows_per_chunk used it for the first chunk
             observed_row_size = self.initial_row_size
             overhead = self.cum_overhead.copy()
+        elif chunk_training_mode() == MODE_PREDICTIVE:
+
+            # update row_size_model with logged bytes overhead for this chunk iteration
+            overhead = {m: 0 for m in METRICS}
+            overhead[BYTES] = self.chunk_ledger.get_hwm_bytes()
+            self.cum_overhead[BYTES] += overhead[BYTES]
+
+            if prev_rows_per_chunk > 0:
+                self.row_size_model.observe(prev_rows_per_chunk, overhead[BYTES])
+                self.observations.observe(prev_rows_per_chunk, overhead[BYTES])
+
+            observed_row_size = self.row_size_model.row_size()
         else:
 
             # calculate overhead for this chunk iteration
@@ -919,7 +1146,9 @@ class ChunkSizer(object):
             )
 
         # rows_per_chunk is closest number of chooser rows to achieve chunk_size without exceeding it
-        if observed_row_size > 0:
+        if observed_row_size > 0 and chunk_training_mode() == MODE_PREDICTIVE:
+            self.rows_per_chunk = self.row_size_model.rows_for_headroom(self.headroom)
+        elif observed_row_size > 0:
             self.rows_per_chunk = int(self.headroom / observed_row_size)
         else:
             # they don't appear to have used any memory; increase cautiously in case small sample size was to blame
@@ -1006,7 +1235,11 @@ class ChunkSizer(object):
             # and passed on down the stack to the base to support hwm tallies
 
             # if this is a base chunk_sizer (and ledger) then start a thread to monitor rss usage
-            if (len(CHUNK_LEDGERS) == 1) and ENABLE_MEMORY_MONITOR:
+            if (
+                (len(CHUNK_LEDGERS) == 1)
+                and ENABLE_MEMORY_MONITOR
+                and chunk_training_mode() != MODE_PREDICTIVE
+            ):
                 stop_snooping = threading.Event()
                 mem_monitor = MemMonitor(self.trace_label, stop_snooping)
                 mem_monitor.start()
@@ -10,7 +10,7 @@ import warnings
 
 import yaml
 
-from activitysim.core import inject, util
+from activitysim.core import config_cache, inject, util
 
 logger = logging.getLogger(__name__)
 
@@ -68,6 +68,11 @@ def rng_base_seed():
     return setting("rng_base_seed", 0)
 
 
+@inject.injectable()
+def rng_channel_type():
+    return setting("rng_channel_type", "simple")
+
+
 @inject.injectable(cache=True)
 def settings_file_name():
     return "settings.yaml"
@@ -469,6 +474,17 @@ class SettingsFileNotFound(Exception):
         return repr(f"Settings file '{self.file_name}' not found in {self.configs_dir}")
 
 
+def _read_yaml(file_path):
+
+    with open(file_path) as f:
+
+        s = yaml.load(f, Loader=yaml.SafeLoader)
+        if s is None:
+            s = {}
+
+    return s
+
+
 def read_settings_file(
     file_name, mandatory=True, include_stack=False, configs_dir_list=None
 ):
@@ -548,11 +564,7 @@ def read_settings_file(
                 file_path not in source_file_paths
             ), f"read_settings_file - recursion in reading 'file_path' after loading: {source_file_paths}"
 
-            with open(file_path) as f:
-
-                s = yaml.load(f, Loader=yaml.SafeLoader)
-                if s is None:
-                    s = {}
+            s = config_cache.cached("yaml", [file_path], lambda: _read_yaml(file_path))
 
             settings = backfill_settings(settings, s)
 
@@ -0,0 +1,156 @@
+# ActivitySim
+# See full license in LICENSE.txt.
+import copy
+import hashlib
+import logging
+import os
+import pickle
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# name of the config cache file in the cache dir
+CACHE_FILE_NAME = "config_cache.pkl"
+
+# bump to invalidate existing caches when what we store (or how we evaluate it) changes
+CACHE_VERSION = 1
+
+# the cache of the current process, if it is open
+_CACHE = None
+
+
+def file_digest(file_path):
+    """
+    Return the content hash of a file
+    """
+    with open(file_path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+class ConfigCache(object):
+    """
+    Parsed and evaluated config files (model settings, specs, coefficients, segment specs)
+
+    Each entry is keyed by the kind of entry, the paths of the config files it was computed from,
+    and any extra arguments of the computation, and records the content hashes of those files, so
+    an entry is only used if none of its files have changed since it was computed. Entries are
+    written to a single pickle file in the cache dir when the cache is closed, so later runs (and
+    all subprocesses of multiprocess runs) read it once instead of parsing each config file.
+    """
+
+    def __init__(self, cache_path):
+
+        self.cache_path = cache_path
+        self.entries = self.read_entries()
+        self.dirty = False
+        self.hits = 0
+        self.misses = 0
+
+    def read_entries(self):
+
+        if not os.path.exists(self.cache_path):
+            return {}
+
+        try:
+            with open(self.cache_path, "rb") as f:
+                version, pandas_version, entries = pickle.load(f)
+        except Exception as e:
+            logger.warning(f"ignoring unreadable config cache {self.cache_path}: {e}")
+            return {}
+
+        if (version, pandas_version) != (CACHE_VERSION, pd.__version__):
+            logger.info(f"ignoring out of date config cache {self.cache_path}")
+            return {}
+
+        return entries
+
+    def cached(self, kind, file_paths, load, extra=None):
+
+        key = (kind, tuple(file_paths), extra)
+        digests = tuple(file_digest(p) for p in file_paths)
+
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == digests:
+            self.hits += 1
+        else:
+            self.misses += 1
+            entry = (digests, load())
+            self.entries[key] = entry
+            self.dirty = True
+
+        # callers are free to modify what they get back
+        return copy.deepcopy(entry[1])
+
+    def write(self):
+
+        if not self.dirty:
+            return
+
+        # keep entries written by other processes since we read the cache
+        # (where we both have an entry for the same key, ours is at least as fresh)
+        entries = self.read_entries()
+        entries.update(self.entries)
+
+        # write to a temp file and rename, so concurrent readers never see a partial cache
+        temp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            pickle.dump(
+                (CACHE_VERSION, pd.__version__, entries),
+                f,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        os.replace(temp_path, self.cache_path)
+
+        self.dirty = False
+        logger.debug(f"wrote {len(entries)} config cache entries to {self.cache_path}")
+
+
+def open_cache(cache_path):
+    """
+    Open the config cache at cache_path, reading any entries written by earlier runs
+    """
+    global _CACHE
+    _CACHE = ConfigCache(cache_path)
+
+
+def close_cache():
+    """
+    Write any new config cache entries and close the cache
+    """
+    global _CACHE
+    if _CACHE is None:
+        return
+    try:
+        logger.info(
+            f"config cache hits {_CACHE.hits} misses {_CACHE.misses} "
+            f"({len(_CACHE.entries)} entries)"
+        )
+        _CACHE.write()
+    finally:
+        _CACHE = None
+
+
+def cached(kind, file_paths, load, extra=None):
+    """
+    Return the result of load() for config files file_paths, from the cache if it is open and
+    the cache has an entry computed from the current contents of those files.
+
+    Parameters
+    ----------
+    kind : str
+        kind of entry (e.g. 'spec'), to distinguish different results computed from the same files
+    file_paths : list of str
+        paths of the config files the result is computed from
+    load : callable
+        function of no arguments computing the result (which must be picklable)
+    extra : tuple, optional
+        any other (hashable) arguments the result depends on
+
+    Returns
+    -------
+    a (deep) copy of the result of load()
+    """
+    if _CACHE is None:
+        return load()
+    return _CACHE.cached(kind, file_paths, load, extra)
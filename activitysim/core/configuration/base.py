@@ -1,4 +1,4 @@
-from typing import Any, Union  # noqa: F401
+from typing import Any, Optional, Union  # noqa: F401
 
 try:
     from pydantic import BaseModel as PydanticBase
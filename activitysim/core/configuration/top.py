@@ -1,4 +1,4 @@
-from .base import PydanticBase, Union
+from .base import Optional, PydanticBase, Union
 
 
 class InputTable(PydanticBase):
@@ -175,6 +175,17 @@ class MultiprocessStep(PydanticBase):
     settings file is used.
     """
 
+    work_units: int = None
+    """
+    The number of work units to slice tables into for this multiprocessing step.
+
+    If provided, tables are sliced into this many (smaller) work units rather
+    than one slice per process, and each process takes the next work unit from
+    a shared queue whenever it finishes one, until all have been run. Results
+    are coalesced in work unit order, so they are the same for any number of
+    processes. Must be at least `num_processes`.
+    """
+
     slice: MultiprocessStepSlice = None
     """Instructions on how to slice tables for each subprocess."""
 
@@ -253,7 +264,7 @@ class Settings(PydanticBase):
     """
     The method to use for chunk training.
 
-    Valid values include {disabled, training, production, adaptive}.
+    Valid values include {disabled, training, production, adaptive, predictive}.
     See :ref:`chunk_size` for more details.
     """
 
@@ -280,6 +291,66 @@ class Settings(PydanticBase):
     list of models to checkpoint.
     """
 
+    checkpoint_format: str = "hdf5"
+    """
+    The storage format for the pipeline checkpoint store.
+
+    * `hdf5` - All checkpointed tables are stored in a single HDF5 file (with the
+      name given by `pipeline_file_name`, default "pipeline.h5").  This is the
+      default.
+    * `parquet` - Each checkpointed table version is written to a compressed
+      parquet file in a sub-directory named for its checkpoint, within a pipeline
+      directory named for `pipeline_file_name` without its extension (so, by
+      default, "output/pipeline/").  Checkpoint history is recorded in an
+      append-only manifest, and earlier versions of tables can be read back one
+      column at a time.
+    """
+
+    checkpoint_compression: str = "zstd"
+    """
+    Compression codec used when writing `parquet` checkpoints.
+
+    Any codec supported by pyarrow may be used (e.g. "snappy", "zstd", "lz4",
+    "gzip") or "none" to disable compression.
+    """
+
+    checkpoint_deltas: bool = False
+    """
+    Write only the changes to a table at each checkpoint.
+
+    When enabled, a checkpointed table is stored as a delta against its previous
+    checkpointed version: only columns that were added or whose values changed,
+    plus the other columns of any appended rows, are written.  Reading a table
+    (e.g. when resuming) reassembles it from these deltas.  A full copy of the
+    table is still written when most of its columns change, or when rows are
+    removed or reordered.
+
+    Pipeline stores written with this setting can only be read through the
+    pipeline API, not by reading the HDF5 file directly.
+    """
+
+    background_checkpoints: bool = False
+    """
+    Write checkpoints from a background thread.
+
+    When enabled, each checkpoint queues copies of the changed tables for a
+    background writer and the next model step starts immediately.  The run
+    only waits for queued checkpoints to be written when the pipeline store is
+    read (e.g. to get a table from an earlier checkpoint) or closed.
+
+    This requires `checkpoint_format: parquet`, as HDF5 files can't safely be
+    written from a background thread.
+    """
+
+    background_checkpoint_max_bytes: Optional[int] = None
+    """
+    Memory budget for checkpoint copies queued for the background writer.
+
+    When the queue is full, adding a checkpoint waits until earlier ones have
+    been written.  Defaults to a quarter of `chunk_size`, or no limit if
+    `chunk_size` is not set.
+    """
+
     check_for_variability: bool = False
     """
     Debugging feature to find broken model specifications.
@@ -457,3 +528,19 @@ class Settings(PydanticBase):
     """
 
     keep_mem_logs: bool = False
+
+    rng_base_seed: Union[int, None] = 0
+    """Base seed for pseudo-random number generator."""
+
+    rng_channel_type: str = "simple"
+    """
+    The type of random number stream used for each chooser table channel.
+
+    * `simple` - Reseed a numpy RandomState for each row and fast forward it
+      to the current offset. This is the default, and reproduces the random
+      streams (and thus the results) of earlier versions of ActivitySim.
+    * `philox` - Use a vectorized counter-based (Philox) generator keyed on
+      each row's id, which is much faster for large tables.  Results are
+      repeatable, including across chunking and multiprocessing, but differ
+      from those of the `simple` channel type.
+    """
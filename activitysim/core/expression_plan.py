@@ -0,0 +1,286 @@
+# ActivitySim
+# See full license in LICENSE.txt.
+import ast
+import hashlib
+import io
+import logging
+import tokenize
+
+import numpy as np
+import pandas as pd
+
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+logger = logging.getLogger(__name__)
+
+# kinds of compiled spec expressions:
+#   PYTHON - "@" expression, eval of a compiled python code object
+#   COLUMN - bare chooser column name
+#   VECTOR - arithmetic and comparisons over numeric columns, evaluated with
+#            numexpr (as pandas eval would) or numpy if numexpr is not installed
+#   FRAME - anything else, evaluated with pandas eval
+PYTHON = "python"
+COLUMN = "column"
+VECTOR = "vector"
+FRAME = "frame"
+
+_ARITHMETIC_OPS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow)
+_BITWISE_OPS = (ast.BitAnd, ast.BitOr, ast.BitXor)
+_COMPARE_OPS = (ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE)
+
+# compiled plans, keyed on a hash of the spec expressions
+_PLANS = {}
+
+
+def _replace_booleans(expr):
+    """
+    Replace ``&`` with ``and`` and ``|`` with ``or``, as pandas does before
+    parsing, so that these operators get boolean rather than bitwise precedence.
+    """
+    tokens = []
+    for tok in tokenize.generate_tokens(io.StringIO(expr).readline):
+        toknum, tokval = tok[0], tok[1]
+        if toknum == tokenize.OP and tokval == "&":
+            toknum, tokval = tokenize.NAME, "and"
+        elif toknum == tokenize.OP and tokval == "|":
+            toknum, tokval = tokenize.NAME, "or"
+        tokens.append((toknum, tokval))
+    return tokenize.untokenize(tokens)
+
+
+def _parse_frame_expression(expr):
+    """
+    Parse a DataFrame.eval expression with pandas precedence rules.
+
+    Returns
+    -------
+    tree : ast.Expression or None
+        None if expr cannot be parsed as a plain python expression
+        (e.g. it contains backtick quoted names or local variable references)
+    """
+    if "`" in expr or "@" in expr:
+        return None
+    try:
+        return ast.parse(_replace_booleans(expr).strip(), mode="eval")
+    except (SyntaxError, tokenize.TokenError):
+        return None
+
+
+class _VectorTransformer(ast.NodeTransformer):
+    """
+    Rewrite a parsed DataFrame.eval expression into an equivalent python
+    expression over numpy arrays, or raise ValueError if that can't be done.
+    """
+
+    def __init__(self):
+        self.names = set()
+        self.inverted_names = set()
+        self.arithmetic = False
+
+    def generic_visit(self, node):
+        raise ValueError(f"unsupported expression node {type(node).__name__}")
+
+    def visit_Expression(self, node):
+        node.body = self.visit(node.body)
+        return node
+
+    def visit_Name(self, node):
+        self.names.add(node.id)
+        return node
+
+    def visit_Constant(self, node):
+        if isinstance(node.value, str) or node.value is None:
+            raise ValueError("unsupported constant")
+        return node
+
+    def visit_BinOp(self, node):
+        if isinstance(node.op, _ARITHMETIC_OPS):
+            self.arithmetic = True
+        elif not isinstance(node.op, _BITWISE_OPS):
+            raise ValueError(f"unsupported operator {type(node.op).__name__}")
+        node.left = self.visit(node.left)
+        node.right = self.visit(node.right)
+        if isinstance(node.op, ast.Div):
+            # pandas casts integer terms of a division to float before evaluating
+            for n in ast.walk(node):
+                if isinstance(n, ast.Constant) and type(n.value) is int:
+                    n.value = float(n.value)
+        return node
+
+    def visit_BoolOp(self, node):
+        op = ast.BitAnd() if isinstance(node.op, ast.And) else ast.BitOr()
+        values = [self.visit(v) for v in node.values]
+        result = values[0]
+        for v in values[1:]:
+            result = ast.BinOp(left=result, op=op, right=v)
+        return result
+
+    def visit_UnaryOp(self, node):
+        if isinstance(node.op, (ast.Not, ast.Invert)):
+            if isinstance(node.operand, ast.Constant):
+                raise ValueError("unsupported inversion of constant")
+            if isinstance(node.operand, ast.Name):
+                self.inverted_names.add(node.operand.id)
+            return ast.UnaryOp(op=ast.Invert(), operand=self.visit(node.operand))
+        if isinstance(node.op, (ast.USub, ast.UAdd)):
+            node.operand = self.visit(node.operand)
+            return node
+        raise ValueError(f"unsupported operator {type(node.op).__name__}")
+
+    def visit_Compare(self, node):
+        # split chained comparisons into pairs joined with &, as pandas does
+        operands = [self.visit(node.left)] + [self.visit(c) for c in node.comparators]
+        result = None
+        for i, op in enumerate(node.ops):
+            if not isinstance(op, _COMPARE_OPS):
+                raise ValueError(f"unsupported comparison {type(op).__name__}")
+            pair = ast.Compare(
+                left=operands[i], ops=[op], comparators=[operands[i + 1]]
+            )
+            result = pair if result is None else ast.BinOp(result, ast.BitAnd(), pair)
+        return result
+
+
+class CompiledExpression(object):
+    """
+    A spec expression, parsed once and ready to be evaluated for any chooser chunk.
+    """
+
+    def __init__(self, expr):
+
+        self.expr = expr
+        self.kind = FRAME
+        self.code = None
+        self.source = None
+        self.names = ()
+        self.inverted_names = ()
+        self.arithmetic = False
+
+        if expr.startswith("@"):
+            self.kind = PYTHON
+            try:
+                self.code = compile(expr[1:], "<expression>", "eval")
+            except SyntaxError:
+                # leave it to eval to raise the error when evaluated
+                self.code = expr[1:]
+            return
+
+        tree = _parse_frame_expression(expr)
+        if tree is None:
+            return
+
+        if isinstance(tree.body, ast.Name):
+            self.kind = COLUMN
+            self.names = (tree.body.id,)
+            return
+
+        # names referenced, in case we need to fall back to pandas eval
+        self.names = tuple(
+            sorted({n.id for n in ast.walk(tree) if isinstance(n, ast.Name)})
+        )
+
+        transformer = _VectorTransformer()
+        try:
+            tree = ast.fix_missing_locations(transformer.visit(tree))
+            self.code = compile(tree, "<expression>", "eval")
+            self.source = ast.unparse(tree)
+        except (ValueError, SyntaxError, TypeError):
+            return
+
+        self.kind = VECTOR
+        self.inverted_names = tuple(transformer.inverted_names)
+        self.arithmetic = transformer.arithmetic
+
+    def _vector_compatible(self, dtypes):
+        for name in self.names:
+            dtype = dtypes.get(name)
+            if not isinstance(dtype, np.dtype) or dtype.kind not in "biuf":
+                return False
+            if dtype == np.float32:
+                # pandas downcasts constants to float32 in float32 expressions
+                return False
+            if dtype.kind == "b" and self.arithmetic:
+                # pandas and numpy disagree about arithmetic on booleans
+                return False
+            if dtype.kind != "b" and name in self.inverted_names:
+                return False
+        return True
+
+    def evaluate(self, df, dtypes, globals_dict, locals_dict):
+        """
+        Evaluate expression for the rows of df.
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            choosers
+        dtypes : dict
+            dtypes of df columns, by column name
+        globals_dict, locals_dict : dict
+            environment for "@" expressions
+
+        Returns
+        -------
+        expression_value : pandas.Series, numpy.ndarray or scalar
+        """
+        if self.kind == PYTHON:
+            return eval(self.code, globals_dict, locals_dict)
+
+        if self.kind == COLUMN and self.names[0] in dtypes:
+            return df[self.names[0]]
+
+        if self.kind == VECTOR and self._vector_compatible(dtypes):
+            arrays = {name: df[name].to_numpy() for name in self.names}
+            if numexpr is not None and self.names:
+                return numexpr.evaluate(self.source, local_dict=arrays)
+            with np.errstate(all="ignore"):
+                return eval(self.code, {"__builtins__": {}}, arrays)
+
+        if self.names and all(name in dtypes for name in self.names):
+            # only resolve the columns we need, rather than every column in df
+            resolvers = ({name: df[name] for name in self.names},)
+            return pd.eval(self.expr, resolvers=resolvers, target=df)
+
+        return df.eval(self.expr)
+
+
+class ExpressionPlan(object):
+    """
+    Compiled spec expressions, reused across chunks and segments.
+    """
+
+    def __init__(self, exprs):
+        self.expressions = [CompiledExpression(expr) for expr in exprs]
+
+    def __len__(self):
+        return len(self.expressions)
+
+    def __getitem__(self, i):
+        return self.expressions[i]
+
+
+def expression_plan(exprs):
+    """
+    Get the (cached) compiled ExpressionPlan for a sequence of spec expressions.
+
+    Parameters
+    ----------
+    exprs : sequence of str
+
+    Returns
+    -------
+    ExpressionPlan
+    """
+    exprs = [str(expr) for expr in exprs]
+    key = hashlib.sha1("\n".join(exprs).encode("utf8")).hexdigest()
+
+    plan = _PLANS.get(key)
+    if plan is None:
+        plan = _PLANS[key] = ExpressionPlan(exprs)
+        logger.debug(
+            "compiled expression plan %s for %s expressions" % (key[:8], len(exprs))
+        )
+    return plan
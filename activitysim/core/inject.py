@@ -183,6 +183,30 @@ def remove_injectable(name):
     orca._INJECTABLES.pop(name, None)
 
 
+def get_table_state():
+    """
+    Snapshot of the registered tables and columns, for restore_table_state
+    """
+    return dict(orca._TABLES), dict(orca._COLUMNS)
+
+
+def restore_table_state(table_state):
+    """
+    Restore the tables and columns registered when table_state was taken with get_table_state
+
+    This forgets any tables added (or replaced) since then, so that (for instance) a
+    multiprocessing work unit doesn't see tables left behind by the previous one.
+    """
+    tables, columns = table_state
+
+    orca._TABLES.clear()
+    orca._TABLES.update(tables)
+    orca._COLUMNS.clear()
+    orca._COLUMNS.update(columns)
+    orca._TABLE_CACHE.clear()
+    orca._COLUMN_CACHE.clear()
+
+
 def reinject_decorated_tables(steps=False):
     """
     reinject the decorated tables (and columns)
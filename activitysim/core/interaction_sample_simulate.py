@@ -186,93 +186,94 @@ def _interaction_sample_simulate(
             transpose=False,
         )
 
-    # reshape utilities (one utility column and one row per row in model_design)
-    # to a dataframe with one row per chooser and one column per alternative
-    # interaction_utilities is sparse because duplicate sampled alternatives were dropped
-    # so we need to pad with dummy utilities so low that they are never chosen
-
-    # number of samples per chooser
-    sample_counts = (
-        interaction_utilities.groupby(interaction_utilities.index).size().values
+    # interaction_utilities is sparse because duplicate sampled alternatives were dropped,
+    # so choosers have different numbers of alternatives. Since its index is sorted, the
+    # utilities of chooser i are rows offsets[i] to offsets[i + 1] of interaction_utilities
+    utilities = interaction_utilities.utility.values
+    utils_index = interaction_utilities.index.values
+    offsets = np.concatenate(
+        [[0], np.flatnonzero(utils_index[1:] != utils_index[:-1]) + 1, [len(utilities)]]
     )
-    chunk.log_df(trace_label, "sample_counts", sample_counts)
+    chunk.log_df(trace_label, "offsets", offsets)
+    del utils_index
 
-    # max number of alternatvies for any chooser
-    max_sample_count = sample_counts.max()
+    # offsets of the first rows of each chooser in sparse interaction_utilities
+    first_row_offsets = offsets[:-1]
 
-    # offsets of the first and last rows of each chooser in sparse interaction_utilities
-    last_row_offsets = sample_counts.cumsum()
-    first_row_offsets = np.insert(last_row_offsets[:-1], 0, 0)
+    # number of samples per chooser
+    sample_counts = np.diff(offsets)
 
-    # repeat the row offsets once for each dummy utility to insert
-    # (we want to insert dummy utilities at the END of the list of alternative utilities)
-    # inserts is a list of the indices at which we want to do the insertions
-    inserts = np.repeat(last_row_offsets, max_sample_count - sample_counts)
+    del interaction_utilities
+    chunk.log_df(trace_label, "interaction_utilities", None)
+    chunk.log_df(trace_label, "utilities", utilities)
 
-    del sample_counts
-    chunk.log_df(trace_label, "sample_counts", None)
+    if have_trace_targets:
+        # pad utilities to a dataframe with one row per chooser and one column per alternative,
+        # with dummy utilities so low that they are never chosen, so probs can be traced
 
-    # insert the zero-prob utilities to pad each alternative set to same size
-    padded_utilities = np.insert(interaction_utilities.utility.values, inserts, -999)
-    chunk.log_df(trace_label, "padded_utilities", padded_utilities)
-    del inserts
+        # max number of alternatvies for any chooser
+        max_sample_count = sample_counts.max()
 
-    del interaction_utilities
-    chunk.log_df(trace_label, "interaction_utilities", None)
+        # repeat the row offsets once for each dummy utility to insert
+        # (we want to insert dummy utilities at the END of the list of alternative utilities)
+        # inserts is a list of the indices at which we want to do the insertions
+        inserts = np.repeat(offsets[1:], max_sample_count - sample_counts)
 
-    # reshape to array with one row per chooser, one column per alternative
-    padded_utilities = padded_utilities.reshape(-1, max_sample_count)
+        # insert the zero-prob utilities to pad each alternative set to same size
+        padded_utilities = np.insert(utilities, inserts, -999)
+        chunk.log_df(trace_label, "padded_utilities", padded_utilities)
+        del inserts
 
-    # convert to a dataframe with one row per chooser and one column per alternative
-    utilities_df = pd.DataFrame(padded_utilities, index=choosers.index)
-    chunk.log_df(trace_label, "utilities_df", utilities_df)
+        # reshape to array with one row per chooser, one column per alternative
+        padded_utilities = padded_utilities.reshape(-1, max_sample_count)
 
-    del padded_utilities
-    chunk.log_df(trace_label, "padded_utilities", None)
+        # convert to a dataframe with one row per chooser and one column per alternative
+        utilities_df = pd.DataFrame(padded_utilities, index=choosers.index)
+        chunk.log_df(trace_label, "utilities_df", utilities_df)
+
+        del padded_utilities
+        chunk.log_df(trace_label, "padded_utilities", None)
 
-    if have_trace_targets:
         tracing.trace_df(
             utilities_df,
             tracing.extend_trace_label(trace_label, "utilities"),
             column_labels=["alternative", "utility"],
         )
 
-    # convert to probabilities (utilities exponentiated and normalized to probs)
-    # probs is same shape as utilities, one row per chooser and one column for alternative
-    probs = logit.utils_to_probs(
-        utilities_df,
-        allow_zero_probs=allow_zero_probs,
-        trace_label=trace_label,
-        trace_choosers=choosers,
-    )
-    chunk.log_df(trace_label, "probs", probs)
-
-    if want_logsums:
-        logsums = logit.utils_to_logsums(
-            utilities_df, allow_zero_probs=allow_zero_probs
+        # convert to probabilities (utilities exponentiated and normalized to probs)
+        # probs is same shape as utilities, one row per chooser and one column for alternative
+        probs = logit.utils_to_probs(
+            utilities_df,
+            allow_zero_probs=allow_zero_probs,
+            trace_label=trace_label,
+            trace_choosers=choosers,
         )
-        chunk.log_df(trace_label, "logsums", logsums)
+        chunk.log_df(trace_label, "probs", probs)
 
-    del utilities_df
-    chunk.log_df(trace_label, "utilities_df", None)
+        if want_logsums or skip_choice:
+            logsums = logit.utils_to_logsums(
+                utilities_df, allow_zero_probs=allow_zero_probs
+            )
+            chunk.log_df(trace_label, "logsums", logsums)
+
+        del utilities_df
+        chunk.log_df(trace_label, "utilities_df", None)
 
-    if have_trace_targets:
         tracing.trace_df(
             probs,
             tracing.extend_trace_label(trace_label, "probs"),
             column_labels=["alternative", "probability"],
         )
 
-    if allow_zero_probs:
-        zero_probs = probs.sum(axis=1) == 0
-        if zero_probs.any():
-            # FIXME this is kind of gnarly, but we force choice of first alt
-            probs.loc[zero_probs, 0] = 1.0
+        if allow_zero_probs:
+            zero_probs = probs.sum(axis=1) == 0
+            if zero_probs.any():
+                # FIXME this is kind of gnarly, but we force choice of first alt
+                probs.loc[zero_probs, 0] = 1.0
 
-    if skip_choice:
-        return choosers.join(logsums.to_frame("logsums"))
+        if skip_choice:
+            return choosers.join(logsums.to_frame("logsums"))
 
-    else:
         # make choices
         # positions is series with the chosen alternative represented as a column index in probs
         # which is an integer between zero and num alternatives in the alternative sample
@@ -286,53 +287,80 @@ def _interaction_sample_simulate(
         del probs
         chunk.log_df(trace_label, "probs", None)
 
-        # shouldn't have chosen any of the dummy pad utilities
-        assert positions.max() < max_sample_count
+    elif skip_choice:
+        logsums = logit.ragged_utils_to_logsums(utilities, offsets, choosers.index)
+        return choosers.join(logsums.to_frame("logsums"))
+
+    else:
+        # probs are not needed for tracing, so choose directly from the ragged utilities
+        # of each chooser, without padding them to the same number of alternatives
+        positions, rands, logsums = logit.ragged_utils_to_choices(
+            utilities,
+            offsets,
+            choosers,
+            trace_label=trace_label,
+            allow_zero_probs=allow_zero_probs,
+        )
 
-        # need to get from an integer offset into the alternative sample to the alternative index
-        # that is, we want the index value of the row that is offset by <position> rows into the
-        # tranche of this choosers alternatives created by cross join of alternatives and choosers
+        chunk.log_df(trace_label, "positions", positions)
+        chunk.log_df(trace_label, "rands", rands)
+        chunk.log_df(trace_label, "logsums", logsums)
 
-        # resulting pandas Int64Index has one element per chooser row and is in same order as choosers
-        choices = alternatives[choice_column].take(positions + first_row_offsets)
+        if allow_zero_probs:
+            # FIXME this is kind of gnarly, but we force choice of first alt
+            zero_probs = positions < 0
+            positions[zero_probs] = 0
 
-        # create a series with index from choosers and the index of the chosen alternative
-        choices = pd.Series(choices, index=choosers.index)
+    del utilities
+    chunk.log_df(trace_label, "utilities", None)
 
-        chunk.log_df(trace_label, "choices", choices)
+    # shouldn't have chosen any of the dummy pad utilities
+    assert (positions.values < sample_counts).all()
 
-        if allow_zero_probs and zero_probs.any() and zero_prob_choice_val is not None:
-            # FIXME this is kind of gnarly, patch choice for zero_probs
-            choices.loc[zero_probs] = zero_prob_choice_val
+    # need to get from an integer offset into the alternative sample to the alternative index
+    # that is, we want the index value of the row that is offset by <position> rows into the
+    # tranche of this choosers alternatives created by cross join of alternatives and choosers
 
-        if have_trace_targets:
-            tracing.trace_df(
-                choices,
-                tracing.extend_trace_label(trace_label, "choices"),
-                columns=[None, trace_choice_name],
-            )
+    # resulting pandas Int64Index has one element per chooser row and is in same order as choosers
+    choices = alternatives[choice_column].take(positions + first_row_offsets)
+
+    # create a series with index from choosers and the index of the chosen alternative
+    choices = pd.Series(choices, index=choosers.index)
+
+    chunk.log_df(trace_label, "choices", choices)
+
+    if allow_zero_probs and zero_probs.any() and zero_prob_choice_val is not None:
+        # FIXME this is kind of gnarly, patch choice for zero_probs
+        choices.loc[zero_probs] = zero_prob_choice_val
+
+    if have_trace_targets:
+        tracing.trace_df(
+            choices,
+            tracing.extend_trace_label(trace_label, "choices"),
+            columns=[None, trace_choice_name],
+        )
+        tracing.trace_df(
+            rands,
+            tracing.extend_trace_label(trace_label, "rands"),
+            columns=[None, "rand"],
+        )
+        if want_logsums:
             tracing.trace_df(
-                rands,
-                tracing.extend_trace_label(trace_label, "rands"),
-                columns=[None, "rand"],
+                logsums,
+                tracing.extend_trace_label(trace_label, "logsum"),
+                columns=[None, "logsum"],
             )
-            if want_logsums:
-                tracing.trace_df(
-                    logsums,
-                    tracing.extend_trace_label(trace_label, "logsum"),
-                    columns=[None, "logsum"],
-                )
 
-        if want_logsums:
-            choices = choices.to_frame("choice")
-            choices["logsum"] = logsums
+    if want_logsums:
+        choices = choices.to_frame("choice")
+        choices["logsum"] = logsums
 
-        chunk.log_df(trace_label, "choices", choices)
+    chunk.log_df(trace_label, "choices", choices)
 
-        # handing this off to our caller
-        chunk.log_df(trace_label, "choices", None)
+    # handing this off to our caller
+    chunk.log_df(trace_label, "choices", None)
 
-        return choices
+    return choices
 
 
 def interaction_sample_simulate(
@@ -7,7 +7,12 @@ import numpy as np
 import pandas as pd
 
 from . import config, pipeline, tracing
-from .choosing import choice_maker
+from .choosing import (
+    choice_maker,
+    logit_choice_maker,
+    ragged_logit_choice_maker,
+    ragged_logsum_maker,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -268,6 +273,270 @@ def make_choices(probs, trace_label=None, trace_choosers=None, allow_bad_probs=F
     return choices, rands
 
 
+def utils_to_choices(
+    utils,
+    trace_label=None,
+    exponentiated=False,
+    allow_zero_probs=False,
+    trace_choosers=None,
+):
+    """
+    Make choices for each chooser directly from a table of utilities.
+
+    This is equivalent to `utils_to_probs` followed by `make_choices`, but
+    exponentiation, normalization, validation and choice are done row by row
+    in a single numba kernel so the table of probabilities is never built.
+    Callers that need to trace or otherwise inspect the probabilities should
+    continue to use `utils_to_probs` and `make_choices`.
+
+    Parameters
+    ----------
+    utils : pandas.DataFrame
+        Rows should be choosers and columns should be alternatives.
+
+    trace_label : str
+        label for tracing bad utility or probability values
+
+    exponentiated : bool
+        True if utilities have already been exponentiated
+
+    allow_zero_probs : bool
+        if True, rows in which all utility alts are EXP_UTIL_MIN are not
+        reported as errors, and are given a choice of -1
+
+    trace_choosers : pandas.dataframe
+        the choosers df (for interaction_simulate) to facilitate the reporting of hh_id
+        by report_bad_choices because it can't deduce hh_id from the interaction_dataset
+        which is indexed on index values from alternatives df
+
+    Returns
+    -------
+    choices : pandas.Series
+        Maps chooser IDs (from `utils` index) to a choice, where the choice
+        is an index into the columns of `utils`.
+
+    rands : pandas.Series
+        The random numbers used to make the choices (for debugging, tracing)
+
+    choice_probs : pandas.Series
+        The probability of the chosen alternative.
+    """
+    trace_label = tracing.extend_trace_label(trace_label, "utils_to_choices")
+
+    utils_arr = utils.values
+    if utils_arr.dtype.kind != "f":
+        utils_arr = utils_arr.astype(np.float64)
+
+    rands = pipeline.get_rn_generator().random_for_df(utils)
+    rands = np.asanyarray(rands).reshape(-1)
+
+    choices, choice_probs, status = logit_choice_maker(
+        utils_arr, rands, EXP_UTIL_MIN, exponentiated=exponentiated
+    )
+
+    if not allow_zero_probs:
+        zero_probs = status == 1
+        if zero_probs.any():
+            report_bad_choices(
+                zero_probs,
+                utils,
+                trace_label=tracing.extend_trace_label(trace_label, "zero_prob_utils"),
+                msg="all probabilities are zero",
+                trace_choosers=trace_choosers,
+            )
+
+    inf_utils = status == 2
+    if inf_utils.any():
+        report_bad_choices(
+            inf_utils,
+            utils,
+            trace_label=tracing.extend_trace_label(trace_label, "inf_exp_utils"),
+            msg="infinite exponentiated utilities",
+            trace_choosers=trace_choosers,
+        )
+
+    # even if allow_zero_probs, as make_choices reports probs that do not add up to 1
+    nan_utils = status == 3
+    if nan_utils.any():
+        report_bad_choices(
+            nan_utils,
+            utils,
+            trace_label=tracing.extend_trace_label(trace_label, "nan_utils"),
+            msg="nan utilities",
+            trace_choosers=trace_choosers,
+        )
+
+    choices = pd.Series(choices, index=utils.index)
+    rands = pd.Series(rands, index=utils.index)
+    choice_probs = pd.Series(choice_probs, index=utils.index)
+
+    return choices, rands, choice_probs
+
+
+def ragged_utils_to_frame(utils, offsets, index):
+    """
+    Pad ragged utilities to a table with one row per chooser and one column per alternative.
+
+    Parameters
+    ----------
+    utils : numpy.ndarray
+        utilities of the alternatives of all choosers, chooser by chooser
+    offsets : numpy.ndarray of int
+        the alternatives of chooser i are utils[offsets[i]:offsets[i + 1]]
+    index : pandas.Index
+        chooser index
+
+    Returns
+    -------
+    utils : pandas.DataFrame
+        padded with nan for choosers with fewer alternatives than the most
+    """
+    counts = np.diff(offsets)
+    rows = np.repeat(np.arange(len(counts)), counts)
+    cols = np.arange(len(utils)) - np.repeat(offsets[:-1], counts)
+
+    padded = np.full((len(counts), counts.max(initial=0)), np.nan, dtype=utils.dtype)
+    padded[rows, cols] = utils
+
+    return pd.DataFrame(padded, index=index)
+
+
+def _report_bad_ragged_choices(
+    status, utils, offsets, trace_choosers, trace_label, allow_zero_probs
+):
+    """
+    report_bad_choices for rows with bad status from the ragged logit kernels
+    """
+
+    bad_rows = (status >= 2) | ((status == 1) & (not allow_zero_probs))
+    if not bad_rows.any():
+        return
+
+    utils_df = ragged_utils_to_frame(utils, offsets, trace_choosers.index)
+
+    if not allow_zero_probs:
+        zero_probs = status == 1
+        if zero_probs.any():
+            report_bad_choices(
+                zero_probs,
+                utils_df,
+                trace_label=tracing.extend_trace_label(trace_label, "zero_prob_utils"),
+                msg="all probabilities are zero",
+                trace_choosers=trace_choosers,
+            )
+
+    inf_utils = status == 2
+    if inf_utils.any():
+        report_bad_choices(
+            inf_utils,
+            utils_df,
+            trace_label=tracing.extend_trace_label(trace_label, "inf_exp_utils"),
+            msg="infinite exponentiated utilities",
+            trace_choosers=trace_choosers,
+        )
+
+    nan_utils = status == 3
+    if nan_utils.any():
+        report_bad_choices(
+            nan_utils,
+            utils_df,
+            trace_label=tracing.extend_trace_label(trace_label, "nan_utils"),
+            msg="nan utilities",
+            trace_choosers=trace_choosers,
+        )
+
+
+def ragged_utils_to_choices(
+    utils,
+    offsets,
+    choosers,
+    trace_label=None,
+    allow_zero_probs=False,
+):
+    """
+    Make choices for each chooser from ragged utilities.
+
+    Each chooser has its own number of alternatives, whose utilities are a segment of
+    one flat array, so utilities need not be padded to a table (as for `utils_to_choices`).
+    Probabilities, choices and logsums are computed segment by segment in a numba kernel.
+
+    Parameters
+    ----------
+    utils : numpy.ndarray
+        utilities of the alternatives of all choosers, chooser by chooser
+    offsets : numpy.ndarray of int
+        the alternatives of chooser i are utils[offsets[i]:offsets[i + 1]]
+    choosers : pandas.DataFrame
+        the choosers, used for their index, random numbers and for reporting bad utilities
+
+    trace_label : str
+        label for tracing bad utility or probability values
+
+    allow_zero_probs : bool
+        if True, rows in which all utility alts are EXP_UTIL_MIN are not
+        reported as errors, and are given a choice of -1
+
+    Returns
+    -------
+    choices : pandas.Series
+        Maps chooser IDs to a choice, where the choice is an offset into the chooser's alternatives.
+
+    rands : pandas.Series
+        The random numbers used to make the choices (for debugging, tracing)
+
+    logsums : pandas.Series
+        logsum of the utilities of each chooser's alternatives
+    """
+    trace_label = tracing.extend_trace_label(trace_label, "ragged_utils_to_choices")
+
+    assert len(offsets) == len(choosers) + 1
+
+    if utils.dtype.kind != "f":
+        utils = utils.astype(np.float64)
+
+    rands = pipeline.get_rn_generator().random_for_df(choosers)
+    rands = np.asanyarray(rands).reshape(-1)
+
+    choices, _, logsums, status = ragged_logit_choice_maker(
+        utils, offsets, rands, EXP_UTIL_MIN
+    )
+
+    _report_bad_ragged_choices(
+        status, utils, offsets, choosers, trace_label, allow_zero_probs
+    )
+
+    choices = pd.Series(choices, index=choosers.index)
+    rands = pd.Series(rands, index=choosers.index)
+    logsums = pd.Series(logsums.astype(utils.dtype), index=choosers.index)
+
+    return choices, rands, logsums
+
+
+def ragged_utils_to_logsums(utils, offsets, index):
+    """
+    Logsums of ragged utilities (see `ragged_utils_to_choices`)
+
+    Parameters
+    ----------
+    utils : numpy.ndarray
+    offsets : numpy.ndarray of int
+    index : pandas.Index
+        chooser index
+
+    Returns
+    -------
+    logsums : pandas.Series
+        -inf for choosers with no available alternatives, and nan for choosers with nan
+        utilities, as from `utils_to_logsums`
+    """
+    if utils.dtype.kind != "f":
+        utils = utils.astype(np.float64)
+
+    logsums, _ = ragged_logsum_maker(utils, offsets, EXP_UTIL_MIN)
+
+    return pd.Series(logsums.astype(utils.dtype), index=index)
+
+
 def interaction_dataset(
     choosers, alternatives, sample_size=None, alt_index_id=None, chooser_index_id=None
 ):
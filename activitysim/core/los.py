@@ -10,12 +10,18 @@ import pandas as pd
 from activitysim.core import skim_dataset  # noqa: F401
 from activitysim.core import config, inject, pathbuilder, skim_dictionary, tracing, util
 from activitysim.core.cleaning import recode_based_on_table
-from activitysim.core.skim_dict_factory import MemMapSkimFactory, NumpyArraySkimFactory
+from activitysim.core.maz_to_maz import MAZ_TO_MAZ_TAG, MazToMazSkims
+from activitysim.core.skim_dict_factory import (
+    MemMapSkimFactory,
+    NumpyArraySkimFactory,
+    SkimStoreFactory,
+)
 from activitysim.core.skim_dictionary import NOT_IN_SKIM_ZONE_ID
 
 skim_factories = {
     "NumpyArraySkimFactory": NumpyArraySkimFactory,
     "MemMapSkimFactory": MemMapSkimFactory,
+    "SkimStoreFactory": SkimStoreFactory,
 }
 
 logger = logging.getLogger(__name__)
@@ -54,9 +60,9 @@ class Network_LOS(object):
 
       # TWO_ZONE and THREE_ZONE
       maz_taz_df: pandas.DataFrame        # DataFrame with two columns, MAZ and TAZ, mapping MAZ to containing TAZ
-      maz_to_maz_df: pandas.DataFrame     # maz_to_maz attributes for MazSkimDict sparse skims
-                                          # indexed by synthetic omaz/dmaz index for faster get_mazpairs lookup)
-      maz_ceiling: int                    # max maz_id + 1 (to compute synthetic omaz/dmaz index by get_mazpairs)
+      maz_to_maz: MazToMazSkims           # maz_to_maz attributes for MazSkimDict sparse skims
+                                          # in compressed sparse row form for fast get_mazpairs lookup
+      maz_ceiling: int                    # max maz_id + 1 (to compute synthetic omaz/dmaz index of maz_to_maz_df)
       max_blend_distance: dict            # dict of int maz_to_maz max_blend_distance values keyed by skim_tag
 
       # THREE_ZONE only
@@ -81,7 +87,7 @@ class Network_LOS(object):
 
         # TWO_ZONE and THREE_ZONE
         self.maz_taz_df = None
-        self.maz_to_maz_df = None
+        self.maz_to_maz = None
         self.maz_ceiling = None
         self.max_blend_distance = {}
 
@@ -283,34 +289,9 @@ class Network_LOS(object):
 
             self.maz_ceiling = self.maz_taz_df.MAZ.max() + 1
 
-            # maz_to_maz_df
-            maz_to_maz_tables = self.setting("maz_to_maz.tables")
-            maz_to_maz_tables = (
-                [maz_to_maz_tables]
-                if isinstance(maz_to_maz_tables, str)
-                else maz_to_maz_tables
-            )
-            for file_name in maz_to_maz_tables:
-
-                df = pd.read_csv(config.data_file_path(file_name, mandatory=True))
-
-                df["i"] = df.OMAZ * self.maz_ceiling + df.DMAZ
-                df.set_index("i", drop=True, inplace=True, verify_integrity=True)
-                logger.debug(
-                    f"loading maz_to_maz table {file_name} with {len(df)} rows"
-                )
-
-                # FIXME - don't really need these columns, but if we do want them,
-                #  we would need to merge them in since files may have different numbers of rows
-                df.drop(columns=["OMAZ", "DMAZ"], inplace=True)
-
-                # besides, we only want data columns so we can coerce to same type as skims
-                df = df.astype(np.dtype(self.skim_dtype_name))
-
-                if self.maz_to_maz_df is None:
-                    self.maz_to_maz_df = df
-                else:
-                    self.maz_to_maz_df = pd.concat([self.maz_to_maz_df, df], axis=1)
+            # maz_to_maz pairs in compressed sparse row form for get_mazpairs
+            self.maz_to_maz = MazToMazSkims(self)
+            self.maz_to_maz.load_data()
 
         # load tap tables
         if self.zone_system == THREE_ZONE:
@@ -442,7 +423,7 @@ class Network_LOS(object):
         if self.zone_system in [TWO_ZONE, THREE_ZONE]:
             if not config.setting("sharrow", False):
                 # create MazSkimDict facade skim_dict
-                # (must have already loaded dependencies: taz skim_dict, maz_to_maz_df, and maz_taz_df)
+                # (must have already loaded dependencies: taz skim_dict, maz_to_maz, and maz_taz_df)
                 assert "maz" not in self.skim_dicts
                 maz_skim_dict = self.create_skim_dict("maz")
                 self.skim_dicts["maz"] = maz_skim_dict
@@ -494,7 +475,7 @@ class Network_LOS(object):
 
         if skim_tag == "maz":
             # MazSkimDict gets a reference to self here, because it has dependencies on self.load_data
-            # (e.g. maz_to_maz_df, maz_taz_df...) We pass in taz_skim_dict as a parameter
+            # (e.g. maz_to_maz, maz_taz_df...) We pass in taz_skim_dict as a parameter
             # to hilight the fact that we do not want two copies of its (very large) data array in memory
             assert (
                 "taz" in self.skim_dicts
@@ -588,6 +569,45 @@ class Network_LOS(object):
     def skim_digital_encoding(self, skim_tag):
         return self.setting(f"{skim_tag}_skims.digital-encoding", [])
 
+    def skim_lookup_settings(self):
+        """
+        Return settings for large skim lookups
+
+        Returns
+        -------
+        dict
+            lookup_threshold (od pairs in a large lookup) and lookup_order ('chooser' or 'blocked')
+        """
+        lookup_order = self.setting("skim_lookup_order", "chooser")
+        if lookup_order not in skim_dictionary.LOOKUP_ORDERS:
+            raise RuntimeError(
+                f"skim_lookup_order '{lookup_order}' not in {skim_dictionary.LOOKUP_ORDERS}"
+            )
+        return {
+            "lookup_threshold": self.setting(
+                "skim_lookup_threshold", skim_dictionary.DEFAULT_LOOKUP_THRESHOLD
+            ),
+            "lookup_order": lookup_order,
+        }
+
+    def skim_quantization(self, skim_tag):
+        """
+        Return skim quantization settings for the specified skim_tag (e.g. 'taz')
+
+        Parameters
+        ----------
+        skim_tag: str (e.g. 'taz')
+
+        Returns
+        -------
+        dict or None
+            e.g. {'dtype': 'int16', 'max_error': 0.01}, or None if skims are not quantized
+        """
+        quantization = self.setting(f"{skim_tag}_skims.quantize", None)
+        if quantization is True:
+            quantization = {"dtype": "int16"}
+        return quantization or None
+
     def multiprocess(self):
         """
         return True if this is a multiprocessing run (even if it is a main or single-process subprocess)
@@ -621,6 +641,9 @@ class Network_LOS(object):
                     self.skims_info[skim_tag], shared_data_buffers[skim_tag]
                 )
 
+        if MAZ_TO_MAZ_TAG in shared_data_buffers:
+            MazToMazSkims(self).load_data_to_buffer(shared_data_buffers[MAZ_TO_MAZ_TAG])
+
         if self.zone_system == THREE_ZONE:
             assert self.tvpb is not None
 
@@ -661,14 +684,41 @@ class Network_LOS(object):
                     self.skims_info[skim_tag], shared=True
                 )
 
+        if self.zone_system in [TWO_ZONE, THREE_ZONE]:
+            skim_buffers[MAZ_TO_MAZ_TAG] = MazToMazSkims(self).allocate_data_buffer()
+
         if self.zone_system == THREE_ZONE:
             assert self.tvpb is not None
             skim_buffers[
                 self.tvpb.tap_cache.cache_tag
             ] = self.tvpb.tap_cache.allocate_data_buffer(shared=True)
+            if self.tvpb.tap_cache.is_dynamic:
+                skim_buffers[
+                    self.tvpb.tap_cache.claims_tag
+                ] = self.tvpb.tap_cache.allocate_claims_buffer()
 
         return skim_buffers
 
+    def write_tvpb_cache(self, shared_data_buffers=None):
+        """
+        Save the populated portion of a DYNAMIC tvpb tap_tap cache for use in subsequent runs.
+        (A STATIC cache is written by the initialize_tvpb step, so nothing to do)
+
+        Parameters
+        ----------
+        shared_data_buffers: dict of multiprocessing.RawArray keyed by skim_tag or None
+            when multiprocessing, the buffers allocated by allocate_shared_skim_buffers
+        """
+
+        if self.zone_system != THREE_ZONE or not self.tvpb.tap_cache.is_dynamic:
+            return
+
+        tap_cache = self.tvpb.tap_cache
+        if shared_data_buffers is not None:
+            tap_cache.write_dynamic_cache(shared_data_buffers[tap_cache.cache_tag])
+        else:
+            tap_cache.write_dynamic_cache()
+
     def get_skim_dict(self, skim_tag):
         """
         Get SkimDict for the specified skim_tag (e.g. 'taz', 'maz', or 'tap')
@@ -684,19 +734,19 @@ class Network_LOS(object):
             from .skim_dataset import SkimDataset
 
             if skim_tag == "maz":
-                return SkimDataset(skim_dataset)
+                return SkimDataset(skim_dataset, **self.skim_lookup_settings())
             else:
                 dropdims = ["omaz", "dmaz"]
                 skim_dataset = skim_dataset.drop_dims(dropdims, errors="ignore")
                 for dd in dropdims:
                     if f"dim_redirection_{dd}" in skim_dataset.attrs:
                         del skim_dataset.attrs[f"dim_redirection_{dd}"]
-                return SkimDataset(skim_dataset)
+                return SkimDataset(skim_dataset, **self.skim_lookup_settings())
         elif sharrow_enabled and skim_tag in ("tap"):
             tap_dataset = inject.get_injectable("tap_dataset")
             from .skim_dataset import SkimDataset
 
-            return SkimDataset(tap_dataset)
+            return SkimDataset(tap_dataset, **self.skim_lookup_settings())
         else:
             assert (
                 skim_tag in self.skim_dicts
@@ -719,30 +769,20 @@ class Network_LOS(object):
 
     def get_mazpairs(self, omaz, dmaz, attribute):
         """
-        look up attribute values of maz od pairs in sparse maz_to_maz df
+        look up attribute values of maz od pairs in sparse maz_to_maz pairs
 
         Parameters
         ----------
         omaz: array-like list of omaz zone_ids
         dmaz: array-like list of omaz zone_ids
-        attribute: str name of attribute column in maz_to_maz_df
+        attribute: str name of maz_to_maz attribute
 
         Returns
         -------
-        Numpy.ndarray: list of attribute values for od pairs
+        Numpy.ndarray: list of attribute values for od pairs (nan for pairs not in maz_to_maz tables)
         """
 
-        # # this is slower
-        # s = pd.merge(pd.DataFrame({'OMAZ': omaz, 'DMAZ': dmaz}),
-        #              self.maz_to_maz_df,
-        #              how="left")[attribute]
-
-        # synthetic index method i : omaz_dmaz
-        i = np.asanyarray(omaz) * self.maz_ceiling + np.asanyarray(dmaz)
-        s = util.quick_loc_df(i, self.maz_to_maz_df, attribute)
-
-        # FIXME - no point in returning series?
-        return np.asanyarray(s)
+        return self.maz_to_maz.lookup(omaz, dmaz, attribute)
 
     def get_tappairs3d(self, otap, dtap, dim3, key):
         """
@@ -877,6 +917,16 @@ class Network_LOS(object):
         assert isinstance(taps, np.ndarray)
         return taps
 
+    @property
+    def maz_to_maz_df(self):
+        """
+        maz_to_maz attributes as a DataFrame indexed by synthetic omaz/dmaz index
+        (built on demand - get_mazpairs looks up pairs in the sparse maz_to_maz arrays)
+        """
+        if self.maz_to_maz is None:
+            return None
+        return self.maz_to_maz.to_frame(self.maz_ceiling)
+
     @property
     def get_maz_to_taz_series(self):
         """
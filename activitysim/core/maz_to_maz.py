@@ -0,0 +1,343 @@
+# ActivitySim
+# See full license in LICENSE.txt.
+import logging
+import multiprocessing
+
+import numba
+import numpy as np
+import pandas as pd
+
+from activitysim.core import config, inject, util
+
+logger = logging.getLogger(__name__)
+
+# data_buffers key of the shared maz_to_maz data when multiprocessing
+MAZ_TO_MAZ_TAG = "maz_to_maz"
+
+# shared data buffer header: number of offsets, number of pairs
+HEADER_DTYPE = np.dtype("int64")
+HEADER_SIZE = 2
+
+OFFSET_DTYPE = np.dtype("int64")
+DEST_DTYPE = np.dtype("int32")
+
+
+@numba.njit(nogil=True)
+def _pair_positions(offsets, dests, omaz, dmaz):
+    """
+    Binary search the sorted destinations of each origin for the position of each od pair
+
+    Parameters
+    ----------
+    offsets : numpy.ndarray of int64
+        dests[offsets[o]:offsets[o + 1]] are the (sorted) destinations of origin o
+    dests : numpy.ndarray of int32
+    omaz : numpy.ndarray of int64
+    dmaz : numpy.ndarray of int64
+
+    Returns
+    -------
+    positions : numpy.ndarray of int64
+        position of each od pair in dests, or -1 if there is no such pair
+    """
+    num_origins = len(offsets) - 1
+    positions = np.full(len(omaz), -1, dtype=np.int64)
+    for i in range(len(omaz)):
+        o = omaz[i]
+        if o < 0 or o >= num_origins:
+            continue
+        d = dmaz[i]
+        lo = offsets[o]
+        end = offsets[o + 1]
+        hi = end
+        while lo < hi:
+            mid = (lo + hi) >> 1
+            if dests[mid] < d:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < end and dests[lo] == d:
+            positions[i] = lo
+    return positions
+
+
+@numba.njit(nogil=True)
+def _pair_values(offsets, dests, values, omaz, dmaz):
+    """
+    Return values of od pairs, or nan where there is no such pair
+
+    Parameters
+    ----------
+    offsets : numpy.ndarray of int64
+    dests : numpy.ndarray of int32
+    values : numpy.ndarray
+        values of one attribute, in the same order as dests
+    omaz : numpy.ndarray of int64
+    dmaz : numpy.ndarray of int64
+
+    Returns
+    -------
+    numpy.ndarray of values.dtype
+    """
+    positions = _pair_positions(offsets, dests, omaz, dmaz)
+    result = np.empty(len(positions), dtype=values.dtype)
+    for i in range(len(positions)):
+        if positions[i] < 0:
+            result[i] = np.nan
+        else:
+            result[i] = values[positions[i]]
+    return result
+
+
+class MazToMazSkims(object):
+    """
+    Sparse maz_to_maz attributes (e.g. DIST, DISTWALK) in compressed sparse row (CSR) form
+
+    The union of the od pairs in all the maz_to_maz tables is stored sorted by origin and then
+    destination, so the destinations of origin o are dests[offsets[o]:offsets[o + 1]], and the
+    values of each attribute are stored in a row of values in the same order. Attributes not in
+    the table an od pair came from are nan.
+
+    Pairs are found by a binary search of the destinations of their origin, so each pair costs
+    only its int32 destination plus its attribute values, rather than an int64 index entry and a
+    hash table slot, and the arrays can be shared by all processes when multiprocessing in the
+    same way as the dense skims.
+    """
+
+    def __init__(self, network_los):
+
+        self.network_los = network_los
+        self.dtype = np.dtype(network_los.skim_dtype_name)
+
+        table_names = network_los.setting("maz_to_maz.tables")
+        self.table_names = (
+            [table_names] if isinstance(table_names, str) else list(table_names)
+        )
+
+        # attribute columns of each table (reading only the header, so we can size shared buffers)
+        self.table_columns = {}
+        for file_name in self.table_names:
+            columns = pd.read_csv(self._table_path(file_name), nrows=0).columns
+            self.table_columns[file_name] = [
+                c for c in columns if c not in ["OMAZ", "DMAZ"]
+            ]
+
+        self.columns = [c for cols in self.table_columns.values() for c in cols]
+        duplicates = pd.Index(self.columns)[pd.Index(self.columns).duplicated()]
+        if len(duplicates):
+            raise RuntimeError(
+                f"maz_to_maz attributes {list(duplicates)} appear in more than one of the "
+                f"maz_to_maz tables {self.table_names}"
+            )
+        self.column_index = {c: i for i, c in enumerate(self.columns)}
+
+        self.offsets = None
+        self.dests = None
+        self.values = None
+
+    def _table_path(self, file_name):
+        return config.data_file_path(file_name, mandatory=True)
+
+    @property
+    def num_pairs(self):
+        return len(self.dests)
+
+    @property
+    def nbytes(self):
+        return self.offsets.nbytes + self.dests.nbytes + self.values.nbytes
+
+    def _read_pair_keys(self, usecols=None):
+        """
+        Read the maz_to_maz tables and return the synthetic od keys of their pairs
+
+        Returns
+        -------
+        tables : dict of pandas.DataFrame keyed by table file name
+        keys : dict of numpy.ndarray of int64 od keys keyed by table file name
+        key_base : int
+            od key is OMAZ * key_base + DMAZ
+        """
+        tables = {}
+        for file_name in self.table_names:
+            df = pd.read_csv(self._table_path(file_name), usecols=usecols)
+            logger.debug(f"loading maz_to_maz table {file_name} with {len(df)} rows")
+            tables[file_name] = df
+
+        key_base = 1 + max(
+            [int(df.DMAZ.max()) for df in tables.values() if len(df)], default=0
+        )
+
+        keys = {}
+        for file_name, df in tables.items():
+            k = df.OMAZ.values.astype(np.int64) * key_base + df.DMAZ.values
+            if pd.Index(k).has_duplicates:
+                raise RuntimeError(
+                    f"duplicate OMAZ, DMAZ pairs in maz_to_maz table {file_name}"
+                )
+            keys[file_name] = k
+
+        return tables, keys, key_base
+
+    def _buffer_shape(self):
+        """
+        Return number of offsets and number of pairs of the CSR arrays
+        """
+        _, keys, key_base = self._read_pair_keys(usecols=["OMAZ", "DMAZ"])
+        keys = np.unique(np.concatenate(list(keys.values())))
+        num_offsets = int(keys[-1] // key_base) + 2 if len(keys) else 1
+        return num_offsets, len(keys)
+
+    def _buffer_layout(self, num_offsets, num_pairs):
+        """
+        Return byte offsets of the header, offsets, dests and values arrays in a shared data buffer,
+        and the total buffer size, aligning each array on an 8 byte boundary
+        """
+
+        def aligned(nbytes):
+            return -(-nbytes // 8) * 8
+
+        layout = {}
+        start = 0
+        for name, dtype, shape in [
+            ("header", HEADER_DTYPE, (HEADER_SIZE,)),
+            ("offsets", OFFSET_DTYPE, (num_offsets,)),
+            ("dests", DEST_DTYPE, (num_pairs,)),
+            ("values", self.dtype, (len(self.columns), num_pairs)),
+        ]:
+            layout[name] = (start, dtype, shape)
+            start += aligned(util.iprod(shape) * dtype.itemsize)
+        return layout, start
+
+    def _arrays_from_buffer(self, data):
+        """
+        Return views of the header, offsets, dests and values arrays in a (uint8) shared data buffer
+        """
+        header = data[: HEADER_SIZE * HEADER_DTYPE.itemsize].view(HEADER_DTYPE)
+        layout, _ = self._buffer_layout(int(header[0]), int(header[1]))
+        arrays = {}
+        for name, (start, dtype, shape) in layout.items():
+            nbytes = util.iprod(shape) * dtype.itemsize
+            arrays[name] = data[start : start + nbytes].view(dtype).reshape(shape)
+        return arrays
+
+    def read_tables(self):
+        """
+        Read the maz_to_maz tables into CSR offsets, dests, and values arrays
+        """
+        tables, keys, key_base = self._read_pair_keys()
+
+        all_keys = np.unique(np.concatenate(list(keys.values())))
+        origins = all_keys // key_base
+
+        num_origins = int(origins[-1]) + 1 if len(all_keys) else 0
+        self.offsets = np.searchsorted(origins, np.arange(num_origins + 1)).astype(
+            OFFSET_DTYPE
+        )
+        self.dests = (all_keys % key_base).astype(DEST_DTYPE)
+
+        self.values = np.full(
+            (len(self.columns), len(all_keys)), np.nan, dtype=self.dtype
+        )
+        for file_name, df in tables.items():
+            positions = np.searchsorted(all_keys, keys[file_name])
+            for c in self.table_columns[file_name]:
+                self.values[self.column_index[c], positions] = df[c].values
+
+        logger.info(
+            f"MazToMazSkims loaded {util.INT(self.num_pairs)} maz_to_maz pairs with "
+            f"attributes {self.columns} ({util.GB(self.nbytes)})"
+        )
+
+    def allocate_data_buffer(self):
+        """
+        allocate a shared data buffer sized to hold the maz_to_maz pairs of all tables
+        Only called when multiprocessing - BEFORE load_data()
+
+        Returns
+        -------
+        multiprocessing.RawArray
+        """
+        num_offsets, num_pairs = self._buffer_shape()
+        _, buffer_size = self._buffer_layout(num_offsets, num_pairs)
+
+        logger.info(
+            f"MazToMazSkims.allocate_data_buffer allocating data buffer for "
+            f"{util.INT(num_pairs)} maz_to_maz pairs ({util.GB(buffer_size)})"
+        )
+        return multiprocessing.RawArray("B", buffer_size)
+
+    def load_data_to_buffer(self, data_buffer):
+        """
+        read the maz_to_maz tables into shared data buffer allocated by allocate_data_buffer
+        """
+        self.read_tables()
+
+        data = np.frombuffer(data_buffer, dtype=np.uint8)
+        layout, buffer_size = self._buffer_layout(len(self.offsets), self.num_pairs)
+        assert len(data) == buffer_size  # internal error
+
+        header = data[: HEADER_SIZE * HEADER_DTYPE.itemsize].view(HEADER_DTYPE)
+        header[:] = [len(self.offsets), self.num_pairs]
+        arrays = self._arrays_from_buffer(data)
+        arrays["offsets"][:] = self.offsets
+        arrays["dests"][:] = self.dests
+        arrays["values"][:] = self.values
+
+        # free our copies now that they are in the shared buffer
+        self.offsets = self.dests = self.values = None
+
+    def load_data(self):
+        """
+        Load the maz_to_maz pairs, using the preloaded shared data buffer when multiprocessing
+        """
+        data_buffers = inject.get_injectable("data_buffers", None)
+        if data_buffers and MAZ_TO_MAZ_TAG in data_buffers:
+            data = np.frombuffer(data_buffers[MAZ_TO_MAZ_TAG], dtype=np.uint8)
+            arrays = self._arrays_from_buffer(data)
+            self.offsets = arrays["offsets"]
+            self.dests = arrays["dests"]
+            self.values = arrays["values"]
+            logger.info(
+                f"MazToMazSkims using {util.INT(self.num_pairs)} maz_to_maz pairs "
+                f"from shared data_buffers"
+            )
+        else:
+            self.read_tables()
+
+    def lookup(self, omaz, dmaz, attribute):
+        """
+        look up attribute values of maz od pairs
+
+        Parameters
+        ----------
+        omaz: array-like list of omaz zone_ids
+        dmaz: array-like list of dmaz zone_ids
+        attribute: str name of maz_to_maz attribute
+
+        Returns
+        -------
+        Numpy.ndarray: attribute values for od pairs (nan for pairs not in maz_to_maz tables)
+        """
+        if attribute not in self.column_index:
+            raise KeyError(f"'{attribute}' is not a maz_to_maz attribute")
+
+        return _pair_values(
+            self.offsets,
+            self.dests,
+            self.values[self.column_index[attribute]],
+            np.asanyarray(omaz).astype(np.int64),
+            np.asanyarray(dmaz).astype(np.int64),
+        )
+
+    def to_frame(self, maz_ceiling):
+        """
+        Return the maz_to_maz attributes as a DataFrame indexed by the synthetic index
+        OMAZ * maz_ceiling + DMAZ
+        """
+        origins = np.repeat(
+            np.arange(len(self.offsets) - 1, dtype=np.int64), np.diff(self.offsets)
+        )
+        index = pd.Index(origins * maz_ceiling + self.dests, name="i")
+        return pd.DataFrame(
+            {c: self.values[i] for c, i in self.column_index.items()}, index=index
+        )
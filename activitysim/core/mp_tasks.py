@@ -15,6 +15,7 @@ import yaml
 
 from activitysim.core import config, inject, mem, pipeline, tracing, util
 from activitysim.core.config import setting
+from activitysim.core.pipeline_store import open_store, store_class
 
 logger = logging.getLogger(__name__)
 
@@ -151,6 +152,29 @@ The third multiprocess_step (mp_summarize) then is handled in single-process mod
 write_tables model, writing the results, but also leaving the tables in the pipeline, with
 essentially the same tables and results as if the whole simulation had been run as a single process.
 
+Static slicing means that the step takes as long as its slowest slice (e.g. one that happens to get
+more large households, or households with more tours.) If a step specifies work_units, the primary
+table is instead sliced by work_units-sized strides into that many (smaller) work unit pipelines.
+The work unit names are placed on a shared queue, and each of the num_processes sub-processes
+repeatedly takes the next unit off the queue and runs the step's models on its pipeline, until the
+queue is empty. So processes that finish their units early simply take on more of them.
+
+::
+
+      - name: mp_households
+        begin: school_location
+        num_processes: 4
+        work_units: 40
+        slice:
+          tables:
+            - households
+            - persons
+
+The work unit pipelines are coalesced in work unit order, regardless of which process ran them,
+so the results only depend on work_units, and not on num_processes or the order in which units
+happened to complete. Since work units don't run in lockstep, a step with work_units can't include
+models that synchronize across sub-processes (i.e. location choice with use_shadow_pricing).
+
 """
 
 """
@@ -185,7 +209,8 @@ think that the existence of such a lock would make shared access pretty straight
 this is not the case as the level of locking is very low, reportedly not very performant, and
 essentially useless in any event since we want to use numpy.frombuffer to wrap and handle them
 as numpy arrays. The Lock is a convenient bundled locking primative, but shadow_pricing rolls
-its own semaphore system using the Lock.
+its own semaphore system using the Lock (which, for shadow pricing buffers, is a
+multiprocessing.Condition so processes can wait on it without polling).
 
 FIXME - The code below knows that it need to allocate skim and shadow price buffers by calling
 the appropriate methods in abm.tables.skims and abm.tables.shadow_pricing to allocate shared
@@ -256,7 +281,7 @@ def pipeline_table_keys(pipeline_store):
     return dict of current (as of last checkpoint) pipeline tables
     and their checkpoint-specific hdf5_keys
 
-    This facilitates reading pipeline tables directly from a 'raw' open pandas.HDFStore without
+    This facilitates reading pipeline tables directly from a 'raw' open PipelineStore without
     opening it as a pipeline (e.g. when apportioning and coalescing pipelines)
 
     We currently only ever need to do this from the last checkpoint, so the ability to specify
@@ -264,7 +289,7 @@ def pipeline_table_keys(pipeline_store):
 
     Parameters
     ----------
-    pipeline_store : open hdf5 pipeline_store
+    pipeline_store : open pipeline_store.PipelineStore
 
     Returns
     -------
@@ -536,11 +561,11 @@ def apportion_pipeline(sub_proc_names, step_info):
 
         # remove existing file
         try:
-            os.unlink(pipeline_path)
+            store_class().remove(pipeline_path)
         except OSError:
             pass
 
-        with pd.HDFStore(pipeline_path, mode="a") as pipeline_store:
+        with open_store(pipeline_path, mode="a") as pipeline_store:
 
             # remember sliced_tables so we can cascade slicing to other tables
             sliced_tables = {}
@@ -633,7 +658,7 @@ def coalesce_pipelines(sub_proc_names, slice_info):
         pipeline_file_name, use_prefix=sub_proc_names[0]
     )
 
-    with pd.HDFStore(pipeline_path, mode="r") as pipeline_store:
+    with open_store(pipeline_path, mode="r") as pipeline_store:
 
         # hdf5_keys is a dict mapping table_name to pipeline hdf5_key
         checkpoint_name, hdf5_keys = pipeline_table_keys(pipeline_store)
@@ -686,9 +711,14 @@ def coalesce_pipelines(sub_proc_names, slice_info):
         )
         logger.info(f"coalesce pipeline {pipeline_path}")
 
-        with pd.HDFStore(pipeline_path, mode="r") as pipeline_store:
-            for table_name, hdf5_key in omnibus_keys.items():
-                omnibus_tables[table_name].append(pipeline_store[hdf5_key])
+        with open_store(pipeline_path, mode="r") as pipeline_store:
+            # the checkpoint at which a table last changed can differ between pipelines
+            # (e.g. if none of a pipeline's persons had non_mandatory tours to schedule)
+            _, process_keys = pipeline_table_keys(pipeline_store)
+            for table_name in omnibus_keys:
+                omnibus_tables[table_name].append(
+                    pipeline_store[process_keys[table_name]]
+                )
 
     # open pipeline, preserving existing checkpoints (so resume_after will work for prior steps)
     pipeline.open_pipeline("_")
@@ -893,6 +923,45 @@ def run_simulation(queue, step_info, resume_after, shared_data_buffer):
     pipeline.close_pipeline()
 
 
+def run_work_units(queue, unit_queue, step_info, resume_after, shared_data_buffer):
+    """
+    run step models as subtask for each work unit taken from unit_queue
+
+    called once in each sub process of a multiprocess step with work_units, and runs
+    work units until it takes the None end marker off unit_queue
+
+    Parameters
+    ----------
+    queue : multiprocessing.Queue
+    unit_queue : multiprocessing.Queue
+        names of the work unit pipelines to run, followed by a None for each sub process
+    step_info : dict
+        step_info for current step from multiprocess_steps
+    resume_after : str or None
+    shared_data_buffer : dict
+        dict of shared data (e.g. skims and shadow_pricing)
+    """
+
+    # so we can forget the tables from one work unit before running the next
+    table_state = inject.get_table_state()
+
+    while True:
+        unit_name = unit_queue.get()
+        if unit_name is None:
+            break
+
+        t0 = time.time()
+        info(f"running work unit {unit_name}")
+
+        inject.restore_table_state(table_state)
+        inject.add_injectable("work_unit", unit_name)
+        inject.add_injectable("pipeline_file_prefix", unit_name)
+
+        run_simulation(queue, step_info, resume_after, shared_data_buffer)
+
+        queue.put({"unit": unit_name, "time": time.time() - t0})
+
+
 """
 ### multiprocessing sub-process entry points
 """
@@ -936,6 +1005,42 @@ def mp_run_simulation(locutor, queue, injectables, step_info, resume_after, **kw
         raise e
 
 
+def mp_run_work_units(
+    locutor, queue, unit_queue, injectables, step_info, resume_after, **kwargs
+):
+    """
+    mp entry point for run_work_units
+
+    Parameters
+    ----------
+    locutor
+    queue
+    unit_queue
+    injectables
+    step_info
+    resume_after : bool
+    kwargs : dict
+        shared_data_buffers passed as kwargs to avoid picking dict
+    """
+
+    setup_injectables_and_logging(injectables, locutor=locutor)
+
+    debug(
+        f"mp_run_work_units {step_info['name']} locutor={inject.get_injectable('locutor', False)} "
+    )
+
+    try:
+
+        shared_data_buffer = kwargs
+        run_work_units(queue, unit_queue, step_info, resume_after, shared_data_buffer)
+
+        mem.log_global_hwm()  # subprocess
+
+    except Exception as e:
+        exception(f"{type(e).__name__} exception caught in mp_run_work_units: {str(e)}")
+        raise e
+
+
 def mp_apportion_pipeline(injectables, sub_proc_names, step_info):
     """
     mp entry point for apportion_pipeline
@@ -1106,6 +1211,7 @@ def run_sub_simulations(
     resume_after,
     previously_completed,
     fail_fast,
+    work_unit_names=None,
 ):
     """
     Launch sub processes to run models in step according to specification in step_info.
@@ -1119,6 +1225,10 @@ def run_sub_simulations(
 
     Wait for all sub-processes to terminate and return list of those that completed successfully.
 
+    If work_unit_names are specified, the sub-processes take work units from a shared queue
+    until all have been run, and completion (and resumption) is tracked by work unit rather
+    than by sub-process.
+
     Parameters
     ----------
     injectables : dict
@@ -1135,11 +1245,13 @@ def run_sub_simulations(
         names of processes that successfully completed in previous run
     fail_fast : bool
         whether to raise error if a sub process terminates with nonzero exitcode
+    work_unit_names : list of str or None
+        names of work unit pipelines for sub processes to run, if step has work_units
 
     Returns
     -------
     completed : list of str
-        names of sub_processes that completed successfully
+        names of sub_processes (or work units) that completed successfully
 
     """
 
@@ -1147,6 +1259,15 @@ def run_sub_simulations(
         for process, queue in zip(procs, queues):
             while not queue.empty():
                 msg = queue.get(block=False)
+                if "unit" in msg:
+                    unit_name = msg["unit"]
+                    info(
+                        f"{process.name} work unit {unit_name} completed : "
+                        f"{tracing.format_elapsed_time(msg['time'])}"
+                    )
+                    completed.add(unit_name)
+                    drop_breadcrumb(step_name, "completed", list(completed))
+                    continue
                 model_name = msg["model"]
                 info(
                     f"{process.name} {model_name} : {tracing.format_elapsed_time(msg['time'])}"
@@ -1161,10 +1282,12 @@ def run_sub_simulations(
                 pass  # still running
             elif p.exitcode == 0:
                 # completed successfully
-                if p.name not in completed:
+                if p.name not in finished:
                     info(f"process {p.name} completed")
-                    completed.add(p.name)
-                    drop_breadcrumb(step_name, "completed", list(completed))
+                    finished.add(p.name)
+                    if work_unit_names is None:
+                        completed.add(p.name)
+                        drop_breadcrumb(step_name, "completed", list(completed))
                     mem.trace_memory_info(f"{p.name}.completed")
             else:
                 # process failed
@@ -1191,9 +1314,17 @@ def run_sub_simulations(
     # if resuming and some processes completed successfully in previous run
     if previously_completed:
         assert resume_after is not None
-        assert set(previously_completed).issubset(set(process_names))
+        assert set(previously_completed).issubset(set(work_unit_names or process_names))
 
-        if resume_after == LAST_CHECKPOINT:
+        if resume_after == LAST_CHECKPOINT and work_unit_names is not None:
+            # only queue the work units that did not complete in the previous run
+            work_unit_names = [
+                name for name in work_unit_names if name not in previously_completed
+            ]
+            info(
+                f"step {step_name}: skipping {len(previously_completed)} previously completed work units"
+            )
+        elif resume_after == LAST_CHECKPOINT:
             # if we are resuming where previous run left off, then we can skip running
             # any subprocudures that successfully complete the previous run
             process_names = [
@@ -1211,11 +1342,24 @@ def run_sub_simulations(
     if resume_after is None and step_info["step_num"] > 0:
         resume_after = LAST_CHECKPOINT
 
+    unit_queue = None
+    if work_unit_names is not None:
+        # no point in launching more sub processes than there are work units left to run
+        process_names = process_names[: len(work_unit_names)]
+
+        # sub processes take work units off the queue until they get the None end marker
+        unit_queue = multiprocessing.Queue()
+        for unit_name in work_unit_names:
+            unit_queue.put(unit_name)
+        for process_name in process_names:
+            unit_queue.put(None)
+
     num_simulations = len(process_names)
     procs = []
     queues = []
 
     completed = set(previously_completed)
+    finished = set([])  # sub processes that terminated successfully
     failed = set([])  # so we can log process failure first time it happens
     drop_breadcrumb(step_name, "completed", list(completed))
 
@@ -1237,18 +1381,33 @@ def run_sub_simulations(
         # for k in shared_data_buffers:
         #     debug(f"create_process {process_name} shared_data_buffers {k}={shared_data_buffers[k]}")
 
-        p = multiprocessing.Process(
-            target=mp_run_simulation,
-            name=process_name,
-            args=(
-                locutor,
-                q,
-                injectables,
-                step_info,
-                resume_after,
-            ),
-            kwargs=shared_data_buffers,
-        )
+        if unit_queue is not None:
+            p = multiprocessing.Process(
+                target=mp_run_work_units,
+                name=process_name,
+                args=(
+                    locutor,
+                    q,
+                    unit_queue,
+                    injectables,
+                    step_info,
+                    resume_after,
+                ),
+                kwargs=shared_data_buffers,
+            )
+        else:
+            p = multiprocessing.Process(
+                target=mp_run_simulation,
+                name=process_name,
+                args=(
+                    locutor,
+                    q,
+                    injectables,
+                    step_info,
+                    resume_after,
+                ),
+                kwargs=shared_data_buffers,
+            )
 
         procs.append(p)
         queues.append(q)
@@ -1302,7 +1461,11 @@ def run_sub_simulations(
             assert p.name in failed
         else:
             info(f"Process {p.name} completed with exitcode {p.exitcode}")
-            assert p.name in completed
+            assert p.name in finished
+
+    if unit_queue is not None:
+        # don't wait to flush end markers left behind by any sub processes that failed
+        unit_queue.cancel_join_thread()
 
     t0 = tracing.print_elapsed_time("run_sub_simulations step %s" % step_name, t0)
 
@@ -1496,14 +1659,23 @@ def run_multiprocess(injectables):
         else:
             sub_proc_names = ["%s_%s" % (step_name, i) for i in range(num_processes)]
 
+        # with work_units, the pipeline is apportioned among the work units rather than sub_procs
+        work_units = step_info.get("work_units", 0)
+        if work_units:
+            work_unit_names = ["%s_unit_%s" % (step_name, i) for i in range(work_units)]
+            pipeline_names = work_unit_names
+        else:
+            work_unit_names = None
+            pipeline_names = sub_proc_names
+
         # - mp_apportion_pipeline
-        if not skip_phase("apportion") and num_processes > 1:
+        if not skip_phase("apportion") and (num_processes > 1 or work_units):
             start_time = time.time()
             run_sub_task(
                 multiprocessing.Process(
                     target=mp_apportion_pipeline,
                     name="%s_apportion" % step_name,
-                    args=(injectables, sub_proc_names, step_info),
+                    args=(injectables, pipeline_names, step_info),
                 )
             )
             tracing.log_runtime(
@@ -1525,23 +1697,28 @@ def run_multiprocess(injectables):
                 resume_after,
                 previously_completed,
                 fail_fast,
+                work_unit_names,
             )
 
-            if len(completed) != num_processes:
+            if len(completed) != len(pipeline_names):
                 raise RuntimeError(
-                    "%s processes failed in step %s"
-                    % (num_processes - len(completed), step_name)
+                    "%s %s failed in step %s"
+                    % (
+                        len(pipeline_names) - len(completed),
+                        "work units" if work_units else "processes",
+                        step_name,
+                    )
                 )
         drop_breadcrumb(step_name, "simulate")
 
         # - mp_coalesce_pipelines
-        if not skip_phase("coalesce") and num_processes > 1:
+        if not skip_phase("coalesce") and (num_processes > 1 or work_units):
             start_time = time.time()
             run_sub_task(
                 multiprocessing.Process(
                     target=mp_coalesce_pipelines,
                     name="%s_coalesce" % step_name,
-                    args=(injectables, sub_proc_names, slice_info),
+                    args=(injectables, pipeline_names, slice_info),
                 )
             )
             tracing.log_runtime(
@@ -1549,6 +1726,11 @@ def run_multiprocess(injectables):
             )
         drop_breadcrumb(step_name, "coalesce")
 
+    # save the populated portion of a dynamic tvpb cache (shared by all the steps)
+    network_los = inject.get_injectable("network_los_preload", None)
+    if network_los is not None and not sharrow_enabled:
+        network_los.write_tvpb_cache(shared_data_buffers)
+
     # add checkpoint with final tables even if not intermediate checkpointing
     if not pipeline.intermediate_checkpoint():
         pipeline.open_pipeline("_")
@@ -1786,6 +1968,25 @@ def get_run_list():
 
             multiprocess_steps[istep]["num_processes"] = num_processes
 
+            # - validate work_units
+            work_units = step.get("work_units", 0)
+            if work_units:
+                if not isinstance(work_units, int) or work_units < 0:
+                    raise RuntimeError(
+                        "bad value (%s) for work_units for step %s"
+                        " in multiprocess_steps" % (work_units, name)
+                    )
+                if "slice" not in step:
+                    raise RuntimeError(
+                        "work_units but no slice info for step %s"
+                        " in multiprocess_steps" % name
+                    )
+                if work_units < num_processes:
+                    raise RuntimeError(
+                        "work_units (%s) fewer than num_processes (%s) for step %s"
+                        " in multiprocess_steps" % (work_units, num_processes, name)
+                    )
+
             # - validate chunk_size and assign default
             chunk_size = step.get("chunk_size", None)
             if chunk_size is None:
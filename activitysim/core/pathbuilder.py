@@ -4,6 +4,7 @@ import logging
 import warnings
 from builtins import range
 
+import numba
 import numpy as np
 import pandas as pd
 
@@ -35,6 +36,214 @@ UNAVAILABLE = -999
 CACHE_TAG = "tap_tap_utilities"
 
 
+@numba.njit(nogil=True)
+def _insert_best_path(
+    utilities, btaps, ataps, sets, num_paths, max_paths, utility, btap, atap, set_idx
+):
+    """
+    Insert a path into a descending list of the max_paths best paths (if it belongs there)
+
+    Ties keep the earlier path ahead of the later one.
+
+    Returns
+    -------
+    num_paths: int
+        number of paths in the list after the insert
+    """
+    if num_paths == max_paths and utility <= utilities[num_paths - 1]:
+        return num_paths
+    k = min(num_paths, max_paths - 1)
+    while k > 0 and utilities[k - 1] < utility:
+        utilities[k] = utilities[k - 1]
+        btaps[k] = btaps[k - 1]
+        ataps[k] = ataps[k - 1]
+        sets[k] = sets[k - 1]
+        k -= 1
+    utilities[k] = utility
+    btaps[k] = btap
+    ataps[k] = atap
+    sets[k] = set_idx
+    return min(num_paths + 1, max_paths)
+
+
+@numba.njit(nogil=True)
+def _best_tap_tap_paths(
+    access_offsets,
+    access_taps,
+    access_utilities,
+    od_access_group,
+    egress_offsets,
+    egress_taps,
+    egress_utilities,
+    od_egress_group,
+    od_base_uids,
+    num_taps,
+    tap_tap_utilities,
+    max_paths_per_tap_set,
+    max_paths_across_tap_sets,
+):
+    """
+    Streaming best path search over the access x egress tap pairs of each maz od pair
+
+    Access and egress legs are CSR-style adjacency lists: the taps of access group g are
+    access_taps[access_offsets[g]:access_offsets[g+1]], and od_access_group maps each od row to
+    its access group (or -1 if there is no access). The tap_tap utility of a btap, atap pair is
+    tap_tap_utilities[od_base_uid + btap * num_taps + atap] (tap ordinals, as in the tap_cache).
+
+    Rather than materializing the cartesian product of legs, only the max_paths_per_tap_set best
+    paths of each set are kept while scanning, and then the max_paths_across_tap_sets best of those.
+
+    Returns
+    -------
+    path_utilities: 2-D float64 array (num_od, max_paths_across_tap_sets) best first
+    path_btaps, path_ataps: 2-D int64 arrays of btap and atap ordinals
+    path_sets: 2-D int64 array of tap_tap_utilities column index of each path
+    path_counts: 1-D int64 array of number of paths found for each od
+    """
+    num_od = od_base_uids.shape[0]
+    num_sets = tap_tap_utilities.shape[1]
+
+    path_utilities = np.full((num_od, max_paths_across_tap_sets), np.nan)
+    path_btaps = np.zeros((num_od, max_paths_across_tap_sets), dtype=np.int64)
+    path_ataps = np.zeros((num_od, max_paths_across_tap_sets), dtype=np.int64)
+    path_sets = np.zeros((num_od, max_paths_across_tap_sets), dtype=np.int64)
+    path_counts = np.zeros(num_od, dtype=np.int64)
+
+    set_utilities = np.empty((num_sets, max_paths_per_tap_set))
+    set_btaps = np.zeros((num_sets, max_paths_per_tap_set), dtype=np.int64)
+    set_ataps = np.zeros((num_sets, max_paths_per_tap_set), dtype=np.int64)
+    set_sets = np.zeros((num_sets, max_paths_per_tap_set), dtype=np.int64)
+    set_counts = np.zeros(num_sets, dtype=np.int64)
+
+    for od in range(num_od):
+        a = od_access_group[od]
+        e = od_egress_group[od]
+        if a < 0 or e < 0:
+            continue
+
+        set_counts[:] = 0
+        for i in range(access_offsets[a], access_offsets[a + 1]):
+            btap = access_taps[i]
+            for j in range(egress_offsets[e], egress_offsets[e + 1]):
+                atap = egress_taps[j]
+                # don't want transit trips that start and stop in same tap
+                if btap == atap:
+                    continue
+                uid = od_base_uids[od] + btap * num_taps + atap
+                for s in range(num_sets):
+                    # same order of addition as best_paths (transit + access) + egress
+                    utility = (
+                        tap_tap_utilities[uid, s] + access_utilities[i]
+                    ) + egress_utilities[j]
+                    set_counts[s] = _insert_best_path(
+                        set_utilities[s],
+                        set_btaps[s],
+                        set_ataps[s],
+                        set_sets[s],
+                        set_counts[s],
+                        max_paths_per_tap_set,
+                        utility,
+                        btap,
+                        atap,
+                        s,
+                    )
+
+        n = 0
+        for s in range(num_sets):
+            for k in range(set_counts[s]):
+                n = _insert_best_path(
+                    path_utilities[od],
+                    path_btaps[od],
+                    path_ataps[od],
+                    path_sets[od],
+                    n,
+                    max_paths_across_tap_sets,
+                    set_utilities[s, k],
+                    set_btaps[s, k],
+                    set_ataps[s, k],
+                    s,
+                )
+        path_counts[od] = n
+
+    return path_utilities, path_btaps, path_ataps, path_sets, path_counts
+
+
+@numba.njit(nogil=True)
+def _tap_tap_uids(
+    access_offsets,
+    access_taps,
+    access_utilities,
+    od_access_group,
+    egress_offsets,
+    egress_taps,
+    egress_utilities,
+    od_egress_group,
+    od_base_uids,
+    num_taps,
+):
+    """
+    tap_tap uids of all the paths _best_tap_tap_paths will consider (with duplicates)
+    """
+    num_uids = 0
+    for od in range(od_base_uids.shape[0]):
+        a = od_access_group[od]
+        e = od_egress_group[od]
+        if a >= 0 and e >= 0:
+            num_uids += (access_offsets[a + 1] - access_offsets[a]) * (
+                egress_offsets[e + 1] - egress_offsets[e]
+            )
+
+    uids = np.empty(num_uids, dtype=np.int64)
+    n = 0
+    for od in range(od_base_uids.shape[0]):
+        a = od_access_group[od]
+        e = od_egress_group[od]
+        if a < 0 or e < 0:
+            continue
+        for i in range(access_offsets[a], access_offsets[a + 1]):
+            for j in range(egress_offsets[e], egress_offsets[e + 1]):
+                if access_taps[i] != egress_taps[j]:
+                    uids[n] = (
+                        od_base_uids[od] + access_taps[i] * num_taps + egress_taps[j]
+                    )
+                    n += 1
+
+    return uids[:n]
+
+
+def _maz_tap_adjacency(maz_od_df, leg_df, maz_col, tap_col, leg, tap_ordinals):
+    """
+    CSR-style adjacency of maz_tap leg_df rows grouped by (idx, maz) for _best_tap_tap_paths
+
+    Returns
+    -------
+    offsets, tap ordinals, and utilities of the leg, and the group of each maz_od_df row (-1 if none)
+    """
+    keys = leg_df[["idx", maz_col]].drop_duplicates()
+    keys["group"] = np.arange(len(keys))
+
+    group = (
+        leg_df[["idx", maz_col]]
+        .merge(keys, on=["idx", maz_col], how="left")
+        .group.values
+    )
+    order = np.argsort(group, kind="stable")
+
+    offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.bincount(group, minlength=len(keys)))
+    taps = tap_ordinals.loc[leg_df[tap_col].values[order]].values.astype(np.int64)
+    utilities = leg_df[leg].values[order].astype(np.float64)
+
+    od_group = (
+        maz_od_df[["idx", maz_col]]
+        .merge(keys, on=["idx", maz_col], how="left")
+        .group.fillna(-1)
+        .values.astype(np.int64)
+    )
+
+    return offsets, taps, utilities, od_group
+
+
 def compute_utilities(
     network_los,
     model_settings,
@@ -419,6 +628,90 @@ class TransitVirtualPathBuilder(object):
 
         return transit_df
 
+    def fill_tap_tap_utilities(self, uids, trace_label):
+        """
+        compute any missing tap_tap utilities for uids in a DYNAMIC tap_cache
+
+        When multiprocessing, we compute only the entries we manage to claim,
+        and wait for other processes to publish the entries that they claimed.
+
+        Parameters
+        ----------
+        uids: 1-D array of tap_cache uids (may contain duplicates)
+        trace_label: str
+        """
+
+        if not self.tap_cache.is_dynamic:
+            return
+
+        trace_label = tracing.extend_trace_label(trace_label, "fill_tap_tap_utils")
+
+        claimed, pending = self.tap_cache.claim(np.unique(uids))
+
+        while True:
+
+            if len(claimed) > 0:
+                logger.debug(
+                    f"{trace_label} computing {len(claimed)} tap_tap utilities "
+                    f"({len(pending)} pending in other processes)"
+                )
+                try:
+                    self.compute_tap_tap_utilities(claimed, trace_label)
+                except Exception:
+                    # let other processes claim the entries we failed to compute
+                    self.tap_cache.release(claimed)
+                    raise
+
+            if len(pending) == 0:
+                break
+
+            with memo("#TVPB fill_tap_tap_utilities wait_for"):
+                self.tap_cache.wait_for(pending)
+
+            # claim any entries released by a process that failed to compute them
+            claimed, pending = self.tap_cache.claim(pending)
+
+    def compute_tap_tap_utilities(self, uids, trace_label):
+        """
+        compute tap_tap utilities for (claimed) uids and publish them to the DYNAMIC tap_cache
+        """
+
+        tap_tap_settings = self.network_los.setting(
+            "TVPB_SETTINGS.tour_mode_choice.tap_tap_settings"
+        )
+        attributes_as_columns = tap_tap_settings.get("attributes_as_columns", [])
+        model_constants = self.network_los.setting(
+            "TVPB_SETTINGS.tour_mode_choice.CONSTANTS"
+        )
+        attribute_combinations_df = self.uid_calculator.scalar_attribute_combinations()
+
+        uid_df = self.uid_calculator.get_uid_dataframe(uids)
+
+        for offset, choosers in uid_df.groupby("offset"):
+
+            # e.g. {'demographic_segment': 0, 'tod': 'AM', 'access_mode': 'walk'}
+            scalar_attributes = attribute_combinations_df.loc[offset].to_dict()
+
+            choosers = choosers[["btap", "atap"]].copy()
+            for attribute_name in attributes_as_columns:
+                choosers[attribute_name] = scalar_attributes[attribute_name]
+
+            constants = model_constants.copy()
+            constants.update(scalar_attributes)
+
+            utilities_df = compute_utilities(
+                self.network_los,
+                model_settings=tap_tap_settings,
+                choosers=choosers,
+                model_constants=constants,
+                trace_label=trace_label,
+            )
+
+            assert len(utilities_df.columns) == len(self.uid_calculator.set_names)
+            assert ERR_CHECK and not utilities_df.isnull().any().any()
+
+            self.tap_cache.publish(choosers.index.values, utilities_df.values)
+
     def lookup_tap_tap_utilities(
         self,
         recipe,
@@ -498,6 +791,8 @@ class TransitVirtualPathBuilder(object):
                 ]  # just needed chooser_columns for uid calculation
                 chunk.log_df(trace_label, "transit_df add uid index", transit_df)
 
+            self.fill_tap_tap_utilities(transit_df.index.values, trace_label)
+
             with memo("#TVPB lookup_tap_tap_utilities reindex transit_df"):
                 utilities = self.tap_cache.data
                 i = 0
@@ -757,6 +1052,144 @@ class TransitVirtualPathBuilder(object):
 
         return path_df
 
+    def use_path_search_kernel(self, recipe, trace):
+        """
+        whether best paths can be found by _best_tap_tap_paths directly from the tap_cache
+
+        Only for utility units (time units filter tap_tap pairs by computed availability)
+        and not when tracing (which computes and traces the intermediate dataframes).
+        """
+        return (
+            not trace
+            and self.units_for_recipe(recipe) == "utility"
+            and self.network_los.setting(
+                f"TVPB_SETTINGS.{recipe}.path_search_kernel", True
+            )
+        )
+
+    def search_best_paths(
+        self,
+        recipe,
+        path_type,
+        maz_od_df,
+        access_df,
+        egress_df,
+        chooser_attributes,
+        path_info,
+        trace_label,
+    ):
+        """
+        compiled equivalent of lookup_tap_tap_utilities followed by best_paths
+
+        Streams the access x egress tap pairs of each maz od pair through _best_tap_tap_paths,
+        looking up tap_tap utilities in the tap_cache, without materializing transit_df or the
+        full cartesian path_df.
+
+        Returns
+        -------
+        path_df: pandas DataFrame
+            same as best_paths: one row per best path with seq, btap, atap, path_set and utility
+            sorted by seq and descending utility
+        """
+
+        trace_label = tracing.extend_trace_label(trace_label, "search_best_paths")
+
+        with chunk.chunk_log(trace_label):
+
+            if not self.tap_cache.is_open:
+                with memo("#TVPB search_best_paths tap_cache.open"):
+                    self.tap_cache.open()
+
+            path_settings = self.network_los.setting(
+                f"TVPB_SETTINGS.{recipe}.path_types.{path_type}"
+            )
+            max_paths_per_tap_set = path_settings.get("max_paths_per_tap_set", 1)
+            max_paths_across_tap_sets = path_settings.get(
+                "max_paths_across_tap_sets", 1
+            )
+            units = self.units_for_recipe(recipe)
+
+            tap_ids = self.uid_calculator.tap_ids
+            tap_ordinals = self.uid_calculator.ordinalizers["btap"]
+
+            access = _maz_tap_adjacency(
+                maz_od_df, access_df, "omaz", "btap", "access", tap_ordinals
+            )
+            egress = _maz_tap_adjacency(
+                maz_od_df, egress_df, "dmaz", "atap", "egress", tap_ordinals
+            )
+
+            # btap and atap are the last (lowest order) ordinals of the uid,
+            # so uid = base_uid + btap_ordinal * num_taps + atap_ordinal
+            with memo("#TVPB search_best_paths base uids"):
+                attribute_segments = self.network_los.setting(
+                    "TVPB_SETTINGS.tour_mode_choice.tap_tap_settings.attribute_segments"
+                )
+                scalar_attributes = {
+                    k: path_info[k]
+                    for k in attribute_segments.keys()
+                    if k not in chooser_attributes
+                }
+                od_attributes = pd.DataFrame(
+                    {
+                        c: reindex(chooser_attributes[c], maz_od_df.idx).values
+                        for c in chooser_attributes.columns
+                    },
+                    index=maz_od_df.index,
+                )
+                od_attributes["btap"] = tap_ids[0]
+                od_attributes["atap"] = tap_ids[0]
+                od_base_uids = self.uid_calculator.get_unique_ids(
+                    od_attributes, scalar_attributes
+                ).astype(np.int64)
+                del od_attributes
+
+            if self.tap_cache.is_dynamic:
+                self.fill_tap_tap_utilities(
+                    _tap_tap_uids(*access, *egress, od_base_uids, len(tap_ids)),
+                    trace_label,
+                )
+
+            with memo("#TVPB search_best_paths _best_tap_tap_paths"):
+                (
+                    path_utilities,
+                    path_btaps,
+                    path_ataps,
+                    path_sets,
+                    path_counts,
+                ) = _best_tap_tap_paths(
+                    *access,
+                    *egress,
+                    od_base_uids,
+                    len(tap_ids),
+                    self.tap_cache.data,
+                    max_paths_per_tap_set,
+                    max_paths_across_tap_sets,
+                )
+
+            found = np.arange(max_paths_across_tap_sets) < path_counts[:, None]
+            seq = np.broadcast_to(np.arange(len(maz_od_df))[:, None], found.shape)[
+                found
+            ]
+            path_df = pd.DataFrame(
+                {
+                    "idx": maz_od_df.idx.values[seq],
+                    "seq": seq,
+                    "btap": tap_ids[path_btaps[found]],
+                    "atap": tap_ids[path_ataps[found]],
+                    "path_set": np.array(self.uid_calculator.set_names)[
+                        path_sets[found]
+                    ],
+                    units: path_utilities[found],
+                }
+            )
+
+            assert ERR_CHECK and not path_df[units].isnull().any()
+
+            chunk.log_df(trace_label, "path_df", path_df)
+
+        return path_df
+
     def build_virtual_path(
         self,
         recipe,
@@ -879,46 +1312,68 @@ class TransitVirtualPathBuilder(object):
         if np.array_equal(access_df["btap"].values, egress_df["atap"].values):
             trace = False
 
-        # path_info for use by expressions (e.g. penalty for drive access if no parking at access tap)
-        with memo("#TVPB build_virtual_path compute_tap_tap"):
-            if len(access_df) * len(egress_df) == 0:
-                trace = False
-            transit_df = self.compute_tap_tap(
-                recipe,
-                maz_od_df,
-                access_df,
-                egress_df,
-                chooser_attributes,
-                path_info=path_info,
-                trace_label=trace_label,
-                trace=trace,
-            )
-        chunk.log_df(trace_label, "transit_df", transit_df)
+        if self.use_path_search_kernel(recipe, trace):
 
-        # Cannot trace if df is empty. Prob happened at L200
-        if len(transit_df) == 0:
-            want_choices = False
+            with memo("#TVPB build_virtual_path search_best_paths"):
+                path_df = self.search_best_paths(
+                    recipe,
+                    path_type,
+                    maz_od_df,
+                    access_df,
+                    egress_df,
+                    chooser_attributes,
+                    path_info=path_info,
+                    trace_label=trace_label,
+                )
+            chunk.log_df(trace_label, "path_df", path_df)
 
-        with memo("#TVPB build_virtual_path best_paths"):
-            path_df = self.best_paths(
-                recipe,
-                path_type,
-                maz_od_df,
-                access_df,
-                egress_df,
-                transit_df,
-                trace_label,
-                trace,
-            )
-        chunk.log_df(trace_label, "path_df", path_df)
+            # no transit paths at all (e.g. all trips are intra-tap)
+            if len(path_df) == 0:
+                want_choices = False
+
+        else:
+
+            # path_info for use by expressions (e.g. penalty for drive access if no parking at access tap)
+            with memo("#TVPB build_virtual_path compute_tap_tap"):
+                if len(access_df) * len(egress_df) == 0:
+                    trace = False
+                transit_df = self.compute_tap_tap(
+                    recipe,
+                    maz_od_df,
+                    access_df,
+                    egress_df,
+                    chooser_attributes,
+                    path_info=path_info,
+                    trace_label=trace_label,
+                    trace=trace,
+                )
+            chunk.log_df(trace_label, "transit_df", transit_df)
+
+            # Cannot trace if df is empty. Prob happened at L200
+            if len(transit_df) == 0:
+                want_choices = False
+
+            with memo("#TVPB build_virtual_path best_paths"):
+                path_df = self.best_paths(
+                    recipe,
+                    path_type,
+                    maz_od_df,
+                    access_df,
+                    egress_df,
+                    transit_df,
+                    trace_label,
+                    trace,
+                )
+            chunk.log_df(trace_label, "path_df", path_df)
+
+            del transit_df
+            chunk.log_df(trace_label, "transit_df", None)
 
         # now that we have created path_df, we are done with the dataframes for the separate legs
         del access_df
         chunk.log_df(trace_label, "access_df", None)
         del egress_df
         chunk.log_df(trace_label, "egress_df", None)
-        del transit_df
-        chunk.log_df(trace_label, "transit_df", None)
 
         if units == "utility":
 
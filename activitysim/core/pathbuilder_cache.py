@@ -5,7 +5,7 @@ import logging
 import multiprocessing
 import os
 from builtins import range
-from contextlib import contextmanager
+from contextlib import contextmanager, nullcontext
 
 import numpy as np
 import pandas as pd
@@ -22,6 +22,14 @@ DYNAMIC = "dynamic"
 STATIC = "static"
 TRACE = "trace"
 
+# DYNAMIC cache slot claim states
+UNCLAIMED = 0
+CLAIMED = 1
+
+# default seconds to wait for other processes to publish claimed DYNAMIC cache entries
+# (network_los setting tvpb_cache_wait_timeout)
+WAIT_TIMEOUT = 3600
+
 MEMO_STACK = []
 
 
@@ -64,6 +72,14 @@ def memo(tag, console=False, disable_gc=True):
 class TVPBCache(object):
     """
     Transit virtual path builder cache for three zone systems
+
+    A STATIC cache is fully populated by the initialize_tvpb step and written to an mmap file.
+
+    A DYNAMIC cache (network_los setting tvpb_cache_type: dynamic) starts out empty (np.nan) and
+    the tap_tap utilities are computed on demand as paths are built. When multiprocessing, the
+    data is shared and each uid is claimed (in a shared claims array guarded by a condition) by the
+    first process that needs it, so no two processes compute the same entry. The populated entries
+    are saved at the end of the run, and are preloaded by the next run unless rebuild_tvpb_cache.
     """
 
     def __init__(self, network_los, uid_calculator, cache_tag):
@@ -78,12 +94,39 @@ class TVPBCache(object):
         self.is_open = False
         self.is_changed = False
         self._data = None
+        self._claims = None
+        self._condition = None
+
+    @property
+    def cache_type(self):
+        cache_type = self.network_los.setting("tvpb_cache_type", STATIC)
+        assert cache_type in [
+            STATIC,
+            DYNAMIC,
+        ], f"unrecognized tvpb_cache_type: {cache_type}. Expected either '{STATIC}' or '{DYNAMIC}'."
+        return cache_type
+
+    @property
+    def is_dynamic(self):
+        return self.cache_type == DYNAMIC
 
     @property
     def cache_path(self):
         file_type = "mmap"
         return os.path.join(config.get_cache_dir(), f"{self.cache_tag}.{file_type}")
 
+    @property
+    def dynamic_cache_path(self):
+        file_type = "npz"
+        return os.path.join(
+            config.get_cache_dir(), f"{self.cache_tag}.{DYNAMIC}.{file_type}"
+        )
+
+    @property
+    def claims_tag(self):
+        # shared data buffer tag for DYNAMIC cache claims
+        return f"{self.cache_tag}_claims"
+
     @property
     def csv_trace_path(self):
         file_type = "csv"
@@ -93,6 +136,10 @@ class TVPBCache(object):
         """
         Called prior to
         """
+        if os.path.isfile(self.dynamic_cache_path):
+            logger.debug(f"deleting cache {self.dynamic_cache_path}")
+            os.unlink(self.dynamic_cache_path)
+
         if os.path.isfile(self.cache_path):
             logger.debug(f"deleting cache {self.cache_path}")
             try:
@@ -134,26 +181,111 @@ class TVPBCache(object):
             f"({data.shape}) to {self.cache_path}"
         )
 
+    def read_dynamic_cache(self, data):
+        """
+        copy populated entries saved by a previous run's write_dynamic_cache into (np.nan filled) data
+
+        Parameters
+        ----------
+        data: numpy array with fully_populated_shape (or flattened)
+        """
+
+        if not os.path.isfile(self.dynamic_cache_path):
+            logger.debug(f"TVPBCache.read_dynamic_cache - saved cache file not found.")
+            return
+
+        data = data.reshape(self.uid_calculator.fully_populated_shape)
+        with np.load(self.dynamic_cache_path) as saved:
+            if tuple(saved["shape"]) != data.shape:
+                logger.warning(
+                    f"TVPBCache.read_dynamic_cache ignoring {self.dynamic_cache_path} "
+                    f"with shape {tuple(saved['shape'])} but expected {data.shape}"
+                )
+                return
+            data[saved["uids"]] = saved["utilities"]
+            logger.info(
+                f"TVPBCache.read_dynamic_cache loaded {len(saved['uids'])} of {data.shape[0]} "
+                f"tap_tap utilities from {self.dynamic_cache_path}"
+            )
+
+    def write_dynamic_cache(self, data_buffer=None):
+        """
+        save the populated entries of a DYNAMIC cache for use by subsequent runs
+
+        Parameters
+        ----------
+        data_buffer: multiprocessing.Array (or RawArray) or None
+            shared data buffer when called by the multiprocessing parent process,
+            otherwise write our own (single process) data if it has changed
+        """
+
+        assert self.is_dynamic
+
+        if data_buffer is not None:
+            if RAWARRAY:
+                data = np.ctypeslib.as_array(data_buffer)
+            else:
+                data = np.ctypeslib.as_array(data_buffer.get_obj())
+        elif self.is_open and self.is_changed:
+            data = self._data
+        else:
+            return
+
+        data = data.reshape(self.uid_calculator.fully_populated_shape)
+        uids = np.flatnonzero(~np.isnan(data[:, 0]))
+
+        # write to a temp file and then rename, so there is never a partially written cache file
+        temp_path = f"{self.dynamic_cache_path}.tmp.npz"
+        np.savez(
+            temp_path,
+            shape=np.array(data.shape),
+            uids=uids,
+            utilities=data[uids],
+        )
+        os.replace(temp_path, self.dynamic_cache_path)
+        self.is_changed = False
+
+        logger.info(
+            f"TVPBCache.write_dynamic_cache wrote {len(uids)} of {data.shape[0]} "
+            f"tap_tap utilities to {self.dynamic_cache_path}"
+        )
+
     def open(self):
         """
-        open STATIC cache and populate with cached data
+        open cache and populate with cached data
 
         if multiprocessing
-            always STATIC cache with data fully_populated preloaded shared data buffer
+            always uses the preloaded shared data buffer (fully_populated for STATIC cache)
+        else if STATIC
+            read the fully_populated data from the mmap file written by initialize_tvpb
+        else if DYNAMIC
+            allocate an np.nan filled buffer and load any entries saved by a previous run
         """
         # MMAP only supported for fully_populated_uids (STATIC)
         # otherwise we would have to store uid index as float, which has roundoff issues for float32
 
         assert not self.is_open, f"TVPBCache open called but already open"
+
+        if self.is_dynamic and not self.network_los.multiprocess():
+            data = self.allocate_data_buffer(shared=False)
+
         self.is_open = True
 
         if self.network_los.multiprocess():
             # multiprocessing usex preloaded fully_populated shared data buffer
             with memo("TVPBCache.open get_data_and_lock_from_buffers"):
                 data, _ = self.get_data_and_lock_from_buffers()
+            if self.is_dynamic:
+                (
+                    self._claims,
+                    self._condition,
+                ) = self.get_claims_and_condition_from_buffers()
             logger.info(
-                f"TVPBCache.open {self.cache_tag} STATIC cache using existing data_buffers"
+                f"TVPBCache.open {self.cache_tag} {self.cache_type.upper()} cache using existing data_buffers"
             )
+        elif self.is_dynamic:
+            self.read_dynamic_cache(data)
+            logger.info(f"TVPBCache.open {self.cache_tag} DYNAMIC cache")
         elif os.path.isfile(self.cache_path):
             # single process ought have created a precomputed fully_populated STATIC file
             data = np.memmap(self.cache_path, dtype=DTYPE_NAME, mode="r")
@@ -189,7 +321,9 @@ class TVPBCache(object):
         assert data.shape[0] == len(fully_populated_uids)
 
         self._data = data
-        logger.debug(f"TVPBCache.open initialized STATIC cache table")
+        logger.debug(
+            f"TVPBCache.open initialized {self.cache_type.upper()} cache table"
+        )
 
     def close(self, trace=False):
         """
@@ -198,9 +332,96 @@ class TVPBCache(object):
 
         assert self.is_open, f"TVPBCache close called but not open"
 
+        if self.is_dynamic and not self.network_los.multiprocess():
+            self.write_dynamic_cache()
+
         self.is_open = False
         self._data = None
-        self.cache_type = None
+        self._claims = None
+        self._condition = None
+
+    def claim(self, uids):
+        """
+        claim the unpopulated entries of a DYNAMIC cache among uids
+
+        Parameters
+        ----------
+        uids: 1-D array of unique uids
+
+        Returns
+        -------
+        claimed: 1-D array of uids that the caller must compute and publish
+        pending: 1-D array of uids already claimed by other processes (see wait_for)
+        """
+
+        assert self.is_dynamic
+
+        with self._condition or nullcontext():
+            uids = uids[np.isnan(self.data[uids, 0])]
+            if self._claims is None:
+                return uids, uids[:0]
+            unclaimed = self._claims[uids] == UNCLAIMED
+            claimed = uids[unclaimed]
+            self._claims[claimed] = CLAIMED
+
+        return claimed, uids[~unclaimed]
+
+    def publish(self, uids, utilities):
+        """
+        store computed utilities for claimed uids and wake any processes waiting for them
+        """
+
+        assert self.is_dynamic
+
+        with self._condition or nullcontext():
+            self.data[uids] = utilities
+            self.is_changed = True
+            if self._condition is not None:
+                self._condition.notify_all()
+
+    def release(self, uids):
+        """
+        release claims on uids that were not published (e.g. because computing them failed)
+        and wake any processes waiting for them, so they can claim and compute them instead
+        """
+
+        assert self.is_dynamic
+
+        if self._claims is None:
+            return
+
+        with self._condition:
+            unpublished = uids[np.isnan(self.data[uids, 0])]
+            self._claims[unpublished] = UNCLAIMED
+            self._condition.notify_all()
+
+        if len(unpublished) > 0:
+            logger.warning(f"TVPBCache.release released {len(unpublished)} claims")
+
+    def wait_for(self, uids):
+        """
+        wait for other processes to publish utilities for uids they claimed
+
+        Returns once each of uids is either published or released (see release),
+        so the caller must claim and compute any released uids itself.
+        Raises RuntimeError if they have not done so within the tvpb_cache_wait_timeout.
+        """
+
+        assert self._condition is not None
+
+        timeout = self.network_los.setting("tvpb_cache_wait_timeout", WAIT_TIMEOUT)
+
+        def published_or_released():
+            return not (
+                np.isnan(self.data[uids, 0]) & (self._claims[uids] == CLAIMED)
+            ).any()
+
+        with self._condition:
+            if not self._condition.wait_for(published_or_released, timeout):
+                raise RuntimeError(
+                    f"TVPBCache.wait_for timed out after {timeout} seconds waiting for "
+                    f"other processes to publish tap_tap utilities"
+                )
 
     @property
     def data(self):
@@ -286,7 +507,10 @@ class TVPBCache(object):
             else:
                 np_wrapped_data_buffer = np.ctypeslib.as_array(data_buffer.get_obj())
 
-        if os.path.isfile(self.cache_path):
+        if self.is_dynamic:
+            np.copyto(np_wrapped_data_buffer, np.nan)
+            self.read_dynamic_cache(np_wrapped_data_buffer)
+        elif os.path.isfile(self.cache_path):
             with memo("TVPBCache.load_data_to_buffer copy memmap"):
                 data = np.memmap(self.cache_path, dtype=DTYPE_NAME, mode="r")
                 np.copyto(np_wrapped_data_buffer, data)
@@ -299,6 +523,39 @@ class TVPBCache(object):
             np.copyto(np_wrapped_data_buffer, np.nan)
             logger.debug(f"TVPBCache.load_data_to_buffer - saved cache file not found.")
 
+    def allocate_claims_buffer(self):
+        """
+        allocate shared DYNAMIC cache claims buffer, one UNCLAIMED slot per uid
+
+        The buffer's lock is a condition that also guards publishing data,
+        so processes waiting for entries claimed by others can be notified.
+
+        Returns
+        -------
+            multiprocessing.Array
+        """
+
+        assert self.is_dynamic
+        assert self.network_los.multiprocess()
+
+        num_uids = self.uid_calculator.fully_populated_shape[0]
+        logger.info(
+            f"TVPBCache.allocate_claims_buffer allocating {util.INT(num_uids)} claims"
+        )
+
+        return multiprocessing.Array("b", num_uids, lock=multiprocessing.Condition())
+
+    def get_claims_and_condition_from_buffers(self):
+        """
+        return shared claims buffer previously allocated by allocate_claims_buffer and its condition
+        """
+        data_buffers = inject.get_injectable("data_buffers", None)
+        assert self.claims_tag in data_buffers  # internal error
+        claims_buffer = data_buffers[self.claims_tag]
+        claims = np.ctypeslib.as_array(claims_buffer.get_obj())
+
+        return claims, claims_buffer.get_lock()
+
     def get_data_and_lock_from_buffers(self):
         """
         return shared data buffer previously allocated by allocate_data_buffer and injected mp_tasks.run_simulation
@@ -427,6 +684,35 @@ class TapTapUidCalculator(object):
 
         return uid
 
+    def get_uid_dataframe(self, uids):
+        """
+        inverse of get_unique_ids - return tap-tap od dataframe with skim offset for uids
+
+        Parameters
+        ----------
+        uids: 1-D array of integer uids
+
+        Returns
+        -------
+        pandas.Dataframe
+            with uid index, btap and atap tap ids, and offset of uid's attribute combination
+            (position in attribute_combination_tuples as in get_skim_offset)
+        """
+
+        # btap and atap go last (see ordinalizers) so uid = (offset * num_taps + btap) * num_taps + atap
+        num_taps = len(self.tap_ids)
+        offset, od = np.divmod(uids, num_taps * num_taps)
+        btap, atap = np.divmod(od, num_taps)
+
+        return pd.DataFrame(
+            data={
+                "btap": self.tap_ids[btap],
+                "atap": self.tap_ids[atap],
+                "offset": offset,
+            },
+            index=uids,
+        )
+
     def get_od_dataframe(self, scalar_attributes):
         """
         return tap-tap od dataframe with unique_id index for 'skim_offset' for scalar_attributes
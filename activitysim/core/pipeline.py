@@ -8,7 +8,17 @@ from builtins import map, next, object
 import pandas as pd
 from orca import orca
 
-from . import config, inject, mem, random, tracing, util
+from . import (
+    config,
+    config_cache,
+    inject,
+    mem,
+    pipeline_store,
+    random,
+    skim_dictionary,
+    tracing,
+    util,
+)
 from .tracing import print_elapsed_time
 
 logger = logging.getLogger(__name__)
@@ -53,6 +63,9 @@ class Pipeline(object):
 
         self.pipeline_store = None
 
+        # BackgroundStoreWriter if background_checkpoints setting is enabled
+        self.store_writer = None
+
         self.is_open = False
 
         tracing.initialize_traceable_tables()
@@ -72,7 +85,7 @@ def is_open():
 def is_readonly():
     if is_open():
         store = get_pipeline_store()
-        if store and store._mode == "r":
+        if store and store.mode == "r":
             return True
     return False
 
@@ -101,6 +114,8 @@ def open_pipeline_store(overwrite=False, mode="a"):
     """
     Open the pipeline checkpoint store
 
+    The type of store (hdf5 or parquet) is determined by the checkpoint_format setting.
+
     Parameters
     ----------
     overwrite : bool
@@ -125,24 +140,53 @@ def open_pipeline_store(overwrite=False, mode="a"):
         inject.get_injectable("pipeline_file_name")
     )
 
+    store_class = pipeline_store.store_class()
+
     if overwrite:
         try:
-            if os.path.isfile(pipeline_file_path):
-                logger.debug("removing pipeline store: %s" % pipeline_file_path)
-                os.unlink(pipeline_file_path)
+            store_class.remove(pipeline_file_path)
         except Exception as e:
             print(e)
             logger.warning("Error removing %s: %s" % (pipeline_file_path, e))
 
-    _PIPELINE.pipeline_store = pd.HDFStore(pipeline_file_path, mode=mode)
+    _PIPELINE.pipeline_store = store_class(pipeline_file_path, mode=mode)
+
+    if mode != "r" and config.setting("background_checkpoints", False):
+        _PIPELINE.store_writer = pipeline_store.BackgroundStoreWriter(
+            _PIPELINE.pipeline_store,
+            max_queued_bytes=background_checkpoint_max_bytes(),
+        )
 
     logger.debug(f"opened pipeline_store {pipeline_file_path}")
 
 
+def background_checkpoint_max_bytes():
+    """
+    Return the memory budget for checkpoint snapshots queued for the background writer
+
+    If not set explicitly with the background_checkpoint_max_bytes setting, this defaults
+    to a quarter of chunk_size (or no limit, if chunk_size is not set.)
+    """
+
+    max_bytes = config.setting("background_checkpoint_max_bytes", None)
+    if max_bytes is None:
+        max_bytes = config.setting("chunk_size", 0) // 4
+    return max_bytes or None
+
+
 def get_pipeline_store():
     """
-    Return the open pipeline hdf5 checkpoint store or return None if it not been opened
+    Return the open pipeline checkpoint store or return None if it not been opened
+
+    If checkpoints are being written in the background, this blocks until all queued
+    checkpoints have been written, so the store can safely be accessed by the caller.
+
+    Returns
+    -------
+    activitysim.core.pipeline_store.PipelineStore
     """
+    if _PIPELINE.store_writer is not None:
+        _PIPELINE.store_writer.wait()
     return _PIPELINE.pipeline_store
 
 
@@ -157,7 +201,7 @@ def get_rn_generator():
     return _PIPELINE.rng()
 
 
-def read_df(table_name, checkpoint_name=None):
+def read_df(table_name, checkpoint_name=None, columns=None):
     """
     Read a pandas dataframe from the pipeline store.
 
@@ -166,12 +210,14 @@ def read_df(table_name, checkpoint_name=None):
 
     The only exception is the checkpoints dataframe, which just has a table_name
 
-    An error will be raised by HDFStore if the table is not found
+    An error will be raised by the store if the table is not found
 
     Parameters
     ----------
     table_name : str
     checkpoint_name : str
+    columns : list of str, optional
+        read only these columns (parquet stores will not read the other columns from disk)
 
     Returns
     -------
@@ -181,7 +227,7 @@ def read_df(table_name, checkpoint_name=None):
     """
 
     store = get_pipeline_store()
-    df = store[pipeline_table_key(table_name, checkpoint_name)]
+    df = store.read_df(table_name, checkpoint_name, columns=columns)
 
     return df
 
@@ -193,8 +239,6 @@ def write_df(df, table_name, checkpoint_name=None):
     We store multiple versions of all simulation tables, for every checkpoint in which they change,
     so we need to know both the table_name and the checkpoint_name to label the saved table
 
-    The only exception is the checkpoints dataframe, which just has a table_name
-
     Parameters
     ----------
     df : pandas.DataFrame
@@ -210,9 +254,7 @@ def write_df(df, table_name, checkpoint_name=None):
 
     store = get_pipeline_store()
 
-    store[pipeline_table_key(table_name, checkpoint_name)] = df
-
-    store.flush()
+    store.write_df(df, table_name, checkpoint_name)
 
 
 def rewrap(table_name, df=None):
@@ -284,6 +326,9 @@ def add_checkpoint(checkpoint_name):
 
     logger.debug("add_checkpoint %s timestamp %s" % (checkpoint_name, timestamp))
 
+    # tables to be written by background store_writer
+    changed_tables = []
+
     for table_name in registered_tables():
 
         # if we have not already checkpointed it or it has changed
@@ -303,7 +348,12 @@ def add_checkpoint(checkpoint_name):
             "add_checkpoint '%s' table '%s' %s"
             % (checkpoint_name, table_name, util.df_size(df))
         )
-        write_df(df, table_name, checkpoint_name)
+        if _PIPELINE.store_writer is not None:
+            # coerce column names to str as unicode names will cause PyTables to pickle them
+            df.columns = df.columns.astype(str)
+            changed_tables.append((df, table_name, checkpoint_name))
+        else:
+            write_df(df, table_name, checkpoint_name)
 
         # remember which checkpoint it was last written
         _PIPELINE.last_checkpoint[table_name] = checkpoint_name
@@ -316,15 +366,12 @@ def add_checkpoint(checkpoint_name):
     # append to the array of checkpoint history
     _PIPELINE.checkpoints.append(_PIPELINE.last_checkpoint.copy())
 
-    # create a pandas dataframe of the checkpoint history, one row per checkpoint
-    checkpoints = pd.DataFrame(_PIPELINE.checkpoints)
-
-    # convert empty values to str so PyTables doesn't pickle object types
-    for c in checkpoints.columns:
-        checkpoints[c] = checkpoints[c].fillna("")
-
-    # write it to the store, overwriting any previous version (no way to simply extend)
-    write_df(checkpoints, CHECKPOINT_TABLE_NAME)
+    if _PIPELINE.store_writer is not None:
+        # queue snapshots of changed tables and checkpoint history for background writer
+        _PIPELINE.store_writer.write(changed_tables, _PIPELINE.checkpoints)
+    else:
+        # write checkpoint history to the store
+        get_pipeline_store().write_checkpoints(_PIPELINE.checkpoints)
 
 
 def registered_tables():
@@ -360,7 +407,7 @@ def load_checkpoint(checkpoint_name):
 
     logger.info("load_checkpoint %s" % (checkpoint_name))
 
-    checkpoints = read_df(CHECKPOINT_TABLE_NAME)
+    checkpoints = get_pipeline_store().read_checkpoints()
 
     if checkpoint_name == LAST_CHECKPOINT:
         checkpoint_name = checkpoints[CHECKPOINT_NAME].iloc[-1]
@@ -374,7 +421,9 @@ def load_checkpoint(checkpoint_name):
         # if the store is not open in read-only mode,
         # write it to the store to ensure so any subsequent checkpoints are forgotten
         if not is_readonly():
-            write_df(checkpoints, CHECKPOINT_TABLE_NAME)
+            get_pipeline_store().write_checkpoints(
+                checkpoints.to_dict(orient="records")
+            )
 
     except IndexError:
         msg = "Couldn't find checkpoint '%s' in checkpoints" % (checkpoint_name,)
@@ -561,10 +610,29 @@ def open_pipeline(resume_after=None, mode="a"):
     if is_open():
         raise RuntimeError("Pipeline is already open!")
 
+    if (
+        config.setting("background_checkpoints", False)
+        and pipeline_store.store_class() is not pipeline_store.ParquetPipelineStore
+    ):
+        # PyTables is not thread safe, and the main thread keeps reading skims and writing
+        # output tables with it while checkpoints are written in the background
+        raise RuntimeError(
+            f"background_checkpoints requires checkpoint_format "
+            f"'{pipeline_store.PARQUET_FORMAT}' (HDF5 stores can't be written in the background)"
+        )
+
     _PIPELINE.init_state()
     _PIPELINE.is_open = True
 
+    if config.setting("use_config_cache", False):
+        config_cache.open_cache(
+            os.path.join(config.get_cache_dir(), config_cache.CACHE_FILE_NAME)
+        )
+
     get_rn_generator().set_base_seed(inject.get_injectable("rng_base_seed", 0))
+    get_rn_generator().set_channel_type(
+        inject.get_injectable("rng_channel_type", "simple")
+    )
 
     if resume_after:
         # open existing pipeline
@@ -615,7 +683,13 @@ def close_pipeline():
 
     close_open_files()
 
-    _PIPELINE.pipeline_store.close()
+    try:
+        if _PIPELINE.store_writer is not None:
+            # wait for any checkpoints still being written in the background
+            _PIPELINE.store_writer.close()
+    finally:
+        _PIPELINE.pipeline_store.close()
+        config_cache.close_cache()
 
     _PIPELINE.init_state()
 
@@ -702,12 +776,14 @@ def run(models, resume_after=None, memory_sidecar_process=None):
 
     mem.trace_memory_info("pipeline.run after run_models")
 
+    skim_dictionary.log_lookup_stats()
+
     t0 = print_elapsed_time("run_model (%s models)" % len(models), t0)
 
     # don't close the pipeline, as the user may want to read intermediate results from the store
 
 
-def get_table(table_name, checkpoint_name=None):
+def get_table(table_name, checkpoint_name=None, columns=None):
     """
     Return pandas dataframe corresponding to table_name
 
@@ -721,6 +797,9 @@ def get_table(table_name, checkpoint_name=None):
     ----------
     table_name : str
     checkpoint_name : str or None
+    columns : list of str or None
+        if specified, return only these columns (when reading a prior version of a table
+        from a parquet pipeline store, only these columns are read from disk)
 
     Returns
     -------
@@ -737,7 +816,7 @@ def get_table(table_name, checkpoint_name=None):
                 "for non-checkpointed table '%s'" % (checkpoint_name, table_name)
             )
 
-        return orca.get_table(table_name).to_frame()
+        return orca.get_table(table_name).to_frame(columns)
 
     # if they want current version of table, no need to read from pipeline store
     if checkpoint_name is None:
@@ -749,7 +828,7 @@ def get_table(table_name, checkpoint_name=None):
             raise RuntimeError("table '%s' was dropped." % table_name)
 
         # return orca.get_table(table_name).local
-        return orca.get_table(table_name).to_frame()
+        return orca.get_table(table_name).to_frame(columns)
 
     # find the requested checkpoint
     checkpoint = next(
@@ -769,9 +848,9 @@ def get_table(table_name, checkpoint_name=None):
 
     # if this version of table is same as current
     if _PIPELINE.last_checkpoint.get(table_name, None) == last_checkpoint_name:
-        return orca.get_table(table_name).to_frame()
+        return orca.get_table(table_name).to_frame(columns)
 
-    return read_df(table_name, last_checkpoint_name)
+    return read_df(table_name, last_checkpoint_name, columns=columns)
 
 
 def get_checkpoints():
@@ -789,12 +868,13 @@ def get_checkpoints():
     store = get_pipeline_store()
 
     if store is not None:
-        df = store[CHECKPOINT_TABLE_NAME]
+        df = store.read_checkpoints()
     else:
         pipeline_file_path = config.pipeline_file_path(
             orca.get_injectable("pipeline_file_name")
         )
-        df = pd.read_hdf(pipeline_file_path, CHECKPOINT_TABLE_NAME)
+        with pipeline_store.open_store(pipeline_file_path, mode="r") as store:
+            df = store.read_checkpoints()
 
     # non-table columns first (column order in df is random because created from a dict)
     table_names = [name for name in df.columns.values if name not in NON_TABLE_COLUMNS]
@@ -957,7 +1037,9 @@ def cleanup_pipeline():
     checkpoints_df = get_checkpoints().tail(1).copy()
     checkpoints_df["checkpoint_name"] = FINAL_CHECKPOINT_NAME
 
-    with pd.HDFStore(final_pipeline_file_path, mode="w") as final_pipeline_store:
+    with pipeline_store.open_store(
+        final_pipeline_file_path, mode="w"
+    ) as final_pipeline_store:
 
         for table_name in checkpointed_tables():
             # patch last checkpoint name for all tables
@@ -975,4 +1057,4 @@ def cleanup_pipeline():
     close_pipeline()
 
     logger.debug(f"deleting all pipeline files except {final_pipeline_file_path}")
-    tracing.delete_output_files("h5", ignore=[final_pipeline_file_path])
+    pipeline_store.store_class().remove_output_stores(ignore=[final_pipeline_file_path])
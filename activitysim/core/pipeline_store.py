@@ -0,0 +1,743 @@
+# ActivitySim
+# See full license in LICENSE.txt.
+import datetime as dt
+import hashlib
+import json
+import logging
+import os
+import queue
+import shutil
+import threading
+from builtins import object
+
+import numpy as np
+import pandas as pd
+
+from . import config, inject, tracing
+
+logger = logging.getLogger(__name__)
+
+# checkpoint_format setting values
+HDF5_FORMAT = "hdf5"
+PARQUET_FORMAT = "parquet"
+
+# name used for the checkpoints table (same as pipeline.CHECKPOINT_TABLE_NAME)
+CHECKPOINT_TABLE_NAME = "checkpoints"
+
+# name of the column with the checkpoint timestamp (same as pipeline.TIMESTAMP)
+TIMESTAMP = "timestamp"
+
+# name of parquet store file with one json checkpoint record per line
+MANIFEST_FILE_NAME = "checkpoints.jsonl"
+
+DEFAULT_PARQUET_COMPRESSION = "zstd"
+
+# suffixes of the auxiliary tables used to store column deltas (see PipelineStore.write_df)
+DELTA_INFO_SUFFIX = "__delta"
+APPENDED_ROWS_SUFFIX = "__appended"
+
+# write a full copy of a table (rather than a delta) if more than this fraction of its
+# columns changed, or if reading it back would require reading more than MAX_DELTA_DEPTH deltas
+MAX_DELTA_COLUMN_FRACTION = 0.5
+MAX_DELTA_DEPTH = 16
+
+
+def split_table_key(key):
+    """
+    Split a pipeline table key (as built by pipeline.pipeline_table_key) into its parts
+
+    Parameters
+    ----------
+    key : str
+        '<table_name>/<checkpoint_name>' or '/<table_name>' or '<table_name>'
+
+    Returns
+    -------
+    table_name : str
+    checkpoint_name : str or None
+    """
+    table_name, _, checkpoint_name = key.lstrip("/").partition("/")
+    return table_name, (checkpoint_name or None)
+
+
+def digest(values):
+    """
+    Return a digest of the values (and dtype) of a pandas Series or Index
+
+    Used to detect which columns of a table have changed since it was last checkpointed
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str(values.dtype).encode("utf8"))
+
+    if isinstance(values.dtype, np.dtype) and values.dtype.kind in "biufcmM":
+        h.update(np.ascontiguousarray(values.to_numpy()).data)
+    else:
+        # object, categorical and other extension types
+        if isinstance(values, pd.Series):
+            hashes = pd.util.hash_pandas_object(values, index=False)
+        else:
+            hashes = pd.util.hash_pandas_object(values)
+        h.update(hashes.to_numpy().data)
+
+    return h.hexdigest()
+
+
+def hdf5_key(table_name, checkpoint_name=None):
+    if checkpoint_name:
+        return f"{table_name}/{checkpoint_name}"
+    return f"/{table_name}"
+
+
+class PipelineStore(object):
+    """
+    Base class for pipeline checkpoint stores
+
+    A pipeline store holds a version of each pipeline table for every checkpoint in which the
+    table changed, plus the checkpoints table that records which version of each table belongs
+    to which checkpoint.
+
+    Subclasses implement the actual storage. For compatibility with code that predates this
+    class (e.g. mp_tasks apportion and coalesce) stores can also be indexed like a
+    pandas.HDFStore with the keys returned by pipeline.pipeline_table_key.
+
+    If the checkpoint_deltas setting is True, a checkpointed table version is stored as a delta
+    against the version of the table most recently written by this store: only the columns
+    whose values changed (or were added) are written in full, and rows appended to the table
+    (e.g. by pipeline.extend_table) are written for the unchanged columns. read_df reassembles
+    the full table from the chain of deltas, reading only the columns it needs from each.
+    """
+
+    def __init__(self, path, mode="a"):
+        self.path = path
+        self.mode = mode
+
+        self.deltas = config.setting("checkpoint_deltas", False)
+
+        # info about the version of each table most recently written by this store
+        # {<table_name>: {checkpoint_name, depth, n_rows, index_digest, column_digests}}
+        self.table_versions = {}
+
+    def _read_df(self, table_name, checkpoint_name=None, columns=None):
+        raise NotImplementedError()
+
+    def _write_df(self, df, table_name, checkpoint_name=None):
+        raise NotImplementedError()
+
+    def _has_df(self, table_name, checkpoint_name=None):
+        raise NotImplementedError()
+
+    def _remove_df(self, table_name, checkpoint_name=None):
+        raise NotImplementedError()
+
+    def read_df(self, table_name, checkpoint_name=None, columns=None):
+        """
+        Read a table version from the store, reassembling it from deltas if necessary
+
+        Parameters
+        ----------
+        table_name : str
+        checkpoint_name : str or None
+        columns : list of str or None
+            read only these columns
+
+        Returns
+        -------
+        df : pandas.DataFrame
+        """
+
+        if checkpoint_name is None or not self._has_df(
+            table_name + DELTA_INFO_SUFFIX, checkpoint_name
+        ):
+            return self._read_df(table_name, checkpoint_name, columns=columns)
+
+        delta_info = self._read_df(
+            table_name + DELTA_INFO_SUFFIX, checkpoint_name
+        ).iloc[0]
+        table_columns = json.loads(delta_info["columns"])
+        changed_columns = json.loads(delta_info["changed_columns"])
+
+        columns = table_columns if columns is None else list(columns)
+        missing_columns = [c for c in columns if c not in table_columns]
+        if missing_columns:
+            raise KeyError(f"{missing_columns} not in {table_name}/{checkpoint_name}")
+
+        # changed columns are stored in full (along with the index of the full table)
+        df = self._read_df(
+            table_name,
+            checkpoint_name,
+            columns=[c for c in columns if c in changed_columns],
+        )
+
+        # unchanged columns come from the previous version (plus any appended rows)
+        unchanged_columns = [c for c in columns if c not in changed_columns]
+        if unchanged_columns:
+            unchanged_df = self.read_df(
+                table_name, delta_info["base_checkpoint"], columns=unchanged_columns
+            )
+            if delta_info["appended_rows"]:
+                appended_df = self._read_df(
+                    table_name + APPENDED_ROWS_SUFFIX,
+                    checkpoint_name,
+                    columns=unchanged_columns,
+                )
+                unchanged_df = pd.concat([unchanged_df, appended_df])
+
+            assert len(unchanged_df) == len(df)
+            unchanged_df.index = df.index
+            df = pd.concat([df, unchanged_df], axis=1)
+
+        return df[columns]
+
+    def write_df(self, df, table_name, checkpoint_name=None):
+        """
+        Write a table version to the store (as a delta, if checkpoint_deltas is enabled)
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+        table_name : str
+        checkpoint_name : str or None
+        """
+
+        previous = self.table_versions.get(table_name)
+
+        if (
+            not self.deltas
+            or checkpoint_name is None
+            or previous is None
+            or previous["depth"] >= MAX_DELTA_DEPTH
+            or not self._write_delta(df, table_name, checkpoint_name, previous)
+        ):
+            self._write_df(df, table_name, checkpoint_name)
+
+            # in case a delta was written with this name in a prior run
+            for suffix in [DELTA_INFO_SUFFIX, APPENDED_ROWS_SUFFIX]:
+                if checkpoint_name and self._has_df(
+                    table_name + suffix, checkpoint_name
+                ):
+                    self._remove_df(table_name + suffix, checkpoint_name)
+
+            if self.deltas and checkpoint_name:
+                self.table_versions[table_name] = {
+                    "checkpoint_name": checkpoint_name,
+                    "depth": 0,
+                    "n_rows": len(df),
+                    "index_digest": digest(df.index),
+                    "column_digests": {c: digest(df[c]) for c in df.columns},
+                }
+
+    def _write_delta(self, df, table_name, checkpoint_name, previous):
+        """
+        Try to write df as a delta against previous version of table
+
+        Returns
+        -------
+        bool
+            False (and nothing written) if a delta is not appropriate
+        """
+
+        n_rows = previous["n_rows"]
+
+        # rows may only have been appended (not removed or reordered)
+        if len(df) < n_rows or digest(df.index[:n_rows]) != previous["index_digest"]:
+            return False
+
+        appended_rows = len(df) > n_rows
+        column_digests = previous["column_digests"]
+
+        changed_columns = [
+            c
+            for c in df.columns
+            if c not in column_digests
+            or digest(df[c].iloc[:n_rows] if appended_rows else df[c])
+            != column_digests[c]
+        ]
+
+        if len(changed_columns) > MAX_DELTA_COLUMN_FRACTION * len(df.columns):
+            return False
+
+        unchanged_columns = [c for c in df.columns if c not in changed_columns]
+
+        logger.debug(
+            f"write_df {table_name}/{checkpoint_name} delta against "
+            f"{previous['checkpoint_name']} changed_columns: {changed_columns} "
+            f"appended rows: {len(df) - n_rows}"
+        )
+
+        self._write_df(df[changed_columns], table_name, checkpoint_name)
+
+        if appended_rows:
+            self._write_df(
+                df[unchanged_columns].iloc[n_rows:],
+                table_name + APPENDED_ROWS_SUFFIX,
+                checkpoint_name,
+            )
+        elif self._has_df(table_name + APPENDED_ROWS_SUFFIX, checkpoint_name):
+            self._remove_df(table_name + APPENDED_ROWS_SUFFIX, checkpoint_name)
+
+        delta_info = pd.DataFrame(
+            {
+                "base_checkpoint": [previous["checkpoint_name"]],
+                "columns": [json.dumps(list(df.columns))],
+                "changed_columns": [json.dumps(changed_columns)],
+                "appended_rows": [appended_rows],
+            }
+        )
+        self._write_df(delta_info, table_name + DELTA_INFO_SUFFIX, checkpoint_name)
+
+        if appended_rows:
+            column_digests = {c: digest(df[c]) for c in df.columns}
+        else:
+            column_digests = {
+                c: (digest(df[c]) if c in changed_columns else column_digests[c])
+                for c in df.columns
+            }
+
+        self.table_versions[table_name] = {
+            "checkpoint_name": checkpoint_name,
+            "depth": previous["depth"] + 1,
+            "n_rows": len(df),
+            "index_digest": digest(df.index)
+            if appended_rows
+            else previous["index_digest"],
+            "column_digests": column_digests,
+        }
+
+        return True
+
+    def read_checkpoints(self):
+        """
+        Returns
+        -------
+        checkpoints : pandas.DataFrame
+            one row per checkpoint with checkpoint_name, timestamp and a column per table
+        """
+        raise NotImplementedError()
+
+    def write_checkpoints(self, checkpoints):
+        """
+        Replace the stored checkpoint history
+
+        Parameters
+        ----------
+        checkpoints : list of dict
+            checkpoint history, one dict per checkpoint, oldest first
+        """
+        raise NotImplementedError()
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    @classmethod
+    def remove(cls, path):
+        """
+        delete the store at path, if it exists
+        """
+        raise NotImplementedError()
+
+    @classmethod
+    def remove_output_stores(cls, ignore=None):
+        """
+        delete all stores of this type in the output directory (except those listed in ignore)
+        """
+        raise NotImplementedError()
+
+    def __getitem__(self, key):
+        table_name, checkpoint_name = split_table_key(key)
+        if table_name == CHECKPOINT_TABLE_NAME and checkpoint_name is None:
+            return self.read_checkpoints()
+        return self.read_df(table_name, checkpoint_name)
+
+    def __setitem__(self, key, df):
+        table_name, checkpoint_name = split_table_key(key)
+        if table_name == CHECKPOINT_TABLE_NAME and checkpoint_name is None:
+            self.write_checkpoints(df.to_dict(orient="records"))
+        else:
+            self.write_df(df, table_name, checkpoint_name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class HdfPipelineStore(PipelineStore):
+    """
+    Pipeline store backed by a single pandas.HDFStore (the traditional pipeline.h5 file)
+
+    Every table version is stored under the key <table_name>/<checkpoint_name> and the
+    checkpoints table is rewritten in its entirety whenever a checkpoint is added.
+    """
+
+    def __init__(self, path, mode="a"):
+        super().__init__(path, mode)
+        self.store = pd.HDFStore(path, mode=mode)
+
+    def _read_df(self, table_name, checkpoint_name=None, columns=None):
+        df = self.store[hdf5_key(table_name, checkpoint_name)]
+        if columns is not None:
+            df = df[columns]
+        return df
+
+    def _write_df(self, df, table_name, checkpoint_name=None):
+        self.store[hdf5_key(table_name, checkpoint_name)] = df
+        self.store.flush()
+
+    def _has_df(self, table_name, checkpoint_name=None):
+        return hdf5_key(table_name, checkpoint_name) in self.store
+
+    def _remove_df(self, table_name, checkpoint_name=None):
+        self.store.remove(hdf5_key(table_name, checkpoint_name))
+
+    def read_checkpoints(self):
+        return self.store[CHECKPOINT_TABLE_NAME]
+
+    def write_checkpoints(self, checkpoints):
+
+        # create a pandas dataframe of the checkpoint history, one row per checkpoint
+        checkpoints = pd.DataFrame(checkpoints)
+
+        # convert empty values to str so PyTables doesn't pickle object types
+        for c in checkpoints.columns:
+            checkpoints[c] = checkpoints[c].fillna("")
+
+        # write it to the store, overwriting any previous version (no way to simply extend)
+        checkpoints.columns = checkpoints.columns.astype(str)
+        self.store[CHECKPOINT_TABLE_NAME] = checkpoints
+        self.store.flush()
+
+    def flush(self):
+        self.store.flush()
+
+    def close(self):
+        self.store.close()
+
+    @classmethod
+    def remove(cls, path):
+        if os.path.isfile(path):
+            logger.debug("removing pipeline store: %s" % path)
+            os.unlink(path)
+
+    @classmethod
+    def remove_output_stores(cls, ignore=None):
+        tracing.delete_output_files("h5", ignore=ignore)
+
+
+class ParquetPipelineStore(PipelineStore):
+    """
+    Pipeline store backed by a directory of compressed parquet files
+
+    ::
+
+        <store_dir>/checkpoints.jsonl                          manifest, one line per checkpoint
+        <store_dir>/<checkpoint_name>/<table_name>.parquet     table versions
+        <store_dir>/<table_name>.parquet                       tables without a checkpoint
+
+    Each table version is an independent file, so writing a checkpoint only touches the tables
+    that changed, and reads can be restricted to a subset of columns. Rather than rewriting the
+    whole checkpoints table at every checkpoint, the manifest is appended to (and only rewritten
+    when the checkpoint history is truncated by load_checkpoint).
+
+    The store directory is the pipeline file path with its extension (if any) removed,
+    so the default pipeline_file_name of pipeline.h5 is stored in <output_dir>/pipeline/
+    """
+
+    def __init__(self, path, mode="a"):
+        super().__init__(path, mode)
+        self.dir = self.store_dir(path)
+
+        if mode == "w":
+            self.remove(path)
+
+        if mode in ["r", "r+"]:
+            if not os.path.isdir(self.dir):
+                raise FileNotFoundError(f"pipeline store {self.dir} not found")
+        else:
+            os.makedirs(self.dir, exist_ok=True)
+
+        self.compression = config.setting(
+            "checkpoint_compression", DEFAULT_PARQUET_COMPRESSION
+        )
+
+        # number of checkpoint records in the manifest (so we know if we can just append)
+        self.manifest_length = None
+
+    @staticmethod
+    def store_dir(path):
+        return os.path.splitext(path)[0]
+
+    def table_path(self, table_name, checkpoint_name=None):
+        if checkpoint_name:
+            return os.path.join(self.dir, checkpoint_name, f"{table_name}.parquet")
+        return os.path.join(self.dir, f"{table_name}.parquet")
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.dir, MANIFEST_FILE_NAME)
+
+    def _read_df(self, table_name, checkpoint_name=None, columns=None):
+        """
+        Read a table version, optionally restricted to the specified columns
+
+        The file is memory mapped and arrow buffers are released as soon as each column is
+        converted, so peak memory stays close to the size of the returned dataframe.
+        """
+        import pyarrow.parquet as pq
+
+        path = self.table_path(table_name, checkpoint_name)
+        if not os.path.exists(path):
+            raise KeyError(
+                f"No object named {table_name}/{checkpoint_name} in {self.dir}"
+            )
+
+        table = pq.read_table(
+            path, columns=columns, memory_map=True, use_pandas_metadata=True
+        )
+        return table.to_pandas(self_destruct=True)
+
+    def _write_df(self, df, table_name, checkpoint_name=None):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        assert self.mode != "r"
+
+        path = self.table_path(table_name, checkpoint_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        table = pa.Table.from_pandas(df, preserve_index=True)
+        pq.write_table(table, path, compression=self.compression)
+
+    def _has_df(self, table_name, checkpoint_name=None):
+        return os.path.exists(self.table_path(table_name, checkpoint_name))
+
+    def _remove_df(self, table_name, checkpoint_name=None):
+        os.unlink(self.table_path(table_name, checkpoint_name))
+
+    def read_checkpoints(self):
+
+        if not os.path.exists(self.manifest_path):
+            raise KeyError(f"No object named {CHECKPOINT_TABLE_NAME} in {self.dir}")
+
+        with open(self.manifest_path, "rt") as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        self.manifest_length = len(records)
+
+        checkpoints = pd.DataFrame(records)
+        for c in checkpoints.columns:
+            checkpoints[c] = checkpoints[c].fillna("")
+        if TIMESTAMP in checkpoints:
+            checkpoints[TIMESTAMP] = pd.to_datetime(checkpoints[TIMESTAMP])
+
+        return checkpoints
+
+    def write_checkpoints(self, checkpoints):
+
+        assert self.mode != "r"
+
+        def to_json(checkpoint):
+            return json.dumps(
+                {
+                    k: (v.isoformat() if isinstance(v, dt.datetime) else v)
+                    for k, v in checkpoint.items()
+                }
+            )
+
+        if self.manifest_length is None and os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "rt") as f:
+                self.manifest_length = sum(1 for line in f if line.strip())
+
+        if self.manifest_length and self.manifest_length <= len(checkpoints):
+            # existing records are unchanged, so we just append the new ones
+            new_checkpoints = checkpoints[self.manifest_length :]
+            file_mode = "at"
+        else:
+            new_checkpoints = checkpoints
+            file_mode = "wt"
+
+        with open(self.manifest_path, file_mode) as f:
+            for checkpoint in new_checkpoints:
+                f.write(to_json(checkpoint) + "\n")
+
+        self.manifest_length = len(checkpoints)
+
+    @classmethod
+    def remove(cls, path):
+        store_dir = cls.store_dir(path)
+        if os.path.isdir(store_dir):
+            logger.debug("removing pipeline store: %s" % store_dir)
+            shutil.rmtree(store_dir)
+
+    @classmethod
+    def remove_output_stores(cls, ignore=None):
+        output_dir = inject.get_injectable("output_dir")
+        ignore = [os.path.realpath(cls.store_dir(p)) for p in (ignore or [])]
+
+        for name in os.listdir(output_dir):
+            store_dir = os.path.join(output_dir, name)
+            if os.path.realpath(store_dir) in ignore:
+                continue
+            # parquet stores are recognizable by their manifest
+            if os.path.isfile(os.path.join(store_dir, MANIFEST_FILE_NAME)):
+                logger.debug("removing pipeline store: %s" % store_dir)
+                shutil.rmtree(store_dir)
+
+
+class BackgroundStoreWriter(object):
+    """
+    Write checkpoints to a PipelineStore from a background thread
+
+    add_checkpoint hands the writer snapshots (deep copies) of the changed tables and the
+    checkpoint history and returns immediately, so the next model step can start while the
+    snapshots are serialized, compressed and written. Snapshots are written strictly in the
+    order they were queued.
+
+    The store must not be accessed by any other thread while writes are pending, so
+    pipeline.get_pipeline_store calls wait() to block until the queue is drained. Only
+    ParquetPipelineStore is written in the background, as PyTables (which the main thread
+    keeps using for skims and output tables) is not thread safe.
+
+    To keep queued snapshots from using more than their share of memory, write() blocks while
+    the bytes already queued plus the new snapshot would exceed max_queued_bytes (but a single
+    snapshot is always accepted when the queue is empty, however large it is).
+
+    Exceptions raised in the writer thread are re-raised by the next call to write or wait.
+    """
+
+    def __init__(self, store, max_queued_bytes=None):
+        self.store = store
+        self.max_queued_bytes = max_queued_bytes
+
+        self.queue = queue.Queue()
+        self.queued_bytes = 0
+        self.condition = threading.Condition()
+        self.error = None
+
+        self.thread = threading.Thread(
+            target=self._run, name="BackgroundStoreWriter", daemon=True
+        )
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                break
+
+            tables, checkpoints, nbytes = item
+            try:
+                if self.error is None:
+                    for df, table_name, checkpoint_name in tables:
+                        self.store.write_df(df, table_name, checkpoint_name)
+                    self.store.write_checkpoints(checkpoints)
+            except Exception as e:
+                logger.exception("BackgroundStoreWriter error writing checkpoint")
+                self.error = e
+            finally:
+                del tables
+                with self.condition:
+                    self.queued_bytes -= nbytes
+                    self.condition.notify_all()
+                self.queue.task_done()
+
+    def _raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise RuntimeError("background checkpoint write failed") from error
+
+    def write(self, tables, checkpoints):
+        """
+        Queue a checkpoint for writing
+
+        Parameters
+        ----------
+        tables : list of (pandas.DataFrame, table_name, checkpoint_name)
+            changed tables (the dataframes are copied, so callers may modify them afterwards)
+        checkpoints : list of dict
+            checkpoint history to write after the tables
+        """
+
+        self._raise_error()
+
+        tables = [
+            (df.copy(deep=True), table_name, checkpoint_name)
+            for df, table_name, checkpoint_name in tables
+        ]
+        checkpoints = [checkpoint.copy() for checkpoint in checkpoints]
+        nbytes = int(sum(df.memory_usage(index=True).sum() for df, _, _ in tables))
+
+        with self.condition:
+            if self.max_queued_bytes:
+                while (
+                    self.queued_bytes > 0
+                    and self.queued_bytes + nbytes > self.max_queued_bytes
+                ):
+                    logger.debug(
+                        f"BackgroundStoreWriter waiting for {self.queued_bytes} "
+                        f"queued bytes to be written"
+                    )
+                    self.condition.wait()
+            self.queued_bytes += nbytes
+
+        self.queue.put((tables, checkpoints, nbytes))
+
+    def wait(self):
+        """
+        Block until all queued checkpoints have been written
+        """
+        self.queue.join()
+        self._raise_error()
+
+    def close(self):
+        """
+        Write any queued checkpoints and stop the writer thread
+        """
+        self.queue.put(None)
+        self.thread.join()
+        self._raise_error()
+
+
+STORE_CLASSES = {
+    HDF5_FORMAT: HdfPipelineStore,
+    PARQUET_FORMAT: ParquetPipelineStore,
+}
+
+
+def store_class(checkpoint_format=None):
+    """
+    Return the PipelineStore subclass for checkpoint_format (default from settings)
+    """
+    if checkpoint_format is None:
+        checkpoint_format = config.setting("checkpoint_format", HDF5_FORMAT)
+
+    if checkpoint_format not in STORE_CLASSES:
+        raise RuntimeError(
+            f"Unrecognized checkpoint_format '{checkpoint_format}' "
+            f"(expected one of {list(STORE_CLASSES.keys())})"
+        )
+
+    return STORE_CLASSES[checkpoint_format]
+
+
+def open_store(path, mode="a", checkpoint_format=None):
+    """
+    Open a pipeline store of the configured checkpoint_format
+
+    Parameters
+    ----------
+    path : str
+        pipeline file path (e.g. as returned by config.pipeline_file_path)
+    mode : {'a', 'w', 'r', 'r+'}, default 'a'
+        same as for pandas.HDFStore
+    checkpoint_format : str or None
+        'hdf5' or 'parquet', if None use checkpoint_format setting (default 'hdf5')
+
+    Returns
+    -------
+    PipelineStore
+    """
+    return store_class(checkpoint_format)(path, mode=mode)
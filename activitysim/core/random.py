@@ -18,6 +18,20 @@ logger = logging.getLogger(__name__)
 _MAX_SEED = 1 << 32
 _SEED_MASK = 0xFFFFFFFF
 
+# Philox4x32-10 round and key schedule constants (Salmon et al., "Parallel Random Numbers:
+# As Easy as 1, 2, 3", SC11 - the same counter-based generator as numpy.random.Philox)
+_PHILOX_M0 = np.uint64(0xD2511F53)
+_PHILOX_M1 = np.uint64(0xCD9E8D57)
+_PHILOX_W0 = np.uint64(0x9E3779B9)
+_PHILOX_W1 = np.uint64(0xBB67AE85)
+_PHILOX_ROUNDS = 10
+_WORD_MASK = np.uint64(_SEED_MASK)
+_WORD_SHIFT = np.uint64(32)
+
+# registered channel types (see Random.set_channel_type)
+SIMPLE_CHANNEL = "simple"
+PHILOX_CHANNEL = "philox"
+
 
 def hash32(s):
     """
@@ -35,6 +49,51 @@ def hash32(s):
     return int(h, base=16) & _SEED_MASK
 
 
+def philox4x32(counter, key):
+    """
+    Vectorized Philox4x32-10 counter-based bijection.
+
+    Every element of the (broadcast) counter and key arrays is encrypted independently, so the
+    output for any (counter, key) pair depends only on that pair and not on its position in
+    the array or on the other values being computed alongside it.
+
+    Parameters
+    ----------
+    counter : tuple of 4 array-like of uint32 values
+    key : tuple of 2 array-like of uint32 values
+
+    Returns
+    -------
+    words : tuple of 4 ndarray of uint64 (each holding a 32 bit value)
+    """
+
+    c0, c1, c2, c3 = (np.asanyarray(c, dtype=np.uint64) for c in counter)
+    k0, k1 = (np.asanyarray(k, dtype=np.uint64) for k in key)
+
+    for _ in range(_PHILOX_ROUNDS):
+        p0 = c0 * _PHILOX_M0
+        p1 = c2 * _PHILOX_M1
+        c0, c1, c2, c3 = (
+            (p1 >> _WORD_SHIFT) ^ c1 ^ k0,
+            p1 & _WORD_MASK,
+            (p0 >> _WORD_SHIFT) ^ c3 ^ k1,
+            p0 & _WORD_MASK,
+        )
+        k0 = (k0 + _PHILOX_W0) & _WORD_MASK
+        k1 = (k1 + _PHILOX_W1) & _WORD_MASK
+
+    return c0, c1, c2, c3
+
+
+def _words_to_unit_float(hi, lo):
+    """
+    combine two 32 bit words into a 53 bit float in range [0, 1) (same recipe as numpy/mt19937)
+    """
+    a = (hi >> np.uint64(5)).astype(np.float64)
+    b = (lo >> np.uint64(6)).astype(np.float64)
+    return (a * 67108864.0 + b) / 9007199254740992.0
+
+
 class SimpleChannel(object):
     """
 
@@ -373,6 +432,159 @@ class SimpleChannel(object):
         return sample
 
 
+class PhiloxChannel(SimpleChannel):
+    """
+    Counter-based alternative to SimpleChannel
+
+    SimpleChannel reseeds a numpy RandomState for every row and then fast-forwards it past the
+    rands already consumed in the current step, one row at a time, so the cost of a draw grows
+    with the number of draws already made in the step. PhiloxChannel instead computes every
+    draw directly as a Philox4x32-10 encryption of a counter under a per-row key, which lets us
+    generate the rands for a whole df in a handful of vectorized numpy operations.
+
+    The key is the 64 bit row index (the domain_df index value), and the counter is
+    (offset of the draw within the step, channel_seed, step_seed, base_seed). Each rand thus
+    depends only on the row index, channel, step, base seed and offset - never on which other
+    rows are in df - so results are repeatable regardless of chunking or multiprocess slicing.
+
+    The streams are NOT the same as those generated by SimpleChannel, so regression results
+    created with one channel type can only be reproduced with the same channel type.
+    """
+
+    def _words_for_df(self, df, n):
+        """
+        Return the four Philox output words for the next n draws of each row in df
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            dataframe with index values for which random streams are to be generated
+            and well-known index name corresponding to the channel
+        n : int
+            number of draws (counter values) per row
+
+        Returns
+        -------
+        words : tuple of 4 ndarray of uint64 with shape (len(df), n)
+        """
+
+        # assert no dupes
+        assert len(df.index.unique()) == len(df.index)
+
+        offsets = self.row_states["offset"].loc[df.index].to_numpy(dtype=np.uint64)
+
+        row_ids = df.index.to_numpy(dtype=np.int64).view(np.uint64)
+        key = (
+            (row_ids & _WORD_MASK)[:, np.newaxis],
+            (row_ids >> _WORD_SHIFT)[:, np.newaxis],
+        )
+
+        counter = (
+            offsets[:, np.newaxis] + np.arange(n, dtype=np.uint64)[np.newaxis, :],
+            self.channel_seed,
+            self.step_seed,
+            int(self.base_seed) & _SEED_MASK,
+        )
+
+        return philox4x32(counter, key)
+
+    def _consume(self, df, n):
+        # update offset for rows we handled
+        self.row_states.loc[df.index, "offset"] += n
+
+    def random_for_df(self, df, step_name, n=1):
+        """
+        Return n floating point random numbers in range [0, 1) for each row in df
+
+        See SimpleChannel.random_for_df
+        """
+
+        assert self.step_name
+        assert self.step_name == step_name
+
+        w0, w1, _, _ = self._words_for_df(df, n)
+        rands = _words_to_unit_float(w0, w1)
+
+        self._consume(df, n)
+        return rands
+
+    def normal_for_df(self, df, step_name, mu, sigma, lognormal=False, size=None):
+        """
+        Return a floating point random number in normal (or lognormal) distribution
+        for each row in df (Box-Muller transform of a single counter value per draw)
+
+        See SimpleChannel.normal_for_df
+        """
+
+        assert self.step_name
+        assert self.step_name == step_name
+
+        n = 1 if size is None else int(size)
+
+        w0, w1, w2, w3 = self._words_for_df(df, n)
+        u1 = _words_to_unit_float(w0, w1)
+        u2 = _words_to_unit_float(w2, w3)
+        z = np.sqrt(-2.0 * np.log1p(-u1)) * np.cos(2.0 * np.pi * u2)
+
+        def to_column(x):
+            if np.isscalar(x):
+                return x
+            return np.asanyarray(x, dtype=np.float64).reshape(-1, 1)
+
+        rands = to_column(mu) + to_column(sigma) * z
+        if lognormal:
+            rands = np.exp(rands)
+
+        if size is None:
+            rands = rands[:, 0]
+
+        self._consume(df, n)
+        return rands
+
+    def choice_for_df(self, df, step_name, a, size, replace):
+        """
+        Apply the equivalent of numpy.random.choice once for each row in df
+
+        Sampling without replacement consumes one draw per element of a (the sample is the
+        first size elements of a random permutation) rather than one draw per sampled element.
+
+        See SimpleChannel.choice_for_df
+        """
+
+        assert self.step_name
+        assert self.step_name == step_name
+
+        size = int(size)
+        pool_size = a if np.isscalar(a) else len(a)
+
+        if replace:
+            n = size
+            w0, w1, _, _ = self._words_for_df(df, n)
+            idx = (_words_to_unit_float(w0, w1) * pool_size).astype(np.int64)
+        else:
+            assert size <= pool_size
+            n = pool_size
+            w0, w1, _, _ = self._words_for_df(df, n)
+            idx = np.argsort(_words_to_unit_float(w0, w1), axis=1, kind="stable")
+            idx = idx[:, :size]
+
+        if np.isscalar(a):
+            sample = idx.ravel()
+        else:
+            sample = np.asanyarray(a)[idx.ravel()]
+
+        if not self.multi_choice_offset:
+            self._consume(df, n)
+
+        return sample
+
+
+_CHANNEL_TYPES = {
+    SIMPLE_CHANNEL: SimpleChannel,
+    PHILOX_CHANNEL: PhiloxChannel,
+}
+
+
 class Random(object):
     def __init__(self):
 
@@ -386,6 +598,8 @@ class Random(object):
         self.base_seed = 0
         self.global_rng = np.random.RandomState()
 
+        self.channel_type = SIMPLE_CHANNEL
+
     def get_channel_for_df(self, df):
         """
         Return the channel for this df. Channel should already have been loaded/added.
@@ -485,7 +699,8 @@ class Random(object):
                 "Adding channel '%s' %s ids" % (channel_name, len(domain_df.index))
             )
 
-            channel = SimpleChannel(
+            channel_class = _CHANNEL_TYPES[self.channel_type]
+            channel = channel_class(
                 channel_name, self.base_seed, domain_df, self.step_name
             )
 
@@ -541,6 +756,37 @@ class Random(object):
             logger.debug("Set random seed base to %s" % seed)
             self.base_seed = seed
 
+    def set_channel_type(self, channel_type=None):
+        """
+        Select the class used to generate random streams for the channels of this Random.
+
+        'simple' (the default) uses SimpleChannel, which reseeds a numpy RandomState for each
+        row and reproduces the streams of earlier versions of ActivitySim.
+
+        'philox' uses PhiloxChannel, a vectorized counter-based generator that is much faster
+        for large choosers tables, but produces different (though equally repeatable) streams.
+
+        Must be called before first step (before any channels are added or rands are consumed)
+
+        Parameters
+        ----------
+        channel_type : str or None
+            one of 'simple' or 'philox' (None means 'simple')
+        """
+
+        if self.step_name is not None or self.channels:
+            raise RuntimeError("Can only call set_channel_type before the first step.")
+
+        channel_type = channel_type or SIMPLE_CHANNEL
+        if channel_type not in _CHANNEL_TYPES:
+            raise RuntimeError(
+                "Unknown rng channel type '%s' (expected one of %s)"
+                % (channel_type, list(_CHANNEL_TYPES.keys()))
+            )
+
+        logger.debug("Set random channel type to %s" % channel_type)
+        self.channel_type = channel_type
+
     def get_global_rng(self):
         """
         Return a numpy random number generator for use within current step.
@@ -11,9 +11,21 @@ from datetime import timedelta
 import numpy as np
 import pandas as pd
 
-from . import assign, chunk, config, logit, pathbuilder, pipeline, tracing, util
+from . import (
+    assign,
+    chunk,
+    config,
+    config_cache,
+    expression_plan,
+    logit,
+    pathbuilder,
+    pipeline,
+    tracing,
+    util,
+)
 from .simulate_consts import (
     ALT_LOSER_UTIL,
+    SPARSE_UTILITY_DENSITY,
     SPEC_DESCRIPTION_NAME,
     SPEC_EXPRESSION_NAME,
     SPEC_LABEL_NAME,
@@ -57,6 +69,12 @@ def read_model_alts(file_name, set_index=None):
     return df
 
 
+def _spec_file_name(file_name):
+    if not file_name.lower().endswith(".csv"):
+        file_name = "%s.csv" % (file_name,)
+    return file_name
+
+
 def read_model_spec(file_name):
     """
     Read a CSV model specification into a Pandas DataFrame or Series.
@@ -90,11 +108,15 @@ def read_model_spec(file_name):
     """
 
     assert isinstance(file_name, str)
-    if not file_name.lower().endswith(".csv"):
-        file_name = "%s.csv" % (file_name,)
+    file_name = _spec_file_name(file_name)
 
     file_path = config.config_file_path(file_name)
 
+    return config_cache.cached("spec", [file_path], lambda: _read_spec(file_path))
+
+
+def _read_spec(file_path):
+
     try:
         spec = pd.read_csv(file_path, comment="#")
     except Exception as err:
@@ -139,6 +161,14 @@ def read_model_coefficients(model_settings=None, file_name=None):
         logger.debug(f"read_model_coefficients file_name {file_name}")
 
     file_path = config.config_file_path(file_name)
+
+    return config_cache.cached(
+        "coefficients", [file_path], lambda: _read_coefficients(file_path)
+    )
+
+
+def _read_coefficients(file_path):
+
     try:
         coefficients = pd.read_csv(file_path, comment="#", index_col="coefficient_name")
     except ValueError:
@@ -178,6 +208,26 @@ def spec_for_segment(model_settings, spec_id, segment_name, estimator):
         canonical spec file with expressions in index and single column with utility coefficients
     """
 
+    spec_file_name = model_settings[spec_id]
+
+    if "COEFFICIENTS" in model_settings:
+        # evaluated segment spec depends only on the spec and coefficients files
+        file_paths = [
+            config.config_file_path(f)
+            for f in [_spec_file_name(spec_file_name), model_settings["COEFFICIENTS"]]
+        ]
+        return config_cache.cached(
+            "segment_spec",
+            file_paths,
+            lambda: _spec_for_segment(model_settings, spec_id, segment_name, estimator),
+            extra=(segment_name, bool(estimator), config.setting("sharrow", False)),
+        )
+
+    return _spec_for_segment(model_settings, spec_id, segment_name, estimator)
+
+
+def _spec_for_segment(model_settings, spec_id, segment_name, estimator):
+
     spec_file_name = model_settings[spec_id]
     spec = read_model_spec(file_name=spec_file_name)
 
@@ -395,9 +445,9 @@ def eval_coefficients(spec, coefficients, estimator):
     for c in spec.columns:
         if c == SPEC_LABEL_NAME:
             continue
-        spec[c] = (
-            spec[c].apply(lambda x: eval(str(x), {}, coefficients)).astype(np.float32)
-        )
+        # most cells are zero or a coefficient name shared by many rows, so eval each once
+        values = {x: eval(str(x), {}, coefficients) for x in pd.unique(spec[c])}
+        spec[c] = spec[c].map(values).astype(np.float32)
 
     sharrow_enabled = config.setting("sharrow", False)
     if sharrow_enabled:
@@ -534,63 +584,94 @@ def eval_utilities(
         else:
             exprs = spec.index
 
-        expression_values = np.empty((spec.shape[0], choosers.shape[0]))
-        chunk.log_df(trace_label, "expression_values", expression_values)
+        coefficients = spec.astype(np.float64).values
+        nonzero_coefficients = coefficients != 0
 
-        i = 0
-        for expr, coefficients in zip(exprs, spec.values):
+        if estimator or have_trace_targets or trace_all_rows or sharrow_enabled:
+            # expression_values for every spec row are reported or compared
+            spec_rows = np.arange(len(spec))
+            sparse = False
+        else:
+            # skip expressions whose coefficients are zero for every alternative
+            spec_rows = np.flatnonzero(nonzero_coefficients.any(axis=1))
+            sparse = (
+                nonzero_coefficients[spec_rows].mean() < SPARSE_UTILITY_DENSITY
+                if len(spec_rows)
+                else False
+            )
 
-            try:
-                with warnings.catch_warnings(record=True) as w:
-                    # Cause all warnings to always be triggered.
-                    warnings.simplefilter("always")
-                    if expr.startswith("@"):
-                        expression_value = eval(expr[1:], globals_dict, locals_dict)
-                    else:
-                        expression_value = choosers.eval(expr)
-
-                    if len(w) > 0:
-                        for wrn in w:
-                            logger.warning(
-                                f"{trace_label} - {type(wrn).__name__} ({wrn.message}) evaluating: {str(expr)}"
-                            )
-
-            except Exception as err:
-                logger.exception(
-                    f"{trace_label} - {type(err).__name__} ({str(err)}) evaluating: {str(expr)}"
-                )
-                raise err
+        if sparse:
+            # accumulate only nonzero (expression, alternative) contributions
+            # one row per alternative so each accumulation is contiguous
+            utilities = np.zeros((spec.shape[1], choosers.shape[0]))
+            chunk.log_df(trace_label, "utilities", utilities)
+        else:
+            expression_values = np.empty((len(spec_rows), choosers.shape[0]))
+            chunk.log_df(trace_label, "expression_values", expression_values)
+
+        # expressions are parsed once per spec and reused across chunks and segments
+        plan = expression_plan.expression_plan(exprs)
+        dtypes = choosers.dtypes.to_dict()
 
-            if log_alt_losers:
-                # utils for each alt for this expression
-                # FIXME if we always did tis, we cold uem these and skip np.dot below
-                utils = np.outer(expression_value, coefficients)
-                losers = np.amax(utils, axis=1) < ALT_LOSER_UTIL
+        with warnings.catch_warnings(record=True) as w:
+            # Cause all warnings to always be triggered.
+            warnings.simplefilter("always")
+
+            for k, i in enumerate(spec_rows):
+
+                expr = plan[i].expr
+                n_warnings = len(w)
+
+                try:
+                    expression_value = plan[i].evaluate(
+                        choosers, dtypes, globals_dict, locals_dict
+                    )
+                except Exception as err:
+                    logger.exception(
+                        f"{trace_label} - {type(err).__name__} ({str(err)}) evaluating: {str(expr)}"
+                    )
+                    raise err
 
-                if losers.any():
+                for wrn in w[n_warnings:]:
                     logger.warning(
-                        f"{trace_label} - {sum(losers)} choosers of {len(losers)} "
-                        f"with prohibitive utilities for all alternatives for expression: {expr}"
+                        f"{trace_label} - {type(wrn).__name__} ({wrn.message}) evaluating: {str(expr)}"
                     )
 
-            expression_values[i] = expression_value
-            i += 1
+                if log_alt_losers:
+                    # utils for each alt for this expression
+                    # FIXME if we always did tis, we cold uem these and skip np.dot below
+                    utils = np.outer(expression_value, spec.values[i])
+                    losers = np.amax(utils, axis=1) < ALT_LOSER_UTIL
 
-        chunk.log_df(trace_label, "expression_values", expression_values)
+                    if losers.any():
+                        logger.warning(
+                            f"{trace_label} - {sum(losers)} choosers of {len(losers)} "
+                            f"with prohibitive utilities for all alternatives for expression: {expr}"
+                        )
 
-        if estimator:
-            df = pd.DataFrame(
-                data=expression_values.transpose(),
-                index=choosers.index,
-                columns=spec.index.get_level_values(SPEC_LABEL_NAME),
-            )
-            df.index.name = choosers.index.name
-            estimator.write_expression_values(df)
+                if sparse:
+                    expression_value = np.asarray(expression_value, dtype=np.float64)
+                    for j in np.flatnonzero(nonzero_coefficients[i]):
+                        utilities[j] += coefficients[i, j] * expression_value
+                else:
+                    expression_values[k] = expression_value
 
-        # - compute_utilities
-        utilities = np.dot(
-            expression_values.transpose(), spec.astype(np.float64).values
-        )
+        if sparse:
+            utilities = utilities.transpose()
+        else:
+            chunk.log_df(trace_label, "expression_values", expression_values)
+
+            if estimator:
+                df = pd.DataFrame(
+                    data=expression_values.transpose(),
+                    index=choosers.index,
+                    columns=spec.index.get_level_values(SPEC_LABEL_NAME),
+                )
+                df.index.name = choosers.index.name
+                estimator.write_expression_values(df)
+
+            # - compute_utilities
+            utilities = np.dot(expression_values.transpose(), coefficients[spec_rows])
 
         timelogger.mark("simple flow", True, logger=logger, suffix=trace_label)
     else:
@@ -1124,6 +1205,17 @@ def eval_mnl(
             column_labels=["alternative", "utility"],
         )
 
+    if not (have_trace_targets or custom_chooser):
+        # probs are not needed for tracing or by a custom chooser,
+        # so choose directly from the utilities
+        choices, rands, _ = logit.utils_to_choices(
+            utilities, trace_label=trace_label, trace_choosers=choosers
+        )
+        del utilities
+        chunk.log_df(trace_label, "utilities", None)
+
+        return choices
+
     probs = logit.utils_to_probs(
         utilities, trace_label=trace_label, trace_choosers=choosers
     )
@@ -3,3 +3,7 @@ SPEC_EXPRESSION_NAME = "Expression"
 SPEC_LABEL_NAME = "Label"
 
 ALT_LOSER_UTIL = -900
+
+# eval_utilities accumulates utilities one nonzero coefficient at a time, rather
+# than with a dense dot product, when fewer than this fraction of coefficients are nonzero
+SPARSE_UTILITY_DENSITY = 0.25
@@ -0,0 +1,249 @@
+# ActivitySim
+# See full license in LICENSE.txt.
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# integer dtypes quantized skims can be stored as
+QUANTIZED_DTYPES = ("int16", "uint8")
+
+# cores with at most this many distinct values (e.g. fares, tolls, distance bands) are dictionary encoded
+DICTIONARY_SIZE = 256
+
+# number of values checked for distinct values before scanning the whole core for dictionary encoding
+DICTIONARY_SAMPLE_SIZE = 4096
+
+# decode parameters of one core, stored in header blocks after the skim blocks in skim_data
+CODEC_DTYPE = np.dtype(
+    [
+        ("scale", "f8"),
+        ("offset", "f8"),
+        ("max_error", "f8"),
+        ("dictionary_size", "i4"),
+        ("table", "f4", (DICTIONARY_SIZE,)),
+    ]
+)
+
+
+def _distinct_values(values):
+    """
+    Return the distinct (non-nan) values of a core, or None if there are more than DICTIONARY_SIZE
+    """
+
+    # most cores (e.g. times and distances) have more distinct values than that in their first rows
+    sample = pd.unique(values.ravel()[:DICTIONARY_SAMPLE_SIZE])
+    if len(sample) > DICTIONARY_SIZE + 1:
+        return None
+
+    distinct = pd.unique(values.ravel())
+    distinct = np.sort(distinct[~np.isnan(distinct)])
+    if len(distinct) > DICTIONARY_SIZE:
+        return None
+    return distinct
+
+
+class SkimCodec(object):
+    """
+    Fixed-point or dictionary encoding of skim cores as int16 or uint8 skim data
+
+    Each core (omx matrix) is encoded either by dictionary, if it has few enough distinct values
+    (which is lossless), or as fixed point with a per-core scale and offset so the codes span the
+    range of its values. The lowest code of the dtype is reserved for missing (nan) values.
+
+    ::
+
+        value = code * scale + offset                   (fixed point)
+        value = table[code - code_base]                 (dictionary)
+
+    The decode parameters are stored in header blocks following the num_skims skim blocks in
+    skim_data, so they travel with the skim data through shared memory buffers, memmap skim caches
+    and skim stores, and every process decodes with the parameters of the process that encoded it.
+    """
+
+    def __init__(self, dtype_name, num_skims, value_dtype_name="float32"):
+
+        if dtype_name not in QUANTIZED_DTYPES:
+            raise RuntimeError(
+                f"skim quantization dtype '{dtype_name}' not in {QUANTIZED_DTYPES}"
+            )
+
+        self.dtype = np.dtype(dtype_name)
+        self.value_dtype = np.dtype(value_dtype_name)
+        self.num_skims = num_skims
+
+        info = np.iinfo(self.dtype)
+        self.missing_code = info.min
+        self.code_base = info.min + 1
+        self.num_codes = info.max - self.code_base + 1
+
+        self.params = np.zeros(num_skims, dtype=CODEC_DTYPE)
+
+    def num_header_blocks(self, omx_shape):
+        """
+        number of skim blocks needed to hold the decode parameters of all cores
+        """
+        block_size = int(np.prod(omx_shape)) * self.dtype.itemsize
+        return -(-self.params.nbytes // block_size)
+
+    def encode(self, block_offset, values, codes):
+        """
+        Encode the values of a core into codes and record its decode parameters
+
+        Parameters
+        ----------
+        block_offset : int
+            offset of the core in skim_data
+        values : numpy.ndarray
+            2D float values of the core
+        codes : numpy.ndarray
+            2D slice of skim_data to encode into
+        """
+
+        params = self.params[block_offset]
+        missing = np.isnan(values)
+
+        if missing.all():
+            codes[:] = self.missing_code
+            return
+
+        distinct = _distinct_values(values)
+        if distinct is not None and len(distinct) <= self.num_codes:
+            # dictionary encoding is lossless
+            params["dictionary_size"] = len(distinct)
+            params["table"][: len(distinct)] = distinct
+            encoded = np.searchsorted(distinct, np.where(missing, distinct[:1], values))
+            encoded += self.code_base
+            params["max_error"] = 0
+        else:
+            min_value = np.nanmin(values)
+            max_value = np.nanmax(values)
+            scale = (max_value - min_value) / (self.num_codes - 1)
+            params["scale"] = scale
+            params["offset"] = min_value - self.code_base * scale
+            encoded = np.rint((values - min_value) / scale)
+            encoded = np.where(missing, 0, encoded) + self.code_base
+
+        np.copyto(
+            codes, np.where(missing, self.missing_code, encoded), casting="unsafe"
+        )
+
+        if not params["dictionary_size"]:
+            decoded = self.decode(codes, block_offset)
+            params["max_error"] = np.nanmax(np.abs(decoded - values))
+
+    def decode(self, codes, block_offsets):
+        """
+        Return the values of codes of the cores at block_offsets
+
+        Parameters
+        ----------
+        codes : numpy.ndarray
+        block_offsets : int or numpy.ndarray of int (same length as codes)
+
+        Returns
+        -------
+        numpy.ndarray of value_dtype
+        """
+
+        params = self.params[block_offsets]
+
+        codes = np.asanyarray(codes).astype(np.int32)
+        values = (codes * params["scale"] + params["offset"]).astype(self.value_dtype)
+
+        is_dictionary = params["dictionary_size"] > 0
+        if np.any(is_dictionary):
+            index = np.clip(codes - self.code_base, 0, DICTIONARY_SIZE - 1)
+            table_values = self.params["table"][block_offsets, index]
+            values = np.where(is_dictionary, table_values, values)
+
+        missing = codes == self.missing_code
+        if np.any(missing):
+            values = np.where(missing, np.nan, values).astype(self.value_dtype)
+
+        return values
+
+    def _header_slice(self, skim_data, row_major):
+        if row_major:
+            return np.s_[self.num_skims :, :, :]
+        return np.s_[:, :, self.num_skims :]
+
+    def write_header(self, skim_data, row_major):
+        """
+        Store decode parameters in the header blocks of skim_data
+        """
+        header_slice = self._header_slice(skim_data, row_major)
+        header = np.zeros(skim_data[header_slice].shape, dtype=self.dtype)
+        header.reshape(-1).view(np.uint8)[: self.params.nbytes] = self.params.view(
+            np.uint8
+        )
+        skim_data[header_slice] = header
+
+    def read_header(self, skim_data, row_major):
+        """
+        Read decode parameters from the header blocks of skim_data
+        """
+        header_slice = self._header_slice(skim_data, row_major)
+        header = np.ascontiguousarray(skim_data[header_slice], dtype=self.dtype)
+        self.params = (
+            header.reshape(-1)
+            .view(np.uint8)[: self.params.nbytes]
+            .copy()
+            .view(CODEC_DTYPE)
+        )
+
+    def log_errors(self, skim_tag, omx_keys, block_offsets, max_error=None):
+        """
+        Report the encoding and decoding error of each core, and raise an error if any
+        exceeds max_error.
+
+        Parameters
+        ----------
+        skim_tag : str
+        omx_keys : dict
+            {skim_key: omx_key}
+        block_offsets : dict
+            {skim_key: block_offset}
+        max_error : float, optional
+        """
+
+        errors = pd.DataFrame(
+            {
+                "omx_key": list(omx_keys.values()),
+                "offset": [block_offsets[k] for k in omx_keys],
+            }
+        )
+        params = self.params[errors.offset.values]
+        errors["encoding"] = np.where(
+            params["dictionary_size"] > 0, "dictionary", "fixed point"
+        )
+        errors["scale"] = params["scale"]
+        errors["max_error"] = params["max_error"]
+
+        for row in errors.itertuples():
+            logger.debug(
+                f"quantized skim {skim_tag} {row.omx_key} {row.encoding} "
+                f"scale {row.scale:.6g} max_error {row.max_error:.6g}"
+            )
+
+        num_dictionary = (errors.encoding == "dictionary").sum()
+        logger.info(
+            f"quantized skims {skim_tag} as {self.dtype.name}: "
+            f"{num_dictionary} of {len(errors)} dictionary encoded"
+        )
+        if len(errors):
+            worst = errors.loc[errors.max_error.idxmax()]
+            logger.info(
+                f"quantized skims {skim_tag} largest error {worst.max_error:.6g} ({worst.omx_key})"
+            )
+
+        if max_error is not None:
+            bad = errors[errors.max_error > max_error]
+            if len(bad):
+                raise RuntimeError(
+                    f"{len(bad)} {skim_tag} skims quantized as {self.dtype.name} exceed "
+                    f"max_error {max_error}: "
+                    f"{dict(zip(bad.omx_key, bad.max_error.round(6)))}"
+                )
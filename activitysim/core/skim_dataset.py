@@ -9,7 +9,7 @@ import sharrow as sh
 
 from . import config
 from . import flow as __flow  # noqa, keep this here for side effects?
-from . import inject
+from . import inject, skim_codec, skim_dictionary
 
 logger = logging.getLogger(__name__)
 
@@ -21,13 +21,17 @@ class SkimDataset:
     A wrapper around xarray.Dataset containing skim data, with time period management.
     """
 
-    def __init__(self, dataset):
+    def __init__(self, dataset, lookup_threshold=None, lookup_order="chooser"):
         self.dataset = dataset
         self.time_map = {
             j: i for i, j in enumerate(self.dataset.indexes["time_period"])
         }
         self.usage = set()  # track keys of skims looked up
 
+        # large lookups (network_los skim_lookup_threshold and skim_lookup_order settings)
+        self.lookup_threshold = lookup_threshold
+        self.lookup_order = lookup_order
+
     @property
     def odim(self):
         if "omaz" in self.dataset.dims:
@@ -64,7 +68,14 @@ class SkimDataset:
         -------
         DatasetWrapper
         """
-        return DatasetWrapper(self.dataset, orig_key, dest_key, time_map=self.time_map)
+        return DatasetWrapper(
+            self.dataset,
+            orig_key,
+            dest_key,
+            time_map=self.time_map,
+            lookup_threshold=self.lookup_threshold,
+            lookup_order=self.lookup_order,
+        )
 
     def wrap_3d(self, orig_key, dest_key, dim3_key):
         """
@@ -79,7 +90,13 @@ class SkimDataset:
         DatasetWrapper
         """
         return DatasetWrapper(
-            self.dataset, orig_key, dest_key, dim3_key, time_map=self.time_map
+            self.dataset,
+            orig_key,
+            dest_key,
+            dim3_key,
+            time_map=self.time_map,
+            lookup_threshold=self.lookup_threshold,
+            lookup_order=self.lookup_order,
         )
 
     def lookup(self, orig, dest, key):
@@ -155,9 +172,25 @@ class DatasetWrapper:
     time_map : Mapping, optional
         A mapping from time period index numbers to (more aggregate) time
         period names.
+    lookup_threshold : int, optional
+        Number of rows in df at or above which lookups are large (and blocked,
+        if lookup_order is 'blocked')
+    lookup_order : {'chooser', 'blocked'}
+        Order in which large lookups visit od pairs.  Blocked lookups gather
+        values grouped by block of the skims and scatter them back to df order.
     """
 
-    def __init__(self, dataset, orig_key, dest_key, time_key=None, *, time_map=None):
+    def __init__(
+        self,
+        dataset,
+        orig_key,
+        dest_key,
+        time_key=None,
+        *,
+        time_map=None,
+        lookup_threshold=None,
+        lookup_order="chooser",
+    ):
         """
         Mimics the SkimWrapper interface to allow legacy code to access data.
 
@@ -167,6 +200,9 @@ class DatasetWrapper:
         self.dest_key = dest_key
         self.time_key = time_key
         self.df = None
+        self.lookup_threshold = lookup_threshold
+        self.lookup_order = lookup_order
+        self.order = None
         if time_map is None:
             self.time_map = {
                 j: i for i, j in enumerate(self.dataset.indexes["time_period"])
@@ -248,8 +284,36 @@ class DatasetWrapper:
         else:
             self.positions = pd.DataFrame(positions).astype(int)
 
+        self.order = None
+        if self.lookup_threshold and len(df) >= self.lookup_threshold:
+            if self.lookup_order == "blocked" and POSITIONS_AS_DICT:
+                self._block_positions()
+
         return self
 
+    def _block_positions(self):
+        """
+        Reorder positions so lookups visit od pairs grouped by block of the skims.
+
+        The order is computed once per df, and lookup scatters values back to df order.
+        """
+        dims = [d for d in ("time_period", self.odim, self.ddim) if d in self.positions]
+        flat_index = np.zeros(len(self.df), dtype=np.int64)
+        for d in dims:
+            flat_index = (
+                flat_index * self.dataset.dims[d] + self.positions[d].to_numpy()
+            )
+        num_cells = int(np.prod([self.dataset.dims[d] for d in dims]))
+
+        # blocks sized for float32 skims
+        block_size = max(skim_dictionary.LOOKUP_BLOCK_BYTES // 4, 1)
+        self.order = skim_dictionary._blocked_lookup_order(
+            flat_index, block_size, -(-num_cells // block_size)
+        )
+        self.positions = {
+            k: v.to_numpy()[self.order] for k, v in self.positions.items()
+        }
+
     def lookup(self, key, reverse=False):
         """
         Generally not called by the user - use __getitem__ instead
@@ -308,6 +372,17 @@ class DatasetWrapper:
         # if 'digital_encoding' in self.dataset[key].attrs:
         #     result = array_decode(result, self.dataset[key].attrs['digital_encoding'])
 
+        if self.lookup_threshold and len(self.df) >= self.lookup_threshold:
+            skim_dictionary.lookup_stats("skim_dataset").add(
+                len(self.df), self.order is not None
+            )
+
+        if self.order is not None:
+            # scatter blocked lookup values back to df order
+            values = np.empty_like(result.values)
+            values[self.order] = result.values
+            return pd.Series(values, index=self.df.index)
+
         # Return a series, consistent with ActivitySim SkimWrapper
         out = result.to_series()
         out.index = self.df.index
@@ -490,6 +565,83 @@ def _apply_digital_encoding(dataset, digital_encodings):
     return dataset
 
 
+def _apply_quantization(dataset, quantization):
+    """
+    Quantize skims with digital encoding, choosing an encoding for each skim.
+
+    Skims with few distinct values (e.g. fares, tolls or distance bands) are
+    dictionary encoded, which is lossless, and other skims are encoded as fixed
+    point with their own scale and offset.  The largest decoding error of each
+    skim is logged, and an error is raised if any exceeds `max_error`.
+
+    Parameters
+    ----------
+    dataset : xarray.Dataset
+    quantization : Dict
+        network_los {skim_tag}_skims.quantize settings (dtype and max_error)
+
+    Returns
+    -------
+    dataset : xarray.Dataset
+        As modified
+    """
+    dtype_name = quantization.get("dtype", "int16")
+    if dtype_name not in skim_codec.QUANTIZED_DTYPES:
+        raise RuntimeError(
+            f"skim quantization dtype '{dtype_name}' not in {skim_codec.QUANTIZED_DTYPES}"
+        )
+    bitwidth = np.dtype(dtype_name).itemsize * 8
+    max_error = quantization.get("max_error")
+
+    errors = {}
+    for k in list(dataset.data_vars):
+        if (
+            not isinstance(k, str)
+            or k.startswith("_")
+            or "digital_encoding" in dataset[k].attrs
+            or not np.issubdtype(dataset[k].dtype, np.floating)
+        ):
+            continue
+        values = dataset[k].to_numpy()
+        if np.isnan(values).any():
+            logger.info(f"not quantizing skim {k} with missing values")
+            continue
+
+        distinct = skim_codec._distinct_values(values)
+        if distinct is not None:
+            dataset = dataset.digital_encoding.set(k, by_dict=8)
+        else:
+            # fixed point encoding truncates to non-negative signed integers
+            min_value = float(values.min())
+            scale = (float(values.max()) - min_value) / ((1 << (bitwidth - 1)) - 1)
+            dataset = dataset.digital_encoding.set(
+                k, bitwidth=bitwidth, scale=scale, offset=min_value
+            )
+
+        decoded = sh.digital_encoding.array_decode(dataset[k]).to_numpy()
+        errors[k] = float(np.abs(decoded - values).max())
+        logger.debug(
+            f"quantized skim {k} {'dictionary' if distinct is not None else 'fixed point'} "
+            f"max_error {errors[k]:.6g}"
+        )
+
+    if errors:
+        worst = max(errors, key=errors.get)
+        logger.info(
+            f"quantized {len(errors)} skims as {dtype_name}, "
+            f"largest error {errors[worst]:.6g} ({worst})"
+        )
+
+    if max_error is not None:
+        bad = {k: round(e, 6) for k, e in errors.items() if e > max_error}
+        if bad:
+            raise RuntimeError(
+                f"{len(bad)} skims quantized as {dtype_name} exceed max_error {max_error}: {bad}"
+            )
+
+    return dataset
+
+
 def _scan_for_unused_names(tokens):
     """
     Scan all spec files to find unused skim variable names.
@@ -770,6 +922,10 @@ def load_skim_dataset_to_shared_memory(skim_tag="taz"):
         # apply non-zarr dependent digital encoding
         d = _apply_digital_encoding(d, skim_digital_encoding)
 
+        skim_quantization = network_los_preload.skim_quantization(skim_tag)
+        if skim_quantization:
+            d = _apply_quantization(d, skim_quantization)
+
     if skim_tag in ("taz", "maz"):
         # check alignment of TAZs that it matches land_use table
         logger.info("checking skims alignment with land_use")
@@ -2,20 +2,165 @@
 # See full license in LICENSE.txt.
 # from builtins import int
 
+import glob
+import hashlib
 import logging
 import multiprocessing
 import os
+import threading
 import warnings
+import zlib
 from abc import ABC
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 import openmatrix as omx
+import pandas as pd
 
-from activitysim.core import config, inject, skim_dictionary, util
+from activitysim.core import (
+    config,
+    inject,
+    skim_codec,
+    skim_dictionary,
+    skim_store,
+    util,
+)
 
 logger = logging.getLogger(__name__)
 
 
+# default maximum number of threads used to read omx skims (network_los setting read_skim_threads)
+MAX_READ_SKIM_THREADS = 8
+
+# skim keys used by previous runs, in order of first use (network_los setting skim_usage_profile)
+USAGE_PROFILE_FILE_NAME = "skim_usage_profile.csv"
+
+
+def skim_usage_profile_path():
+    return os.path.join(config.get_cache_dir(), USAGE_PROFILE_FILE_NAME)
+
+
+def read_skim_usage_profile():
+    """
+    Read the skim usage profile written by consolidate_skim_usage_logs at the end of previous runs
+
+    Returns
+    -------
+    pandas.DataFrame with skim_tag and key columns in order of first use, or None if there is none
+    """
+    profile_path = skim_usage_profile_path()
+    if not os.path.isfile(profile_path):
+        return None
+    return pd.read_csv(profile_path, comment="#", dtype=str)
+
+
+def consolidate_skim_usage_logs():
+    """
+    Add the skim keys first used in this run (by any process) to the persisted skim usage profile
+
+    Keys are appended in order of first use, after those of previous runs, so the profile only grows
+    (a run that skipped some models, e.g. when resuming, does not drop the skims they need).
+    """
+
+    glob_file_name = config.log_file_path(
+        f"*{skim_dictionary.USAGE_LOG_FILE_NAME}", prefix=False
+    )
+    glob_files = glob.glob(glob_file_name)
+
+    if not glob_files:
+        return
+
+    logger.debug(f"consolidate_skim_usage_logs reading glob {glob_file_name}")
+    usage_df = pd.concat(pd.read_csv(f, dtype={"key": str}) for f in glob_files)
+    usage_df = usage_df.sort_values(by="time", kind="mergesort")[["skim_tag", "key"]]
+
+    profile_df = read_skim_usage_profile()
+    if profile_df is not None:
+        usage_df = pd.concat([profile_df[["skim_tag", "key"]], usage_df])
+    usage_df = usage_df.drop_duplicates()
+
+    util.delete_files(glob_files, "consolidate_skim_usage_logs")
+
+    profile_path = skim_usage_profile_path()
+    logger.info(
+        f"consolidate_skim_usage_logs writing {len(usage_df)} skim keys to {profile_path}"
+    )
+    usage_df.to_csv(profile_path, mode="w", index=False)
+
+
+def _decode_omx_chunk(raw, filters, dtype, chunkshape):
+    """
+    Decode a raw hdf5 chunk written with (optional) shuffle and zlib filters
+    """
+    if filters.complevel:
+        # zlib releases the GIL, so chunks are decompressed in parallel
+        raw = zlib.decompress(raw)
+    if filters.shuffle and dtype.itemsize > 1:
+        # hdf5 shuffle stores the first byte of every element, then the second...
+        raw = (
+            np.frombuffer(raw, dtype=np.uint8)
+            .reshape(dtype.itemsize, -1)
+            .transpose()
+            .copy()
+        )
+    return np.frombuffer(raw, dtype=dtype).reshape(chunkshape)
+
+
+def read_omx_matrix(omx_data, a, hdf5_lock):
+    """
+    Read omx matrix omx_data into 2D array a, converting to a.dtype on the fly
+
+    For matrices stored with (the openmatrix default) zlib and shuffle filters,
+    raw chunks are read from the file while holding hdf5_lock, but decompressed
+    and copied into `a` outside of it, so several threads can read matrices at
+    once while only one of them is in the (not thread safe) hdf5 library.
+    Working memory is a single chunk, rather than a full copy of the matrix
+    in its stored dtype.
+
+    Other matrices are read whole, holding hdf5_lock.
+
+    Parameters
+    ----------
+    omx_data : tables.CArray
+    a : numpy.ndarray
+    hdf5_lock : threading.Lock
+    """
+    filters = omx_data.filters
+    chunkshape = omx_data.chunkshape
+
+    if (
+        chunkshape is None
+        or not hasattr(omx_data, "read_chunk")
+        or filters.fletcher32
+        or filters.bitshuffle
+        or (filters.complevel and filters.complib != "zlib")
+        or len(omx_data.shape) != 2
+    ):
+        with hdf5_lock:
+            # this will trigger omx readslice to read and copy data to skim_data's buffer
+            a[:] = omx_data[:]
+        return
+
+    # omx_data.dtype is native, but raw chunks are in the byte order the matrix was stored in
+    dtype = omx_data.dtype.newbyteorder(
+        {"little": "<", "big": ">"}.get(omx_data.byteorder, "=")
+    )
+    num_rows, num_cols = omx_data.shape
+    for r0 in range(0, num_rows, chunkshape[0]):
+        r1 = min(r0 + chunkshape[0], num_rows)
+        for c0 in range(0, num_cols, chunkshape[1]):
+            c1 = min(c0 + chunkshape[1], num_cols)
+            with hdf5_lock:
+                info = omx_data.chunk_info((r0, c0))
+                if info.offset is None or info.filter_mask:
+                    # missing chunk (fill value) or chunk written without some filters
+                    a[r0:r1, c0:c1] = omx_data[r0:r1, c0:c1]
+                    continue
+                raw = omx_data.read_chunk((r0, c0))
+            chunk = _decode_omx_chunk(raw, filters, dtype, chunkshape)
+            a[r0:r1, c0:c1] = chunk[: r1 - r0, : c1 - c0]
+
+
 class SkimData(object):
     """
     A facade for 3D skim data exposing numpy indexing and shape
@@ -56,7 +201,7 @@ class SkimInfo(object):
         """
 
         skim_tag:           str             (e.g. 'TAZ')
-        dtype_name:         str             (e.g. 'float32')
+        dtype_name:         str             (e.g. 'float32', or 'int16' if quantized)
         omx_manifest:       dict            dict mapping { omx_key: omx_file_name }
         omx_shape:          2D tuple        shape of omx matrix: (<number_of_zones>, <number_of_zones>)
         num_skims:          int             total number of individual skim matrices in omx files
@@ -68,6 +213,10 @@ class SkimInfo(object):
                                             ('DRV_COM_WLK_BOARDS', 'AM'): DRV_COM_WLK_BOARDS__AM, ...}
         base_keys:          list of str     e.g. 'BIKEDIST' or 'SOVTOLL_VTOLL' (base key of 3d skim)
         block_offsets:      dict            dict mapping skim key tuple to offset
+        quantization:       dict or None    network_los {skim_tag}_skims.quantize setting
+        lookup_threshold:   int             od pairs in a lookup to gather with a numba kernel
+        lookup_order:       str             order large lookups visit od pairs ('chooser' or 'blocked')
+        codec:              SkimCodec       decode parameters of quantized skims (or None)
 
         Parameters
         ----------
@@ -87,6 +236,18 @@ class SkimInfo(object):
         self.omx_keys = None
         self.base_keys = None
         self.block_offsets = None
+        self.quantization = None
+        self.codec = None
+
+        # large skim lookups
+        lookup_settings = network_los.skim_lookup_settings()
+        self.lookup_threshold = lookup_settings["lookup_threshold"]
+        self.lookup_order = lookup_settings["lookup_order"]
+
+        # skim usage profile
+        self.track_usage = network_los.setting("skim_usage_profile", False)
+        self.pruned_keys = set()
+        self.layout_tag = None
 
         if skim_tag:
             self.load_skim_info(skim_tag)
@@ -103,6 +264,10 @@ class SkimInfo(object):
 
         omx_file_names = self.network_los.omx_file_names(skim_tag)
 
+        self.quantization = self.network_los.skim_quantization(skim_tag)
+        if self.quantization:
+            self.dtype_name = self.quantization.get("dtype", "int16")
+
         self.omx_file_paths = config.expand_input_file_list(omx_file_names)
 
         # ignore any 3D skims not in skim_time_periods
@@ -162,6 +327,9 @@ class SkimInfo(object):
 
             self.omx_keys[skim_key] = skim_name
 
+        if self.track_usage:
+            self.apply_usage_profile()
+
         self.num_skims = len(self.omx_keys)
 
         # - key1_subkeys dict maps key1 to dict of subkeys with that key1
@@ -199,18 +367,84 @@ class SkimInfo(object):
             key2_relative_offset = key1_subkeys.get(key1).get(key2)
             self.block_offsets[skim_key] = key1_offset + key2_relative_offset
 
+        # quantized skim decode parameters are stored in header blocks after the skims
+        num_blocks = self.num_skims
+        if self.quantization:
+            self.codec = skim_codec.SkimCodec(
+                self.dtype_name, self.num_skims, self.network_los.skim_dtype_name
+            )
+            num_blocks += self.codec.num_header_blocks(self.omx_shape)
+
         if skim_dictionary.ROW_MAJOR_LAYOUT:
             self.skim_data_shape = (
-                self.num_skims,
+                num_blocks,
                 self.omx_shape[0],
                 self.omx_shape[1],
             )
         else:
-            self.skim_data_shape = self.omx_shape + (self.num_skims,)
+            self.skim_data_shape = self.omx_shape + (num_blocks,)
 
         # list of base keys (keys
         self.base_keys = tuple(k for k in key1_block_offsets.keys())
 
+    def apply_usage_profile(self):
+        """
+        Drop skims that were not used by previous runs (according to the skim usage profile)
+        from omx_keys, so they are never read or allocated, and order the rest by first use
+        so that skims used together (e.g. by the same model) are adjacent in skim_data.
+
+        Stacked (3D) skims looked up by base key keep all their dim3 keys together.
+        """
+
+        profile_df = read_skim_usage_profile()
+        if profile_df is None:
+            logger.info(
+                f"skim usage profile {self.skim_tag}: no profile yet, loading all skims"
+            )
+            return
+
+        used_keys = profile_df[profile_df.skim_tag == self.skim_tag].key
+        if len(used_keys) == 0:
+            logger.info(
+                f"skim usage profile {self.skim_tag}: no recorded usage, loading all skims"
+            )
+            return
+
+        first_use = {key: rank for rank, key in enumerate(used_keys)}
+
+        def skim_key_rank(skim_key):
+            key1 = skim_key[0] if isinstance(skim_key, tuple) else skim_key
+            return min(
+                first_use.get(skim_dictionary.skim_usage_key(skim_key), np.inf),
+                first_use.get(key1, np.inf),
+            )
+
+        ranks = {skim_key: skim_key_rank(skim_key) for skim_key in self.omx_keys}
+
+        # stable sort keeps omx order for dim3 keys of the same base key
+        keep = sorted((k for k in self.omx_keys if ranks[k] < np.inf), key=ranks.get)
+
+        self.pruned_keys = set(
+            skim_dictionary.skim_usage_key(k) for k in self.omx_keys if k not in keep
+        )
+
+        if keep != list(self.omx_keys):
+            # identify the layout in names of files that cache skim_data
+            self.layout_tag = hashlib.sha1(
+                str([self.omx_keys[k] for k in keep]).encode("utf8")
+            ).hexdigest()[:8]
+
+        num_pruned = len(self.omx_keys) - len(keep)
+        saved = (
+            num_pruned * util.iprod(self.omx_shape) * np.dtype(self.dtype_name).itemsize
+        )
+        logger.info(
+            f"skim usage profile {self.skim_tag}: loading {len(keep)} of {len(self.omx_keys)} skims, "
+            f"skipping {num_pruned} unused skims saves {util.INT(saved)} ({util.GB(saved)})"
+        )
+
+        self.omx_keys = {k: self.omx_keys[k] for k in keep}
+
     def print(self):
         print(f"SkimInfo for {self.skim_tag}")
         print(f"omx_shape {self.omx_shape}")
@@ -262,52 +496,102 @@ class AbstractSkimFactory(ABC):
     def _skim_data_from_buffer(self, skim_info, skim_buffer):
         assert False, "Not supported"
 
-    def _memmap_skim_data_path(self, skim_tag):
-        return os.path.join(config.get_cache_dir(), f"cached_{skim_tag}.mmap")
+    def _memmap_skim_data_path(self, skim_info):
+        tags = [skim_info.skim_tag]
+        if skim_info.layout_tag:
+            # skims were pruned or reordered by the skim usage profile
+            tags.append(skim_info.layout_tag)
+        if skim_info.codec is not None:
+            tags.append(skim_info.dtype_name)
+        return os.path.join(config.get_cache_dir(), f"cached_{'.'.join(tags)}.mmap")
 
     def load_skim_info(self, skim_tag):
         return SkimInfo(skim_tag, self.network_los)
 
+    def _read_skim_threads(self):
+        read_skim_threads = self.network_los.setting("read_skim_threads", None)
+        if read_skim_threads is None:
+            read_skim_threads = min(MAX_READ_SKIM_THREADS, os.cpu_count() or 1)
+        return max(int(read_skim_threads), 1)
+
     def _read_skims_from_omx(self, skim_info, skim_data):
         """
         read skims from omx file into skim_data
+
+        Matrices are read concurrently by a pool of read_skim_threads threads
+        (see read_omx_matrix), and converted to the skim_data dtype chunk by chunk.
+        Quantized skims are read whole and then encoded (see skim_codec.SkimCodec).
         """
 
         skim_tag = skim_info.skim_tag
         omx_keys = skim_info.omx_keys
         omx_manifest = skim_info.omx_manifest  # dict mapping { omx_key: skim_name }
+        codec = skim_info.codec
+
+        num_threads = self._read_skim_threads()
 
         for omx_file_path in skim_info.omx_file_paths:
 
-            num_skims_loaded = 0
+            logger.info(
+                f"_read_skims_from_omx {omx_file_path} with {num_threads} threads"
+            )
 
-            logger.info(f"_read_skims_from_omx {omx_file_path}")
+            # the skim_data slice each omx matrix in this file should be read into
+            skim_slices = {}
+            skim_offsets = {}
+            for skim_key, omx_key in omx_keys.items():
 
-            # read skims into skim_data
-            with omx.open_file(omx_file_path, mode="r") as omx_file:
-                for skim_key, omx_key in omx_keys.items():
+                if omx_manifest[omx_key] == omx_file_path:
 
-                    if omx_manifest[omx_key] == omx_file_path:
+                    offset = skim_info.block_offsets[skim_key]
+                    logger.debug(
+                        f"_read_skims_from_omx file {omx_file_path} omx_key {omx_key} "
+                        f"skim_key {skim_key} to offset {offset}"
+                    )
 
-                        offset = skim_info.block_offsets[skim_key]
-                        logger.debug(
-                            f"_read_skims_from_omx file {omx_file_path} omx_key {omx_key} "
-                            f"skim_key {skim_key} to offset {offset}"
-                        )
+                    skim_offsets[omx_key] = offset
+                    if skim_dictionary.ROW_MAJOR_LAYOUT:
+                        skim_slices[omx_key] = skim_data[offset, :, :]
+                    else:
+                        skim_slices[omx_key] = skim_data[:, :, offset]
 
-                        if skim_dictionary.ROW_MAJOR_LAYOUT:
-                            a = skim_data[offset, :, :]
-                        else:
-                            a = skim_data[:, :, offset]
+            # read skims into skim_data
+            with omx.open_file(omx_file_path, mode="r") as omx_file:
 
-                        # this will trigger omx readslice to read and copy data to skim_data's buffer
+                # the hdf5 library is not thread safe, so all calls into it are serialized
+                hdf5_lock = threading.Lock()
+
+                def read_skim(omx_key):
+                    with hdf5_lock:
                         omx_data = omx_file[omx_key]
-                        a[:] = omx_data[:]
+                    if codec is None:
+                        read_omx_matrix(omx_data, skim_slices[omx_key], hdf5_lock)
+                    else:
+                        values = np.empty(skim_info.omx_shape, dtype=codec.value_dtype)
+                        read_omx_matrix(omx_data, values, hdf5_lock)
+                        codec.encode(
+                            skim_offsets[omx_key], values, skim_slices[omx_key]
+                        )
 
-                        num_skims_loaded += 1
+                if num_threads > 1 and len(skim_slices) > 1:
+                    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+                        # list() to re-raise any exceptions from the threads
+                        list(executor.map(read_skim, skim_slices.keys()))
+                else:
+                    for omx_key in skim_slices.keys():
+                        read_skim(omx_key)
 
             logger.info(
-                f"_read_skims_from_omx loaded {num_skims_loaded} skims from {omx_file_path}"
+                f"_read_skims_from_omx loaded {len(skim_slices)} skims from {omx_file_path}"
+            )
+
+        if codec is not None:
+            codec.write_header(skim_data, skim_dictionary.ROW_MAJOR_LAYOUT)
+            codec.log_errors(
+                skim_tag,
+                omx_keys,
+                skim_info.block_offsets,
+                skim_info.quantization.get("max_error"),
             )
 
     def _open_existing_readonly_memmap_skim_cache(self, skim_info):
@@ -318,7 +602,7 @@ class AbstractSkimFactory(ABC):
 
         dtype = np.dtype(skim_info.dtype_name)
 
-        skim_cache_path = self._memmap_skim_data_path(skim_info.skim_tag)
+        skim_cache_path = self._memmap_skim_data_path(skim_info)
 
         if not os.path.isfile(skim_cache_path):
             logger.warning(f"read_skim_cache file not found: {skim_cache_path}")
@@ -350,7 +634,7 @@ class AbstractSkimFactory(ABC):
 
         dtype = np.dtype(skim_info.dtype_name)
 
-        skim_cache_path = self._memmap_skim_data_path(skim_info.skim_tag)
+        skim_cache_path = self._memmap_skim_data_path(skim_info)
 
         logger.info(
             f"writing skim cache {skim_info.skim_tag} {skim_info.skim_data_shape} to {skim_cache_path}"
@@ -414,6 +698,10 @@ class NumpyArraySkimFactory(AbstractSkimFactory):
                 typecode = "d"
             elif dtype_name == "float32":
                 typecode = "f"
+            elif dtype_name == "int16":
+                typecode = "h"
+            elif dtype_name == "uint8":
+                typecode = "B"
             else:
                 raise RuntimeError(
                     "allocate_skim_buffer unrecognized dtype %s" % dtype_name
@@ -596,7 +884,7 @@ class MemMapSkimFactory(AbstractSkimFactory):
         # don't expect legacy shared memory buffers
         assert not inject.get_injectable("data_buffers", {}).get(skim_tag)
 
-        skim_cache_path = self._memmap_skim_data_path(skim_tag)
+        skim_cache_path = self._memmap_skim_data_path(skim_info)
         if not os.path.isfile(skim_cache_path):
             self.copy_omx_to_mmap_file(skim_info)
 
@@ -613,3 +901,43 @@ class MemMapSkimFactory(AbstractSkimFactory):
         )
 
         return skim_data
+
+
+class SkimStoreFactory(AbstractSkimFactory):
+    """
+    Skim factory backed by a persistent, content-addressed skim store (see skim_store.SkimStore)
+
+    The first run to need a given set of skims reads them from omx into a memmap file in the
+    skim store directory (network_los setting skim_store_dir, by default in /dev/shm), and every
+    later or concurrent run (and every subprocess of a multiprocess run) with the same skims
+    attaches that file read-only instead of reading the omx files again.
+    """
+
+    def __init__(self, network_los):
+        super().__init__(network_los)
+        self.store = skim_store.SkimStore(network_los.setting("skim_store_dir", None))
+
+    def get_skim_data(self, skim_tag, skim_info):
+        """
+        Attach (building if need be) the skim store for skim_tag and return it as a SkimData object
+
+        Parameters
+        ----------
+        skim_tag: str
+        skim_info: string
+
+        Returns
+        -------
+        SkimData
+        """
+
+        # don't expect legacy shared memory buffers
+        assert not inject.get_injectable("data_buffers", {}).get(skim_tag)
+
+        skim_data = SkimData(self.store.attach(skim_info, self._read_skims_from_omx))
+
+        logger.info(
+            f"get_skim_data {skim_tag} {type(skim_data).__name__} shape {skim_data.shape}"
+        )
+
+        return skim_data
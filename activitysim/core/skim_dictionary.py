@@ -2,11 +2,15 @@
 # See full license in LICENSE.txt.
 
 import logging
+import time
 from builtins import object, range
 
+import numba
 import numpy as np
 import pandas as pd
 
+from activitysim.core import config
+
 logger = logging.getLogger(__name__)
 
 NOT_IN_SKIM_ZONE_ID = -1
@@ -14,6 +18,177 @@ NOT_IN_SKIM_NAN = np.nan
 
 ROW_MAJOR_LAYOUT = True
 
+# per-process log of first use of each skim key (see skim_dict_factory.consolidate_skim_usage_logs)
+USAGE_LOG_FILE_NAME = "skim_usage_log.csv"
+
+# lookups of at least this many od pairs gather skim values with _gather_skim_values
+# (network_los setting skim_lookup_threshold)
+DEFAULT_LOOKUP_THRESHOLD = 10_000
+
+# order in which large lookups visit od pairs (network_los setting skim_lookup_order)
+#   chooser: in chooser order
+#   blocked: grouped by LOOKUP_BLOCK_BYTES block of skim_data, then scattered back to chooser order
+LOOKUP_ORDERS = ("chooser", "blocked")
+LOOKUP_BLOCK_BYTES = 1 << 18
+
+# for lookup locality statistics
+CACHE_LINE_BYTES = 64
+PAGE_BYTES = 4096
+
+
+def skim_usage_key(skim_key):
+    """
+    string representation of a skim key in the skim usage profile (same as the omx matrix name)
+
+    e.g. 'DIST' or ('SOV_TIME', 'AM') -> 'SOV_TIME__AM'
+    """
+    if isinstance(skim_key, tuple):
+        return "__".join(skim_key)
+    return skim_key
+
+
+@numba.njit(nogil=True)
+def _blocked_lookup_order(flat_index, block_size, num_blocks):
+    """
+    Order in which to visit skim cells so that they are gathered block by block (counting sort)
+
+    Parameters
+    ----------
+    flat_index : numpy.ndarray of int
+        index of each od pair's cell in flattened skim_data (negative if not in skim)
+    block_size : int
+        number of skim cells in a block
+    num_blocks : int
+
+    Returns
+    -------
+    order : numpy.ndarray of int
+    """
+    block_start = np.zeros(num_blocks + 1, dtype=np.int64)
+    for i in range(flat_index.shape[0]):
+        block_start[max(flat_index[i], 0) // block_size + 1] += 1
+    for b in range(num_blocks):
+        block_start[b + 1] += block_start[b]
+    order = np.empty(flat_index.shape[0], dtype=np.int64)
+    for i in range(flat_index.shape[0]):
+        b = max(flat_index[i], 0) // block_size
+        order[block_start[b]] = i
+        block_start[b] += 1
+    return order
+
+
+@numba.njit(nogil=True)
+def _flat_skim_index(num_rows, num_cols, block_offsets, orig, dest):
+    """
+    Index of each od pair's cell in flattened (row major) skim_data, or -1 if not in skim
+    """
+    flat_index = np.empty(orig.shape[0], dtype=np.int64)
+    for i in range(orig.shape[0]):
+        b = block_offsets[i] if block_offsets.shape[0] > 1 else block_offsets[0]
+        if 0 <= orig[i] < num_rows and 0 <= dest[i] < num_cols:
+            flat_index[i] = (b * num_rows + orig[i]) * num_cols + dest[i]
+        else:
+            flat_index[i] = -1
+    return flat_index
+
+
+@numba.njit(nogil=True)
+def _gather_skim_values(skim_data, flat_index, order, line_shift, page_shift):
+    """
+    Gather flat_index cells of skim_data, visiting them in order, and count how many
+    are in the same cache line (or page) as the cell visited before them.
+
+    Parameters
+    ----------
+    skim_data : numpy.ndarray
+        1D view of skim_data
+    flat_index : numpy.ndarray of int
+        cells to gather (negative if not in skim)
+    order : numpy.ndarray of int
+        order to visit flat_index in (empty to visit in chooser order)
+    line_shift, page_shift : int
+        log2 of the number of skim cells in a cache line and a page
+
+    Returns
+    -------
+    values : numpy.ndarray
+        skim values in chooser order (0 if not in skim)
+    line_hits, page_hits : int
+    """
+    n = flat_index.shape[0]
+    values = np.zeros(n, dtype=skim_data.dtype)
+    line_hits = 0
+    page_hits = 0
+    previous = -1
+    for j in range(n):
+        i = order[j] if order.shape[0] else j
+        cell = flat_index[i]
+        if cell < 0:
+            continue
+        values[i] = skim_data[cell]
+        if previous >= 0:
+            if (cell >> line_shift) == (previous >> line_shift):
+                line_hits += 1
+            if (cell >> page_shift) == (previous >> page_shift):
+                page_hits += 1
+        previous = cell
+    return values, line_hits, page_hits
+
+
+class LookupStats(object):
+    """
+    Counts of large skim lookups and of the locality of the cells they gathered
+
+    Line (page) hits are gathers from the same cache line (page) as the one before them.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.lookups = 0
+        self.blocked_lookups = 0
+        self.values = 0
+        self.line_hits = 0
+        self.page_hits = 0
+
+    def add(self, num_values, blocked, line_hits=None, page_hits=None):
+        self.lookups += 1
+        self.blocked_lookups += int(blocked)
+        self.values += num_values
+        if line_hits is not None:
+            self.line_hits += line_hits
+            self.page_hits += page_hits
+
+    def summary(self):
+        summary = (
+            f"{self.name}: {self.lookups} large lookups ({self.blocked_lookups} blocked) "
+            f"of {self.values} od pairs"
+        )
+        if self.line_hits or self.page_hits:
+            summary += (
+                f", cache line hits {self.line_hits / max(self.values, 1):.1%}"
+                f" page hits {self.page_hits / max(self.values, 1):.1%}"
+            )
+        return summary
+
+
+# LookupStats by name, for this process
+LOOKUP_STATS = {}
+
+
+def lookup_stats(name):
+    if name not in LOOKUP_STATS:
+        LOOKUP_STATS[name] = LookupStats(name)
+    return LOOKUP_STATS[name]
+
+
+def log_lookup_stats():
+    """
+    log statistics of large skim lookups (if there were any) in this process
+    """
+    for stats in LOOKUP_STATS.values():
+        if stats.lookups:
+            logger.info(f"skim lookup stats {stats.summary()}")
+
 
 class OffsetMapper(object):
     """
@@ -162,6 +337,16 @@ class SkimDict(object):
         self.skim_info = skim_info
         self.usage = set()  # track keys of skims looked up
 
+        # log first use of each key for the skim usage profile (network_los skim_usage_profile setting)
+        self.log_usage = getattr(skim_info, "track_usage", False)
+
+        # large lookups (network_los skim_lookup_threshold and skim_lookup_order settings)
+        self.lookup_threshold = getattr(
+            skim_info, "lookup_threshold", DEFAULT_LOOKUP_THRESHOLD
+        )
+        self.lookup_order = getattr(skim_info, "lookup_order", "chooser")
+        self.lookup_stats = lookup_stats(skim_tag)
+
         self.offset_mapper = (
             self._offset_mapper()
         )  # (in function so subclass can override)
@@ -172,6 +357,12 @@ class SkimDict(object):
             skim_info.dtype_name
         )  # so we can coerce if we have missing values
 
+        # quantized skims are decoded on lookup, with decode parameters stored in skim_data
+        self.codec = getattr(skim_info, "codec", None)
+        if self.codec is not None:
+            self.codec.read_header(skim_data, ROW_MAJOR_LAYOUT)
+            self.dtype = self.codec.value_dtype
+
         # - skim_dim3 dict maps key1 to dict of key2 absolute offsets into block
         # DRV_COM_WLK_BOARDS: {'MD': 4, 'AM': 3, 'PM': 5}, ...
         self.skim_dim3 = {}
@@ -228,6 +419,34 @@ class SkimDict(object):
         """
         return self.usage
 
+    def _use(self, key):
+        """
+        track usage of skim key
+        """
+        if key in self.usage:
+            return
+        self.usage.add(key)
+
+        if self.log_usage:
+            with config.open_log_file(
+                USAGE_LOG_FILE_NAME, "a", header="time,skim_tag,key", prefix=True
+            ) as log_file:
+                print(
+                    f"{time.time()},{self.skim_info.skim_tag},{skim_usage_key(key)}",
+                    file=log_file,
+                )
+
+    def _check_not_pruned(self, key):
+        """
+        raise a helpful error if key was not loaded because it is not in the skim usage profile
+        """
+        if skim_usage_key(key) in getattr(self.skim_info, "pruned_keys", ()):
+            raise RuntimeError(
+                f"skim '{skim_usage_key(key)}' was not loaded because it was not used by the runs "
+                f"recorded in the skim usage profile. Delete the skim usage profile from the cache "
+                f"directory (or set network_los skim_usage_profile: False) to load all skims."
+            )
+
     def _lookup(self, orig, dest, block_offsets):
         """
         Return list of skim values of skims(s) at orig/dest for the skim(s) at block_offset in skim_data
@@ -255,11 +474,16 @@ class SkimDict(object):
 
         mapped_orig = self.offset_mapper.map(orig)
         mapped_dest = self.offset_mapper.map(dest)
-        if ROW_MAJOR_LAYOUT:
+        if self._use_gather_kernel(len(mapped_orig)):
+            result = self._gather(block_offsets, mapped_orig, mapped_dest)
+        elif ROW_MAJOR_LAYOUT:
             result = self.skim_data[block_offsets, mapped_orig, mapped_dest]
         else:
             result = self.skim_data[mapped_orig, mapped_dest, block_offsets]
 
+        if self.codec is not None:
+            result = self.codec.decode(result, block_offsets)
+
         # FIXME - should return nan if not in skim (negative indices wrap around)
         # FIXME - this check only works if # of origin zones match # of dest zones!
         in_skim = (
@@ -287,6 +511,54 @@ class SkimDict(object):
 
         return result
 
+    def _use_gather_kernel(self, num_od_pairs):
+        """
+        Gather with _gather_skim_values if the lookup is large and skim_data is an in-memory array
+        """
+        if not (
+            ROW_MAJOR_LAYOUT
+            and self.lookup_threshold
+            and num_od_pairs >= self.lookup_threshold
+        ):
+            return False
+        skim_data = getattr(self.skim_data, "_skim_data", self.skim_data)
+        return isinstance(skim_data, np.ndarray) and skim_data.flags.c_contiguous
+
+    def _gather(self, block_offsets, mapped_orig, mapped_dest):
+        """
+        Gather skim values for a large lookup (in memory order if skim_lookup_order is 'blocked')
+        """
+        skim_data = np.asarray(getattr(self.skim_data, "_skim_data", self.skim_data))
+        num_blocks, num_rows, num_cols = skim_data.shape
+
+        flat_index = _flat_skim_index(
+            num_rows,
+            num_cols,
+            np.atleast_1d(np.asanyarray(block_offsets, dtype=np.int64)),
+            np.asanyarray(mapped_orig, dtype=np.int64),
+            np.asanyarray(mapped_dest, dtype=np.int64),
+        )
+
+        blocked = self.lookup_order == "blocked"
+        if blocked:
+            block_size = max(LOOKUP_BLOCK_BYTES // skim_data.itemsize, 1)
+            order = _blocked_lookup_order(
+                flat_index, block_size, -(-skim_data.size // block_size)
+            )
+        else:
+            order = np.empty(0, dtype=np.int64)
+
+        values, line_hits, page_hits = _gather_skim_values(
+            skim_data.reshape(-1),
+            flat_index,
+            order,
+            max(CACHE_LINE_BYTES // skim_data.itemsize, 1).bit_length() - 1,
+            max(PAGE_BYTES // skim_data.itemsize, 1).bit_length() - 1,
+        )
+        self.lookup_stats.add(len(flat_index), blocked, line_hits, page_hits)
+
+        return values
+
     def lookup(self, orig, dest, key):
         """
         Return list of skim values of skims(s) at orig/dest in skim with the specified key (e.g. 'DIST')
@@ -302,9 +574,11 @@ class SkimDict(object):
         Numpy.ndarray: list of skim values for od pairs
         """
 
-        self.usage.add(key)
+        self._use(key)
 
         block_offset = self.skim_info.block_offsets.get(key)
+        if block_offset is None:
+            self._check_not_pruned(key)
         assert block_offset is not None, f"SkimDict lookup key '{key}' not in skims"
 
         try:
@@ -342,8 +616,10 @@ class SkimDict(object):
         Numpy.ndarray: list of skim values
         """
 
-        self.usage.add(key)  # should we keep usage stats by (key, dim3)?
+        self._use(key)  # should we keep usage stats by (key, dim3)?
 
+        if key not in self.skim_dim3:
+            self._check_not_pruned(key)
         assert key in self.skim_dim3, f"3d skim key {key} not in skims."
 
         # map dim3 to block_offsets
@@ -606,7 +882,7 @@ class MazSkimDict(SkimDict):
     MazSkimDict provides a facade that allows skim-like lookup by maz orig,dest zone_id
     when there are often too many maz zones to create maz skims.
 
-    Dependencies: network_los.load_data must have already loaded: taz skim_dict, maz_to_maz_df, and maz_taz_df
+    Dependencies: network_los.load_data must have already loaded: taz skim_dict, maz_to_maz, and maz_taz_df
 
     It performs lookups from a sparse list of maz-maz od pairs on selected attributes (e.g. WALKDIST)
     where accuracy for nearby od pairs is critical. And is backed by a fallback taz skim dict
@@ -615,7 +891,7 @@ class MazSkimDict(SkimDict):
 
     def __init__(self, skim_tag, network_los, taz_skim_dict):
         """
-        we need network_los because we have dependencies on network_los.load_data (e.g. maz_to_maz_df, maz_taz_df,
+        we need network_los because we have dependencies on network_los.load_data (e.g. maz_to_maz, maz_taz_df,
         and the fallback taz skim_dict)
 
         We require taz_skim_dict as an explicit parameter to emphasize that we are piggybacking on taz_skim_dict's
@@ -643,7 +919,7 @@ class MazSkimDict(SkimDict):
 
             skim_info = SkimInfo(None, network_los)
             skim_info.skim_tag = taz_skim_dict.skim_info.skim_tag
-            skim_info.dtype_name = network_los.skim_dtype_name
+            skim_info.dtype_name = taz_skim_dict.skim_info.dtype_name
             skim_info.omx_manifest = taz_skim_dict.skim_info.omx_manifest
             skim_info.omx_shape = taz_skim_dict.skim_info.omx_shape
             skim_info.num_skims = taz_skim_dict.skim_info.num_skims
@@ -652,6 +928,8 @@ class MazSkimDict(SkimDict):
             skim_info.omx_keys = taz_skim_dict.skim_info.omx_keys
             skim_info.base_keys = taz_skim_dict.skim_info.base_keys
             skim_info.block_offsets = taz_skim_dict.skim_info.block_offsets
+            skim_info.pruned_keys = taz_skim_dict.skim_info.pruned_keys
+            skim_info.codec = taz_skim_dict.skim_info.codec
 
             skim_info.offset_map = recode_based_on_table(
                 taz_skim_dict.skim_info.offset_map, "land_use_taz"
@@ -664,11 +942,9 @@ class MazSkimDict(SkimDict):
             self.offset_mapper is not None
         )  # should have been set with _init_offset_mapper
 
-        self.dtype = np.dtype(self.skim_info.dtype_name)
+        self.dtype = taz_skim_dict.dtype
         self.base_keys = taz_skim_dict.skim_info.base_keys
-        self.sparse_keys = list(
-            set(network_los.maz_to_maz_df.columns) - {"OMAZ", "DMAZ"}
-        )
+        self.sparse_keys = list(network_los.maz_to_maz.columns)
         self.sparse_key_usage = set()
 
     def _offset_mapper(self):
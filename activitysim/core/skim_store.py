@@ -0,0 +1,362 @@
+# ActivitySim
+# See full license in LICENSE.txt.
+import hashlib
+import json
+import logging
+import multiprocessing.util
+import os
+import shutil
+import socket
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from activitysim.core import skim_dictionary
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# bump this if the layout of stored skim data changes, so old stores are never attached
+SKIM_STORE_VERSION = 1
+
+SHM_DIR = "/dev/shm"
+SKIM_STORE_DIR_NAME = "activitysim_skim_store"
+
+DATA_SUFFIX = ".mmap"
+META_SUFFIX = ".json"
+REFS_SUFFIX = ".refs"
+LOCK_SUFFIX = ".lock"
+
+
+def default_skim_store_dir():
+    """
+    Default location of skim stores: tmpfs shared memory if available, else a directory in tmp
+    """
+    if os.path.isdir(SHM_DIR):
+        return os.path.join(SHM_DIR, SKIM_STORE_DIR_NAME)
+    import tempfile
+
+    return os.path.join(tempfile.gettempdir(), SKIM_STORE_DIR_NAME)
+
+
+def skim_store_digest(skim_info):
+    """
+    Content address of the skim data that would be loaded for skim_info.
+
+    The address covers the store version, dtype and layout of the skim data,
+    the omx keys and their offsets, and the path, size and modification time
+    of the source omx files, so any change to the skims (or to which of them
+    are loaded) results in a new store rather than a stale one.
+
+    Parameters
+    ----------
+    skim_info : SkimInfo
+
+    Returns
+    -------
+    str
+    """
+    identity = {
+        "version": SKIM_STORE_VERSION,
+        "skim_tag": skim_info.skim_tag,
+        "dtype": skim_info.dtype_name,
+        "shape": list(skim_info.skim_data_shape),
+        "row_major": skim_dictionary.ROW_MAJOR_LAYOUT,
+        "omx_keys": sorted(
+            [str(skim_key), omx_key, int(skim_info.block_offsets[skim_key])]
+            for skim_key, omx_key in skim_info.omx_keys.items()
+        ),
+        "omx_files": [],
+    }
+    for path in skim_info.omx_file_paths:
+        stat = os.stat(path)
+        identity["omx_files"].append(
+            [os.path.abspath(path), stat.st_size, stat.st_mtime_ns]
+        )
+
+    return hashlib.sha1(json.dumps(identity).encode("utf8")).hexdigest()
+
+
+def _pid_is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # process exists but belongs to someone else
+        return True
+    except OSError:
+        return True
+    return True
+
+
+class SkimStore(object):
+    """
+    Persistent, versioned, content-addressed skim data stores.
+
+    Each store is a raw memmap file holding the 3D skim data for one skim_tag,
+    named by the skim_tag and the digest of its sources (see skim_store_digest).
+    Stores outlive the run that built them, so later (or concurrent) runs with
+    the same skims attach the existing memmap read-only instead of reading
+    the omx files again. When the store directory is in tmpfs (e.g. /dev/shm)
+    all attached processes share the same physical pages.
+
+    Attached processes are reference counted with one marker file per process
+    in the store's refs directory, removed when the process exits. Stores are
+    only removed by an explicit call to evict (superseded versions of a skim_tag
+    are evicted when a new version is built), and only if they have no live
+    references.
+
+    ::
+
+        <store_dir>/<skim_tag>-<digest>.mmap    skim data
+        <store_dir>/<skim_tag>-<digest>.json    metadata (shape, dtype, sources)
+        <store_dir>/<skim_tag>-<digest>.refs/   one file per attached process
+        <store_dir>/<skim_tag>.lock             held while building a store
+    """
+
+    def __init__(self, store_dir=None):
+        self.store_dir = store_dir or default_skim_store_dir()
+        os.makedirs(self.store_dir, exist_ok=True)
+        self._attached = set()
+
+    def _base_path(self, skim_tag, digest):
+        return os.path.join(self.store_dir, f"{skim_tag}-{digest}")
+
+    @staticmethod
+    def _ref_name():
+        return f"{socket.gethostname()}.{os.getpid()}"
+
+    @contextmanager
+    def _lock(self, skim_tag):
+        """
+        Hold an exclusive lock while building a store for skim_tag, so that
+        concurrent runs wait for the first one to finish rather than all
+        reading the omx files at the same time.
+        """
+        if fcntl is None:
+            # no advisory locks - concurrent builds are still safe (see build)
+            yield
+            return
+        with open(os.path.join(self.store_dir, f"{skim_tag}{LOCK_SUFFIX}"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def stores(self, skim_tag=None):
+        """
+        List digests of existing stores, by skim_tag
+
+        Returns
+        -------
+        dict of list of str
+            {skim_tag: [digest, ...]}
+        """
+        stores = {}
+        for file_name in os.listdir(self.store_dir):
+            if not file_name.endswith(DATA_SUFFIX):
+                continue
+            tag, sep, digest = file_name[: -len(DATA_SUFFIX)].rpartition("-")
+            if sep and (skim_tag is None or tag == skim_tag):
+                stores.setdefault(tag, []).append(digest)
+        return stores
+
+    def live_refs(self, skim_tag, digest):
+        """
+        Names of processes attached to a store, after discarding references
+        left behind by dead processes on this host.
+
+        Returns
+        -------
+        list of str
+        """
+        refs_dir = self._base_path(skim_tag, digest) + REFS_SUFFIX
+        if not os.path.isdir(refs_dir):
+            return []
+        hostname = socket.gethostname()
+        refs = []
+        for ref in os.listdir(refs_dir):
+            host, _, pid = ref.rpartition(".")
+            if host == hostname and pid.isdigit() and not _pid_is_alive(int(pid)):
+                logger.debug(f"removing stale skim store reference {ref}")
+                try:
+                    os.remove(os.path.join(refs_dir, ref))
+                except FileNotFoundError:
+                    pass
+                continue
+            # processes on other hosts (sharing a file system) are assumed alive
+            refs.append(ref)
+        return refs
+
+    def build(self, skim_info, read_skims):
+        """
+        Create the store for skim_info, if it does not already exist.
+
+        Skims are read into a temporary memmap file that is renamed into place
+        once complete, so a partially written store is never attached.
+
+        Parameters
+        ----------
+        skim_info : SkimInfo
+        read_skims : callable(skim_info, skim_data)
+            reads skims from omx into the 3D skim_data array
+
+        Returns
+        -------
+        digest : str
+        """
+        skim_tag = skim_info.skim_tag
+        digest = skim_store_digest(skim_info)
+        base_path = self._base_path(skim_tag, digest)
+
+        with self._lock(skim_tag):
+
+            if os.path.isfile(base_path + DATA_SUFFIX):
+                return digest
+
+            logger.info(
+                f"building skim store {skim_tag} {skim_info.skim_data_shape} at {base_path}"
+            )
+            t0 = time.time()
+
+            tmp_path = f"{base_path}.{self._ref_name()}.tmp"
+            data = np.memmap(
+                tmp_path,
+                shape=skim_info.skim_data_shape,
+                dtype=np.dtype(skim_info.dtype_name),
+                mode="w+",
+            )
+            try:
+                read_skims(skim_info, data)
+                data.flush()
+            except BaseException:
+                data._mmap.close()
+                os.remove(tmp_path)
+                raise
+            data._mmap.close()
+            del data
+
+            meta = {
+                "version": SKIM_STORE_VERSION,
+                "skim_tag": skim_tag,
+                "digest": digest,
+                "dtype": skim_info.dtype_name,
+                "shape": list(skim_info.skim_data_shape),
+                "omx_file_paths": [
+                    os.path.abspath(p) for p in skim_info.omx_file_paths
+                ],
+                "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+            }
+            with open(base_path + META_SUFFIX, "w") as f:
+                json.dump(meta, f, indent=2)
+
+            os.replace(tmp_path, base_path + DATA_SUFFIX)
+
+            logger.info(
+                f"built skim store {skim_tag} in {time.time() - t0:.1f} seconds"
+            )
+
+        # earlier versions of these skims are no longer useful
+        self.evict(skim_tag, keep=digest)
+
+        return digest
+
+    def attach(self, skim_info, read_skims):
+        """
+        Attach (building if necessary) the store for skim_info read-only.
+
+        Parameters
+        ----------
+        skim_info : SkimInfo
+        read_skims : callable(skim_info, skim_data)
+            reads skims from omx into the 3D skim_data array, if the store must be built
+
+        Returns
+        -------
+        numpy.memmap
+            read-only 3D skim data
+        """
+        skim_tag = skim_info.skim_tag
+        digest = skim_store_digest(skim_info)
+        base_path = self._base_path(skim_tag, digest)
+
+        # take our reference before building, so the store can't be evicted under us
+        refs_dir = base_path + REFS_SUFFIX
+        os.makedirs(refs_dir, exist_ok=True)
+        ref_path = os.path.join(refs_dir, self._ref_name())
+        open(ref_path, "w").close()
+        if ref_path not in self._attached:
+            self._attached.add(ref_path)
+            # unlike atexit, this also runs when multiprocessing subprocesses exit
+            multiprocessing.util.Finalize(
+                None, self._detach, args=(ref_path,), exitpriority=0
+            )
+
+        # prune references left behind by processes that did not exit cleanly
+        self.live_refs(skim_tag, digest)
+
+        self.build(skim_info, read_skims)
+
+        logger.info(f"attached skim store {skim_tag} at {base_path}")
+
+        return np.memmap(
+            base_path + DATA_SUFFIX,
+            shape=skim_info.skim_data_shape,
+            dtype=np.dtype(skim_info.dtype_name),
+            mode="r",
+        )
+
+    def _detach(self, ref_path):
+        self._attached.discard(ref_path)
+        try:
+            os.remove(ref_path)
+        except FileNotFoundError:
+            pass
+
+    def evict(self, skim_tag=None, keep=None, force=False):
+        """
+        Remove stores that have no live references.
+
+        Parameters
+        ----------
+        skim_tag : str, optional
+            only evict stores for this skim_tag (default all)
+        keep : str, optional
+            digest of a store not to evict
+        force : bool
+            evict even if the stores are still referenced (attached processes
+            keep their mapping, but it can no longer be attached by others)
+
+        Returns
+        -------
+        list of str
+            base names of evicted stores
+        """
+        evicted = []
+        for tag, digests in self.stores(skim_tag).items():
+            for digest in digests:
+                if digest == keep:
+                    continue
+                refs = self.live_refs(tag, digest)
+                if refs and not force:
+                    logger.info(
+                        f"not evicting skim store {tag}-{digest} with {len(refs)} references"
+                    )
+                    continue
+                base_path = self._base_path(tag, digest)
+                logger.info(f"evicting skim store {base_path}")
+                for suffix in (DATA_SUFFIX, META_SUFFIX):
+                    try:
+                        os.remove(base_path + suffix)
+                    except FileNotFoundError:
+                        pass
+                shutil.rmtree(base_path + REFS_SUFFIX, ignore_errors=True)
+                evicted.append(os.path.basename(base_path))
+        return evicted
@@ -6,7 +6,7 @@ import sys
 import numpy as np
 import pandas as pd
 
-from activitysim.core import config, inject, pipeline
+from activitysim.core import config, inject, pipeline, skim_dictionary
 from activitysim.core.config import setting
 
 logger = logging.getLogger(__name__)
@@ -51,6 +51,10 @@ def track_skim_usage(output_dir):
         for key in unused:
             print(key, file=output_file)
 
+        print("\n### large skim lookups", file=output_file)
+        for stats in skim_dictionary.LOOKUP_STATS.values():
+            print(stats.summary(), file=output_file)
+
 
 def previous_write_data_dictionary(output_dir):
     """
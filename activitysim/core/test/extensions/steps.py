@@ -42,6 +42,20 @@ def step_add_col():
     pipeline.replace_table(table_name, table)
 
 
+@inject.step()
+def step_extend_tab():
+
+    table_name = inject.get_step_arg("table_name")
+    assert table_name is not None
+
+    table = pipeline.get_table(table_name)
+
+    new_rows = table.iloc[-1:].copy()
+    new_rows.index = new_rows.index + 1
+
+    pipeline.extend_table(table_name, new_rows)
+
+
 @inject.step()
 def step_forget_tab():
 
@@ -0,0 +1,95 @@
+# ActivitySim
+# See full license in LICENSE.txt.
+import os
+
+import numpy as np
+import numpy.testing as npt
+import pandas as pd
+import pytest
+
+from .. import chunk, config, inject
+
+
+@pytest.fixture
+def predictive_chunking(tmp_path):
+
+    configs_dir = os.path.join(os.path.dirname(__file__), "configs")
+    inject.add_injectable("configs_dir", configs_dir)
+    inject.add_injectable("output_dir", str(tmp_path))
+    config.override_setting("cache_dir", str(tmp_path / "cache"))
+
+    saved_settings = chunk.SETTINGS.copy()
+    saved_historian = chunk._HISTORIAN
+    chunk.SETTINGS["chunk_training_mode"] = chunk.MODE_PREDICTIVE
+    chunk._HISTORIAN = chunk.ChunkHistorian()
+
+    yield tmp_path
+
+    chunk.SETTINGS.clear()
+    chunk.SETTINGS.update(saved_settings)
+    chunk._HISTORIAN = saved_historian
+
+    inject.clear_cache()
+    inject.reinject_decorated_tables()
+
+
+def test_row_size_model():
+
+    model = chunk.RowSizeModel()
+    assert not model.trained
+    assert model.fit() == (0.0, 0.0)
+
+    # a single observation is all attributed to rows
+    model.observe(100, 50_000)
+    npt.assert_allclose(model.fit(), (0.0, 500.0))
+
+    # with different numbers of rows, fixed overhead is distinguished from row_size
+    model.observe(300, 90_000)
+    model.observe(200, 70_000)
+    npt.assert_allclose(model.fit(), (30_000.0, 200.0))
+    assert model.rows_for_headroom(230_000) == 1000
+    assert model.rows_for_headroom(10_000) == 1
+
+    # observations combine by adding stats
+    combined = chunk.RowSizeModel(model.stats)
+    combined.add(model.stats)
+    npt.assert_allclose(combined.fit(), model.fit())
+
+
+def test_predictive_chunking(predictive_chunking, monkeypatch):
+
+    # so headroom is the whole chunk_size
+    monkeypatch.setattr(chunk.mem, "get_rss", lambda **kwargs: (0, 0))
+
+    row_size = 8 * 100
+    choosers = pd.DataFrame({"a": np.arange(1000)})
+
+    def run_chunks(chunk_size):
+        rows = []
+        for i, chooser_chunk, trace_label in chunk.adaptive_chunked_choosers(
+            choosers, chunk_size, "test_predictive_chunking"
+        ):
+            rows.append(len(chooser_chunk))
+            data = np.zeros((len(chooser_chunk), 100))
+            chunk.log_df(trace_label, "data", data)
+            chunk.log_df(trace_label, "data", None)
+        return rows
+
+    # first chunk has default_initial_rows_per_chunk, after that the learned row_size
+    rows = run_chunks(chunk_size=200 * row_size)
+    assert rows[0] == chunk.default_initial_rows_per_chunk()
+    assert rows[1:] == [200, 200, 200, 200, 100]
+
+    model = chunk._HISTORIAN.row_size_model("test_predictive_chunking")
+    npt.assert_allclose(model.row_size(), row_size)
+
+    # model is persisted in cache_dir at end of run
+    chunk.consolidate_logs()
+    model_df = pd.read_csv(os.path.join(config.get_cache_dir(), chunk.MODEL_FILE_NAME))
+    assert model_df.tag.tolist() == ["test_predictive_chunking"]
+    assert model_df.row_size.tolist() == [row_size]
+
+    # and a new run starts with it
+    chunk._HISTORIAN = chunk.ChunkHistorian()
+    rows = run_chunks(chunk_size=250 * row_size)
+    assert rows == [250, 250, 250, 250]
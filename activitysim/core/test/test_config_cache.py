@@ -0,0 +1,77 @@
+# ActivitySim
+# See full license in LICENSE.txt.
+
+import os
+
+import numpy as np
+import pandas.testing as pdt
+import pytest
+
+from .. import config, config_cache, inject, simulate
+
+
+def teardown_function(func):
+    config_cache.close_cache()
+    inject.clear_cache()
+    inject.reinject_decorated_tables()
+
+
+@pytest.fixture
+def configs_dir(tmp_path):
+
+    configs_dir = tmp_path / "configs"
+    configs_dir.mkdir()
+    (configs_dir / "model.yaml").write_text(
+        "SPEC: model.csv\nCOEFFICIENTS: coefs.csv\n"
+    )
+    (configs_dir / "model.csv").write_text(
+        "Label,Description,Expression,work,school\n"
+        "util_age,,age,coef_age,coef_age\n"
+        "util_zero,,income,0,0\n"
+        "util_age,,age,coef_age_work,0\n"
+    )
+    (configs_dir / "coefs.csv").write_text(
+        "coefficient_name,value,constrain\n"
+        "coef_age,0.5,F\n"
+        "coef_age_work,-1.25,F\n"
+    )
+    inject.add_injectable("configs_dir", str(configs_dir))
+    inject.add_injectable("settings", {})
+    return configs_dir
+
+
+def read_segment_spec():
+    model_settings = config.read_model_settings("model.yaml")
+    return simulate.spec_for_segment(model_settings, "SPEC", "work", estimator=None)
+
+
+def test_config_cache(configs_dir, tmp_path):
+
+    expected = read_segment_spec()
+    assert expected.work.tolist() == [0.5, -1.25]
+
+    cache_path = str(tmp_path / config_cache.CACHE_FILE_NAME)
+    config_cache.open_cache(cache_path)
+    pdt.assert_frame_equal(read_segment_spec(), expected)
+    assert config_cache._CACHE.misses > 0 and config_cache._CACHE.hits == 0
+
+    # callers get their own copy of cached values
+    spec = read_segment_spec()
+    spec.work = np.float32(0)
+    pdt.assert_frame_equal(read_segment_spec(), expected)
+    assert config_cache._CACHE.hits > 0
+
+    config_cache.close_cache()
+    assert os.path.exists(cache_path)
+
+    # a later run reads the cache written by the earlier one
+    config_cache.open_cache(cache_path)
+    pdt.assert_frame_equal(read_segment_spec(), expected)
+    assert config_cache._CACHE.misses == 0
+
+    # entries are invalidated when the content of their files changes
+    (configs_dir / "coefs.csv").write_text(
+        "coefficient_name,value,constrain\ncoef_age,0.5,F\ncoef_age_work,2.0,F\n"
+    )
+    assert read_segment_spec().work.tolist() == [0.5, 2.0]
+    assert config_cache._CACHE.misses > 0
@@ -4,11 +4,12 @@
 import os.path
 
 import numpy as np
+import numpy.testing as npt
 import pandas as pd
 import pandas.testing as pdt
 import pytest
 
-from .. import inject, logit
+from .. import choosing, inject, logit
 from ..simulate import eval_variables
 
 
@@ -132,6 +133,153 @@ def test_make_choices_real_probs(utilities):
     )
 
 
+def test_utils_to_choices(utilities):
+    choices, rands, choice_probs = logit.utils_to_choices(utilities)
+
+    pdt.assert_series_equal(
+        choices,
+        pd.Series([1, 2], index=[0, 1]),
+        check_dtype=False,
+    )
+
+    probs = logit.utils_to_probs(utilities, trace_label=None)
+    npt.assert_almost_equal(
+        choice_probs.values, probs.values[np.arange(len(probs)), choices.values]
+    )
+
+
+def test_logit_choice_maker_matches_choice_maker():
+    rng = np.random.default_rng(42)
+    utils = rng.normal(scale=3.0, size=(1000, 6))
+    # some unavailable alternatives
+    utils[rng.random(utils.shape) < 0.2] = -999
+    utils[:, 0] = 0.0
+    rands = rng.random(len(utils))
+
+    probs = logit.utils_to_probs(pd.DataFrame(utils), trace_label=None)
+    expected = choosing.choice_maker(probs.values, rands)
+
+    choices, choice_probs, status = choosing.logit_choice_maker(
+        utils, rands, logit.EXP_UTIL_MIN
+    )
+    npt.assert_array_equal(choices, expected)
+    npt.assert_almost_equal(choice_probs, probs.values[np.arange(len(utils)), choices])
+    assert (status == 0).all()
+
+    # same choices from exponentiated utilities
+    choices, _, _ = choosing.logit_choice_maker(
+        np.exp(utils), rands, logit.EXP_UTIL_MIN, exponentiated=True
+    )
+    npt.assert_array_equal(choices, expected)
+
+
+def test_utils_to_choices_raises():
+
+    add_canonical_dirs()
+
+    idx = pd.Index(name="household_id", data=[1])
+    with pytest.raises(RuntimeError) as excinfo:
+        logit.utils_to_choices(pd.DataFrame([[1, 2, np.inf, 3]], index=idx))
+    assert "infinite exponentiated utilities" in str(excinfo.value)
+
+    with pytest.raises(RuntimeError) as excinfo:
+        logit.utils_to_choices(pd.DataFrame([[-999, -999, -999, -999]], index=idx))
+    assert "all probabilities are zero" in str(excinfo.value)
+
+    choices, _, _ = logit.utils_to_choices(
+        pd.DataFrame([[-999, -999, -999, -999]], index=idx), allow_zero_probs=True
+    )
+    assert choices.iloc[0] == -1
+
+
+def test_utils_to_choices_nan():
+
+    add_canonical_dirs()
+
+    utils = np.array([[1, np.nan, 2], [np.nan, np.nan, np.nan], [1, 2, 3]])
+    choices, choice_probs, status = choosing.logit_choice_maker(
+        utils, np.full(len(utils), 0.5), logit.EXP_UTIL_MIN
+    )
+    npt.assert_array_equal(status, [3, 3, 0])
+    npt.assert_array_equal(choices[:2], [-1, -1])
+    npt.assert_array_equal(choice_probs[:2], [0, 0])
+
+    # nan utilities are reported even if zero probs are allowed
+    idx = pd.Index(name="household_id", data=[1, 2, 3])
+    for allow_zero_probs in [False, True]:
+        with pytest.raises(RuntimeError) as excinfo:
+            logit.utils_to_choices(
+                pd.DataFrame(utils, index=idx), allow_zero_probs=allow_zero_probs
+            )
+        assert "nan utilities for 2 of 3 rows" in str(excinfo.value)
+
+
+def test_ragged_logit_choice_maker_matches_padded():
+    rng = np.random.default_rng(42)
+    counts = rng.integers(1, 8, size=1000)
+    offsets = np.concatenate([[0], counts.cumsum()])
+    utils = rng.normal(scale=3.0, size=offsets[-1])
+    # some unavailable alternatives
+    utils[rng.random(len(utils)) < 0.2] = -999
+    utils[offsets[:-1]] = 0.0
+    rands = rng.random(len(counts))
+
+    # padded with dummy utilities that are never chosen
+    padded = logit.ragged_utils_to_frame(utils, offsets, pd.RangeIndex(len(counts)))
+    padded = padded.fillna(-999)
+
+    expected, expected_probs, _ = choosing.logit_choice_maker(
+        padded.values, rands, logit.EXP_UTIL_MIN
+    )
+    choices, choice_probs, logsums, status = choosing.ragged_logit_choice_maker(
+        utils, offsets, rands, logit.EXP_UTIL_MIN
+    )
+    npt.assert_array_equal(choices, expected)
+    npt.assert_almost_equal(choice_probs, expected_probs)
+    assert (status == 0).all()
+
+    expected_logsums = logit.utils_to_logsums(padded)
+    npt.assert_almost_equal(logsums, expected_logsums.values)
+    npt.assert_almost_equal(
+        logit.ragged_utils_to_logsums(utils, offsets, padded.index).values,
+        expected_logsums.values,
+    )
+
+
+def test_ragged_utils_to_choices_nan():
+
+    add_canonical_dirs()
+
+    utils = np.array([1, np.nan, 2, np.nan, 1, 2, 3])
+    offsets = np.array([0, 3, 4, 7])
+    choosers = pd.DataFrame(index=pd.Index(name="household_id", data=[1, 2, 3]))
+
+    choices, _, logsums, status = choosing.ragged_logit_choice_maker(
+        utils, offsets, np.full(len(choosers), 0.5), logit.EXP_UTIL_MIN
+    )
+    npt.assert_array_equal(status, [3, 3, 0])
+    npt.assert_array_equal(choices[:2], [-1, -1])
+
+    # logsums agree with those of the padded utilities, as traced
+    padded = logit.ragged_utils_to_frame(utils, offsets, choosers.index).fillna(-999)
+    padded.iloc[0, 1] = padded.iloc[1, 0] = np.nan
+    expected_logsums = logit.utils_to_logsums(padded).values
+    npt.assert_array_equal(np.isnan(expected_logsums), [True, True, False])
+    npt.assert_almost_equal(logsums, expected_logsums)
+    npt.assert_almost_equal(
+        logit.ragged_utils_to_logsums(utils, offsets, choosers.index).values,
+        expected_logsums,
+    )
+
+    # nan utilities are reported even if zero probs are allowed
+    for allow_zero_probs in [False, True]:
+        with pytest.raises(RuntimeError) as excinfo:
+            logit.ragged_utils_to_choices(
+                utils, offsets, choosers, allow_zero_probs=allow_zero_probs
+            )
+        assert "nan utilities for 2 of 3 rows" in str(excinfo.value)
+
+
 @pytest.fixture(scope="module")
 def interaction_choosers():
     return pd.DataFrame({"attr": ["a", "b", "c", "b"]}, index=["w", "x", "y", "z"])
@@ -10,6 +10,7 @@ import pandas.testing as pdt
 import pytest
 
 from .. import inject, los
+from ..maz_to_maz import MAZ_TO_MAZ_TAG, MazToMazSkims
 
 
 def teardown_function(func):
@@ -162,6 +163,52 @@ def test_three_zone():
     np.testing.assert_almost_equal(dist, [0.24, 0.14, 2.55, 1.9, 0.62])
 
 
+def test_maz_to_maz_lookup():
+
+    add_canonical_dirs("configs_2z")
+
+    # no input tables, so load_data never recodes mazs based on a land_use table
+    inject.add_injectable("settings", {"multiprocess": False, "input_table_list": []})
+
+    network_los = los.Network_LOS()
+    network_los.load_data()
+
+    # reference pandas lookup of the union of pairs in all maz_to_maz tables
+    data_dir = inject.get_injectable("data_dir")
+    tables = [
+        pd.read_csv(os.path.join(data_dir, f)).set_index(["OMAZ", "DMAZ"])
+        for f in ["maz_to_maz_walk.csv", "maz_to_maz_bike.csv"]
+    ]
+    maz_to_maz_df = pd.concat(tables, axis=1)
+
+    rng = np.random.default_rng(0)
+    mazs = np.unique(maz_to_maz_df.index.get_level_values("OMAZ"))
+    omaz = np.append(rng.choice(mazs, 500), [1000, 999999, 0])
+    dmaz = np.append(rng.choice(mazs, 500), [999999, 1000, 0])
+    pairs = pd.MultiIndex.from_arrays([omaz, dmaz])
+
+    for attribute in ["DIST", "DISTBIKE", "DISTWALK"]:
+        expected = maz_to_maz_df[attribute].reindex(pairs).values.astype(np.float32)
+        npt.assert_array_equal(
+            network_los.get_mazpairs(omaz, dmaz, attribute), expected
+        )
+    assert np.isnan(network_los.get_mazpairs(omaz, dmaz, "DIST")[-3:]).all()
+
+    # pairs are shared with subprocesses in a data buffer
+    maz_to_maz = MazToMazSkims(network_los)
+    data_buffer = maz_to_maz.allocate_data_buffer()
+    maz_to_maz.load_data_to_buffer(data_buffer)
+    inject.add_injectable("data_buffers", {MAZ_TO_MAZ_TAG: data_buffer})
+
+    shared = MazToMazSkims(network_los)
+    shared.load_data()
+    assert shared.num_pairs == len(maz_to_maz_df)
+    npt.assert_array_equal(
+        shared.lookup(omaz, dmaz, "DISTWALK"),
+        network_los.get_mazpairs(omaz, dmaz, "DISTWALK"),
+    )
+
+
 def test_30_minute_windows():
 
     add_canonical_dirs("configs_test_misc")
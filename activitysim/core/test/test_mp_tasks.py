@@ -0,0 +1,201 @@
+# ActivitySim
+# See full license in LICENSE.txt.
+import os
+
+import numpy as np
+import pandas as pd
+import pandas.testing as pdt
+import pytest
+
+from .. import config, inject, mp_tasks, pipeline
+
+NUM_HOUSEHOLDS = 20
+WORK_UNITS = 4
+STEP_NAME = "mp_step"
+WORK_UNIT_NAMES = ["%s_unit_%s" % (STEP_NAME, i) for i in range(WORK_UNITS)]
+
+
+@inject.step()
+def mp_test_init():
+
+    households = pd.DataFrame(
+        {"income": np.arange(NUM_HOUSEHOLDS) * 1000},
+        index=pd.Index(np.arange(1, NUM_HOUSEHOLDS + 1), name="household_id"),
+    )
+    persons = pd.DataFrame(
+        {"household_id": np.repeat(households.index, households.index % 3 + 1)}
+    )
+    persons.index = pd.Index(np.arange(len(persons)) + 100, name="person_id")
+
+    pipeline.replace_table("households", households)
+    pipeline.replace_table("persons", persons)
+
+
+@inject.step()
+def mp_test_annotate(persons, households):
+
+    persons = persons.to_frame()
+    households = households.to_frame()
+
+    persons["household_size"] = persons.groupby("household_id").household_id.transform(
+        "size"
+    )
+    persons["income"] = households.income.reindex(persons.household_id).values
+    persons["work_unit"] = inject.get_injectable("work_unit")
+
+    pipeline.replace_table("persons", persons)
+
+
+def run_settings(**step_settings):
+    return {
+        "models": ["mp_test_init", "mp_test_annotate"],
+        "multiprocess": True,
+        "multiprocess_steps": [
+            {"name": "mp_init", "begin": "mp_test_init"},
+            dict(
+                {
+                    "name": STEP_NAME,
+                    "begin": "mp_test_annotate",
+                    "slice": {"tables": ["households", "persons"]},
+                },
+                **step_settings,
+            ),
+        ],
+    }
+
+
+@pytest.fixture
+def step_info(tmp_path):
+
+    configs_dir = os.path.join(os.path.dirname(__file__), "configs")
+    inject.add_injectable("configs_dir", configs_dir)
+    inject.add_injectable("output_dir", str(tmp_path))
+    inject.add_injectable(
+        "settings", run_settings(num_processes=2, work_units=WORK_UNITS)
+    )
+    inject.clear_cache()
+
+    # pipeline as left by the prior (single process) step
+    pipeline.run(models=["mp_test_init"], resume_after=None)
+    pipeline.add_checkpoint("mp_init")
+    pipeline.close_pipeline()
+
+    yield mp_tasks.get_run_list()["multiprocess_steps"][1]
+
+    if pipeline.is_open():
+        pipeline.close_pipeline()
+    inject.remove_injectable("breadcrumbs")
+    inject.clear_cache()
+    inject.reinject_decorated_tables()
+
+
+def run_work_units(step_info, process_names, work_unit_names, previously_completed=()):
+
+    # preloaded injectables, so sub processes don't register the abm steps
+    injectables = {
+        "configs_dir": inject.get_injectable("configs_dir"),
+        "output_dir": inject.get_injectable("output_dir"),
+        "settings": inject.get_injectable("settings"),
+        "preload_injectables": True,
+    }
+
+    return mp_tasks.run_sub_simulations(
+        injectables,
+        {},
+        step_info,
+        process_names,
+        mp_tasks.LAST_CHECKPOINT if previously_completed else None,
+        list(previously_completed),
+        fail_fast=True,
+        work_unit_names=work_unit_names,
+    )
+
+
+def unit_checkpoints(unit_name):
+    pipeline_path = config.build_output_file_path(
+        inject.get_injectable("pipeline_file_name"), use_prefix=unit_name
+    )
+    return pd.read_hdf(pipeline_path, pipeline.CHECKPOINT_TABLE_NAME).checkpoint_name
+
+
+def coalesced_persons(step_info):
+
+    mp_tasks.coalesce_pipelines(WORK_UNIT_NAMES, step_info["slice"])
+
+    pipeline.open_pipeline(resume_after=mp_tasks.LAST_CHECKPOINT)
+    persons = pipeline.get_table("persons")
+    pipeline.close_pipeline()
+
+    return persons
+
+
+def test_work_units(step_info):
+
+    assert step_info["models"] == ["mp_test_annotate"]
+    process_names = ["%s_%s" % (STEP_NAME, i) for i in range(2)]
+
+    # units run in reverse order, spread over two sub processes
+    mp_tasks.apportion_pipeline(WORK_UNIT_NAMES, step_info)
+    completed = run_work_units(step_info, process_names, WORK_UNIT_NAMES[::-1])
+    assert sorted(completed) == WORK_UNIT_NAMES
+    persons = coalesced_persons(step_info)
+
+    # units run in order, in a single sub process
+    mp_tasks.apportion_pipeline(WORK_UNIT_NAMES, step_info)
+    completed = run_work_units(step_info, process_names[:1], WORK_UNIT_NAMES)
+    assert sorted(completed) == WORK_UNIT_NAMES
+
+    # coalesced in work unit order, whichever process ran them, in whatever order
+    pdt.assert_frame_equal(coalesced_persons(step_info), persons)
+    assert persons.work_unit.tolist() == sorted(persons.work_unit)
+    assert set(persons.work_unit) == set(WORK_UNIT_NAMES)
+
+    expected = persons.sort_index()
+    assert (expected.household_size == expected.household_id % 3 + 1).all()
+    assert (expected.income == (expected.household_id - 1) * 1000).all()
+
+
+def test_work_units_resume(step_info):
+
+    mp_tasks.apportion_pipeline(WORK_UNIT_NAMES, step_info)
+
+    # only the units that did not complete in the previous run are run
+    previously_completed = WORK_UNIT_NAMES[::2]
+    completed = run_work_units(
+        step_info,
+        ["%s_%s" % (STEP_NAME, i) for i in range(2)],
+        WORK_UNIT_NAMES,
+        previously_completed=previously_completed,
+    )
+    assert sorted(completed) == WORK_UNIT_NAMES
+    assert sorted(mp_tasks.read_breadcrumbs()[STEP_NAME]["completed"]) == sorted(
+        WORK_UNIT_NAMES
+    )
+
+    for unit_name in WORK_UNIT_NAMES:
+        ran = "mp_test_annotate" in unit_checkpoints(unit_name).values
+        assert ran == (unit_name not in previously_completed)
+
+
+@pytest.mark.parametrize(
+    "step_settings, error",
+    [
+        ({"num_processes": 4, "work_units": 2}, "fewer than num_processes"),
+        ({"num_processes": 2, "work_units": -1}, "bad value"),
+        ({"num_processes": 2, "work_units": 1.5}, "bad value"),
+    ],
+)
+def test_work_units_run_list_errors(step_info, step_settings, error):
+
+    inject.add_injectable("settings", run_settings(**step_settings))
+    with pytest.raises(RuntimeError, match=error):
+        mp_tasks.get_run_list()
+
+
+def test_work_units_without_slice(step_info):
+
+    settings = run_settings(num_processes=1, work_units=2)
+    del settings["multiprocess_steps"][1]["slice"]
+    inject.add_injectable("settings", settings)
+    with pytest.raises(RuntimeError, match="work_units but no slice info"):
+        mp_tasks.get_run_list()
@@ -0,0 +1,108 @@
+# ActivitySim
+# See full license in LICENSE.txt.
+import numpy as np
+import pandas as pd
+import pandas.testing as pdt
+
+from .. import pathbuilder
+
+
+def test_best_tap_tap_paths():
+
+    rng = np.random.default_rng(0)
+    num_taps, num_sets = 6, 3
+    max_paths_per_tap_set, max_paths_across_tap_sets = 2, 3
+
+    # two choosers, the second with two destinations, and one od with no egress
+    maz_od_df = pd.DataFrame(
+        {"idx": [10, 11, 11, 12], "omaz": [1, 2, 2, 3], "dmaz": [4, 5, 6, 9]}
+    )
+    tap_ids = np.arange(num_taps) * 100 + 100
+    tap_ordinals = pd.Series(range(num_taps), index=tap_ids)
+
+    access_df = pd.DataFrame(
+        {
+            "idx": [10, 10, 10, 11, 11, 12],
+            "omaz": [1, 1, 1, 2, 2, 3],
+            "btap": tap_ids[[0, 1, 2, 2, 3, 4]],
+            "access": rng.normal(size=6),
+        }
+    )
+    egress_df = pd.DataFrame(
+        {
+            "idx": [10, 10, 11, 11, 11],
+            "dmaz": [4, 4, 5, 5, 6],
+            "atap": tap_ids[[1, 4, 5, 2, 0]],
+            "egress": rng.normal(size=5),
+        }
+    )
+    od_base_uids = np.array([0, 1, 1, 0]) * num_taps * num_taps
+    tap_tap_utilities = rng.normal(size=(2 * num_taps * num_taps, num_sets)).astype(
+        np.float32
+    )
+
+    utilities, btaps, ataps, sets, counts = pathbuilder._best_tap_tap_paths(
+        *pathbuilder._maz_tap_adjacency(
+            maz_od_df, access_df, "omaz", "btap", "access", tap_ordinals
+        ),
+        *pathbuilder._maz_tap_adjacency(
+            maz_od_df, egress_df, "dmaz", "atap", "egress", tap_ordinals
+        ),
+        od_base_uids,
+        num_taps,
+        tap_tap_utilities,
+        max_paths_per_tap_set,
+        max_paths_across_tap_sets,
+    )
+
+    # brute force the cartesian product of legs and sets
+    path_df = (
+        maz_od_df.assign(seq=range(len(maz_od_df)), base=od_base_uids)
+        .merge(access_df, on=["idx", "omaz"])
+        .merge(egress_df, on=["idx", "dmaz"])
+    )
+    path_df = path_df[path_df.btap != path_df.atap]
+    path_df = pd.concat(
+        [
+            path_df.assign(
+                path_set=s,
+                utility=(
+                    tap_tap_utilities[
+                        path_df.base
+                        + tap_ordinals.loc[path_df.btap].values * num_taps
+                        + tap_ordinals.loc[path_df.atap].values,
+                        s,
+                    ]
+                    + path_df.access
+                )
+                + path_df.egress,
+            )
+            .sort_values("utility", ascending=False)
+            .groupby("seq")
+            .head(max_paths_per_tap_set)
+            for s in range(num_sets)
+        ]
+    )
+    expected = (
+        path_df.sort_values(["seq", "utility"], ascending=[True, False])
+        .groupby("seq")
+        .head(max_paths_across_tap_sets)
+    )
+
+    assert counts.tolist() == [3, 3, 3, 0]
+
+    found = np.arange(max_paths_across_tap_sets) < counts[:, None]
+    result = pd.DataFrame(
+        {
+            "btap": tap_ids[btaps[found]],
+            "atap": tap_ids[ataps[found]],
+            "path_set": sets[found],
+            "utility": utilities[found],
+        }
+    )
+    pdt.assert_frame_equal(
+        result,
+        expected[["btap", "atap", "path_set", "utility"]].reset_index(drop=True),
+        check_dtype=False,
+    )
+    assert np.isnan(utilities[~found]).all()
@@ -0,0 +1,198 @@
+# ActivitySim
+# See full license in LICENSE.txt.
+import multiprocessing
+import time
+
+import numpy as np
+import numpy.testing as npt
+import pytest
+
+from .. import inject, pathbuilder
+from ..pathbuilder_cache import CLAIMED, DYNAMIC, TVPBCache
+
+NUM_UIDS = 20
+SET_NAMES = ["fastest", "cheapest"]
+
+
+class NetworkLOS(object):
+    # just the network_los settings TVPBCache uses
+
+    def __init__(self, multiprocess, **settings):
+        self._multiprocess = multiprocess
+        self.settings = dict(tvpb_cache_type=DYNAMIC, **settings)
+
+    def setting(self, key, default=None):
+        return self.settings.get(key, default)
+
+    def multiprocess(self):
+        return self._multiprocess
+
+
+class UidCalculator(object):
+    set_names = SET_NAMES
+    fully_populated_shape = (NUM_UIDS, len(SET_NAMES))
+    fully_populated_uids = np.arange(NUM_UIDS)
+
+
+def utilities(uids):
+    return np.stack([uids * 10.0, uids * -1.0], axis=1).astype(np.float32)
+
+
+def open_cache(network_los):
+    cache = TVPBCache(network_los, UidCalculator(), "tap_tap_utilities")
+    cache.open()
+    return cache
+
+
+def path_builder(cache, compute):
+    # TransitVirtualPathBuilder with just the tap_cache fill_tap_tap_utilities needs
+    pb = object.__new__(pathbuilder.TransitVirtualPathBuilder)
+    pb.tap_cache = cache
+    pb.compute_tap_tap_utilities = compute
+    return pb
+
+
+def publish_utilities(cache):
+    def compute(uids, trace_label):
+        cache.publish(uids, utilities(uids))
+
+    return compute
+
+
+@pytest.fixture
+def data_buffers(tmp_path):
+
+    # no saved dynamic cache in cache_dir, so buffer is loaded with nan
+    inject.add_injectable("settings", {"cache_dir": str(tmp_path)})
+
+    network_los = NetworkLOS(multiprocess=True, tvpb_cache_wait_timeout=30)
+    cache = TVPBCache(network_los, UidCalculator(), "tap_tap_utilities")
+    data_buffer = cache.allocate_data_buffer(shared=True)
+    cache.load_data_to_buffer(data_buffer)
+    data_buffers = {
+        cache.cache_tag: data_buffer,
+        cache.claims_tag: cache.allocate_claims_buffer(),
+    }
+    inject.add_injectable("data_buffers", data_buffers)
+
+    yield data_buffers
+
+    inject.remove_injectable("data_buffers")
+    inject.clear_cache()
+    inject.reinject_decorated_tables()
+
+
+def claim_and_publish(data_buffers, uids, claimed_event, publish_event):
+    inject.add_injectable("data_buffers", data_buffers)
+    cache = open_cache(NetworkLOS(multiprocess=True))
+    claimed, pending = cache.claim(uids)
+    assert len(pending) == 0
+    claimed_event.set()
+    publish_event.wait()
+    cache.publish(claimed, utilities(claimed))
+
+
+def claim_and_fail(data_buffers, uids, claimed_event):
+    inject.add_injectable("data_buffers", data_buffers)
+    cache = open_cache(NetworkLOS(multiprocess=True))
+
+    def compute(uids, trace_label):
+        # other process must be waiting for our claims when we fail
+        claimed_event.set()
+        time.sleep(0.5)
+        raise RuntimeError("failed computing tap_tap utilities")
+
+    with pytest.raises(RuntimeError):
+        path_builder(cache, compute).fill_tap_tap_utilities(uids, "test")
+
+
+def test_claim_publish_wait_for(data_buffers):
+
+    uids = np.arange(5, 15)
+    claimed_event = multiprocessing.Event()
+    publish_event = multiprocessing.Event()
+    worker = multiprocessing.Process(
+        target=claim_and_publish,
+        args=(data_buffers, uids, claimed_event, publish_event),
+    )
+    worker.start()
+    assert claimed_event.wait(30)
+
+    cache = open_cache(NetworkLOS(multiprocess=True, tvpb_cache_wait_timeout=30))
+
+    # entries claimed by the worker are pending, the rest are ours to compute
+    claimed, pending = cache.claim(np.arange(0, 10))
+    npt.assert_array_equal(claimed, np.arange(0, 5))
+    npt.assert_array_equal(pending, np.arange(5, 10))
+    cache.publish(claimed, utilities(claimed))
+
+    publish_event.set()
+    cache.wait_for(pending)
+    worker.join(30)
+    assert worker.exitcode == 0
+
+    npt.assert_array_equal(cache.data[:15], utilities(np.arange(15)))
+    assert np.isnan(cache.data[15:]).all()
+
+
+def test_released_claims_are_recomputed(data_buffers):
+
+    uids = np.arange(5, 15)
+    claimed_event = multiprocessing.Event()
+    worker = multiprocessing.Process(
+        target=claim_and_fail, args=(data_buffers, uids, claimed_event)
+    )
+    worker.start()
+    assert claimed_event.wait(30)
+
+    cache = open_cache(NetworkLOS(multiprocess=True, tvpb_cache_wait_timeout=30))
+
+    # we wait for the worker, which fails and releases its claims, so we compute them ourselves
+    path_builder(cache, publish_utilities(cache)).fill_tap_tap_utilities(
+        np.arange(0, 20), "test"
+    )
+    worker.join(30)
+    assert worker.exitcode == 0
+
+    npt.assert_array_equal(cache.data, utilities(np.arange(NUM_UIDS)))
+
+
+def test_wait_for_timeout(data_buffers):
+
+    cache = open_cache(NetworkLOS(multiprocess=True, tvpb_cache_wait_timeout=0.1))
+
+    # claimed by a process that never publishes
+    cache._claims[3] = CLAIMED
+    with pytest.raises(RuntimeError) as excinfo:
+        cache.wait_for(np.array([3]))
+    assert "timed out" in str(excinfo.value)
+
+
+def test_dynamic_cache_persistence(tmp_path):
+
+    inject.add_injectable("settings", {"cache_dir": str(tmp_path)})
+    try:
+        network_los = NetworkLOS(multiprocess=False)
+
+        cache = open_cache(network_los)
+        assert np.isnan(cache.data).all()
+        uids = np.array([1, 4, 7])
+        cache.publish(uids, utilities(uids))
+        cache.close()
+
+        # the next run starts with the entries published by the last
+        cache = open_cache(network_los)
+        npt.assert_array_equal(cache.data[uids], utilities(uids))
+        assert np.isnan(np.delete(cache.data, uids, axis=0)).all()
+        cache.close()
+
+        # saved cache with a different shape is ignored
+        UidCalculator.fully_populated_shape = (NUM_UIDS + 1, len(SET_NAMES))
+        UidCalculator.fully_populated_uids = np.arange(NUM_UIDS + 1)
+        cache = open_cache(network_los)
+        assert np.isnan(cache.data).all()
+    finally:
+        UidCalculator.fully_populated_shape = (NUM_UIDS, len(SET_NAMES))
+        UidCalculator.fully_populated_uids = np.arange(NUM_UIDS)
+        inject.clear_cache()
+        inject.reinject_decorated_tables()
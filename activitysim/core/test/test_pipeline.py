@@ -2,11 +2,12 @@
 # See full license in LICENSE.txt.
 import logging
 import os
+import shutil
 
 import pytest
 import tables
 
-from activitysim.core import inject, pipeline, tracing
+from activitysim.core import config, inject, pipeline, tracing
 
 from .extensions import steps
 
@@ -136,6 +137,189 @@ def test_pipeline_checkpoint_drop():
     close_handlers()
 
 
+def test_pipeline_restore_table_state():
+
+    inject.add_step("step1", steps.step1)
+    inject.add_step("step2", steps.step2)
+
+    # e.g. multiprocessing work units run one after another in the same process
+    table_state = inject.get_table_state()
+
+    pipeline.run(models=["step1", "step2"], resume_after=None)
+    pipeline.close_pipeline()
+    assert pipeline.is_table("table1") and pipeline.is_table("table2")
+
+    inject.restore_table_state(table_state)
+    assert not pipeline.is_table("table1")
+    assert not pipeline.is_table("table2")
+
+    pipeline.run(models=["step1"], resume_after=None)
+    assert pipeline.is_table("table1")
+    assert not pipeline.is_table("table2")
+
+    pipeline.close_pipeline()
+    close_handlers()
+
+
+def test_pipeline_parquet():
+
+    inject.add_step("step1", steps.step1)
+    inject.add_step("step2", steps.step2)
+    inject.add_step("step3", steps.step3)
+    inject.add_step("step_add_col", steps.step_add_col)
+
+    config.override_setting("checkpoint_format", "parquet")
+
+    _MODELS = [
+        "step1",
+        "step2",
+        "step_add_col.table_name=table2;column_name=c2",
+        "step3",
+    ]
+
+    pipeline.run(models=_MODELS, resume_after=None)
+
+    pipeline_dir = os.path.join(inject.get_injectable("output_dir"), "pipeline")
+    assert os.path.isfile(os.path.join(pipeline_dir, "checkpoints.jsonl"))
+    assert os.path.isfile(os.path.join(pipeline_dir, "step2", "table2.parquet"))
+
+    table2 = pipeline.get_table("table2")
+    assert list(table2.columns) == ["c", "c2"]
+
+    # column projection when reading an earlier version of a table
+    step2_table2 = pipeline.get_table("table2", checkpoint_name="step2", columns=["c"])
+    assert list(step2_table2.columns) == ["c"]
+    assert step2_table2.c.tolist() == table2.c.tolist()
+
+    pipeline.close_pipeline()
+
+    # resume from parquet store and ensure checkpoint history is truncated
+    pipeline.open_pipeline(resume_after="step2")
+    checkpoints = pipeline.get_checkpoints()
+    assert checkpoints.checkpoint_name.tolist() == ["init", "step1", "step2"]
+    assert list(pipeline.get_table("table2").columns) == ["c"]
+    assert "table3" not in pipeline.checkpointed_tables()
+    pipeline.close_pipeline()
+
+    shutil.rmtree(pipeline_dir)
+
+    close_handlers()
+
+
+@pytest.mark.parametrize("checkpoint_format", ["hdf5", "parquet"])
+def test_pipeline_checkpoint_deltas(checkpoint_format):
+
+    inject.add_step("step1", steps.step1)
+    inject.add_step("step2", steps.step2)
+    inject.add_step("step_add_col", steps.step_add_col)
+    inject.add_step("step_extend_tab", steps.step_extend_tab)
+
+    config.override_setting("checkpoint_format", checkpoint_format)
+    config.override_setting("checkpoint_deltas", True)
+
+    _MODELS = [
+        "step1",
+        "step2",
+        "step_add_col.table_name=table2;column_name=c2",
+        "step_add_col.table_name=table2;column_name=c3",
+        "step_extend_tab.table_name=table2",
+        "step_add_col.table_name=table2;column_name=c4",
+    ]
+
+    pipeline.run(models=_MODELS, resume_after=None)
+
+    table2 = pipeline.get_table("table2")
+    assert list(table2.columns) == ["c", "c2", "c3", "c4"]
+    assert len(table2) == 4
+
+    store = pipeline.get_pipeline_store()
+    assert store.table_versions["table2"]["depth"] == 4
+
+    # only the added column was written for the delta checkpoint
+    stored_df = store._read_df("table2", _MODELS[3])
+    assert list(stored_df.columns) == ["c3"]
+
+    # earlier versions (and column subsets) are reassembled from the deltas
+    c3_table2 = pipeline.get_table("table2", checkpoint_name=_MODELS[3])
+    assert list(c3_table2.columns) == ["c", "c2", "c3"]
+    assert len(c3_table2) == 3
+
+    extended_table2 = pipeline.get_table(
+        "table2", checkpoint_name=_MODELS[4], columns=["c2", "c"]
+    )
+    assert extended_table2.equals(table2[["c2", "c"]])
+
+    pipeline.close_pipeline()
+
+    # the current version of table2 is reassembled when resuming
+    pipeline.open_pipeline(resume_after="_")
+    assert pipeline.get_table("table2").equals(table2)
+    pipeline.close_pipeline()
+
+    if checkpoint_format == "parquet":
+        shutil.rmtree(os.path.join(inject.get_injectable("output_dir"), "pipeline"))
+
+    close_handlers()
+
+
+@pytest.mark.parametrize("max_bytes", [None, 1])
+def test_pipeline_background_checkpoints(max_bytes):
+
+    inject.add_step("step1", steps.step1)
+    inject.add_step("step2", steps.step2)
+    inject.add_step("step3", steps.step3)
+    inject.add_step("step_add_col", steps.step_add_col)
+
+    config.override_setting("checkpoint_format", "parquet")
+    config.override_setting("background_checkpoints", True)
+    config.override_setting("background_checkpoint_max_bytes", max_bytes)
+
+    _MODELS = [
+        "step1",
+        "step2",
+        "step_add_col.table_name=table2;column_name=c2",
+        "step3",
+    ]
+
+    pipeline.run(models=_MODELS, resume_after=None)
+
+    assert pipeline.get_pipeline_store().mode == "a"
+
+    # reading from the store waits for the background writer
+    checkpoints = pipeline.get_checkpoints()
+    assert checkpoints.checkpoint_name.tolist() == ["init"] + _MODELS
+    assert list(pipeline.get_table("table2", checkpoint_name="step2").columns) == ["c"]
+
+    table2 = pipeline.get_table("table2")
+
+    pipeline.close_pipeline()
+
+    pipeline.open_pipeline(resume_after="_")
+    assert pipeline.get_table("table2").equals(table2)
+    pipeline.close_pipeline()
+
+    shutil.rmtree(os.path.join(inject.get_injectable("output_dir"), "pipeline"))
+
+    close_handlers()
+
+
+def test_pipeline_background_checkpoints_hdf5():
+
+    inject.add_step("step1", steps.step1)
+
+    config.override_setting("checkpoint_format", "hdf5")
+    config.override_setting("background_checkpoints", True)
+
+    with pytest.raises(RuntimeError) as excinfo:
+        pipeline.run(models=["step1"], resume_after=None)
+    assert "background_checkpoints requires checkpoint_format 'parquet'" in str(
+        excinfo.value
+    )
+    assert not pipeline.is_open()
+
+    close_handlers()
+
+
 # if __name__ == "__main__":
 #
 #     print "\n\ntest_pipeline_run"
@@ -125,3 +125,58 @@ def test_channel():
     npt.assert_almost_equal(np.asanyarray(rands).flatten(), test1_expected_rands2)
 
     rng.end_step("test_step")
+
+
+def test_philox_channel():
+
+    rng = random.Random()
+
+    with pytest.raises(RuntimeError) as excinfo:
+        rng.set_channel_type("bogus")
+    assert "Unknown rng channel type" in str(excinfo.value)
+
+    rng.set_channel_type("philox")
+
+    persons = pd.DataFrame(index=pd.Index([1, 2, 3, 4, 5], name="person_id"))
+
+    rng.begin_step("test_step")
+    rng.add_channel("persons", persons)
+
+    rands = rng.random_for_df(persons, n=2)
+    assert rands.shape == (5, 2)
+    assert ((rands >= 0) & (rands < 1)).all()
+
+    # second call should return something different
+    rands2 = rng.random_for_df(persons)
+    assert not np.isin(rands2, rands).any()
+
+    normals = rng.normal_for_df(persons, mu=1.0, sigma=0.5)
+    assert normals.shape == (5,)
+
+    choices = rng.choice_for_df(persons, [1, 2, 3, 4], 2, replace=False)
+    assert choices.shape == (10,)
+    for pair in choices.reshape(5, 2):
+        assert pair[0] != pair[1]
+
+    rng.end_step("test_step")
+
+    # rands for a row do not depend on the other rows in df (chunking or mp slicing)
+    rng.begin_step("test_step")
+    sliced_rands = np.concatenate(
+        [
+            rng.random_for_df(persons.iloc[3:], n=2),
+            rng.random_for_df(persons.iloc[:3], n=2),
+        ]
+    )
+    npt.assert_almost_equal(sliced_rands, np.concatenate([rands[3:], rands[:3]]))
+    npt.assert_almost_equal(rng.random_for_df(persons.iloc[::-1]), rands2[::-1])
+    rng.end_step("test_step")
+
+    # different step should provide different streams
+    rng.begin_step("test_step2")
+    assert not np.isin(rng.random_for_df(persons, n=2), rands).any()
+    rng.end_step("test_step2")
+
+    with pytest.raises(RuntimeError) as excinfo:
+        rng.set_channel_type("simple")
+    assert "call set_channel_type before the first step" in str(excinfo.value)
@@ -9,7 +9,7 @@ import pandas as pd
 import pandas.testing as pdt
 import pytest
 
-from .. import inject, simulate
+from .. import chunk, expression_plan, inject, simulate
 
 
 @pytest.fixture(scope="module")
@@ -87,3 +87,92 @@ def test_simple_simulate_chunked(data, spec):
     )
     expected = pd.Series([1, 1, 1], index=data.index)
     pdt.assert_series_equal(choices, expected, check_dtype=False)
+
+
+@pytest.mark.parametrize(
+    "expr",
+    [
+        "a",
+        "a > 1 & b < 0",
+        "a > 1 and b < 0 or c",
+        "~c",
+        "(a == 2) | (b > 0.5) & c",
+        "a * 2 + b / 3",
+        "1 < a < 4",
+        "f > 0.1",
+        "s == 'x'",
+        "a % 2",
+        "a in [1, 2]",
+        "c * 2",
+        "-a + 1",
+    ],
+)
+def test_expression_plan(expr):
+
+    rng = np.random.default_rng(0)
+    n = 100
+    df = pd.DataFrame(
+        {
+            "a": rng.integers(0, 5, n),
+            "b": rng.normal(size=n),
+            "c": rng.random(n) > 0.5,
+            "f": rng.normal(size=n).astype(np.float32),
+            "s": rng.choice(["x", "y"], n),
+        }
+    )
+
+    plan = expression_plan.expression_plan([expr, "@df.a * 2"])
+
+    # plans are cached on spec content
+    assert expression_plan.expression_plan([expr, "@df.a * 2"]) is plan
+
+    dtypes = df.dtypes.to_dict()
+    npt.assert_array_equal(
+        np.asanyarray(plan[0].evaluate(df, dtypes, {}, {"df": df})),
+        np.asanyarray(df.eval(expr)),
+    )
+    npt.assert_array_equal(plan[1].evaluate(df, dtypes, {}, {"df": df}), df.a * 2)
+
+
+@pytest.fixture
+def utility_settings():
+
+    inject.add_injectable("settings", {"check_for_variability": False})
+
+    # eval_utilities logs to a base chunk_log, so run adaptive chunking for this test only
+    saved_settings = chunk.SETTINGS.copy()
+    chunk.SETTINGS["chunk_training_mode"] = chunk.MODE_ADAPTIVE
+
+    yield
+
+    chunk.SETTINGS.clear()
+    chunk.SETTINGS.update(saved_settings)
+
+    # restore the decorated settings injectable
+    inject.clear_cache()
+    inject.reinject_decorated_tables()
+
+
+@pytest.mark.parametrize("sparse_density", [0.0, 1.1])
+def test_eval_utilities_sparse(
+    data, spec, sparse_density, utility_settings, monkeypatch
+):
+
+    # use dense or sparse accumulation for any spec
+    monkeypatch.setattr(simulate, "SPARSE_UTILITY_DENSITY", sparse_density)
+
+    # a sparse spec, with one row that has no nonzero coefficients at all
+    sparse_spec = spec.copy()
+    sparse_spec.iloc[:, :] = [[1.1, 0], [0, 0], [0, 0], [4.4, 0]]
+
+    expression_values = simulate.eval_variables(spec.index, data).astype(np.float64)
+
+    for s in [spec, sparse_spec]:
+        expected = pd.DataFrame(
+            np.dot(expression_values.values, s.values),
+            index=data.index,
+            columns=spec.columns,
+        )
+        with chunk.chunk_log("test_eval_utilities_sparse", base=True):
+            utilities = simulate.eval_utilities(s, data)
+        pdt.assert_frame_equal(utilities, expected)
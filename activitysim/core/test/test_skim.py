@@ -1,13 +1,16 @@
 # ActivitySim
 # See full license in LICENSE.txt.
 
+import threading
+
 import numpy as np
 import numpy.testing as npt
 import pandas as pd
 import pandas.testing as pdt
 import pytest
+import tables
 
-from .. import skim_dictionary
+from .. import skim_codec, skim_dict_factory, skim_dictionary, skim_store
 
 
 @pytest.fixture
@@ -86,3 +89,237 @@ def test_3dskims(data):
     pdt.assert_series_equal(
         skims3d["SOV"], pd.Series([12, 930, 47], index=[0, 1, 2]), check_dtype=False
     )
+
+
+class FakeStoreSkimInfo(object):
+    def __init__(self, omx_file_path, num_skims):
+        self.skim_tag = "taz"
+        self.dtype_name = "float32"
+        self.skim_data_shape = (num_skims, 10, 10)
+        self.omx_file_paths = [omx_file_path]
+        self.omx_keys = {f"SKIM{i}": f"SKIM{i}" for i in range(num_skims)}
+        self.block_offsets = {f"SKIM{i}": i for i in range(num_skims)}
+
+
+def test_skim_store(tmp_path, data):
+
+    omx_file_path = tmp_path / "skims.omx"
+    omx_file_path.touch()
+
+    store = skim_store.SkimStore(str(tmp_path / "store"))
+
+    reads = []
+
+    def read_skims(skim_info, skim_data):
+        reads.append(skim_info.skim_data_shape)
+        for i in range(skim_data.shape[0]):
+            skim_data[i] = data * i
+
+    skim_info = FakeStoreSkimInfo(str(omx_file_path), 2)
+    skim_data = store.attach(skim_info, read_skims)
+    npt.assert_array_equal(skim_data[1], data)
+    assert not skim_data.flags.writeable
+    assert len(reads) == 1
+
+    # a second attach (e.g. from another run) does not re-read the skims
+    skim_data = store.attach(skim_info, read_skims)
+    npt.assert_array_equal(skim_data[1], data)
+    assert len(reads) == 1
+
+    (digest,) = store.stores()["taz"]
+    assert store.live_refs("taz", digest)
+
+    # referenced stores are not evicted, unless forced
+    assert store.evict() == []
+
+    # different skims get a new store, the superseded one stays while referenced
+    skim_info = FakeStoreSkimInfo(str(omx_file_path), 3)
+    skim_data = store.attach(skim_info, read_skims)
+    assert skim_data.shape == (3, 10, 10)
+    assert len(reads) == 2
+    assert len(store.stores()["taz"]) == 2
+
+    for ref_path in list(store._attached):
+        store._detach(ref_path)
+    assert len(store.evict("taz")) == 2
+    assert store.stores() == {}
+
+
+@pytest.mark.parametrize(
+    "filters",
+    [
+        tables.Filters(complevel=1, complib="zlib", shuffle=True),
+        tables.Filters(complevel=5, complib="zlib", shuffle=False),
+        tables.Filters(complevel=0),
+        tables.Filters(complevel=1, complib="blosc"),
+    ],
+)
+@pytest.mark.parametrize("byteorder", ["little", "big"])
+def test_read_omx_matrix(tmp_path, filters, byteorder):
+
+    matrix = np.random.default_rng(0).random((23, 17)) * 100
+
+    with tables.open_file(tmp_path / "skims.omx", mode="w") as h5:
+        # chunks that don't evenly divide the matrix
+        h5.create_carray(
+            "/",
+            "SKIM",
+            obj=matrix,
+            chunkshape=(5, 7),
+            filters=filters,
+            byteorder=byteorder,
+        )
+
+    with tables.open_file(tmp_path / "skims.omx", mode="r") as h5:
+        a = np.zeros(matrix.shape, dtype=np.float32)
+        skim_dict_factory.read_omx_matrix(h5.root.SKIM, a, threading.Lock())
+
+    npt.assert_array_equal(a, matrix.astype(np.float32))
+
+
+def test_apply_usage_profile(monkeypatch):
+
+    profile_df = pd.DataFrame(
+        {
+            "skim_tag": ["taz", "taz", "taz", "maz"],
+            "key": ["SOV_TIME__PM", "DIST", "SOV_DIST", "DISTWALK"],
+        }
+    )
+    monkeypatch.setattr(
+        skim_dict_factory, "read_skim_usage_profile", lambda: profile_df
+    )
+
+    skim_info = skim_dict_factory.SkimInfo.__new__(skim_dict_factory.SkimInfo)
+    skim_info.skim_tag = "taz"
+    skim_info.omx_shape = (10, 10)
+    skim_info.dtype_name = "float32"
+    skim_info.pruned_keys = set()
+    skim_info.layout_tag = None
+    skim_info.omx_keys = {
+        "DIST": "DIST",
+        "DISTWALK": "DISTWALK",
+        ("SOV_TIME", "AM"): "SOV_TIME__AM",
+        ("SOV_TIME", "PM"): "SOV_TIME__PM",
+        ("SOV_DIST", "AM"): "SOV_DIST__AM",
+        ("SOV_DIST", "PM"): "SOV_DIST__PM",
+    }
+
+    skim_info.apply_usage_profile()
+
+    # unused skims are dropped, the rest are in order of first use,
+    # with all dim3 keys of a base key used by 3D lookups
+    assert list(skim_info.omx_keys) == [
+        ("SOV_TIME", "PM"),
+        "DIST",
+        ("SOV_DIST", "AM"),
+        ("SOV_DIST", "PM"),
+    ]
+    assert skim_info.pruned_keys == {"DISTWALK", "SOV_TIME__AM"}
+    assert skim_info.layout_tag is not None
+
+    skim_info.offset_map = None
+    skim_info.block_offsets = {"DIST": 0}
+    skim_dict = skim_dictionary.SkimDict(
+        "taz", skim_info, np.zeros((1, 10, 10), dtype=np.float32)
+    )
+    with pytest.raises(RuntimeError) as excinfo:
+        skim_dict.lookup(np.array([1]), np.array([1]), "DISTWALK")
+    assert "skim usage profile" in str(excinfo.value)
+
+
+@pytest.mark.parametrize("dtype_name", ["int16", "uint8"])
+def test_quantized_skims(dtype_name):
+
+    rng = np.random.default_rng(0)
+    times = (rng.random((30, 30)) * 60).astype(np.float32)
+    times[2, 3] = np.nan
+    fares = rng.choice([0.0, 1.75, 2.5, 4.25], size=(30, 30)).astype(np.float32)
+
+    codec = skim_codec.SkimCodec(dtype_name, 2)
+    num_blocks = 2 + codec.num_header_blocks((30, 30))
+    skim_data = np.zeros((num_blocks, 30, 30), dtype=dtype_name)
+    codec.encode(0, times, skim_data[0])
+    codec.encode(1, fares, skim_data[1])
+    codec.write_header(skim_data, row_major=True)
+
+    skim_info = FakeSkimInfo()
+    skim_info.block_offsets = {("TIME", "AM"): 0, "FARE": 1}
+    skim_info.omx_shape = (30, 30)
+    skim_info.dtype_name = dtype_name
+    skim_info.codec = skim_codec.SkimCodec(dtype_name, 2)
+
+    # decode parameters are read from skim_data
+    skim_dict = skim_dictionary.SkimDict("taz", skim_info, skim_data)
+    skim_dict.offset_mapper.set_offset_int(0)
+    assert skim_dict.dtype == np.float32
+
+    orig = np.arange(30).repeat(30)
+    dest = np.tile(np.arange(30), 30)
+
+    # fares are dictionary encoded without loss
+    npt.assert_array_equal(skim_dict.lookup(orig, dest, "FARE"), fares.ravel())
+
+    # times are within the scale of the fixed point encoding
+    max_error = skim_info.codec.params["max_error"][0]
+    assert 0 < max_error <= 60 / (np.iinfo(dtype_name).max - np.iinfo(dtype_name).min)
+    npt.assert_allclose(
+        skim_dict.lookup(orig, dest, ("TIME", "AM")),
+        times.ravel(),
+        atol=max_error,
+    )
+    assert np.isnan(skim_dict.lookup(np.array([2]), np.array([3]), ("TIME", "AM")))
+
+    # 3D lookups mix cores
+    npt.assert_allclose(
+        skim_dict._lookup(np.array([1, 1]), np.array([4, 4]), np.array([0, 1])),
+        [times[1, 4], fares[1, 4]],
+        atol=max_error,
+    )
+
+    with pytest.raises(RuntimeError, match="exceed max_error"):
+        skim_info.codec.log_errors(
+            "taz", {("TIME", "AM"): "TIME__AM"}, skim_info.block_offsets, max_error / 2
+        )
+
+
+def test_large_lookups(monkeypatch):
+
+    rng = np.random.default_rng(0)
+    skim_data = rng.random((3, 40, 40)).astype(np.float32)
+
+    skim_info = FakeSkimInfo()
+    skim_info.block_offsets = {("SOV", "AM"): 0, ("SOV", "PM"): 1, "DIST": 2}
+    skim_info.omx_shape = (40, 40)
+    skim_info.dtype_name = "float32"
+
+    orig = rng.integers(1, 41, 500)
+    dest = rng.integers(1, 41, 500)
+    dest[7] = skim_dictionary.NOT_IN_SKIM_ZONE_ID
+    periods = rng.choice(["AM", "PM"], 500)
+
+    skim_info.lookup_threshold = 0
+    skim_dict = skim_dictionary.SkimDict("taz", skim_info, skim_data)
+    expected_2d = skim_dict.lookup(orig, dest, "DIST")
+    expected_3d = skim_dict.lookup_3d(orig, dest, periods, "SOV")
+    assert np.isnan(expected_2d[7])
+
+    # blocks of one page
+    monkeypatch.setattr(skim_dictionary, "LOOKUP_BLOCK_BYTES", 4096)
+
+    page_hits = {}
+    for lookup_order in ["chooser", "blocked"]:
+        skim_info.lookup_threshold = 100
+        skim_info.lookup_order = lookup_order
+        skim_dict = skim_dictionary.SkimDict(lookup_order, skim_info, skim_data)
+        npt.assert_array_equal(skim_dict.lookup(orig, dest, "DIST"), expected_2d)
+        npt.assert_array_equal(
+            skim_dict.lookup_3d(orig, dest, periods, "SOV"), expected_3d
+        )
+
+        stats = skim_dictionary.LOOKUP_STATS.pop(lookup_order)
+        assert (stats.lookups, stats.values) == (2, 1000)
+        assert stats.blocked_lookups == (2 if lookup_order == "blocked" else 0)
+        page_hits[lookup_order] = stats.page_hits
+
+    # blocked lookups only change page when they move to the next block
+    assert page_hits["blocked"] > 990 > page_hits["chooser"]
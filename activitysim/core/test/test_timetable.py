@@ -9,10 +9,23 @@ import pandas.testing as pdt
 import pytest
 from numpy.testing import assert_array_equal
 
-from .. import chunk
+from .. import chunk, inject
 from .. import timetable as tt
 
 
+@pytest.fixture
+def settings(tmp_path):
+
+    # chunk_log reads chunk_training_mode from settings and writes its history to output_dir
+    inject.add_injectable("settings", {})
+    inject.add_injectable("output_dir", str(tmp_path))
+
+    yield
+
+    inject.clear_cache()
+    inject.reinject_decorated_tables()
+
+
 @pytest.fixture
 def persons():
 
@@ -54,7 +67,7 @@ def tdd_alts():
     return alts
 
 
-def test_basic(persons, tdd_alts):
+def test_basic(settings, persons, tdd_alts):
 
     with chunk.chunk_log("test_basic", base=True):
 